@@ -0,0 +1,237 @@
+"""
+Per-request latency and cost budget.
+
+A ``Budget`` is created once per request and carried in
+``config["configurable"]["budget"]``. LangGraph hands the same configurable
+values to nested subgraphs, so every node and tool of a supervised request sees
+the same object. Nodes use it to bound their model calls, degrade when the
+deadline is close (skip optional steps, reuse cached tool results, switch to a
+smaller model) and record what they spent.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import asyncio
+import math
+import threading
+import time
+
+from .cancellation import operation
+from .hedging import hedged
+from .scheduler import estimate_tokens, is_rate_limit_error, model_scheduler, priority_for, retry_after, tenant_for
+
+
+# Remaining time below which nodes start to degrade
+SKIP_OPTIONAL_BELOW_S = 3.0
+USE_CACHED_TOOLS_BELOW_S = 4.0
+USE_SMALL_MODEL_BELOW_S = 6.0
+# Fraction of the cost budget after which nodes switch to a smaller model
+USE_SMALL_MODEL_ABOVE_COST = 0.8
+
+# Smaller model used by each model when the budget runs low
+SMALLER_MODELS = {
+    "gpt-4o": "gpt-4o-mini",
+    "claude-3-5-sonnet-latest": "claude-3-5-haiku-latest",
+    "gemini-1.5-pro": "gemini-1.5-flash",
+}
+
+# USD per million (input, output) tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "claude-3-5-sonnet-latest": (3.00, 15.00),
+    "claude-3-5-haiku-latest": (0.80, 4.00),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs past its deadline."""
+
+
+class Budget:
+    """Deadline and spend limits for one request, with per-component accounting."""
+
+    def __init__(
+        self,
+        deadline_ms: Optional[float] = None,
+        max_cost_usd: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        self._clock = clock
+        self.started = clock()
+        self.deadline = self.started + deadline_ms / 1000 if deadline_ms is not None else None
+        self.max_cost_usd = max_cost_usd
+        self.spent: Dict[str, Dict[str, float]] = {}
+        self.degradations: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    # Time
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline (infinite when there is none)."""
+        if self.deadline is None:
+            return math.inf
+        return self.deadline - self._clock()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, component: str) -> None:
+        """Raise ``DeadlineExceeded`` if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded(f"{component}: deadline exceeded")
+
+    def timeout(self) -> Optional[float]:
+        """Timeout to apply to the next blocking call, or None when unbounded."""
+        return None if self.deadline is None else max(self.remaining(), 0.0)
+
+    # Degradation decisions
+
+    def should_skip_optional(self, component: str) -> bool:
+        """Whether an optional step such as re-classification should be skipped."""
+        return self.degrade(component, "skipped", self.remaining() < SKIP_OPTIONAL_BELOW_S)
+
+    def should_use_cached_tools(self, component: str) -> bool:
+        """Whether tools should answer from cached results instead of a fresh lookup."""
+        return self.degrade(component, "cached tools", self.remaining() < USE_CACHED_TOOLS_BELOW_S)
+
+    def model_for(self, component: str, model: str) -> str:
+        """The model a component should call: ``model`` or its smaller sibling."""
+        low_time = self.remaining() < USE_SMALL_MODEL_BELOW_S
+        low_money = (
+            self.max_cost_usd is not None
+            and self.cost() >= self.max_cost_usd * USE_SMALL_MODEL_ABOVE_COST
+        )
+        smaller = SMALLER_MODELS.get(model)
+        if smaller and self.degrade(component, f"model {smaller}", low_time or low_money):
+            return smaller
+        return model
+
+    def degrade(self, component: str, action: str, condition: bool = True) -> bool:
+        """Record that ``component`` degraded with ``action`` when ``condition`` holds."""
+        if condition:
+            with self._lock:
+                self.degradations[component] = action
+        return condition
+
+    # Accounting
+
+    def record(
+        self,
+        component: str,
+        seconds: float = 0.0,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        model: Optional[str] = None,
+    ) -> None:
+        """Add time, tokens and the resulting cost to a component's spend."""
+        cost = 0.0
+        if model in MODEL_PRICES:
+            input_price, output_price = MODEL_PRICES[model]
+            cost = (input_tokens * input_price + output_tokens * output_price) / 1e6
+        with self._lock:
+            entry = self.spent.setdefault(component, {
+                "calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+            })
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += cost
+
+    @contextmanager
+    def track(self, component: str) -> Iterator[None]:
+        """Record the wall-clock time spent inside the block."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(component, seconds=self._clock() - start)
+
+    def cost(self) -> float:
+        with self._lock:
+            return sum(entry["cost_usd"] for entry in self.spent.values())
+
+    def tokens(self) -> int:
+        with self._lock:
+            return sum(entry["input_tokens"] + entry["output_tokens"] for entry in self.spent.values())
+
+    def report(self) -> Dict[str, Any]:
+        """Summary of the request's spend, suitable for logging or returning."""
+        with self._lock:
+            return {
+                "elapsed_s": round(self._clock() - self.started, 3),
+                "remaining_s": None if self.deadline is None else round(self.deadline - self._clock(), 3),
+                "cost_usd": round(sum(e["cost_usd"] for e in self.spent.values()), 6),
+                "components": {name: dict(entry) for name, entry in self.spent.items()},
+                "degradations": dict(self.degradations),
+            }
+
+
+def get_budget(config: Optional[Dict[str, Any]]) -> Budget:
+    """The request's budget from ``config["configurable"]``, or a new unbounded one."""
+    budget = ((config or {}).get("configurable") or {}).get("budget")
+    return budget if isinstance(budget, Budget) else Budget()
+
+
+def budget_config(budget: Budget, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Copy of ``config`` with ``budget`` placed in its configurable values."""
+    config = dict(config or {})
+    config["configurable"] = {**(config.get("configurable") or {}), "budget": budget}
+    return config
+
+
+async def invoke_model(
+    runnable: Any,
+    model_input: Any,
+    config: Optional[Dict[str, Any]],
+    component: str,
+    model: Optional[str] = None,
+    hedge: bool = False,
+) -> Any:
+    """Call ``runnable.ainvoke`` bounded by the request deadline and record its spend.
+
+    The call waits for a slot from ``model_scheduler`` and is registered as an
+    operation of the current run, so cancelling the run cancels it. Raises
+    ``DeadlineExceeded`` if the call, including its time queued, does not
+    finish before the deadline. With ``hedge`` set, a slow call is raced
+    against a duplicate (see ``hedging``).
+    """
+    budget = get_budget(config)
+    budget.check(component)
+    start = time.monotonic()
+
+    async def call() -> Any:
+        async with model_scheduler.slot(
+            model or "unknown", estimate_tokens(model_input), priority_for(component, config), tenant_for(config),
+        ) as permit:
+            try:
+                response = await runnable.ainvoke(model_input, config)
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    permit.throttle(retry_after(e))
+                raise
+            usage = getattr(response, "usage_metadata", None) or {}
+            permit.settle(usage.get("total_tokens"))
+            return response
+
+    with operation(component) as op:
+        try:
+            attempt = hedged(call, component, estimate_tokens(model_input, output_tokens=0)) if hedge else call()
+            response = await asyncio.wait_for(attempt, timeout=budget.timeout())
+        except asyncio.TimeoutError as e:
+            budget.record(component, seconds=time.monotonic() - start, model=model)
+            raise DeadlineExceeded(f"{component}: deadline exceeded") from e
+        usage = getattr(response, "usage_metadata", None) or {}
+        op.tokens = usage.get("output_tokens", 0)
+
+    budget.record(
+        component,
+        seconds=time.monotonic() - start,
+        input_tokens=usage.get("input_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+        model=model,
+    )
+    return response
@@ -0,0 +1,194 @@
+"""
+Bulkheads and circuit breakers for sub-agents.
+
+Every sub-agent shares the event loop and the provider connections, so one
+that misbehaves (stuck in long streams, sleeping, failing) can hold resources
+that the router and the other agents need. ``Bulkheads.guard`` wraps a
+sub-agent node with:
+
+- a bulkhead: at most ``max_concurrency`` runs of the agent at once; a run
+  that cannot get a slot within ``queue_timeout`` is not started;
+- a circuit breaker that opens after ``failure_threshold`` consecutive
+  failures, where a failure is an exception or a run slower than
+  ``slo_seconds``; after ``cooldown`` seconds one probe run is let through
+  (half-open) and its outcome closes or reopens the breaker.
+
+Runs that are rejected, short-circuited or fail are answered by the fallback
+node instead, so the user gets a fast reply rather than a queue or an error.
+The fallback is a node function returning only its new messages; they are
+returned after the messages it was given, the way a sub-agent graph returns
+its whole state, so callers such as the supervisor's fan-out see one shape.
+"""
+
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+import asyncio
+import logging
+import time
+
+from .providers import BREAKER_COOLDOWN_S, FAILURE_THRESHOLD, CircuitBreaker
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a run waits for a bulkhead slot before falling back
+DEFAULT_QUEUE_TIMEOUT_S = 0.5
+
+
+class AgentPolicy:
+    """Bulkhead and breaker settings of one sub-agent. ``None`` means unlimited."""
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT_S,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN_S,
+        slo_seconds: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.slo_seconds = slo_seconds
+
+
+async def call_node(node: Any, state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a node: a compiled graph through ``ainvoke``, or a node function."""
+    if hasattr(node, "ainvoke"):
+        return await node.ainvoke(state, config) or {}
+    return await node(state, config) or {}
+
+
+def _as_graph_result(state: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """``update`` of a node function with its messages following ``state``'s."""
+    return {**update, "messages": list(state.get("messages") or []) + list(update.get("messages") or [])}
+
+
+class Bulkhead:
+    """Concurrency limit with a FIFO of waiters; a released slot passes straight to the next."""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def enter(self, timeout: float) -> bool:
+        """Take a slot, waiting up to ``timeout`` seconds; False if none freed up."""
+        if self.limit is None or (self.in_flight < self.limit and not self.waiting()):
+            self.in_flight += 1
+            return True
+        if timeout <= 0:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the wait ended: pass it on
+                self.exit()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+        return True
+
+    def exit(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AgentGuard:
+    """Bulkhead, breaker and counters of one sub-agent."""
+
+    def __init__(self, name: str, policy: AgentPolicy, clock=time.monotonic):
+        self.name = name
+        self.policy = policy
+        self.bulkhead = Bulkhead(policy.max_concurrency)
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.cooldown, clock)
+        self.counts = {"calls": 0, "succeeded": 0, "failed": 0, "slo_breaches": 0, "rejected": 0, "short_circuited": 0}
+        self._clock = clock
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "times_opened": self.breaker.times_opened,
+            "in_flight": self.bulkhead.in_flight,
+            "waiting": self.bulkhead.waiting(),
+            "max_concurrency": self.policy.max_concurrency,
+            **self.counts,
+        }
+
+
+class Bulkheads:
+    """Guards of every wrapped sub-agent, by node name."""
+
+    def __init__(self, clock=time.monotonic):
+        self.guards: Dict[str, AgentGuard] = {}
+        self._clock = clock
+
+    def guard(
+        self,
+        name: str,
+        node: Any,
+        policy: AgentPolicy,
+        fallback: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    ) -> Callable:
+        """Node running ``node`` behind ``name``'s bulkhead and breaker, else ``fallback``."""
+        guard = self.guards[name] = AgentGuard(name, policy, self._clock)
+
+        async def answer(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+            return _as_graph_result(state, await fallback(state, config) or {})
+
+        async def guarded(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+            guard.counts["calls"] += 1
+            if not guard.breaker.allow():
+                guard.counts["short_circuited"] += 1
+                return await answer(state, config)
+            if not await guard.bulkhead.enter(policy.queue_timeout):
+                guard.counts["rejected"] += 1
+                # The breaker let this run through; a probe that never ran decides nothing
+                guard.breaker.probing = False
+                return await answer(state, config)
+
+            start = self._clock()
+            try:
+                result = await call_node(node, state, config)
+            except asyncio.CancelledError:
+                guard.breaker.probing = False
+                raise
+            except Exception:
+                logger.exception("%s failed; answering with the fallback", name)
+                result = None
+            finally:
+                guard.bulkhead.exit()
+
+            if result is None:
+                guard.counts["failed"] += 1
+                guard.breaker.failure()
+                return await answer(state, config)
+            if policy.slo_seconds is not None and self._clock() - start > policy.slo_seconds:
+                guard.counts["slo_breaches"] += 1
+                guard.breaker.failure()
+            else:
+                guard.counts["succeeded"] += 1
+                guard.breaker.success()
+            return result
+
+        guarded.__name__ = f"guarded_{name}"
+        return guarded
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: guard.snapshot() for name, guard in self.guards.items()}
+
+
+# Process-wide guards, reported by the server's /stats endpoint
+bulkheads = Bulkheads()
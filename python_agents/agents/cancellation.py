@@ -0,0 +1,297 @@
+"""
+Structured cancellation of agent runs.
+
+A ``RunHandle`` owns the task of one run. The handle is stored in a context
+variable when the run starts; asyncio tasks and ``run_in_thread`` jobs copy the
+context, so every nested subgraph node, model stream and tool job of the run
+can find it. ``RunHandle.cancel`` cancels the run's task tree, wakes tool
+threads blocked in ``sleep`` and waits, up to a bounded time, until every
+registered operation has unwound.
+
+Model calls and streams register themselves as operations. An operation that
+is cut short by cancellation counts the seconds and output tokens it would
+still have used, estimated from completed operations of the same component,
+towards ``cancellation_metrics``.
+"""
+
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Set
+import asyncio
+import threading
+import time
+import uuid
+
+from .scheduler import estimate_tokens, model_scheduler, priority_for, tenant_for
+
+
+# Upper bound on how long cancel() waits for the task tree to unwind
+CANCEL_TIMEOUT = 2.0
+# Weight of the newest completion in the per-component expectations
+EXPECTATION_ALPHA = 0.2
+
+
+class RunCancelled(Exception):
+    """Raised in tool threads when their run has been cancelled."""
+
+
+class CancellationMetrics:
+    """Counters for cancelled runs and the work cancellation avoided."""
+
+    def __init__(self):
+        self.runs_cancelled = 0
+        self.operations_cancelled = 0
+        self.seconds_saved = 0.0
+        self.tokens_saved = 0
+        self.teardown_seconds_max = 0.0
+        self.orphaned = 0
+        # component -> [expected seconds, expected output tokens]
+        self._expected: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def record_completed(self, component: str, seconds: float, tokens: int) -> None:
+        with self._lock:
+            expected = self._expected.get(component)
+            if expected is None:
+                self._expected[component] = [seconds, float(tokens)]
+            else:
+                expected[0] += EXPECTATION_ALPHA * (seconds - expected[0])
+                expected[1] += EXPECTATION_ALPHA * (tokens - expected[1])
+
+    def record_cancelled(self, component: str, seconds: float, tokens: int) -> None:
+        with self._lock:
+            self.operations_cancelled += 1
+            expected = self._expected.get(component)
+            if expected is not None:
+                self.seconds_saved += max(expected[0] - seconds, 0.0)
+                self.tokens_saved += int(max(expected[1] - tokens, 0))
+
+    def record_teardown(self, seconds: float, orphaned: int) -> None:
+        with self._lock:
+            self.runs_cancelled += 1
+            self.teardown_seconds_max = max(self.teardown_seconds_max, seconds)
+            self.orphaned += orphaned
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "runs_cancelled": self.runs_cancelled,
+                "operations_cancelled": self.operations_cancelled,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "tokens_saved": self.tokens_saved,
+                "teardown_seconds_max": round(self.teardown_seconds_max, 3),
+                "orphaned": self.orphaned,
+            }
+
+
+# Process-wide metrics, reported by the server's /stats endpoint
+cancellation_metrics = CancellationMetrics()
+
+current_run: ContextVar[Optional["RunHandle"]] = ContextVar("current_run", default=None)
+
+
+class Operation:
+    """One in-flight model call, stream or tool job of a run."""
+
+    def __init__(self, component: str):
+        self.component = component
+        self.started = time.monotonic()
+        self.tokens = 0
+
+
+class RunHandle:
+    """Handle to one agent run; ``cancel`` tears down everything the run started."""
+
+    def __init__(self, run_id: Optional[str] = None, metrics: CancellationMetrics = cancellation_metrics):
+        self.run_id = run_id or str(uuid.uuid4())
+        self.metrics = metrics
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_reason: Optional[str] = None
+        self._event = threading.Event()
+        self._operations: Set[Operation] = set()
+        self._children: Set[asyncio.Task] = set()
+        self._threads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def start(self, coro) -> asyncio.Task:
+        """Run ``coro`` in a new task that carries this handle in its context."""
+        token = current_run.set(self)
+        try:
+            self.task = asyncio.ensure_future(coro)
+        finally:
+            current_run.reset(token)
+        return self.task
+
+    async def run(self, coro, reason: str = "caller cancelled") -> Any:
+        """Start ``coro`` and wait for it, cancelling the run if the caller is cancelled."""
+        task = self.start(coro)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            await self.cancel(reason)
+            raise
+
+    async def cancel(self, reason: str = "cancelled", timeout: float = CANCEL_TIMEOUT) -> bool:
+        """Cancel the run and wait up to ``timeout`` seconds for it to unwind.
+
+        Returns True if no task, operation or tool thread of the run was left
+        running.
+        """
+        if self.cancelled:
+            return not self.pending()
+        self.cancel_reason = reason
+        self._event.set()
+        start = time.monotonic()
+        deadline = start + timeout
+
+        tasks = [task for task in [self.task, *self._children] if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        # Tool threads notice the event on their next sleep or check
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+        orphaned = self.pending()
+        self.metrics.record_teardown(time.monotonic() - start, orphaned)
+        return not orphaned
+
+    def pending(self) -> int:
+        """Number of tasks, operations and tool threads of the run still running."""
+        with self._lock:
+            running = len(self._operations) + self._threads
+        tasks = [self.task, *self._children]
+        return running + sum(1 for task in tasks if task is not None and not task.done())
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Run ``coro`` in a background task that is cancelled with the run."""
+        task = asyncio.ensure_future(coro)
+        self._children.add(task)
+        task.add_done_callback(self._children.discard)
+        return task
+
+    def check(self) -> None:
+        """Raise ``RunCancelled`` if the run has been cancelled."""
+        if self._event.is_set():
+            raise RunCancelled(self.cancel_reason or "cancelled")
+
+    def sleep(self, seconds: float) -> None:
+        """Blocking sleep that returns early, raising ``RunCancelled``, on cancel."""
+        if self._event.wait(seconds):
+            raise RunCancelled(self.cancel_reason or "cancelled")
+
+    @contextmanager
+    def operation(self, component: str) -> Iterator[Operation]:
+        op = Operation(component)
+        with self._lock:
+            self._operations.add(op)
+        try:
+            yield op
+        except (asyncio.CancelledError, RunCancelled):
+            self.metrics.record_cancelled(component, time.monotonic() - op.started, op.tokens)
+            raise
+        else:
+            self.metrics.record_completed(component, time.monotonic() - op.started, op.tokens)
+        finally:
+            with self._lock:
+                self._operations.discard(op)
+
+
+@contextmanager
+def operation(component: str) -> Iterator[Operation]:
+    """Register an operation with the current run, if there is one.
+
+    Set ``tokens`` on the yielded operation to the output tokens produced so far.
+    """
+    handle = current_run.get()
+    if handle is None:
+        op = Operation(component)
+        yield op
+        cancellation_metrics.record_completed(component, time.monotonic() - op.started, op.tokens)
+        return
+    with handle.operation(component) as op:
+        yield op
+
+
+def spawn(coro) -> asyncio.Task:
+    """Start ``coro`` in a background task owned by the current run, if there is one."""
+    handle = current_run.get()
+    return asyncio.ensure_future(coro) if handle is None else handle.spawn(coro)
+
+
+def sleep(seconds: float) -> None:
+    """``time.sleep`` that is cut short when the current run is cancelled."""
+    handle = current_run.get()
+    if handle is None:
+        time.sleep(seconds)
+    else:
+        handle.sleep(seconds)
+
+
+async def run_in_thread(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking function in the default executor as part of the current run.
+
+    The thread sees the run in its context, so ``sleep`` inside it returns as
+    soon as the run is cancelled, and ``RunHandle.cancel`` waits for it.
+    """
+    handle = current_run.get()
+    if handle is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    # Whichever of the thread and the awaiting side gets the lock first
+    # decides who gives the thread count back
+    started = released = False
+
+    def job() -> Any:
+        nonlocal started
+        with handle._lock:
+            if released:
+                raise RunCancelled(handle.cancel_reason or "cancelled")
+            started = True
+        try:
+            handle.check()
+            return func(*args, **kwargs)
+        finally:
+            with handle._lock:
+                handle._threads -= 1
+
+    with handle._lock:
+        handle._threads += 1
+    try:
+        return await asyncio.to_thread(job)
+    except asyncio.CancelledError:
+        # Cancelled while still queued in the executor: the job never runs
+        with handle._lock:
+            if not started:
+                released = True
+                handle._threads -= 1
+        raise
+
+
+async def astream_model(
+    runnable: Any,
+    model_input: Any,
+    component: str,
+    config: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> AsyncIterator[Any]:
+    """Iterate ``runnable.astream`` as an operation of the current run.
+
+    The stream holds a ``model_scheduler`` slot until it ends. It is closed as
+    soon as iteration stops, including on cancellation, so the provider
+    connection is released immediately.
+    """
+    tokens = estimate_tokens(model_input)
+    with operation(component) as op:
+        async with model_scheduler.slot(model or "unknown", tokens, priority_for(component, config), tenant_for(config)) as permit:
+            async with aclosing(runnable.astream(model_input, config)) as stream:
+                async for chunk in stream:
+                    op.tokens += 1
+                    yield chunk
+            # Prompt estimate plus the chunks actually streamed
+            permit.settle(estimate_tokens(model_input, output_tokens=op.tokens))
@@ -0,0 +1,174 @@
+"""
+Small-model-first cascades.
+
+A ``Cascade`` pairs a pool of small, cheap models with a pool of large ones.
+``invoke_cascade`` calls the small pool first and checks the response with the
+node's validator, which returns a reason to escalate (invalid tool call, route
+outside the allowed set, unparseable dates, low confidence) or None to accept
+it. Only rejected responses are retried on the large pool. A tier with no
+provider credentials configured is left out: the other tier serves every
+call. Escalations, latency and cost per tier are recorded per node in
+``cascade_stats``.
+"""
+
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import threading
+import time
+
+from .budget import budget_config, get_budget
+from .providers import (
+    Capability, ModelBalancer, ModelPool, NoModelAvailable, configured_models, invoke_pool, model_balancer,
+)
+
+
+SMALL_MODELS = ["gpt-4o-mini", "claude-3-5-haiku-latest", "gemini-1.5-flash"]
+LARGE_MODELS = ["gpt-4o", "claude-3-5-sonnet-latest", "gemini-1.5-pro"]
+
+# Self-reported confidence below which a small model's decision is escalated
+MIN_CONFIDENCE = 0.7
+
+
+class Cascade:
+    """Small and large model pools with the same capabilities and options."""
+
+    def __init__(
+        self,
+        capabilities: Iterable[Capability],
+        small: List[str] = SMALL_MODELS,
+        large: List[str] = LARGE_MODELS,
+        **options: Any,
+    ):
+        capabilities = list(capabilities)
+        self.small = ModelPool(capabilities, small, **options)
+        self.large = ModelPool(capabilities, large, **options)
+
+
+class CascadeStats:
+    """Per-node counts of accepted and escalated calls, with time and cost per tier."""
+
+    def __init__(self):
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _node(self, component: str) -> Dict[str, Any]:
+        node = self._nodes.get(component)
+        if node is None:
+            node = self._nodes[component] = {
+                "calls": 0,
+                "escalated": 0,
+                "reasons": Counter(),
+                "small_seconds": 0.0,
+                "large_seconds": 0.0,
+                "small_cost_usd": 0.0,
+                "large_cost_usd": 0.0,
+            }
+        return node
+
+    def record(self, component: str, tier: str, seconds: float, cost: float, first: bool = False) -> None:
+        """Time and cost of one tier; ``first`` if it was the first tier the call tried."""
+        with self._lock:
+            node = self._node(component)
+            if first:
+                node["calls"] += 1
+            node[f"{tier}_seconds"] += seconds
+            node[f"{tier}_cost_usd"] += cost
+
+    def record_escalation(self, component: str, reason: str) -> None:
+        with self._lock:
+            node = self._node(component)
+            node["escalated"] += 1
+            node["reasons"][reason] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                component: {
+                    "calls": node["calls"],
+                    "escalated": node["escalated"],
+                    "escalation_rate": round(node["escalated"] / node["calls"], 4) if node["calls"] else 0.0,
+                    "reasons": dict(node["reasons"]),
+                    "small_seconds": round(node["small_seconds"], 3),
+                    "large_seconds": round(node["large_seconds"], 3),
+                    "cost_usd": round(node["small_cost_usd"] + node["large_cost_usd"], 6),
+                }
+                for component, node in self._nodes.items()
+            }
+
+
+# Process-wide statistics, reported by the server's /stats endpoint
+cascade_stats = CascadeStats()
+
+
+def tool_call_errors(response: Any, tools: List[Any]) -> Optional[str]:
+    """Why the response's tool calls do not fit ``tools``' schemas, or None if they all do."""
+    schemas = {tool.name: tool.args_schema for tool in tools}
+    for tool_call in getattr(response, "tool_calls", None) or []:
+        name = tool_call.get("name")
+        if name not in schemas:
+            return f"unknown tool {name}"
+        schema = schemas[name]
+        if schema is None or not hasattr(schema, "model_validate"):
+            continue
+        try:
+            schema.model_validate(tool_call.get("args") or {})
+        except Exception:
+            return f"invalid {name} arguments"
+    return None
+
+
+def low_confidence(args: Dict[str, Any], threshold: float = MIN_CONFIDENCE) -> bool:
+    """Whether a tool call's self-reported ``confidence`` is missing or below ``threshold``."""
+    try:
+        return float(args.get("confidence")) < threshold
+    except (TypeError, ValueError):
+        return True
+
+
+async def invoke_cascade(
+    cascade: Cascade,
+    build: Callable[[Any], Any],
+    model_input: Any,
+    config: Optional[Dict[str, Any]],
+    component: str,
+    validate: Callable[[Any], Optional[str]],
+    hedge: bool = False,
+    stats: CascadeStats = cascade_stats,
+    balancer: ModelBalancer = model_balancer,
+) -> Any:
+    """``invoke_pool`` on the small pool, escalating to the large pool when
+    ``validate`` returns a reason for the small model's response.
+
+    Without credentials for any small model the large pool is called
+    directly; without any for the large models the small model's response
+    is returned even if rejected, as there is nothing to escalate to.
+    """
+    budget = get_budget(config)
+    # The same budget must see both tiers so their spend can be told apart
+    config = budget_config(budget, config)
+    large_configured = bool(configured_models(cascade.large))
+    try_small = not large_configured or bool(configured_models(cascade.small))
+
+    def spent() -> float:
+        return budget.spent.get(component, {}).get("cost_usd", 0.0)
+
+    if try_small:
+        start, cost = time.monotonic(), spent()
+        try:
+            response = await invoke_pool(cascade.small, build, model_input, config, component, hedge=hedge, balancer=balancer)
+            reason = validate(response)
+        except NoModelAvailable:
+            response, reason = None, "small models unavailable"
+        except (ValueError, TypeError) as e:
+            # Structured output that fails to parse surfaces as a validation error
+            response, reason = None, f"unparseable output ({type(e).__name__})"
+        stats.record(component, "small", time.monotonic() - start, spent() - cost, first=True)
+        if reason is None or (response is not None and not large_configured):
+            return response
+        stats.record_escalation(component, reason)
+
+    start, cost = time.monotonic(), spent()
+    try:
+        return await invoke_pool(cascade.large, build, model_input, config, component, hedge=hedge, balancer=balancer)
+    finally:
+        stats.record(component, "large", time.monotonic() - start, spent() - cost, first=not try_small)
@@ -0,0 +1,465 @@
+"""
+Record and replay of chat model calls.
+
+``record(path)`` wraps every provider's chat models so that each call, from
+any node, is appended to a cassette file with the time each streamed chunk
+arrived. ``replay(path)`` serves the same calls from the cassette instead of
+the provider, with no network or API keys, yielding each chunk at its
+recorded time (scaled by ``time_scale``; 0 replays without waiting), so
+streaming behaviour can be benchmarked against real response shapes.
+
+Calls are keyed by their normalized request: the messages (with tool call
+ids numbered in order of appearance, and UUIDs and timestamps in text
+masked), the bound tools, tool choice and stop sequences. The model name is
+not part of the key, so a replay does not depend on which model of a pool the
+balancer picks. A request recorded several times is replayed in recording
+order, and its last recording repeats after that.
+
+A cassette file is the magic, then the records, each ``<payload length>
+<16-byte key> <zlib-compressed JSON>``, then an open-addressing hash table
+of ``(key, record offset)`` slots and a trailer locating it. ``Cassette``
+memory-maps the file and probes the table in place, so opening is O(1)
+however many calls it holds, and a lookup reads one slot run and one record.
+The table is written when the recording is closed; recording into an existing
+cassette appends to it, and a cassette whose recording crashed before closing
+is indexed when it is next opened.
+
+Structured output is recorded as the forced tool call that
+``with_structured_output`` binds, which every provider here supports.
+"""
+
+from functools import partial, reduce
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .providers import PROVIDER_FACTORIES, _chat_models
+
+
+logger = logging.getLogger("python_agents.cassettes")
+
+MAGIC = b"AGCASS1\n"
+# payload length, request key
+RECORD_HEADER = struct.Struct("<I16s")
+# request key, record offset (0: empty slot)
+SLOT = struct.Struct("<16sQ")
+# index offset, slot count, record count, magic
+TRAILER = struct.Struct("<QQQ8s")
+# Slots per record at least; keeps probe runs short
+LOAD_FACTOR = 2
+
+# Text that differs between runs of the same conversation
+_VOLATILE = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?"
+    r"|\b1\d{9}\.\d+\b",
+    re.IGNORECASE,
+)
+
+
+class CassetteMiss(KeyError):
+    """The cassette holds no recording of a request."""
+
+
+def _normalize_text(text: str) -> str:
+    return _VOLATILE.sub("<volatile>", text).strip()
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return _normalize_text(content)
+    return [
+        {**block, "text": _normalize_text(block["text"])} if isinstance(block, dict) and "text" in block else block
+        for block in content or []
+    ]
+
+
+def request_key(
+    messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]] = None, tool_choice: Any = None, stop: Any = None,
+) -> bytes:
+    """16-byte key of a chat model request; equal for requests that only differ by ids and timestamps."""
+    call_ids: Dict[str, str] = {}
+
+    def call_id(value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return call_ids.setdefault(value, f"call_{len(call_ids)}")
+
+    normalized = []
+    for message in messages:
+        item: Dict[str, Any] = {"type": message.type, "content": _normalize_content(message.content)}
+        for call in getattr(message, "tool_calls", None) or []:
+            item.setdefault("tool_calls", []).append([call["name"], call["args"], call_id(call.get("id"))])
+        if getattr(message, "tool_call_id", None):
+            item["tool_call_id"] = call_id(message.tool_call_id)
+        normalized.append(item)
+    request = {"messages": normalized, "tools": tools or [], "tool_choice": tool_choice, "stop": stop}
+    data = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).digest()
+
+
+def _slot(key: bytes, slots: int) -> int:
+    return int.from_bytes(key[:8], "little") & (slots - 1)
+
+
+def _scan(data: Any, end: int) -> List[Tuple[bytes, int]]:
+    """(key, offset) of every complete record before ``end``, in file order."""
+    entries = []
+    offset = len(MAGIC)
+    while offset + RECORD_HEADER.size <= end:
+        length, key = RECORD_HEADER.unpack_from(data, offset)
+        if offset + RECORD_HEADER.size + length > end:
+            # Torn by a crash mid-write
+            break
+        entries.append((key, offset))
+        offset += RECORD_HEADER.size + length
+    return entries
+
+
+def _records_end(data: Any) -> Optional[int]:
+    """Where the records of an indexed cassette end; None if it has no index."""
+    if len(data) < len(MAGIC) + TRAILER.size:
+        return None
+    index_offset, _, _, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+    return index_offset if magic == MAGIC else None
+
+
+class CassetteWriter:
+    """Appends records to a cassette file; ``close`` writes its index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: List[Tuple[bytes, int]] = []
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{path} is not a cassette")
+                self._entries = _scan(data, _records_end(data) or len(data))
+                end = len(MAGIC)
+                if self._entries:
+                    last = self._entries[-1][1]
+                    end = last + RECORD_HEADER.size + RECORD_HEADER.unpack_from(data, last)[0]
+            self._file = open(path, "r+b")
+            # Drop the old index (and a torn record); the new one covers every record
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(MAGIC)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: bytes, record: Dict[str, Any]) -> None:
+        payload = zlib.compress(json.dumps(record, separators=(",", ":"), default=str).encode())
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(RECORD_HEADER.pack(len(payload), key) + payload)
+            self._entries.append((key, offset))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            slots = 8
+            while slots < LOAD_FACTOR * len(self._entries):
+                slots *= 2
+            table = bytearray(slots * SLOT.size)
+            # In record order, so a key's recordings lie along its probe run in that order
+            for key, offset in self._entries:
+                slot = _slot(key, slots)
+                while SLOT.unpack_from(table, slot * SLOT.size)[1]:
+                    slot = (slot + 1) & (slots - 1)
+                SLOT.pack_into(table, slot * SLOT.size, key, offset)
+            index_offset = self._file.tell()
+            self._file.write(table)
+            self._file.write(TRAILER.pack(index_offset, slots, len(self._entries), MAGIC))
+            self._file.close()
+
+
+class Cassette:
+    """Read-only, memory-mapped cassette; ``next(key)`` replays a request's recordings in order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a cassette")
+        if _records_end(data) is None:
+            data.close()
+            logger.warning("%s was not closed after recording; indexing it", path)
+            CassetteWriter(path).close()
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = data
+        self._index_offset, self._slots, self.records, _ = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        self._played: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self.records
+
+    def offset(self, key: bytes, occurrence: int = 0) -> Optional[int]:
+        """Offset of the ``occurrence``-th recording of ``key``, or its last; None if never recorded."""
+        slot = _slot(key, self._slots)
+        found = None
+        seen = 0
+        while True:
+            slot_key, offset = SLOT.unpack_from(self._data, self._index_offset + slot * SLOT.size)
+            if not offset:
+                return found
+            if slot_key == key:
+                found = offset
+                if seen == occurrence:
+                    return found
+                seen += 1
+            slot = (slot + 1) & (self._slots - 1)
+
+    def read(self, offset: int) -> Dict[str, Any]:
+        length, _ = RECORD_HEADER.unpack_from(self._data, offset)
+        start = offset + RECORD_HEADER.size
+        return json.loads(zlib.decompress(self._data[start:start + length]))
+
+    def next(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """The next recording of ``key`` to replay; None if it was never recorded."""
+        with self._lock:
+            occurrence = self._played.get(key, 0)
+            self._played[key] = occurrence + 1
+        offset = self.offset(key, occurrence)
+        if offset is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.read(offset)
+
+    def rewind(self) -> None:
+        """Replay every request from its first recording again."""
+        with self._lock:
+            self._played.clear()
+
+    def close(self) -> None:
+        self._data.close()
+
+
+def _chunk_fields(message: BaseMessage) -> Dict[str, Any]:
+    """JSON fields of an ``AIMessageChunk`` equivalent to ``message``, without empty ones."""
+    if isinstance(message, AIMessageChunk):
+        tool_call_chunks = list(message.tool_call_chunks)
+    else:
+        tool_call_chunks = [
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call.get("id"), "index": i}
+            for i, call in enumerate(getattr(message, "tool_calls", None) or [])
+        ]
+    fields = {
+        "content": message.content,
+        "tool_call_chunks": tool_call_chunks,
+        "usage_metadata": getattr(message, "usage_metadata", None),
+        "response_metadata": message.response_metadata,
+    }
+    return {name: value for name, value in fields.items() if value or name == "content"}
+
+
+# Config of the recorded model's own call: its events are already this model's
+_UNTRACED = {"callbacks": []}
+
+
+def _is_end_marker(chunk: BaseMessage) -> bool:
+    """The empty chunk ``astream`` ends a stream with; the replaying model adds its own."""
+    return getattr(chunk, "chunk_position", None) == "last" and _chunk_fields(chunk) == {"content": ""}
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model that records the calls of ``chat_model`` into ``recorder``,
+    or, without a ``chat_model``, replays them from ``cassette``.
+
+    A replayed chunk is yielded ``time_scale`` times its recorded delay after
+    the call started. A request the cassette does not hold goes to
+    ``fallback`` if set, and raises ``CassetteMiss`` otherwise.
+    """
+
+    model: str
+    chat_model: Optional[Any] = None
+    recorder: Optional[Any] = None
+    cassette: Optional[Any] = None
+    time_scale: float = 1.0
+    fallback: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools: Any, *, tool_choice: Any = None, **kwargs: Any) -> Any:
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_choice=tool_choice, **kwargs)
+
+    def _request(self, messages: List[BaseMessage], stop: Any, kwargs: Dict[str, Any]) -> Tuple[bytes, Any]:
+        """Key of the request, and the recorded model bound to its tools."""
+        tools, tool_choice = kwargs.get("tools"), kwargs.get("tool_choice")
+        runnable = self.chat_model
+        if runnable is not None and tools:
+            runnable = runnable.bind_tools(tools, tool_choice=tool_choice) if tool_choice else runnable.bind_tools(tools)
+        return request_key(messages, tools, tool_choice, stop), runnable
+
+    def _recording(self, key: bytes, messages: List[BaseMessage]) -> Optional[Dict[str, Any]]:
+        record = self.cassette.next(key)
+        if record is None and self.fallback is None:
+            last = messages[-1].content if messages else ""
+            raise CassetteMiss(f"{self.cassette.path} has no recording of this request (last message: {str(last)[:80]!r})")
+        return record
+
+    def _delay(self, start: float, offset_ms: float) -> float:
+        return start + offset_ms / 1000 * self.time_scale - time.monotonic()
+
+    @staticmethod
+    def _message(record: Dict[str, Any]) -> AIMessage:
+        chunks = [AIMessageChunk(**fields) for _, fields in record["chunks"]]
+        return message_chunk_to_message(reduce(lambda a, b: a + b, chunks, AIMessageChunk(content="")))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key, runnable = self._request(messages, stop, kwargs)
+        start = time.monotonic()
+        if runnable is not None:
+            message = runnable.invoke(messages, _UNTRACED, stop=stop)
+            self.recorder.add(key, {"model": self.model, "chunks": [[_elapsed_ms(start), _chunk_fields(message)]]})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        record = self._recording(key, messages)
+        if record is None:
+            return self.fallback._generate(messages, stop, run_manager, **kwargs)
+        time.sleep(max(0.0, self._delay(start, record["chunks"][-1][0])))
+        return ChatResult(generations=[ChatGeneration(message=self._message(record))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key, runnable = self._request(messages, stop, kwargs)
+        start = time.monotonic()
+        if runnable is not None:
+            message = await runnable.ainvoke(messages, _UNTRACED, stop=stop)
+            self.recorder.add(key, {"model": self.model, "chunks": [[_elapsed_ms(start), _chunk_fields(message)]]})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        record = self._recording(key, messages)
+        if record is None:
+            return await self.fallback._agenerate(messages, stop, run_manager, **kwargs)
+        await asyncio.sleep(max(0.0, self._delay(start, record["chunks"][-1][0])))
+        return ChatResult(generations=[ChatGeneration(message=self._message(record))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key, runnable = self._request(messages, stop, kwargs)
+        start = time.monotonic()
+        if runnable is not None:
+            chunks = []
+            for chunk in runnable.stream(messages, _UNTRACED, stop=stop):
+                if _is_end_marker(chunk):
+                    continue
+                chunks.append([_elapsed_ms(start), _chunk_fields(chunk)])
+                yield ChatGenerationChunk(message=chunk)
+            self.recorder.add(key, {"model": self.model, "chunks": chunks})
+            return
+        record = self._recording(key, messages)
+        if record is None:
+            yield from self.fallback._stream(messages, stop, run_manager, **kwargs)
+            return
+        for offset_ms, fields in record["chunks"]:
+            time.sleep(max(0.0, self._delay(start, offset_ms)))
+            yield ChatGenerationChunk(message=AIMessageChunk(**fields))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key, runnable = self._request(messages, stop, kwargs)
+        start = time.monotonic()
+        if runnable is not None:
+            chunks = []
+            async for chunk in runnable.astream(messages, _UNTRACED, stop=stop):
+                if _is_end_marker(chunk):
+                    continue
+                chunks.append([_elapsed_ms(start), _chunk_fields(chunk)])
+                yield ChatGenerationChunk(message=chunk)
+            self.recorder.add(key, {"model": self.model, "chunks": chunks})
+            return
+        record = self._recording(key, messages)
+        if record is None:
+            async for chunk in self.fallback._astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+        for offset_ms, fields in record["chunks"]:
+            # Against the call's start, so sleep overshoot does not add up over a long reply
+            delay = self._delay(start, offset_ms)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(**fields))
+
+
+# Provider factories before ``record`` or ``replay`` wrapped them
+_original_factories: Optional[Dict[str, Callable[..., Any]]] = None
+
+
+def _wrap_factories(wrap: Callable[..., Any]) -> None:
+    global _original_factories
+    stop()
+    _original_factories = dict(PROVIDER_FACTORIES)
+    for provider, factory in _original_factories.items():
+        PROVIDER_FACTORIES[provider] = partial(wrap, factory)
+    # Models built before must not bypass the cassette
+    _chat_models.clear()
+
+
+def record(path: str) -> CassetteWriter:
+    """Record every chat model call into the cassette at ``path``, appending if it exists.
+
+    Close the returned writer when done; ``stop`` restores the providers.
+    """
+    writer = CassetteWriter(path)
+
+    def wrap(factory: Callable[..., Any], model: str, **options: Any) -> CassetteChatModel:
+        return CassetteChatModel(model=model, chat_model=factory(model, **options), recorder=writer)
+
+    _wrap_factories(wrap)
+    return writer
+
+
+def replay(path: str, time_scale: float = 1.0, fallback: bool = False) -> Cassette:
+    """Serve every chat model call from the cassette at ``path``.
+
+    With ``fallback``, a request it does not hold goes to the provider's model
+    (or whatever its factory builds, e.g. a fake) instead of raising
+    ``CassetteMiss``.
+    """
+    cassette = Cassette(path)
+
+    def wrap(factory: Callable[..., Any], model: str, **options: Any) -> CassetteChatModel:
+        return CassetteChatModel(
+            model=model, cassette=cassette, time_scale=time_scale,
+            fallback=factory(model, **options) if fallback else None,
+        )
+
+    _wrap_factories(wrap)
+    return cassette
+
+
+def stop() -> None:
+    """Undo ``record`` or ``replay``: models come from the providers again."""
+    global _original_factories
+    if _original_factories is None:
+        return
+    PROVIDER_FACTORIES.update(_original_factories)
+    _original_factories = None
+    _chat_models.clear()
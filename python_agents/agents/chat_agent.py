@@ -4,10 +4,10 @@ Chat Agent - A simple chat agent without tools or generative UI components.
 
 from typing import Dict, Any, List
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 
 from .types import GenerativeUIAnnotation
+from .providers import ModelPool, invoke_pool
 
 
 # Create annotation for chat agent
@@ -15,11 +15,11 @@ ChatAgentAnnotation = GenerativeUIAnnotation.Root({
     "messages": GenerativeUIAnnotation.spec["messages"]
 })
 
+CHAT_MODELS = ModelPool([], ["gpt-4o-mini", "claude-3-5-haiku-latest", "gemini-1.5-flash"])
 
-async def chat_node(state: Dict[str, Any]) -> Dict[str, Any]:
+
+async def chat_node(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
     """Simple chat node that processes messages with an LLM."""
-    model = ChatOpenAI(model="gpt-4o-mini")
-    
     # Convert state messages to proper format
     messages = []
     for msg in state.get("messages", []):
@@ -35,7 +35,7 @@ async def chat_node(state: Dict[str, Any]) -> Dict[str, Any]:
     system_message = HumanMessage(content="You are a helpful assistant.")
     messages.insert(0, system_message)
     
-    response = await model.ainvoke(messages)
+    response = await invoke_pool(CHAT_MODELS, lambda model: model, messages, config, "chat")
     
     return {
         "messages": [response]
@@ -0,0 +1,187 @@
+"""
+Downsampling of series-valued UI props.
+
+Long price histories are reduced on the server before they are pushed to the
+UI, keeping roughly one point per device pixel of the client's chart. Two
+methods are available: Largest-Triangle-Three-Buckets (LTTB), which preserves
+the visual shape of a line, and a min/max envelope, which preserves extremes.
+"""
+
+from typing import Any, Dict, List, Optional
+import math
+
+import numpy as np
+
+
+# Chart width assumed when the client does not report its viewport
+DEFAULT_VIEWPORT_WIDTH = 768
+MIN_POINTS = 32
+MAX_POINTS = 4096
+
+# Keys that mark a list of dicts as a series of points
+X_KEYS = ("time", "timestamp", "date", "x")
+# Preferred value columns, in order, when choosing which column to preserve
+Y_KEYS = ("close", "price", "value", "y")
+
+METHODS = ("lttb", "minmax")
+
+
+def target_points(config: Optional[Dict[str, Any]]) -> int:
+    """Number of points worth sending for the client's viewport.
+
+    Reads ``viewport_width`` (CSS pixels) and ``device_pixel_ratio`` from
+    ``config["configurable"]``; values that are not positive numbers fall
+    back to the defaults.
+    """
+    configurable = (config or {}).get("configurable", {}) or {}
+    width = _positive(configurable.get("viewport_width"), DEFAULT_VIEWPORT_WIDTH)
+    ratio = _positive(configurable.get("device_pixel_ratio"), 1.0)
+    return int(min(MAX_POINTS, max(MIN_POINTS, math.ceil(min(width * ratio, MAX_POINTS)))))
+
+
+def _positive(value: Any, default: float) -> float:
+    """``value`` as a finite positive float; ``default`` for anything else the client sent."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return default
+    try:
+        value = float(value)
+    except ValueError:
+        return default
+    return value if math.isfinite(value) and value > 0 else default
+
+
+def downsample_method(config: Optional[Dict[str, Any]]) -> str:
+    """Method named by ``downsample_method`` in ``config["configurable"]``.
+
+    Comes from the client, so an unknown name falls back to ``"lttb"`` rather
+    than failing the run at its first chart.
+    """
+    configurable = (config or {}).get("configurable", {}) or {}
+    method = configurable.get("downsample_method")
+    return method if method in METHODS else "lttb"
+
+
+def lttb_indices(y: np.ndarray, threshold: int, x: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    Bucket boundaries and bucket averages are computed for all buckets at once;
+    only the choice of the largest triangle, which depends on the point picked
+    in the previous bucket, runs once per output point.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    buckets = threshold - 2
+    edges = (np.floor(np.arange(buckets + 1) * ((n - 2) / buckets)) + 1).astype(np.int64)
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+
+    csum_x = np.concatenate([[0.0], np.cumsum(x)])
+    csum_y = np.concatenate([[0.0], np.cumsum(y)])
+    # Average of the bucket after each bucket; the last one looks at the final point
+    next_x = np.empty(buckets)
+    next_y = np.empty(buckets)
+    next_x[:-1] = (csum_x[edges[2:]] - csum_x[edges[1:-1]]) / counts[1:]
+    next_y[:-1] = (csum_y[edges[2:]] - csum_y[edges[1:-1]]) / counts[1:]
+    next_x[-1] = x[-1]
+    next_y[-1] = y[-1]
+
+    out = np.empty(threshold, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(buckets):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the minimum and maximum of each bucket, plus both endpoints."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+
+    buckets = (threshold - 2) // 2
+    size = math.ceil(n / buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    # Trailing buckets can be entirely padding when n is small
+    valid = offsets < n
+    lows = offsets[valid] + np.nanargmin(grid[valid], axis=1)
+    highs = offsets[valid] + np.nanargmax(grid[valid], axis=1)
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+
+def downsample_indices(y: np.ndarray, threshold: int, method: str = "lttb") -> np.ndarray:
+    """Indices of the points to keep from ``y`` using ``method``."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    y = np.asarray(y, dtype=float)
+    if np.isnan(y).any():
+        # Gaps only affect which points are picked, not the values sent
+        y = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+    if method == "minmax":
+        return minmax_indices(y, threshold)
+    return lttb_indices(y, threshold)
+
+
+def _value_key(row: Dict[str, Any]) -> Optional[str]:
+    for key in Y_KEYS:
+        if isinstance(row.get(key), (int, float)):
+            return key
+    for key, value in row.items():
+        if key not in X_KEYS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return key
+    return None
+
+
+def _is_series(value: Any) -> bool:
+    if not isinstance(value, list) or not value:
+        return False
+    first = value[0]
+    if isinstance(first, dict):
+        return any(key in first for key in X_KEYS) and _value_key(first) is not None
+    return isinstance(first, (int, float)) and not isinstance(first, bool)
+
+
+def downsample_series(series: List[Any], max_points: int, method: str = "lttb") -> List[Any]:
+    """Reduce a list of numbers or point dicts to at most ``max_points`` entries."""
+    if len(series) <= max_points:
+        return series
+    if isinstance(series[0], dict):
+        key = _value_key(series[0])
+        y = np.fromiter(
+            (row.get(key) if row.get(key) is not None else np.nan for row in series),
+            dtype=float, count=len(series),
+        )
+    else:
+        y = np.asarray(series, dtype=float)
+    return [series[i] for i in downsample_indices(y, max_points, method)]
+
+
+def downsample_props(props: Dict[str, Any], max_points: int, method: str = "lttb") -> Dict[str, Any]:
+    """Downsample every series-valued prop longer than ``max_points``.
+
+    Props that are not series are returned untouched; the input dict is never
+    mutated.
+    """
+    updated = None
+    for name, value in props.items():
+        if _is_series(value) and len(value) > max_points:
+            if updated is None:
+                updated = dict(props)
+            updated[name] = downsample_series(value, max_points, method)
+    return props if updated is None else updated
+
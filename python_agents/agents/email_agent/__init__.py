@@ -16,8 +16,8 @@ def route_after_interrupt(state: EmailAgentState) -> str:
     if not response_type or response_type == "ignore":
         return END
     if response_type == "response":
-        return "rewrite_email"
-    return "send_email"
+        return "rewriteEmail"
+    return "sendEmail"
 
 
 def route_after_writing_email(state: EmailAgentState) -> str:
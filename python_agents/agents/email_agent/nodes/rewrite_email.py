@@ -3,16 +3,17 @@ Rewrite email node for email agent.
 """
 
 from typing import Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 
 from ..types import EmailAgentState, EmailAgentUpdate
+from ...providers import ModelPool, invoke_pool
 
 
-async def rewrite_email(state: EmailAgentState) -> EmailAgentUpdate:
+REWRITE_EMAIL_MODELS = ModelPool([], ["gpt-4o", "claude-3-5-sonnet-latest", "gemini-1.5-pro"], temperature=0)
+
+
+async def rewrite_email(state: EmailAgentState, config: Dict[str, Any]) -> EmailAgentUpdate:
     """Rewrite the email based on human feedback."""
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    
     email = state.get("email", {})
     human_response = state.get("human_response", {})
     
@@ -22,7 +23,7 @@ async def rewrite_email(state: EmailAgentState) -> EmailAgentUpdate:
         HumanMessage(content=f"Original email: To: {email.get('to')}, Subject: {email.get('subject')}, Body: {email.get('body')}")
     ]
     
-    response = await model.ainvoke(messages)
+    response = await invoke_pool(REWRITE_EMAIL_MODELS, lambda model: model, messages, config, "email_agent.rewrite_email")
     
     # Update email with rewritten content
     updated_email = email.copy()
@@ -2,12 +2,13 @@
 Write email node for email agent.
 """
 
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, Optional
 from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel, Field
 
 from ..types import EmailAgentState, EmailAgentUpdate
+from ...cascade import Cascade, invoke_cascade
+from ...providers import Capability
 
 
 class EmailSchema(BaseModel):
@@ -17,10 +18,22 @@ class EmailSchema(BaseModel):
     body: str = Field(description="Email body content")
 
 
-async def write_email(state: EmailAgentState) -> EmailAgentUpdate:
+WRITE_EMAIL_MODELS = Cascade([Capability.STRUCTURED_OUTPUT], temperature=0)
+
+
+def validate_email(response: Any) -> Optional[str]:
+    """Reason to escalate a drafted email, or None to accept it."""
+    if not isinstance(response, EmailSchema):
+        return "no email"
+    if "@" not in response.to:
+        return "invalid recipient"
+    if not response.subject.strip() or not response.body.strip():
+        return "empty subject or body"
+    return None
+
+
+async def write_email(state: EmailAgentState, config: Dict[str, Any]) -> EmailAgentUpdate:
     """Write an email based on user input."""
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    
     # Format messages
     messages = []
     for msg in state.get("messages", []):
@@ -40,8 +53,14 @@ async def write_email(state: EmailAgentState) -> EmailAgentUpdate:
     messages.insert(0, system_message)
     
     # Use structured output to extract email details
-    structured_model = model.with_structured_output(EmailSchema)
-    response = await structured_model.ainvoke(messages)
+    response = await invoke_cascade(
+        WRITE_EMAIL_MODELS,
+        lambda model: model.with_structured_output(EmailSchema),
+        messages,
+        config,
+        "email_agent.write_email",
+        validate_email,
+    )
     
     # Create email object
     email = {
@@ -0,0 +1,159 @@
+"""
+Hedged model calls for latency-critical nodes.
+
+A hedged call sends the request once and, if it has not returned after the
+component's observed p95 latency, sends a duplicate. Whichever attempt finishes
+first wins and the other is cancelled. Hedges are paid for out of a global
+budget that earns ``HEDGE_BUDGET`` of a hedge per call, so hedging adds at most
+about that fraction of extra calls however slow the provider gets.
+"""
+
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+import asyncio
+import threading
+import time
+
+
+# Extra calls allowed, as a fraction of all hedged-eligible calls
+HEDGE_BUDGET = 0.05
+# Unused hedge budget that may accumulate, in hedges
+HEDGE_BURST = 10.0
+# Latency percentile after which the duplicate is sent
+HEDGE_PERCENTILE = 0.95
+# Completed calls a component needs before it is hedged at all
+MIN_SAMPLES = 20
+# Latencies kept per component
+LATENCY_SAMPLES = 512
+# Never hedge sooner than this, however fast the component usually is
+MIN_HEDGE_DELAY_S = 0.05
+
+
+class HedgeMetrics:
+    """Latency history per component, the hedge budget and hedge counters."""
+
+    def __init__(self, budget: float = HEDGE_BUDGET, burst: float = HEDGE_BURST):
+        self.budget = budget
+        self.burst = burst
+        self.credit = burst
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self.tokens_wasted = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def threshold(self, component: str) -> Optional[float]:
+        """Seconds to wait before hedging ``component``; None until it has enough samples."""
+        with self._lock:
+            samples = self._latencies.get(component)
+            if samples is None or len(samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return max(ordered[min(int(HEDGE_PERCENTILE * len(ordered)), len(ordered) - 1)], MIN_HEDGE_DELAY_S)
+
+    def record_latency(self, component: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._latencies.get(component)
+            if samples is None:
+                samples = self._latencies[component] = deque(maxlen=LATENCY_SAMPLES)
+            samples.append(seconds)
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.credit = min(self.burst, self.credit + self.budget)
+
+    def try_hedge(self) -> bool:
+        """Spend one hedge from the budget, if there is one left."""
+        with self._lock:
+            if self.credit < 1.0:
+                self.denied += 1
+                return False
+            self.credit -= 1.0
+            self.hedges += 1
+            return True
+
+    def record_outcome(self, hedge_won: bool, tokens_wasted: int) -> None:
+        with self._lock:
+            self.hedge_wins += int(hedge_won)
+            self.tokens_wasted += tokens_wasted
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "denied": self.denied,
+                "tokens_wasted": self.tokens_wasted,
+            }
+
+
+# Process-wide metrics, reported by the server's /stats endpoint
+hedge_metrics = HedgeMetrics()
+
+
+def _tokens_used(response: Any) -> int:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("total_tokens", 0)
+
+
+async def hedged(
+    attempt: Callable[[], Awaitable[Any]],
+    component: str,
+    prompt_tokens: int = 0,
+    metrics: HedgeMetrics = hedge_metrics,
+) -> Any:
+    """Await ``attempt()``, starting a second ``attempt()`` if the first is slow.
+
+    ``prompt_tokens`` is what a cancelled attempt is assumed to have cost: the
+    provider has read the prompt by the time the attempt is cut short.
+    """
+    metrics.record_call()
+    start = time.monotonic()
+    first = asyncio.ensure_future(attempt())
+    attempts = [first]
+    delay = metrics.threshold(component)
+    try:
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done or not metrics.try_hedge():
+            response = await first
+            metrics.record_latency(component, time.monotonic() - start)
+            return response
+
+        hedge_start = time.monotonic()
+        second = asyncio.ensure_future(attempt())
+        attempts.append(second)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                # A failed attempt does not decide the race while the other is still running
+                error = next(iter(done)).exception()
+                continue
+
+            loser = second if winner is first else first
+            wasted = 0
+            if not loser.done():
+                loser.cancel()
+                await asyncio.gather(loser, return_exceptions=True)
+                wasted = prompt_tokens
+            elif loser.exception() is None:
+                wasted = _tokens_used(loser.result())
+            metrics.record_outcome(winner is second, wasted)
+            began = hedge_start if winner is second else start
+            metrics.record_latency(component, time.monotonic() - began)
+            return winner.result()
+        raise error
+    finally:
+        # Only reached with attempts still running if the caller was cancelled
+        unfinished = [task for task in attempts if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
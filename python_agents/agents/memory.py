@@ -0,0 +1,362 @@
+"""
+Memory accounting of conversation threads.
+
+A thread's state (``messages``, ``ui``, ``trip_details``, ``email``,
+``plan``, ...) is returned by every run and carried into the next one, so
+what a conversation costs is the size of that state, and it grows with the
+conversation: every message, every UI item, model replies kept in UI
+metadata. ``thread_memory`` keeps, for the most recently active threads, the
+estimated retained size of each channel of the state their latest run
+returned; ``top`` gives the heaviest ones, and a state over ``cap_bytes`` is
+logged (and counted in ``/metrics``) as soon as a run returns it.
+
+Sizes are ``sys.getsizeof`` summed over everything the state references,
+each object counted once: a message referenced from both ``messages`` and a
+UI item's metadata is counted in the channel listed first in
+``CHANNELS``. ``Telemetry`` records the state of every finished run whose
+config names a ``thread_id`` (``thread_config``); runs without one are not
+measured. Walking a large state takes tens of milliseconds, so it is done by
+a background thread (``measure_later``) rather than on the event loop; a
+state still waiting to be measured is replaced by the thread's next one.
+
+``trace_allocations`` is the on-demand counterpart: a tracemalloc diff of
+what was allocated and not freed around a block, e.g. one run.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+logger = logging.getLogger(__name__)
+
+# Channels measured first, in this order; the rest of the state follows
+CHANNELS = ("messages", "ui", "trip_details", "email", "plan")
+# Threads tracked, the most recently active ones
+MAX_THREADS = 10000
+# Objects visited per measured state; past it the size is a lower bound
+MAX_OBJECTS = 1_000_000
+# States waiting for the background thread; more are dropped, not queued
+MAX_PENDING = 1000
+# Frames of the allocation traceback kept by tracemalloc
+TRACEMALLOC_FRAMES = 8
+
+_LEAVES = (str, bytes, bytearray, int, float, bool, complex, type(None))
+_NOT_DATA = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+_CONTAINERS = (list, tuple, set, frozenset)
+# type -> names of its slots, __dict__ and __weakref__ aside
+_slots: Dict[type, Tuple[str, ...]] = {}
+
+
+def _slot_names(cls: type) -> Tuple[str, ...]:
+    names = _slots.get(cls)
+    if names is None:
+        found: List[str] = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name not in ("__dict__", "__weakref__") and name not in found:
+                    found.append(name)
+        names = _slots[cls] = tuple(found)
+    return names
+
+
+def retained_size(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """Estimated bytes held by ``obj`` and everything it references that is not in ``seen``.
+
+    ``seen`` (object ids) is updated, so measuring several objects with the
+    same set counts what they share once.
+    """
+    seen = set() if seen is None else seen
+    total, visited = 0, 0
+    pending = [obj]
+    while pending and visited < MAX_OBJECTS:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, _NOT_DATA):
+            continue
+        seen.add(id(current))
+        visited += 1
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, _LEAVES):
+            continue
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            pending.extend(current)
+        else:
+            # Objects, including pydantic models (messages): their __dict__ and slots
+            attributes = getattr(current, "__dict__", None)
+            if isinstance(attributes, dict):
+                pending.append(attributes)
+            for name in _slot_names(type(current)):
+                value = getattr(current, name, None)
+                if value is not None:
+                    pending.append(value)
+    return total
+
+
+def state_size(state: Dict[str, Any]) -> Dict[str, int]:
+    """Bytes of each channel of ``state``; what channels share is counted in the first one."""
+    seen: Set[int] = set()
+    sizes = {}
+    for channel in [c for c in CHANNELS if c in state] + [c for c in state if c not in CHANNELS]:
+        sizes[channel] = retained_size(state[channel], seen)
+    return sizes
+
+
+def thread_config(config: Optional[Dict[str, Any]], thread_id: Optional[str]) -> Dict[str, Any]:
+    """Copy of ``config`` naming ``thread_id`` in its configurable values and its metadata."""
+    config = dict(config or {})
+    if thread_id is not None:
+        config["configurable"] = {**(config.get("configurable") or {}), "thread_id": thread_id}
+        # Callback handlers see metadata, not configurable values
+        config["metadata"] = {**(config.get("metadata") or {}), "thread_id": thread_id}
+    return config
+
+
+class ThreadUsage:
+    """Size of a thread's state as of its latest run."""
+
+    __slots__ = ("thread_id", "agent", "channels", "bytes", "runs", "updated", "over_cap")
+
+    def __init__(self, thread_id: str, agent: str):
+        self.thread_id = thread_id
+        self.agent = agent
+        self.channels: Dict[str, int] = {}
+        self.bytes = 0
+        self.runs = 0
+        self.updated = 0.0
+        self.over_cap = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "thread_id": self.thread_id,
+            "agent": self.agent,
+            "bytes": self.bytes,
+            "channels": dict(sorted(self.channels.items(), key=lambda item: -item[1])),
+            "runs": self.runs,
+            "updated": self.updated,
+            "over_cap": self.over_cap,
+        }
+
+
+class ThreadMemory:
+    """Size of the state of the most recently active threads; see the module docstring."""
+
+    def __init__(self, max_threads: int = MAX_THREADS, cap_bytes: Optional[int] = None):
+        self.max_threads = max_threads
+        self.cap_bytes = cap_bytes
+        self._threads: "OrderedDict[str, ThreadUsage]" = OrderedDict()
+        self._lock = threading.Lock()
+        # thread_id -> (agent, state, callback) waiting for the measuring thread
+        self._pending: "OrderedDict[str, Tuple[str, Dict[str, Any], Optional[Callable[[ThreadUsage], None]]]]" = OrderedDict()
+        self._measuring = 0
+        self._changed = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self.dropped = 0
+
+    def configure(self, cap_bytes: Optional[int] = None, max_threads: Optional[int] = None) -> None:
+        """Warn about states over ``cap_bytes``; track at most ``max_threads`` threads."""
+        self.cap_bytes = cap_bytes
+        if max_threads is not None:
+            self.max_threads = max_threads
+
+    def record(self, thread_id: Optional[str], agent: str, state: Dict[str, Any]) -> ThreadUsage:
+        """Measure ``state``, the latest state of ``thread_id`` (a one-off run when None)."""
+        channels = state_size(state)
+        usage = ThreadUsage(thread_id or "", agent)
+        if thread_id is not None:
+            with self._lock:
+                usage = self._threads.pop(thread_id, None) or usage
+                self._threads[thread_id] = usage
+                while len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+        usage.agent = agent
+        usage.channels = channels
+        usage.bytes = sum(channels.values())
+        usage.runs += 1
+        usage.updated = time.time()
+        usage.over_cap = self.cap_bytes is not None and usage.bytes > self.cap_bytes
+        if usage.over_cap:
+            heaviest = max(channels, key=channels.get)
+            logger.warning(
+                "state of thread %s (%s) is %d bytes, over the cap of %d; heaviest channel %s: %d bytes",
+                thread_id or "(none)", agent, usage.bytes, self.cap_bytes, heaviest, channels[heaviest],
+            )
+        return usage
+
+    def measure_later(
+        self,
+        thread_id: str,
+        agent: str,
+        state: Dict[str, Any],
+        done: Optional[Callable[[ThreadUsage], None]] = None,
+    ) -> bool:
+        """Have the background thread ``record`` ``state`` and pass the usage to ``done``.
+
+        False, and nothing measured, when ``MAX_PENDING`` other threads' states
+        are already waiting.
+        """
+        with self._lock:
+            if thread_id not in self._pending and len(self._pending) >= MAX_PENDING:
+                self.dropped += 1
+                return False
+            self._pending.pop(thread_id, None)
+            self._pending[thread_id] = (agent, state, done)
+            # A worker started before a fork does not run in the child
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._worker = threading.Thread(target=self._measure_pending, name="thread-memory", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+            self._changed.notify_all()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every state passed to ``measure_later`` is measured; False on timeout."""
+        with self._lock:
+            return self._changed.wait_for(lambda: not self._pending and not self._measuring, timeout)
+
+    def _measure_pending(self) -> None:
+        while True:
+            with self._lock:
+                self._changed.wait_for(lambda: self._pending)
+                thread_id, (agent, state, done) = self._pending.popitem(last=False)
+                self._measuring += 1
+            try:
+                usage = self.record(thread_id, agent, state)
+                if done is not None:
+                    done(usage)
+            except Exception:
+                # E.g. a dict of the state changed size while it was walked
+                logger.debug("could not measure the state of thread %s", thread_id, exc_info=True)
+            finally:
+                with self._lock:
+                    self._measuring -= 1
+                    self._changed.notify_all()
+
+    def get(self, thread_id: str) -> Optional[ThreadUsage]:
+        return self._threads.get(thread_id)
+
+    def forget(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def top(self, n: int = 10) -> List[ThreadUsage]:
+        """The ``n`` threads with the largest state."""
+        with self._lock:
+            threads = list(self._threads.values())
+        return heapq.nlargest(n, threads, key=lambda usage: usage.bytes)
+
+    def summary(self, n: int = 10) -> Dict[str, Any]:
+        """Totals by channel and agent, for capacity planning, and the ``n`` heaviest threads."""
+        with self._lock:
+            threads = list(self._threads.values())
+        channels: Dict[str, int] = {}
+        agents: Dict[str, Dict[str, int]] = {}
+        for usage in threads:
+            for channel, size in usage.channels.items():
+                channels[channel] = channels.get(channel, 0) + size
+            entry = agents.setdefault(usage.agent, {"threads": 0, "bytes": 0})
+            entry["threads"] += 1
+            entry["bytes"] += usage.bytes
+        return {
+            "threads": len(threads),
+            "bytes": sum(channels.values()),
+            "cap_bytes": self.cap_bytes,
+            "over_cap": sum(1 for usage in threads if usage.over_cap),
+            "dropped": self.dropped,
+            "channels": dict(sorted(channels.items(), key=lambda item: -item[1])),
+            "agents": agents,
+            "top": [usage.to_dict() for usage in heapq.nlargest(n, threads, key=lambda usage: usage.bytes)],
+        }
+
+
+class AllocationDiff:
+    """What a ``trace_allocations`` block allocated and did not free, by source line."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.stats: List[tracemalloc.StatisticDiff] = []
+        self.seconds = 0.0
+
+    @property
+    def bytes(self) -> int:
+        return sum(stat.size_diff for stat in self.stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "top": [
+                {
+                    "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "bytes": stat.size_diff,
+                    "blocks": stat.count_diff,
+                }
+                for stat in self.stats[:self.limit]
+            ],
+        }
+
+    def format(self) -> str:
+        lines = [f"allocated and kept: {self.bytes / 1024:+.1f} KiB in {self.seconds:.2f}s"]
+        for stat in self.stats[:self.limit]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+7d} blocks  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines)
+
+
+# Blocks inside ``trace_allocations``, and whether they started tracemalloc
+_tracing = 0
+_started = False
+_tracing_lock = threading.Lock()
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+@contextmanager
+def trace_allocations(limit: int = 20, key_type: str = "lineno") -> Iterator[AllocationDiff]:
+    """Diff tracemalloc snapshots around the block; the diff is filled in on exit.
+
+    tracemalloc traces the whole process, so runs concurrent with the block
+    show up in its diff too. It is started for the block unless it already
+    runs, and slows allocation down while it does.
+    """
+    global _tracing, _started
+    with _tracing_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _started = True
+        _tracing += 1
+    diff = AllocationDiff(limit)
+    before = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    start = time.monotonic()
+    try:
+        yield diff
+    finally:
+        diff.seconds = time.monotonic() - start
+        after = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        diff.stats = [stat for stat in after.compare_to(before, key_type) if stat.size_diff > 0]
+        with _tracing_lock:
+            _tracing -= 1
+            if _tracing == 0 and _started:
+                # Left running when it was already on before the first block
+                tracemalloc.stop()
+                _started = False
+
+
+# Threads of every run reported to ``telemetry``
+thread_memory = ThreadMemory()
@@ -3,7 +3,6 @@ Executor node for open code agent.
 """
 
 from typing import Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 import uuid
 import time
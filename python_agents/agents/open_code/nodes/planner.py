@@ -3,16 +3,17 @@ Planner node for open code agent.
 """
 
 from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 
 from ..types import OpenCodeState, OpenCodeUpdate
+from ...providers import ModelPool, invoke_pool
 
 
-async def planner(state: OpenCodeState) -> OpenCodeUpdate:
+PLANNER_MODELS = ModelPool([], ["gpt-4o", "claude-3-5-sonnet-latest", "gemini-1.5-pro"], temperature=0)
+
+
+async def planner(state: OpenCodeState, config: Dict[str, Any]) -> OpenCodeUpdate:
     """Plan the code generation steps."""
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    
     # Format messages
     messages = []
     for msg in state.get("messages", []):
@@ -31,7 +32,7 @@ async def planner(state: OpenCodeState) -> OpenCodeUpdate:
     )
     messages.insert(0, system_message)
     
-    response = await model.ainvoke(messages)
+    response = await invoke_pool(PLANNER_MODELS, lambda model: model, messages, config, "open_code.planner")
     
     # Create a static plan for demonstration
     plan = [
@@ -5,12 +5,12 @@ Pizza Orderer Agent - Handles pizza ordering.
 import asyncio
 from typing import Dict, Any
 from langgraph.graph import StateGraph, START, END
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel, Field
 import uuid
 
 from .types import GenerativeUIAnnotation
+from .providers import Capability, ModelPool, invoke_pool
 
 
 class FindShopSchema(BaseModel):
@@ -31,19 +31,16 @@ PizzaOrdererAnnotation = GenerativeUIAnnotation.Root({
     "messages": GenerativeUIAnnotation.spec["messages"]
 })
 
+PIZZA_MODELS = ModelPool([Capability.STRUCTURED_OUTPUT], ["claude-3-5-sonnet-latest", "gpt-4o", "gemini-1.5-pro"], temperature=0)
+
 
 async def sleep(ms: int = 5000) -> None:
     """Sleep for specified milliseconds."""
     await asyncio.sleep(ms / 1000)
 
 
-async def find_store(state: Dict[str, Any]) -> Dict[str, Any]:
+async def find_store(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
     """Find a pizza store for the user."""
-    model = ChatAnthropic(
-        model="claude-3-5-sonnet-latest",
-        temperature=0
-    ).with_structured_output(FindShopSchema)
-    
     # Format messages
     messages = []
     for msg in state.get("messages", []):
@@ -60,7 +57,13 @@ async def find_store(state: Dict[str, Any]) -> Dict[str, Any]:
     )
     messages.insert(0, system_message)
     
-    response = await model.ainvoke(messages)
+    response = await invoke_pool(
+        PIZZA_MODELS,
+        lambda model: model.with_structured_output(FindShopSchema),
+        messages,
+        config,
+        "pizza_orderer.find_store",
+    )
     
     await sleep()
     
@@ -77,15 +80,10 @@ async def find_store(state: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-async def order_pizza(state: Dict[str, Any]) -> Dict[str, Any]:
+async def order_pizza(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
     """Order pizza for the user."""
     await sleep(1500)
     
-    model = ChatAnthropic(
-        model="claude-3-5-sonnet-latest",
-        temperature=0
-    ).with_structured_output(PlaceOrderSchema)
-    
     # Format messages
     messages = []
     for msg in state.get("messages", []):
@@ -102,7 +100,13 @@ async def order_pizza(state: Dict[str, Any]) -> Dict[str, Any]:
     )
     messages.insert(0, system_message)
     
-    response = await model.ainvoke(messages)
+    response = await invoke_pool(
+        PIZZA_MODELS,
+        lambda model: model.with_structured_output(PlaceOrderSchema),
+        messages,
+        config,
+        "pizza_orderer.order_pizza",
+    )
     
     # Create tool response
     tool_response = {
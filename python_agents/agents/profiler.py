@@ -0,0 +1,428 @@
+"""
+Event loop stalls and critical paths of graph runs (``run.py --profile``).
+
+A ``Profiler`` is a ``Telemetry`` handler that, while attached (``attach``),
+sees every run started in the calling context, keeps the span tree of each,
+and watches the event loop they run on:
+
+- a heartbeat task wakes every ``HEARTBEAT_MS`` on the loop; when it is late
+  by ``stall_ms`` or more, something held the loop (a ``time.sleep`` in a
+  tool, CPU-bound work in a node) and no other run made progress meanwhile.
+  A watchdog thread samples the loop thread's stack while the heartbeat is
+  overdue, and each stall is attributed to the innermost node, tool or model
+  call on those stacks;
+- after the runs, each one's critical path: from the end of a span, the child
+  that finished last, then the child that finished last before that one
+  started, and so on down the tree. It is the chain of nodes (and of the tools
+  and model calls in them) that set the run's end-to-end latency. Part of it
+  is reported as avoidable serialization: tool calls of one node that ran one
+  after the other although a model turn's tool calls are independent, and
+  stalls that held up the run while another call blocked the loop.
+
+``report`` is the JSON report and ``folded`` the same data as folded stacks
+(``frame;frame;frame weight`` lines, weights in microseconds) for
+flamegraph.pl, inferno or speedscope: critical paths under ``critical``,
+stall stack samples under ``stall``.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from langchain_core.tracers.context import register_configure_hook
+
+from .telemetry import Span, Telemetry
+
+
+DEFAULT_STALL_MS = 50.0
+# Heartbeat period on the loop; lateness is measured against it
+HEARTBEAT_MS = 10.0
+# Innermost frames kept of a stack sample
+MAX_FRAMES = 64
+# Runs kept for the report, the most recent ones
+MAX_RUNS = 1000
+
+# Profiler attached to the runs of the current context, see ``Profiler.attach``
+_current_profiler: ContextVar[Optional["Profiler"]] = ContextVar("agent_profiler", default=None)
+register_configure_hook(_current_profiler, inheritable=True)
+
+
+class Stall:
+    """The event loop not running from ``start_ns`` to ``end_ns``."""
+
+    __slots__ = ("expected_ns", "start_ns", "end_ns", "samples")
+
+    def __init__(self, expected_ns: int):
+        # Monotonic time the heartbeat was due; identifies the stall while it lasts
+        self.expected_ns = expected_ns
+        self.start_ns = 0
+        self.end_ns = 0
+        # (span the stack was in, folded stack) -> samples
+        self.samples: Dict[Tuple[Optional[Span], str], int] = {}
+
+    @property
+    def ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    @property
+    def span(self) -> Optional[Span]:
+        """The span most samples were in; a stall may run through several calls."""
+        counts: Dict[Optional[Span], int] = {}
+        for (span, _), count in self.samples.items():
+            counts[span] = counts.get(span, 0) + count
+        return max(counts, key=lambda span: (counts[span], span is not None), default=None)
+
+    def stacks(self) -> Dict[str, int]:
+        """Samples by folded stack, prefixed by the path of the span they were in."""
+        stacks: Dict[str, int] = {}
+        for (span, stack), count in self.samples.items():
+            key = ";".join(_names(span)[1:] + [stack])
+            stacks[key] = stacks.get(key, 0) + count
+        return stacks
+
+
+def _names(span: Optional[Span]) -> List[str]:
+    """Span names from the run's root down to ``span``."""
+    names = []
+    while span is not None:
+        names.append(span.name)
+        span = span.parent
+    return names[::-1]
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _overlap_ns(start: int, end: int, intervals: List[Tuple[int, int]]) -> int:
+    """Time of ``start..end`` covered by the union of ``intervals``."""
+    total, cursor = 0, start
+    for a, b in sorted(intervals):
+        a, b = max(a, cursor), min(b, end)
+        if b > a:
+            total += b - a
+            cursor = b
+    return total
+
+
+class Profiler(Telemetry):
+    """Span trees of the runs it is attached to, and the stalls of their event loop."""
+
+    def __init__(self, stall_ms: float = DEFAULT_STALL_MS):
+        super().__init__()
+        self.stall_ms = stall_ms
+        self.stalls: List[Stall] = []
+        self.runs: Deque[Tuple[Span, List[Span]]] = deque(maxlen=MAX_RUNS)
+        self.runs_seen = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # Monotonic time the heartbeat is due, None while no loop is watched
+        self._expected_ns: Optional[int] = None
+        self._stall: Optional[Stall] = None
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    @contextmanager
+    def attach(self) -> Iterator["Profiler"]:
+        """Profile every run started in this context (and the tasks it creates) until exit."""
+        token = _current_profiler.set(self)
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        try:
+            yield self
+        finally:
+            _current_profiler.reset(token)
+            self._stopped.set()
+            task = self._heartbeat_task
+            if task is not None and not task.done():
+                task.get_loop().call_soon_threadsafe(task.cancel)
+
+    # Spans
+
+    def _retains(self) -> bool:
+        return True
+
+    def _export(self, root: Span, spans: List[Span]) -> None:
+        with self._lock:
+            self.runs.append((root, spans))
+            self.runs_seen += 1
+
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id is None:
+            self._watch_loop()
+        super().on_chain_start(serialized, inputs, run_id=run_id, parent_run_id=parent_run_id, **kwargs)
+
+    # Event loop
+
+    def _watch_loop(self) -> None:
+        """Start the heartbeat on the running loop, unless it already runs there."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # A synchronous run: nothing to stall
+            return
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        # Due now: a node blocking before the task first runs is a stall too
+        self._expected_ns = time.monotonic_ns()
+        # Outside the run's context, which would attach this profiler to it
+        self._heartbeat_task = loop.create_task(self._heartbeat(), context=Context())
+
+    async def _heartbeat(self) -> None:
+        interval_ns = int(HEARTBEAT_MS * 1e6)
+        try:
+            while True:
+                now = time.monotonic_ns()
+                late_ns = now - self._expected_ns
+                with self._lock:
+                    stall, self._stall = self._stall, None
+                if late_ns >= self.stall_ms * 1e6:
+                    if stall is None or stall.expected_ns != self._expected_ns:
+                        # Too short for the watchdog to sample it
+                        stall = Stall(self._expected_ns)
+                    stall.end_ns = time.time_ns()
+                    stall.start_ns = stall.end_ns - late_ns
+                    with self._lock:
+                        self.stalls.append(stall)
+                self._expected_ns = now + interval_ns
+                await asyncio.sleep(interval_ns / 1e9)
+        finally:
+            self._expected_ns = None
+            self._loop = None
+
+    def _watch(self) -> None:
+        """Watchdog thread: sample the loop thread's stack while the heartbeat is overdue."""
+        # Sampling from half the threshold on, so that stalls just over it get samples
+        start_ns = self.stall_ms * 1e6 / 2
+        period = min(HEARTBEAT_MS, self.stall_ms / 4) / 1000
+        while not self._stopped.wait(period):
+            expected = self._expected_ns
+            if expected is None or time.monotonic_ns() - expected < start_ns:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            span, stack = self._sample(frame)
+            del frame
+            with self._lock:
+                if self._expected_ns != expected:
+                    # The loop ran again meanwhile
+                    continue
+                stall = self._stall
+                if stall is None or stall.expected_ns != expected:
+                    stall = self._stall = Stall(expected)
+                stall.samples[span, stack] = stall.samples.get((span, stack), 0) + 1
+
+    def _sample(self, frame: Any) -> Tuple[Optional[Span], str]:
+        """Innermost traced run on the stack and the frames inside it, as a folded stack."""
+        frames: List[str] = []
+        span = None
+        while frame is not None and len(frames) < MAX_FRAMES:
+            frames.append(_frame_label(frame))
+            if "run_manager" in frame.f_code.co_varnames:
+                # Node, tool and model calls all hold the callback manager of their run
+                run_id = getattr(frame.f_locals.get("run_manager"), "run_id", None)
+                span = self._spans.get(run_id) if run_id is not None else None
+                if span is not None:
+                    break
+            frame = frame.f_back
+        return span, ";".join(frames[::-1])
+
+    # Report
+
+    def _critical_path(self, root: Span, children: Dict[str, List[Span]]) -> Tuple[List[Tuple[Span, int]], List[List[Span]]]:
+        """Spans on the critical path with their self time, and the chains of children it went through."""
+        path: List[Tuple[Span, int]] = []
+        chains: List[List[Span]] = []
+        pending = [root]
+        while pending:
+            span = pending.pop()
+            chain, cursor = [], span.end_ns
+            for child in sorted(children.get(span.span_id, ()), key=lambda s: s.end_ns, reverse=True):
+                if child.end_ns <= cursor:
+                    chain.append(child)
+                    cursor = child.start_ns
+            chain.reverse()
+            path.append((span, span.end_ns - span.start_ns - sum(c.end_ns - c.start_ns for c in chain)))
+            chains.append(chain)
+            # Depth first, in time order
+            pending.extend(reversed(chain))
+        return path, chains
+
+    def _analyze(self, root: Span, spans: List[Span]) -> Dict[str, Any]:
+        children: Dict[str, List[Span]] = {}
+        for span in spans:
+            if span.parent is not None:
+                children.setdefault(span.parent.span_id, []).append(span)
+        path, chains = self._critical_path(root, children)
+
+        serialized = []
+        for chain in chains:
+            group: List[Span] = []
+            for span in chain + [None]:
+                if span is not None and span.kind == "tool":
+                    group.append(span)
+                    continue
+                if len(group) > 1:
+                    durations = [s.end_ns - s.start_ns for s in group]
+                    serialized.append({
+                        "node": "/".join(_names(group[0].parent)[1:]),
+                        "tools": [s.name for s in group],
+                        "ms": round(sum(durations) / 1e6, 3),
+                        "avoidable_ms": round((sum(durations) - max(durations)) / 1e6, 3),
+                    })
+                group = []
+
+        blocked_ns = held_up_ns = 0
+        for stall in self.stalls:
+            if stall.end_ns <= root.start_ns or stall.start_ns >= root.end_ns:
+                continue
+            blocked_ns += min(stall.end_ns, root.end_ns) - max(stall.start_ns, root.start_ns)
+            blocking = stall.span
+            if blocking is None or blocking.trace_id != root.trace_id:
+                # Another run's call blocked the loop while this one was in flight
+                held_up_ns += min(stall.end_ns, root.end_ns) - max(stall.start_ns, root.start_ns)
+                continue
+            # Spans of this run in flight beside the blocking ones
+            related = {id(span) for sampled, _ in stall.samples if sampled is not None
+                       for span in self._lineage(sampled, children)}
+            beside = [(s.start_ns, s.end_ns) for s in spans if id(s) not in related]
+            held_up_ns += _overlap_ns(stall.start_ns, stall.end_ns, beside)
+
+        avoidable_ms = sum(group["avoidable_ms"] for group in serialized) + held_up_ns / 1e6
+        return {
+            "agent": root.agent,
+            "trace_id": root.trace_id,
+            "ms": round((root.end_ns - root.start_ns) / 1e6, 3),
+            "error": root.error,
+            "chain": [span.path for span, _ in path if span.kind in ("node", "subgraph")],
+            "critical_path": [
+                {
+                    "span": "/".join(_names(span)[1:]) or span.name,
+                    "kind": span.kind,
+                    "start_ms": round((span.start_ns - root.start_ns) / 1e6, 3),
+                    "ms": round((span.end_ns - span.start_ns) / 1e6, 3),
+                    "self_ms": round(self_ns / 1e6, 3),
+                }
+                for span, self_ns in path
+            ],
+            "serialized_tools": serialized,
+            "blocked_ms": round(blocked_ns / 1e6, 3),
+            "avoidable_ms": round(avoidable_ms, 3),
+            "_path": path,
+        }
+
+    @staticmethod
+    def _lineage(span: Span, children: Dict[str, List[Span]]) -> List[Span]:
+        """``span``, its ancestors and its descendants."""
+        lineage, parent = [], span.parent
+        while parent is not None:
+            lineage.append(parent)
+            parent = parent.parent
+        pending = [span]
+        while pending:
+            current = pending.pop()
+            lineage.append(current)
+            pending.extend(children.get(current.span_id, ()))
+        return lineage
+
+    def _analyses(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            runs = list(self.runs)
+        return [self._analyze(root, spans) for root, spans in runs]
+
+    def report(self, analyses: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """The JSON report: stalls, where they happened, and every kept run's critical path."""
+        analyses = self._analyses() if analyses is None else analyses
+        with self._lock:
+            stalls = list(self.stalls)
+        by_span: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        for stall in stalls:
+            span = stall.span
+            names = tuple(_names(span)) or ("(unattributed)",)
+            entry = by_span.setdefault(names, {
+                "agent": names[0] if span is not None else None,
+                "span": "/".join(names[1:]) if span is not None else names[0],
+                "kind": span.kind if span is not None else None,
+                "stalls": 0, "ms": 0.0, "max_ms": 0.0,
+            })
+            entry["stalls"] += 1
+            entry["ms"] = round(entry["ms"] + stall.ms, 3)
+            entry["max_ms"] = round(max(entry["max_ms"], stall.ms), 3)
+        return {
+            "stall_threshold_ms": self.stall_ms,
+            "runs_seen": self.runs_seen,
+            "stalls_by_span": sorted(by_span.values(), key=lambda entry: -entry["ms"]),
+            "stalls": [
+                {
+                    "start_unix_ms": round(stall.start_ns / 1e6, 3),
+                    "ms": round(stall.ms, 3),
+                    "agent": span.agent if span is not None else None,
+                    "span": "/".join(_names(span)[1:]) if span is not None else None,
+                    "stacks": stall.stacks(),
+                }
+                for stall, span in ((stall, stall.span) for stall in stalls)
+            ],
+            "runs": [{key: value for key, value in run.items() if not key.startswith("_")} for run in analyses],
+        }
+
+    def folded(self, analyses: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Critical paths and stall samples as folded stacks, weighted in microseconds."""
+        analyses = self._analyses() if analyses is None else analyses
+        weights: Dict[str, int] = {}
+        for run in analyses:
+            for span, self_ns in run["_path"]:
+                if self_ns > 0:
+                    key = ";".join(["critical"] + _names(span))
+                    weights[key] = weights.get(key, 0) + self_ns // 1000
+        with self._lock:
+            stalls = list(self.stalls)
+        for stall in stalls:
+            samples = sum(stall.samples.values())
+            if not samples:
+                key = "stall;(unattributed)"
+                weights[key] = weights.get(key, 0) + int(stall.ms * 1000)
+                continue
+            # The stall's time, split between its samples
+            for (span, stack), count in stall.samples.items():
+                key = ";".join(["stall"] + (_names(span) or ["(unattributed)"]) + [stack])
+                weights[key] = weights.get(key, 0) + int(stall.ms * 1000 * count / samples)
+        return "".join(f"{key} {weight}\n" for key, weight in sorted(weights.items()) if weight > 0)
+
+    def save(self, prefix: str) -> Tuple[str, str]:
+        """Write ``<prefix>.json`` and ``<prefix>.folded``; returns their paths."""
+        analyses = self._analyses()
+        json_path, folded_path = f"{prefix}.json", f"{prefix}.folded"
+        with open(json_path, "w") as f:
+            json.dump(self.report(analyses), f, indent=2, default=str)
+        with open(folded_path, "w") as f:
+            f.write(self.folded(analyses))
+        return json_path, folded_path
+
+    def summary(self, report: Optional[Dict[str, Any]] = None, top: int = 5) -> str:
+        """A few lines on the worst stalls and the slowest runs."""
+        report = report or self.report()
+        lines = [f"Profiled {report['runs_seen']} runs: {len(report['stalls'])} event loop stalls "
+                 f"of {self.stall_ms:g} ms or more"]
+        for entry in report["stalls_by_span"][:top]:
+            where = f"{entry['agent']} {entry['span']}" if entry["agent"] else entry["span"]
+            lines.append(f"  {entry['ms']:.0f} ms in {entry['stalls']} stalls (max {entry['max_ms']:.0f} ms): {where}")
+        for run in sorted(report["runs"], key=lambda run: -run["ms"])[:top]:
+            chain = " -> ".join(run["chain"]) or "-"
+            lines.append(f"  {run['agent']} {run['ms']:.0f} ms, critical path {chain}; "
+                         f"{run['avoidable_ms']:.0f} ms avoidable, {run['blocked_ms']:.0f} ms blocked")
+        return "\n".join(lines)
@@ -0,0 +1,465 @@
+"""
+Equivalent models across providers, with latency-aware balancing and failover.
+
+A node declares a ``ModelPool``: the capabilities it needs (tool calling,
+structured output, streaming) and the models that are interchangeable for it.
+``invoke_pool`` and ``astream_pool`` try the pool's models whose provider has
+credentials configured, in the order ``model_balancer`` gives: the pool's own
+order, re-ranked by each model's EWMA latency and error rate, skipping
+providers whose circuit breaker is open. If the chosen model cannot be built
+or fails with a provider or auth error (5xx, 429, 401, timeout, connection
+error), the call fails over to the next model.
+
+Provider SDKs are imported only when a model of that provider is first built.
+"""
+
+from contextlib import aclosing
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, Iterable, List, Optional
+import asyncio
+import importlib
+import os
+import threading
+import time
+
+from .budget import DeadlineExceeded, get_budget, invoke_model
+from .cancellation import astream_model
+from .scheduler import is_rate_limit_error
+
+
+class Capability(str, Enum):
+    TOOL_CALLING = "tool_calling"
+    STRUCTURED_OUTPUT = "structured_output"
+    STREAMING = "streaming"
+
+
+ALL_CAPABILITIES = frozenset(Capability)
+
+# Provider and capabilities of every model a pool may name
+MODELS: Dict[str, Dict[str, Any]] = {
+    "gpt-4o": {"provider": "openai", "capabilities": ALL_CAPABILITIES},
+    "gpt-4o-mini": {"provider": "openai", "capabilities": ALL_CAPABILITIES},
+    "claude-3-5-sonnet-latest": {"provider": "anthropic", "capabilities": ALL_CAPABILITIES},
+    "claude-3-5-haiku-latest": {"provider": "anthropic", "capabilities": ALL_CAPABILITIES},
+    "gemini-1.5-pro": {"provider": "google", "capabilities": ALL_CAPABILITIES},
+    "gemini-1.5-flash": {"provider": "google", "capabilities": ALL_CAPABILITIES},
+}
+
+# Weight of the newest call in the latency and error-rate averages
+EWMA_ALPHA = 0.2
+# Latency assumed for a model before its first call; low so new models get tried
+INITIAL_LATENCY_S = 0.5
+# Consecutive failures that open a provider's breaker
+FAILURE_THRESHOLD = 5
+# Seconds an open breaker stays open before letting a probe call through
+BREAKER_COOLDOWN_S = 30.0
+# How strongly errors count against a model, relative to latency
+ERROR_PENALTY = 10.0
+
+
+class NoModelAvailable(RuntimeError):
+    """Every model in the pool is unavailable or failed."""
+
+
+class ModelPool:
+    """Models that are interchangeable for a node, in order of preference.
+
+    ``options`` (e.g. ``temperature``) are passed to every chat model built.
+    """
+
+    def __init__(self, capabilities: Iterable[Capability], models: List[str], **options: Any):
+        self.capabilities: FrozenSet[Capability] = frozenset(capabilities)
+        for model in models:
+            missing = self.capabilities - MODELS[model]["capabilities"]
+            if missing:
+                raise ValueError(f"{model} lacks {', '.join(sorted(c.value for c in missing))}")
+        self.models = list(models)
+        self.options = options
+
+
+def register_model(model: str, provider: str, capabilities: Iterable[Capability] = ALL_CAPABILITIES) -> None:
+    """Make ``model`` available to pools."""
+    MODELS[model] = {"provider": provider, "capabilities": frozenset(capabilities)}
+
+
+def _openai(model: str, **options: Any) -> Any:
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, **options)
+
+
+def _anthropic(model: str, **options: Any) -> Any:
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(model=model, **options)
+
+
+def _google(model: str, **options: Any) -> Any:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, **options)
+
+
+# provider -> factory(model, **options) returning a chat model
+PROVIDER_FACTORIES: Dict[str, Callable[..., Any]] = {
+    "openai": _openai,
+    "anthropic": _anthropic,
+    "google": _google,
+}
+
+
+# SDK factory -> environment variables, any of which configures its API key
+FACTORY_CREDENTIALS: Dict[Callable[..., Any], Any] = {
+    _openai: ("OPENAI_API_KEY",),
+    _anthropic: ("ANTHROPIC_API_KEY",),
+    _google: ("GOOGLE_API_KEY",),
+}
+
+
+def has_credentials(model: str, options: Optional[Dict[str, Any]] = None) -> bool:
+    """Whether ``model``'s provider has an API key, in the environment or ``options``.
+
+    Only the SDK factories need one: a factory put in their place, e.g. a
+    fake or a cassette replay, is assumed configured.
+    """
+    names = FACTORY_CREDENTIALS.get(PROVIDER_FACTORIES[MODELS[model]["provider"]])
+    if names is None or (options or {}).get("api_key"):
+        return True
+    return any(os.environ.get(name) for name in names)
+
+
+# provider -> SDK module its factory imports
+PROVIDER_MODULES = {
+    "openai": "langchain_openai",
+    "anthropic": "langchain_anthropic",
+    "google": "langchain_google_genai",
+}
+
+
+def preload_providers() -> List[str]:
+    """Import every provider SDK now rather than on the first model call, e.g.
+    before forking workers that should share them. Returns the providers whose
+    SDK is installed.
+    """
+    loaded = []
+    for provider, module in PROVIDER_MODULES.items():
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        loaded.append(provider)
+    return loaded
+
+
+# (factory, model, options) -> chat model; clients keep their connection pools warm between calls
+_chat_models: Dict[Any, Any] = {}
+_chat_models_lock = threading.Lock()
+
+
+def create_chat_model(model: str, **options: Any) -> Any:
+    """Chat model for ``model`` from its provider's SDK.
+
+    Models are built once per model and options and then reused, so every call
+    after the first skips client construction and reuses open connections.
+    """
+    factory = PROVIDER_FACTORIES[MODELS[model]["provider"]]
+    try:
+        key = (factory, model, tuple(sorted(options.items())))
+        hash(key)
+    except TypeError:
+        # Unhashable options: build a model for this call only
+        return factory(model, **options)
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        with _chat_models_lock:
+            chat_model = _chat_models.get(key)
+            if chat_model is None:
+                chat_model = _chat_models[key] = factory(model, **options)
+    return chat_model
+
+
+def is_provider_error(error: BaseException) -> bool:
+    """Whether ``error`` says the provider, not the request, is at fault."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if is_rate_limit_error(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    name = type(error).__name__
+    return any(part in name for part in ("Connection", "Timeout", "Overloaded", "Unavailable", "InternalServer"))
+
+
+def is_auth_error(error: BaseException) -> bool:
+    """Whether ``error`` says the provider rejected our credentials."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status in (401, 403):
+        return True
+    name = type(error).__name__
+    return any(part in name for part in ("Authentication", "PermissionDenied"))
+
+
+def _fails_over(error: BaseException, built: bool) -> bool:
+    """Whether a call that raised ``error`` should move on to the next model.
+
+    Before the model is built, a missing SDK, bad options or a config the
+    provider's client rejects (e.g. a pydantic ``ValidationError``) only rule
+    out this model.
+    """
+    if is_provider_error(error) or is_auth_error(error):
+        return True
+    return not built and isinstance(error, (ImportError, TypeError, ValueError))
+
+
+class CircuitBreaker:
+    """Closed until ``threshold`` consecutive failures, then open for ``cooldown``
+    seconds, then half-open: one probe call decides whether it closes again.
+    """
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN_S, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.times_opened = 0
+        self._clock = clock
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self._clock() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one probe may."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+            self.opened_at = self._clock()
+            self.times_opened += 1
+        self.probing = False
+
+
+class ModelStats:
+    """EWMA latency and error rate of one model."""
+
+    def __init__(self):
+        self.latency = INITIAL_LATENCY_S
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def update(self, seconds: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += int(failed)
+        if not failed:
+            self.latency += EWMA_ALPHA * (seconds - self.latency)
+        self.error_rate += EWMA_ALPHA * (float(failed) - self.error_rate)
+
+    def score(self) -> float:
+        """Expected cost of a call; lower is better."""
+        return self.latency * (1.0 + ERROR_PENALTY * self.error_rate)
+
+
+class ModelBalancer:
+    """Orders a pool's models for each call and tracks their health."""
+
+    def __init__(
+        self,
+        threshold: int = FAILURE_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN_S,
+        clock=time.monotonic,
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = self._breakers[provider] = CircuitBreaker(self.threshold, self.cooldown, self._clock)
+        return breaker
+
+    def _model_stats(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def order(self, models: List[str]) -> List[str]:
+        """``models`` to try, in order, skipping those whose provider's breaker is open.
+
+        The rest are ranked by score; models with equal scores, e.g. ones not
+        called yet, keep their order in ``models``. A model starts at the low
+        ``INITIAL_LATENCY_S``, so one slower than that is soon passed over for
+        the next, which then gets measured.
+        """
+        with self._lock:
+            available = [m for m in models if self._breaker(MODELS[m]["provider"]).state != "open"]
+            # sorted() is stable, so ties keep the declared order
+            return sorted(available, key=lambda m: self._model_stats(m).score())
+
+    def allow(self, model: str) -> bool:
+        with self._lock:
+            return self._breaker(MODELS[model]["provider"]).allow()
+
+    def record(self, model: str, seconds: float, failed: bool) -> None:
+        with self._lock:
+            self._model_stats(model).update(seconds, failed)
+            breaker = self._breaker(MODELS[model]["provider"])
+            if failed:
+                breaker.failure()
+            else:
+                breaker.success()
+
+    def release(self, model: str) -> None:
+        """Forget an unfinished probe call, e.g. one that was cancelled."""
+        with self._lock:
+            self._breaker(MODELS[model]["provider"]).probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "providers": {
+                    provider: {"state": breaker.state, "times_opened": breaker.times_opened}
+                    for provider, breaker in self._breakers.items()
+                },
+                "models": {
+                    model: {
+                        "calls": stats.calls,
+                        "errors": stats.errors,
+                        "latency_s": round(stats.latency, 4),
+                        "error_rate": round(stats.error_rate, 4),
+                    }
+                    for model, stats in self._stats.items()
+                },
+            }
+
+
+# Shared balancer, reported by the server's /stats endpoint
+model_balancer = ModelBalancer()
+
+
+def configured_models(pool: ModelPool) -> List[str]:
+    """``pool``'s models whose provider has credentials, in the pool's order."""
+    return [model for model in pool.models if has_credentials(model, pool.options)]
+
+
+def _candidates(pool: ModelPool, balancer: ModelBalancer) -> List[str]:
+    configured = configured_models(pool)
+    if not configured:
+        raise NoModelAvailable(f"no credentials configured for {', '.join(pool.models)}")
+    models = balancer.order(configured)
+    if not models:
+        raise NoModelAvailable(f"no provider available for {', '.join(configured)}")
+    return models
+
+
+async def invoke_pool(
+    pool: ModelPool,
+    build: Callable[[Any], Any],
+    model_input: Any,
+    config: Optional[Dict[str, Any]],
+    component: str,
+    hedge: bool = False,
+    balancer: ModelBalancer = model_balancer,
+) -> Any:
+    """``invoke_model`` on a model from ``pool``, failing over on provider errors.
+
+    ``build`` turns the chat model into the runnable to call, e.g. by binding
+    tools or a structured output schema.
+    """
+    budget = get_budget(config)
+    error: Optional[BaseException] = None
+    for candidate in _candidates(pool, balancer):
+        if not balancer.allow(candidate):
+            continue
+        if error is not None:
+            balancer.failovers += 1
+        model_name = budget.model_for(component, candidate)
+        start = time.monotonic()
+        runnable = None
+        try:
+            runnable = build(create_chat_model(model_name, **pool.options))
+            response = await invoke_model(runnable, model_input, config, component, model_name, hedge=hedge)
+        except asyncio.CancelledError:
+            balancer.release(candidate)
+            raise
+        except Exception as e:
+            if not _fails_over(e, built=runnable is not None):
+                balancer.release(candidate)
+                raise
+            balancer.record(candidate, time.monotonic() - start, failed=True)
+            error = e
+            continue
+        balancer.record(candidate, time.monotonic() - start, failed=False)
+        return response
+    raise NoModelAvailable(f"{component}: every model failed") from error
+
+
+async def astream_pool(
+    pool: ModelPool,
+    build: Callable[[Any], Any],
+    model_input: Any,
+    config: Optional[Dict[str, Any]],
+    component: str,
+    balancer: ModelBalancer = model_balancer,
+) -> AsyncIterator[Any]:
+    """``astream_model`` on a model from ``pool``.
+
+    A stream can only fail over before its first chunk; once output has been
+    yielded, a provider error is raised to the caller.
+    """
+    budget = get_budget(config)
+    error: Optional[BaseException] = None
+    for candidate in _candidates(pool, balancer):
+        if not balancer.allow(candidate):
+            continue
+        if error is not None:
+            balancer.failovers += 1
+        model_name = budget.model_for(component, candidate)
+        start = time.monotonic()
+        runnable = None
+        started = False
+        try:
+            runnable = build(create_chat_model(model_name, **pool.options))
+            async with aclosing(astream_model(runnable, model_input, component, config, model=model_name)) as stream:
+                async for chunk in stream:
+                    if not started:
+                        # Time to first token is what a streaming caller waits on
+                        balancer.record(candidate, time.monotonic() - start, failed=False)
+                        started = True
+                    yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            if not started:
+                balancer.release(candidate)
+            raise
+        except Exception as e:
+            if started or not _fails_over(e, built=runnable is not None):
+                if not started:
+                    balancer.release(candidate)
+                raise
+            balancer.record(candidate, time.monotonic() - start, failed=True)
+            error = e
+            continue
+        if not started:
+            balancer.record(candidate, time.monotonic() - start, failed=False)
+        return
+    raise NoModelAvailable(f"{component}: every model failed") from error
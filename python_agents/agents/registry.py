@@ -0,0 +1,123 @@
+"""
+Lazy loading of agent graphs.
+
+Importing a graph pulls in its nodes, their prompts and pydantic schemas, and
+compiles it, which adds up to most of the process start-up time. ``AGENTS`` in
+``main`` is an ``AgentRegistry`` of ``"module:attribute"`` specs instead: a
+graph is imported and compiled the first time it is looked up, so a CLI run or
+a fresh server replica only pays for the graphs it uses. ``prewarm`` loads the
+rest in a background thread. ``LazyGraph`` is the same idea for a single
+graph used as a node of another, e.g. the supervisor's sub-agents.
+
+A graph loaded for an agent of the registry is instrumented on load (see
+``telemetry``); a graph used as a node is traced as part of its parent's run.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, Optional
+import asyncio
+import importlib
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def import_string(spec: str) -> Any:
+    """Object named by ``"package.module:attribute"``."""
+    module, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module), attribute)
+
+
+class LazyGraph:
+    """Stand-in for the graph at ``spec``, imported when first used.
+
+    ``ainvoke`` imports in a worker thread so the event loop keeps serving;
+    any other attribute imports synchronously.
+    """
+
+    def __init__(self, spec: str, agent: Optional[str] = None):
+        self.spec = spec
+        self.agent = agent
+        self.load_seconds: Optional[float] = None
+        self._graph: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._graph is not None
+
+    def load(self) -> Any:
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    start = time.perf_counter()
+                    graph = import_string(self.spec)
+                    if self.agent is not None:
+                        from .telemetry import instrument
+                        graph = instrument(graph, self.agent)
+                    self.load_seconds = time.perf_counter() - start
+                    self._graph = graph
+        return self._graph
+
+    async def aload(self) -> Any:
+        return self._graph if self._graph is not None else await asyncio.to_thread(self.load)
+
+    async def ainvoke(self, *args: Any, **kwargs: Any) -> Any:
+        return await (await self.aload()).ainvoke(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self) -> str:
+        return f"LazyGraph({self.spec!r}, loaded={self.loaded})"
+
+
+class AgentRegistry(Mapping):
+    """Agent name -> graph, importing each graph on first lookup."""
+
+    def __init__(self, specs: Dict[str, str]):
+        self._graphs = {name: LazyGraph(spec, agent=name) for name, spec in specs.items()}
+
+    def __getitem__(self, name: str) -> Any:
+        return self._graphs[name].load()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._graphs)
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._graphs
+
+    def is_loaded(self, name: str) -> bool:
+        return self._graphs[name].loaded
+
+    async def aget(self, name: str) -> Any:
+        """The graph for ``name``, imported off the event loop if need be."""
+        return await self._graphs[name].aload()
+
+    def prewarm(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """Import ``names`` (default: all) in a background thread and return it."""
+        names = list(self._graphs if names is None else names)
+
+        def load_all() -> None:
+            for name in names:
+                try:
+                    self._graphs[name].load()
+                except Exception:
+                    # The request that needs it will raise the same error
+                    logger.exception("pre-warming %s failed", name)
+
+        thread = threading.Thread(target=load_all, name="agents-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def load_times(self) -> Dict[str, Optional[float]]:
+        """Seconds each loaded graph took to import and compile."""
+        return {name: graph.load_seconds for name, graph in self._graphs.items()}
@@ -0,0 +1,490 @@
+"""
+Admission control for LLM calls.
+
+Every model call acquires a slot from ``model_scheduler`` before it is sent.
+Slots are limited per provider and per model by token buckets on requests per
+minute and tokens per minute, and by a cap on concurrent requests. Token use is
+estimated from the prompt up front and corrected once the response reports its
+usage. Waiting calls are admitted in priority order, so interactive calls such
+as routing are not stuck behind background work. Within a priority, calls of
+different tenants are admitted by start-time fair queuing on their estimated
+tokens, so a tenant with a deep backlog gets its weighted share of the slots
+rather than all of them. The time each call spent queued is recorded per model
+and priority, and per tenant.
+"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+
+class Priority(IntEnum):
+    """Admission priority; lower values are admitted first."""
+    INTERACTIVE = 0
+    DEFAULT = 1
+    BACKGROUND = 2
+
+
+# Priority of each component unless the request overrides it
+COMPONENT_PRIORITIES = {
+    "supervisor.router": Priority.INTERACTIVE,
+    "supervisor.general_input": Priority.INTERACTIVE,
+    "chat": Priority.INTERACTIVE,
+    "writer.suggestions": Priority.BACKGROUND,
+}
+
+# Tenant of calls whose request names none
+DEFAULT_TENANT = "default"
+
+# Output tokens assumed for a call until its usage is known
+DEFAULT_OUTPUT_TOKENS = 256
+# Queue times kept per model and priority for percentiles
+QUEUE_TIME_SAMPLES = 2048
+
+
+class ModelLimits:
+    """Limits for one provider or model. ``None`` means unlimited.
+
+    ``burst_seconds`` is how much unused rate a bucket may accumulate: a
+    request bucket of 600/min with a 1s burst holds at most 10 requests.
+    """
+
+    def __init__(
+        self,
+        requests_per_min: Optional[float] = None,
+        tokens_per_min: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        burst_seconds: float = 60.0,
+    ):
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self.max_concurrency = max_concurrency
+        self.burst_seconds = burst_seconds
+
+
+# Keys are "<provider>" or "<provider>:<model>"
+DEFAULT_LIMITS = {
+    "openai": ModelLimits(requests_per_min=5_000, tokens_per_min=2_000_000, max_concurrency=256),
+    "openai:gpt-4o": ModelLimits(requests_per_min=5_000, tokens_per_min=800_000, max_concurrency=128),
+    "openai:gpt-4o-mini": ModelLimits(requests_per_min=5_000, tokens_per_min=2_000_000, max_concurrency=128),
+    "anthropic": ModelLimits(requests_per_min=4_000, tokens_per_min=400_000, max_concurrency=128),
+    "anthropic:claude-3-5-sonnet-latest": ModelLimits(requests_per_min=4_000, tokens_per_min=400_000, max_concurrency=64),
+    "anthropic:claude-3-5-haiku-latest": ModelLimits(requests_per_min=4_000, tokens_per_min=400_000, max_concurrency=64),
+    "google": ModelLimits(requests_per_min=2_000, tokens_per_min=4_000_000, max_concurrency=128),
+}
+
+
+def provider_for(model: Optional[str]) -> str:
+    """Provider serving ``model``, judged by its name."""
+    name = (model or "").lower()
+    if name.startswith("claude"):
+        return "anthropic"
+    if name.startswith(("gpt", "o1", "o3", "o4")):
+        return "openai"
+    if name.startswith("gemini"):
+        return "google"
+    return "default"
+
+
+def priority_for(component: str, config: Optional[Dict[str, Any]] = None) -> Priority:
+    """Priority of a component's calls; a valid ``configurable.priority`` overrides it.
+
+    The override comes from the client, and is only read at the first model
+    call of an admitted run, so one that names no priority is ignored rather
+    than failing the run.
+    """
+    override = ((config or {}).get("configurable") or {}).get("priority")
+    if isinstance(override, str) and override.upper() in Priority.__members__:
+        return Priority[override.upper()]
+    if isinstance(override, int) and not isinstance(override, bool) and override in set(Priority):
+        return Priority(override)
+    return COMPONENT_PRIORITIES.get(component, Priority.DEFAULT)
+
+
+def tenant_for(config: Optional[Dict[str, Any]] = None) -> str:
+    """Tenant a request runs for, from ``configurable.tenant``."""
+    return str(((config or {}).get("configurable") or {}).get("tenant") or DEFAULT_TENANT)
+
+
+def estimate_tokens(model_input: Any, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    """Rough token count of a prompt (about four characters per token) plus expected output."""
+    if isinstance(model_input, str):
+        return len(model_input) // 4 + output_tokens
+    chars = 0
+    count = 0
+    for message in model_input or []:
+        content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", message)
+        chars += len(content) if isinstance(content, str) else len(str(content))
+        count += 1
+    # Each message carries a few tokens of role and framing overhead
+    return chars // 4 + count * 4 + output_tokens
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether ``error`` is a provider 429, from any SDK."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: BaseException, default: float = 1.0) -> float:
+    """Seconds the provider asked us to wait in its 429 response, or ``default``."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """Refills at ``per_minute / 60`` per second up to ``per_minute * burst_seconds / 60``."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 60.0, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self._clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken; 0 if it can be taken now."""
+        self._refill()
+        # Requests larger than the bucket go through once it is full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the provider answered 429."""
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class Lane:
+    """Buckets and concurrency count for one provider or model."""
+
+    def __init__(self, key: str, limits: ModelLimits, clock=time.monotonic):
+        self.key = key
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_min, limits.burst_seconds, clock) if limits.requests_per_min else None
+        self.tokens = TokenBucket(limits.tokens_per_min, limits.burst_seconds, clock) if limits.tokens_per_min else None
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._clock = clock
+
+    def wait_time(self, tokens: int) -> Optional[float]:
+        """Seconds until a call of ``tokens`` fits; None while concurrency is exhausted."""
+        if self.limits.max_concurrency is not None and self.in_flight >= self.limits.max_concurrency:
+            return None
+        wait = max(self.blocked_until - self._clock(), 0.0)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def admit(self, tokens: int) -> None:
+        self.in_flight += 1
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def settle(self, delta: int) -> None:
+        """Charge (positive) or refund (negative) the difference from the estimate."""
+        if self.tokens is None or not delta:
+            return
+        if delta > 0:
+            self.tokens.take(delta)
+        else:
+            self.tokens.give(-delta)
+
+    def throttle(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, self._clock() + seconds)
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.drain()
+
+
+class FairShare:
+    """Start-time fair queuing tags for the calls waiting on one provider.
+
+    A tenant's next call starts, in virtual time, when its previous one
+    finished or at the current virtual time, whichever is later, and finishes
+    ``cost / weight`` later. Serving calls in order of start tag gives each
+    backlogged tenant a share of admissions proportional to its weight, while
+    a tenant that was idle starts at the current virtual time instead of
+    banking credit.
+    """
+
+    def __init__(self):
+        self.virtual = 0.0
+        self._finish: Dict[str, float] = {}
+
+    def tag(self, tenant: str, cost: float, weight: float) -> float:
+        start = max(self.virtual, self._finish.get(tenant, 0.0))
+        self._finish[tenant] = start + cost / weight
+        return start
+
+    def served(self, start: float) -> None:
+        self.virtual = max(self.virtual, start)
+        if len(self._finish) > 1024:
+            # Forget tenants with nothing ahead of virtual time
+            self._finish = {t: f for t, f in self._finish.items() if f > self.virtual}
+
+
+class QueueStats:
+    """Queue times of admitted calls for one model and priority."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=QUEUE_TIME_SAMPLES)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(q: float) -> float:
+            return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 4) if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "mean_s": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50_s": percentile(0.50),
+            "p99_s": percentile(0.99),
+            "max_s": round(self.max, 4),
+        }
+
+
+class Permit:
+    """An admitted call. ``settle`` corrects the token estimate once usage is known."""
+
+    def __init__(self, scheduler: "ModelScheduler", lanes: List[Lane], tokens: int, queue_time: float):
+        self.scheduler = scheduler
+        self.lanes = lanes
+        self.tokens = tokens
+        self.queue_time = queue_time
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        if not actual_tokens:
+            return
+        with self.scheduler._lock:
+            for lane in self.lanes:
+                lane.settle(actual_tokens - self.tokens)
+        self.tokens = actual_tokens
+
+    def throttle(self, seconds: float) -> None:
+        """Hold back further calls to these lanes, e.g. after a 429."""
+        with self.scheduler._lock:
+            for lane in self.lanes:
+                lane.throttle(seconds)
+
+
+# Permit of the model call about to be sent in this context
+current_permit: ContextVar[Optional[Permit]] = ContextVar("current_permit", default=None)
+
+
+class ModelScheduler:
+    """Admits model calls in priority order, and fairly between tenants, within
+    per-provider and per-model limits."""
+
+    def __init__(self, limits: Optional[Dict[str, ModelLimits]] = None, clock=time.monotonic):
+        self._limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._clock = clock
+        self._lanes: Dict[str, Lane] = {}
+        # provider -> model -> heap of (priority, start tag, seq, future, tokens, enqueued)
+        self._waiting: Dict[str, Dict[str, list]] = {}
+        self._fair: Dict[str, FairShare] = {}
+        self._weights: Dict[str, float] = {}
+        # provider -> (event loop, pending dispatch timer)
+        self._timers: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.TimerHandle]] = {}
+        self._stats: Dict[Tuple[str, str], QueueStats] = {}
+        self._tenant_stats: Dict[str, QueueStats] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def configure(self, key: str, limits: ModelLimits) -> None:
+        """Set the limits for ``"<provider>"`` or ``"<provider>:<model>"``."""
+        with self._lock:
+            self._limits[key] = limits
+            self._lanes.pop(key, None)
+
+    def set_weight(self, tenant: str, weight: float) -> None:
+        """Share of contended slots ``tenant`` gets relative to others (default 1)."""
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        with self._lock:
+            self._weights[tenant] = weight
+
+    def _lane(self, key: str) -> Lane:
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = Lane(key, self._limits.get(key, ModelLimits()), self._clock)
+            self._lanes[key] = lane
+        return lane
+
+    def _lanes_for(self, provider: str, model: str) -> List[Lane]:
+        return [self._lane(provider), self._lane(f"{provider}:{model}")]
+
+    async def acquire(
+        self, model: str, tokens: int, priority: Priority = Priority.DEFAULT, tenant: str = DEFAULT_TENANT,
+    ) -> Permit:
+        """Wait until a call to ``model`` using about ``tokens`` tokens may be sent."""
+        provider = provider_for(model)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        enqueued = self._clock()
+        with self._lock:
+            heap = self._waiting.setdefault(provider, {}).setdefault(model, [])
+            tag = self._fair.setdefault(provider, FairShare()).tag(tenant, tokens, self._weights.get(tenant, 1.0))
+            heapq.heappush(heap, (int(priority), tag, next(self._seq), future, tokens, enqueued))
+        self._dispatch(provider)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller was cancelled: hand the slot back
+                self._release(provider, self._lanes_for(provider, model))
+            raise
+
+        queue_time = self._clock() - enqueued
+        with self._lock:
+            self._stats.setdefault((f"{provider}:{model}", Priority(priority).name.lower()), QueueStats()).add(queue_time)
+            self._tenant_stats.setdefault(tenant, QueueStats()).add(queue_time)
+            lanes = self._lanes_for(provider, model)
+        return Permit(self, lanes, tokens, queue_time)
+
+    def release(self, model: str, permit: Permit) -> None:
+        self._release(provider_for(model), permit.lanes)
+
+    def _release(self, provider: str, lanes: List[Lane]) -> None:
+        with self._lock:
+            for lane in lanes:
+                lane.in_flight -= 1
+        self._dispatch(provider)
+
+    @asynccontextmanager
+    async def slot(
+        self, model: str, tokens: int, priority: Priority = Priority.DEFAULT, tenant: str = DEFAULT_TENANT,
+    ) -> AsyncIterator[Permit]:
+        """Hold an admitted slot for the duration of the block."""
+        permit = await self.acquire(model, tokens, priority, tenant)
+        # For the model call made in the block, e.g. to report its queue time
+        token = current_permit.set(permit)
+        try:
+            yield permit
+        finally:
+            self.release(model, permit)
+            # Code after the block must not see a released permit
+            current_permit.reset(token)
+
+    def _dispatch(self, provider: str) -> None:
+        """Admit waiting calls for ``provider`` while limits allow, best priority
+        and earliest fair-share tag first."""
+        retry_in = None
+        with self._lock:
+            models = self._waiting.get(provider, {})
+            provider_lane = self._lane(provider)
+            while True:
+                best = None
+                for model, heap in models.items():
+                    # Drop callers that gave up while queued
+                    while heap and heap[0][3].done():
+                        heapq.heappop(heap)
+                    if not heap:
+                        continue
+                    wait = self._lane(f"{provider}:{model}").wait_time(heap[0][4])
+                    if wait is None:
+                        continue
+                    if wait > 0:
+                        retry_in = wait if retry_in is None else min(retry_in, wait)
+                        continue
+                    if best is None or heap[0][:3] < models[best][0][:3]:
+                        best = model
+                if best is None:
+                    break
+
+                heap = models[best]
+                tokens = heap[0][4]
+                wait = provider_lane.wait_time(tokens)
+                if wait is None:
+                    break
+                if wait > 0:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    break
+
+                _, tag, _, future, tokens, _ = heapq.heappop(heap)
+                self._fair[provider].served(tag)
+                provider_lane.admit(tokens)
+                self._lane(f"{provider}:{best}").admit(tokens)
+                future.set_result(None)
+
+        if retry_in is not None:
+            self._schedule(provider, retry_in)
+
+    def _schedule(self, provider: str, delay: float) -> None:
+        """Run ``_dispatch`` for ``provider`` in ``delay`` seconds, unless a sooner run is pending."""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        pending = self._timers.get(provider)
+        if pending is not None:
+            timer_loop, timer = pending
+            # A timer from another (possibly closed) event loop never fires here
+            if timer_loop is loop and timer.when() <= when:
+                return
+            timer.cancel()
+        self._timers[provider] = (loop, loop.call_at(when, self._on_timer, provider))
+
+    def _on_timer(self, provider: str) -> None:
+        self._timers.pop(provider, None)
+        self._dispatch(provider)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, in-flight calls and queue-time percentiles per model."""
+        with self._lock:
+            result: Dict[str, Any] = {}
+            for key, lane in self._lanes.items():
+                entry = result.setdefault(key, {"queue_time": {}})
+                entry["in_flight"] = lane.in_flight
+            for provider, models in self._waiting.items():
+                for model, heap in models.items():
+                    entry = result.setdefault(f"{provider}:{model}", {"queue_time": {}})
+                    entry["queued"] = sum(1 for item in heap if not item[3].done())
+            for (key, priority), stats in self._stats.items():
+                result.setdefault(key, {"queue_time": {}})["queue_time"][priority] = stats.summary()
+            return result
+
+    def tenant_snapshot(self) -> Dict[str, Any]:
+        """Queue-time percentiles of admitted calls per tenant."""
+        with self._lock:
+            return {tenant: stats.summary() for tenant, stats in self._tenant_stats.items()}
+
+
+# Shared scheduler used by invoke_model and astream_model
+model_scheduler = ModelScheduler()
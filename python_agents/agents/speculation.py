@@ -0,0 +1,289 @@
+"""
+Speculative execution of a sub-agent's first step while the supervisor routes.
+
+The supervisor's router predicts the route before its model call returns,
+from the previous turn's ``next`` or a keyword classifier over the last user
+message. If the prediction is confident enough and the predicted route has a
+registered speculative step, that step starts at once, concurrently with the
+router. When the router decides, a speculation for a chosen route is
+committed and its result is handed to the sub-agent node that asks for it with
+``take_speculative``; speculations for other routes are cancelled and counted
+as waste.
+
+Only functions marked with ``speculation_safe`` may be registered: they must
+not have side effects or push UI, since their work may be thrown away.
+
+A step runs as its own run, ``speculation:<component>``, tagged
+``speculation``, so traces show it apart from the router that started it.
+It spends from the request's budget.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+import asyncio
+import re
+import threading
+import time
+
+from langchain_core.runnables import RunnableLambda
+
+from .cancellation import spawn
+from .registry import import_string
+
+
+# Prior a predicted route needs before it is speculated on
+MIN_SPECULATION_PRIOR = 0.6
+# Prior of repeating the previous turn's route
+PREVIOUS_ROUTE_PRIOR = 0.7
+# Tag of speculative runs
+SPECULATION_TAG = "speculation"
+
+# Keywords of the local route classifier
+ROUTE_KEYWORDS = {
+    "stockbroker": ["stock", "stocks", "share", "shares", "ticker", "price", "portfolio", "buy", "invest", "market"],
+    "tripPlanner": ["trip", "travel", "hotel", "hotels", "stay", "restaurant", "restaurants", "vacation", "visit", "flight"],
+    "orderPizza": ["pizza", "pizzas", "pepperoni", "delivery"],
+    "openCode": ["todo", "react", "app", "code"],
+    "writerAgent": ["write", "document", "essay", "draft", "article"],
+}
+
+
+def speculation_safe(fn: Callable) -> Callable:
+    """Mark a node or step as free of side effects, so it may run speculatively."""
+    fn.speculation_safe = True
+    return fn
+
+
+class SpeculativeStep:
+    """Side-effect-free prefix of a route: ``run(state, config)`` produces what
+    the node named ``component`` would have produced.
+
+    The step may be given as a ``"module:attribute"`` spec, imported in a
+    worker thread the first time it runs, so registering it does not load the
+    sub-agent it belongs to. ``when(state)``, if given, tells whether the route
+    would run ``component`` first from ``state``; the step is not started when
+    it would not, since its result could never be taken.
+    """
+
+    def __init__(
+        self,
+        route: str,
+        component: str,
+        run: Union[str, Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]],
+        when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        self.route = route
+        self.component = component
+        self.spec = run if isinstance(run, str) else None
+        self._run = None if isinstance(run, str) else self._checked(run)
+        self.when = when
+
+    def _checked(self, run: Callable) -> Callable:
+        if not getattr(run, "speculation_safe", False):
+            raise ValueError(f"{self.component} is not marked speculation_safe")
+        return run
+
+    def load(self) -> Callable:
+        if self._run is None:
+            self._run = self._checked(import_string(self.spec))
+        return self._run
+
+    async def run(self, state: Dict[str, Any], config: Dict[str, Any]) -> Any:
+        run = self._run if self._run is not None else await asyncio.to_thread(self.load)
+        return await run(state, config)
+
+
+# route -> speculative step
+SPECULATIVE_STEPS: Dict[str, SpeculativeStep] = {}
+
+
+def register_speculative_step(
+    route: str,
+    component: str,
+    run: Union[str, Callable[..., Awaitable[Any]]],
+    when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> None:
+    SPECULATIVE_STEPS[route] = SpeculativeStep(route, component, run, when)
+
+
+def last_human_message(state: Dict[str, Any]) -> str:
+    for message in reversed(state.get("messages", [])):
+        if isinstance(message, dict):
+            if message.get("role") in ("human", "user"):
+                return str(message.get("content", ""))
+        elif getattr(message, "type", None) == "human":
+            return str(message.content)
+    return ""
+
+
+def predict_route(state: Dict[str, Any]) -> Tuple[Optional[str], float]:
+    """Likely route and its prior: the keyword classifier's pick, else the previous route."""
+    words = re.findall(r"[a-z]+", last_human_message(state).lower())
+    hits = {route: sum(word in keywords for word in words) for route, keywords in ROUTE_KEYWORDS.items()}
+    best = max(hits, key=hits.__getitem__)
+    if hits[best]:
+        total = sum(hits.values())
+        return best, hits[best] / total * min(1.0, 0.5 + 0.25 * hits[best])
+    previous = state.get("next")
+    if previous:
+        return previous, PREVIOUS_ROUTE_PRIOR
+    return None, 0.0
+
+
+class SpeculationMetrics:
+    """Hit rate and waste of speculative steps, per route."""
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _route(self, route: str) -> Dict[str, float]:
+        entry = self._routes.get(route)
+        if entry is None:
+            entry = self._routes[route] = {
+                "started": 0, "committed": 0, "used": 0, "discarded": 0,
+                "seconds_saved": 0.0, "seconds_wasted": 0.0,
+            }
+        return entry
+
+    def record(self, route: str, outcome: str, seconds: float = 0.0) -> None:
+        with self._lock:
+            entry = self._route(route)
+            entry[outcome] += 1
+            if outcome == "used":
+                entry["seconds_saved"] += seconds
+            elif outcome == "discarded":
+                entry["seconds_wasted"] += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                route: {
+                    **{key: round(value, 3) if isinstance(value, float) else value for key, value in entry.items()},
+                    "hit_rate": round(entry["committed"] / entry["started"], 4) if entry["started"] else 0.0,
+                }
+                for route, entry in self._routes.items()
+            }
+
+
+# Process-wide metrics, reported by the server's /stats endpoint
+speculation_metrics = SpeculationMetrics()
+
+
+class Speculation:
+    def __init__(self, step: SpeculativeStep, key: str, task: asyncio.Task):
+        self.step = step
+        self.key = key
+        self.task = task
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self.finished = time.monotonic()
+        if not task.cancelled():
+            # Failures of discarded speculations are expected; mark them retrieved
+            task.exception()
+
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+
+class Speculations:
+    """Speculative steps of one request, carried in ``config["configurable"]["speculation"]``."""
+
+    def __init__(self, metrics: SpeculationMetrics = speculation_metrics):
+        self.metrics = metrics
+        self._pending: List[Speculation] = []
+        self._committed: Dict[str, Speculation] = {}
+
+    def start(self, route: str, state: Dict[str, Any], config: Dict[str, Any]) -> bool:
+        """Start the speculative step of ``route``, if it has one that applies to ``state``."""
+        step = SPECULATIVE_STEPS.get(route)
+        if step is None or any(s.step.route == route for s in self._pending):
+            return False
+        if step.when is not None and not step.when(state):
+            return False
+        task = spawn(RunnableLambda(step.run).ainvoke(state, speculative_config(step, config)))
+        self._pending.append(Speculation(step, last_human_message(state), task))
+        self.metrics.record(route, "started")
+        return True
+
+    def resolve(self, routes: Union[None, str, Iterable[str]]) -> None:
+        """Commit the speculations for the chosen ``routes`` and cancel the others."""
+        routes = {routes} if isinstance(routes, str) else set(routes or ())
+        pending, self._pending = self._pending, []
+        for speculation in pending:
+            if speculation.step.route in routes:
+                self._committed[speculation.step.component] = speculation
+                self.metrics.record(speculation.step.route, "committed")
+            else:
+                self._discard(speculation)
+
+    async def take(self, component: str, state: Dict[str, Any]) -> Optional[Any]:
+        """Result of the committed speculation for ``component``, or None to run it normally."""
+        speculation = self._committed.pop(component, None)
+        if speculation is None:
+            return None
+        if speculation.key != last_human_message(state):
+            self._discard(speculation)
+            return None
+        waited = time.monotonic()
+        try:
+            result = await asyncio.shield(speculation.task)
+        except asyncio.CancelledError:
+            speculation.task.cancel()
+            raise
+        except Exception:
+            # The node runs normally and may fail or succeed on its own
+            self.metrics.record(speculation.step.route, "discarded", speculation.elapsed())
+            return None
+        # Time the step had already run before the node needed it
+        self.metrics.record(speculation.step.route, "used", max(waited - speculation.started, 0.0))
+        return result
+
+    def close(self) -> None:
+        """Cancel anything not taken by the end of the request."""
+        leftovers = self._pending + list(self._committed.values())
+        self._pending, self._committed = [], {}
+        for speculation in leftovers:
+            self._discard(speculation)
+
+    def _discard(self, speculation: Speculation) -> None:
+        speculation.task.cancel()
+        self.metrics.record(speculation.step.route, "discarded", speculation.elapsed())
+
+
+def speculative_config(step: SpeculativeStep, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Config of a run of ``step`` started from ``config``.
+
+    The run gets its own name, ``metadata["speculation"]`` and the
+    ``speculation`` tag, and keeps the request's budget. It does not get the
+    request's speculations, so the step cannot wait on itself.
+    """
+    run_name = f"speculation:{step.component}"
+    configurable = {k: v for k, v in (config.get("configurable") or {}).items() if k != "speculation"}
+    return {
+        **config,
+        "run_name": run_name,
+        "tags": [*(config.get("tags") or []), SPECULATION_TAG],
+        "metadata": {**(config.get("metadata") or {}), "speculation": run_name, "speculation_route": step.route},
+        "configurable": configurable,
+    }
+
+
+def speculation_config(config: Optional[Dict[str, Any]] = None, speculations: Optional[Speculations] = None) -> Dict[str, Any]:
+    """Copy of ``config`` carrying a ``Speculations`` for the request."""
+    config = dict(config or {})
+    config["configurable"] = {**(config.get("configurable") or {}), "speculation": speculations or Speculations()}
+    return config
+
+
+def get_speculations(config: Optional[Dict[str, Any]]) -> Optional[Speculations]:
+    speculations = ((config or {}).get("configurable") or {}).get("speculation")
+    return speculations if isinstance(speculations, Speculations) else None
+
+
+async def take_speculative(config: Optional[Dict[str, Any]], component: str, state: Dict[str, Any]) -> Optional[Any]:
+    """Committed speculative result for ``component`` in this request, if any."""
+    speculations = get_speculations(config)
+    return None if speculations is None else await speculations.take(component, state)
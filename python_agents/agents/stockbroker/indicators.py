@@ -0,0 +1,335 @@
+"""
+Technical indicators for the Stockbroker agent.
+
+All indicators are computed along the last axis of NumPy arrays, so the same
+functions work for a single ticker (1D) or a panel of tickers (2D). Recursive
+indicators (EMA, RSI, MACD) are evaluated in closed form over fixed-size blocks
+instead of bar by bar.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import math
+import threading
+
+import numpy as np
+
+from .market_data import MarketDataStore, PriceHistory, market_data
+from ..telemetry import record_cache
+
+
+RSI_WINDOW = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+BOLLINGER_STD = 2.0
+
+# Largest decay power allowed inside one EMA block before precision suffers
+_MAX_BLOCK_SCALE = 1e12
+_MAX_BLOCK = 4096
+
+SERIES_KEYS = (
+    "sma", "ema", "rsi", "macd", "macd_signal", "macd_histogram",
+    "bollinger_middle", "bollinger_upper", "bollinger_lower", "vwap",
+)
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum over a trailing window; the first ``window - 1`` entries are NaN."""
+    out = np.full(values.shape, np.nan)
+    if window > values.shape[-1]:
+        return out
+    csum = np.cumsum(values, axis=-1)
+    out[..., window - 1] = csum[..., window - 1]
+    out[..., window:] = csum[..., window:] - csum[..., :-window]
+    return out
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """Simple moving average."""
+    values = np.asarray(values, dtype=float)
+    # Shift by the first value to keep the running sum small
+    base = values[..., :1]
+    return _rolling_sum(values - base, window) / window + base
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Population standard deviation over a trailing window."""
+    values = np.asarray(values, dtype=float)
+    shifted = values - values[..., :1]
+    mean = _rolling_sum(shifted, window) / window
+    mean_sq = _rolling_sum(shifted * shifted, window) / window
+    return np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+
+
+def ema(values: np.ndarray, alpha: float, initial: Optional[np.ndarray] = None) -> np.ndarray:
+    """Exponential moving average with smoothing factor ``alpha``.
+
+    ``initial`` is the EMA value just before the first input; it defaults to the
+    first input itself. Within each block the recurrence is unrolled as
+    ``ema[k] = d**(k+1) * prev + alpha * d**k * cumsum(x[j] / d**j)`` with
+    ``d = 1 - alpha``, so only one Python iteration is needed per block.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.shape[-1] == 0 or alpha >= 1:
+        return values.copy()
+
+    decay = 1.0 - alpha
+    prev = values[..., 0] if initial is None else np.broadcast_to(np.asarray(initial, dtype=float), values.shape[:-1])
+    block = int(min(_MAX_BLOCK, max(1, math.log(_MAX_BLOCK_SCALE) / -math.log(decay))))
+    steps = np.arange(block)
+    decay_k = decay ** steps
+    inv_decay_k = decay ** -steps
+
+    out = np.empty_like(values)
+    for start in range(0, values.shape[-1], block):
+        chunk = values[..., start:start + block]
+        size = chunk.shape[-1]
+        acc = np.cumsum(chunk * inv_decay_k[:size], axis=-1)
+        out[..., start:start + size] = (
+            decay_k[:size] * decay * prev[..., None] + alpha * decay_k[:size] * acc
+        )
+        prev = out[..., start + size - 1]
+    return out
+
+
+def span_alpha(span: int) -> float:
+    """Smoothing factor for an EMA over ``span`` periods."""
+    return 2.0 / (span + 1)
+
+
+def vwap(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray, window: int) -> np.ndarray:
+    """Volume-weighted average of the typical price over a trailing window."""
+    typical = (np.asarray(high) + np.asarray(low) + np.asarray(close)) / 3.0
+    volume = np.asarray(volume, dtype=float)
+    return _rolling_sum(typical * volume, window) / _rolling_sum(volume, window)
+
+
+def _rsi_from_averages(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        return np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+
+
+def _compute(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    volume: np.ndarray,
+    window: int,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Compute every indicator plus the recursive state needed to extend them."""
+    close = np.asarray(close, dtype=float)
+    series: Dict[str, np.ndarray] = {}
+
+    series["sma"] = sma(close, window)
+    series["ema"] = ema(close, span_alpha(window))
+
+    delta = np.diff(close, axis=-1)
+    gain = np.maximum(delta, 0.0)
+    loss = np.maximum(-delta, 0.0)
+    avg_gain = ema(gain, 1.0 / RSI_WINDOW)
+    avg_loss = ema(loss, 1.0 / RSI_WINDOW)
+    rsi = np.full(close.shape, np.nan)
+    rsi[..., 1:] = _rsi_from_averages(avg_gain, avg_loss)
+    rsi[..., :RSI_WINDOW] = np.nan
+    series["rsi"] = rsi
+
+    fast = ema(close, span_alpha(MACD_FAST))
+    slow = ema(close, span_alpha(MACD_SLOW))
+    macd_line = fast - slow
+    signal = ema(macd_line, span_alpha(MACD_SIGNAL))
+    series["macd"] = macd_line
+    series["macd_signal"] = signal
+    series["macd_histogram"] = macd_line - signal
+
+    std = rolling_std(close, window)
+    series["bollinger_middle"] = series["sma"]
+    series["bollinger_upper"] = series["sma"] + BOLLINGER_STD * std
+    series["bollinger_lower"] = series["sma"] - BOLLINGER_STD * std
+
+    series["vwap"] = vwap(high, low, close, volume, window)
+
+    state = {
+        "ema": series["ema"][..., -1],
+        "macd_fast": fast[..., -1],
+        "macd_slow": slow[..., -1],
+        "macd_signal": signal[..., -1],
+        "avg_gain": avg_gain[..., -1],
+        "avg_loss": avg_loss[..., -1],
+    }
+    return series, state
+
+
+def _extend(
+    history: PriceHistory,
+    start: int,
+    window: int,
+    state: Dict[str, np.ndarray],
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Compute indicators for bars ``start:`` only, seeding from ``state``."""
+    new_close = history.close[start:]
+    lookback = slice(start - (window - 1), None)
+    series: Dict[str, np.ndarray] = {}
+
+    series["sma"] = sma(history.close[lookback], window)[window - 1:]
+    series["ema"] = ema(new_close, span_alpha(window), state["ema"])
+
+    delta = np.diff(history.close[start - 1:])
+    avg_gain = ema(np.maximum(delta, 0.0), 1.0 / RSI_WINDOW, state["avg_gain"])
+    avg_loss = ema(np.maximum(-delta, 0.0), 1.0 / RSI_WINDOW, state["avg_loss"])
+    series["rsi"] = _rsi_from_averages(avg_gain, avg_loss)
+
+    fast = ema(new_close, span_alpha(MACD_FAST), state["macd_fast"])
+    slow = ema(new_close, span_alpha(MACD_SLOW), state["macd_slow"])
+    macd_line = fast - slow
+    signal = ema(macd_line, span_alpha(MACD_SIGNAL), state["macd_signal"])
+    series["macd"] = macd_line
+    series["macd_signal"] = signal
+    series["macd_histogram"] = macd_line - signal
+
+    std = rolling_std(history.close[lookback], window)[window - 1:]
+    series["bollinger_middle"] = series["sma"]
+    series["bollinger_upper"] = series["sma"] + BOLLINGER_STD * std
+    series["bollinger_lower"] = series["sma"] - BOLLINGER_STD * std
+
+    series["vwap"] = vwap(
+        history.high[lookback], history.low[lookback],
+        history.close[lookback], history.volume[lookback], window,
+    )[window - 1:]
+
+    new_state = {
+        "ema": series["ema"][-1],
+        "macd_fast": fast[-1],
+        "macd_slow": slow[-1],
+        "macd_signal": signal[-1],
+        "avg_gain": avg_gain[-1],
+        "avg_loss": avg_loss[-1],
+    }
+    return series, new_state
+
+
+def compute_indicators(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    volume: np.ndarray,
+    window: int = 20,
+) -> Dict[str, np.ndarray]:
+    """Compute SMA, EMA, RSI, MACD, Bollinger bands and VWAP.
+
+    Inputs may be 1D (one ticker) or 2D (tickers x bars); every output has the
+    same shape as ``close`` with NaN during each indicator's warm-up period.
+    """
+    series, _ = _compute(high, low, close, volume, window)
+    return series
+
+
+class _CacheEntry:
+    __slots__ = ("length", "series", "state")
+
+    def __init__(self, length: int, series: Dict[str, np.ndarray], state: Dict[str, np.ndarray]):
+        self.length = length
+        self.series = series
+        self.state = state
+
+
+class IndicatorCache:
+    """LRU cache of indicator series keyed by (ticker, interval, window).
+
+    When new bars are appended to the store, cached entries are extended with
+    just the new bars instead of being recomputed from scratch.
+    """
+
+    def __init__(self, store: MarketDataStore = market_data, max_entries: int = 1024):
+        self.store = store
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self._entries: "OrderedDict[tuple, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ticker: str, interval: str = "day", window: int = 20) -> Tuple[PriceHistory, Dict[str, np.ndarray]]:
+        """Return the price history and indicator series for a ticker."""
+        if window < 2:
+            raise ValueError("window must be at least 2")
+        history = self.store.history(ticker, interval)
+        key = (history.ticker, interval, window)
+        length = len(history)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.length == length:
+                    self.hits += 1
+                    record_cache("indicators", "hit")
+                    return history, entry.series
+
+        if entry is not None and window <= entry.length < length:
+            tail, state = _extend(history, entry.length, window, entry.state)
+            series = {name: np.concatenate([entry.series[name], tail[name]]) for name in SERIES_KEYS}
+            self.extensions += 1
+            record_cache("indicators", "extended")
+        else:
+            series, state = _compute(history.high, history.low, history.close, history.volume, window)
+            self.misses += 1
+            record_cache("indicators", "miss")
+
+        with self._lock:
+            self._entries[key] = _CacheEntry(length, series, state)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return history, series
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _to_float(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def latest_values(history: PriceHistory, series: Dict[str, np.ndarray]) -> Dict[str, Optional[float]]:
+    """Most recent value of every indicator, with NaN mapped to None."""
+    latest = {"close": _to_float(history.close[-1])}
+    latest.update({name: _to_float(series[name][-1]) for name in SERIES_KEYS})
+    return latest
+
+
+def chart_series(history: PriceHistory, series: Dict[str, np.ndarray], points: int = 120) -> List[Dict[str, Any]]:
+    """Last ``points`` bars as chart rows for the ``indicators`` UI component."""
+    start = max(0, len(history) - points)
+    columns = {
+        "close": history.close[start:],
+        "sma": series["sma"][start:],
+        "ema": series["ema"][start:],
+        "upperBand": series["bollinger_upper"][start:],
+        "lowerBand": series["bollinger_lower"][start:],
+        "vwap": series["vwap"][start:],
+        "rsi": series["rsi"][start:],
+        "macd": series["macd"][start:],
+        "macdSignal": series["macd_signal"][start:],
+        "macdHistogram": series["macd_histogram"][start:],
+    }
+    rounded = {name: np.round(values, 4) for name, values in columns.items()}
+    times = history.time[start:]
+
+    rows = []
+    for i, timestamp in enumerate(times):
+        row: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(int(timestamp), tz=timezone.utc).isoformat(),
+        }
+        for name, values in rounded.items():
+            value = values[i]
+            row[name] = None if np.isnan(value) else float(value)
+        rows.append(row)
+    return rows
+
+
+# Shared cache used by the stockbroker tools
+indicator_cache = IndicatorCache()
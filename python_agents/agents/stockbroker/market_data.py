@@ -0,0 +1,178 @@
+"""
+Market data store for the Stockbroker agent.
+
+Holds OHLCV price history per (ticker, interval) as NumPy arrays so that
+tools can run vectorized computations over it. Histories are simulated
+deterministically from the ticker symbol until a real data provider is wired in.
+"""
+
+from typing import Any, Dict, Iterable, Optional
+import threading
+import zlib
+
+import numpy as np
+
+
+# Seconds per bar for each supported interval
+INTERVALS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+# Ten years of trading days
+DEFAULT_BARS = 2520
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+class PriceHistory:
+    """OHLCV bars for a single ticker and interval.
+
+    ``version`` is bumped every time bars are appended so that derived results
+    (indicators, risk estimates) can tell whether they are stale.
+    """
+
+    def __init__(self, ticker: str, interval: str, time: np.ndarray, bars: Dict[str, np.ndarray]):
+        self.ticker = ticker
+        self.interval = interval
+        self.time = time
+        self.open = bars["open"]
+        self.high = bars["high"]
+        self.low = bars["low"]
+        self.close = bars["close"]
+        self.volume = bars["volume"]
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def field(self, name: str) -> np.ndarray:
+        """Return the array for one of ``BAR_FIELDS``."""
+        if name not in BAR_FIELDS:
+            raise ValueError(f"Unknown bar field: {name}")
+        return getattr(self, name)
+
+
+def _seed_for(ticker: str, interval: str) -> int:
+    return zlib.crc32(f"{ticker}:{interval}".encode())
+
+
+def synthetic_bars(
+    tickers: Iterable[str],
+    num_bars: int = DEFAULT_BARS,
+    interval: str = "day",
+) -> Dict[str, np.ndarray]:
+    """Simulate aligned OHLCV bars for several tickers at once.
+
+    Returns a dict of 2D arrays shaped ``(len(tickers), num_bars)``. Each row is a
+    geometric random walk seeded by the ticker, so the same ticker always yields
+    the same history.
+    """
+    tickers = list(tickers)
+    rows = len(tickers)
+    close = np.empty((rows, num_bars))
+    noise = np.empty((rows, num_bars, 3))
+    scale = np.sqrt(INTERVALS[interval] / INTERVALS["day"])
+
+    for i, ticker in enumerate(tickers):
+        rng = np.random.default_rng(_seed_for(ticker, interval))
+        start = rng.uniform(20, 500)
+        drift = rng.normal(0.0003, 0.0002) * scale**2
+        vol = rng.uniform(0.01, 0.03) * scale
+        returns = rng.normal(drift, vol, num_bars)
+        close[i] = start * np.exp(np.cumsum(returns))
+        noise[i] = rng.random((num_bars, 3))
+
+    open_ = np.empty_like(close)
+    open_[:, 0] = close[:, 0]
+    open_[:, 1:] = close[:, :-1]
+    body_high = np.maximum(open_, close)
+    body_low = np.minimum(open_, close)
+    spread = close * 0.01 * scale
+
+    return {
+        "open": open_,
+        "high": body_high + spread * noise[..., 0],
+        "low": body_low - spread * noise[..., 1],
+        "close": close,
+        "volume": np.floor(1_000_000 + 9_000_000 * noise[..., 2]),
+    }
+
+
+class MarketDataStore:
+    """In-process store of price histories keyed by (ticker, interval)."""
+
+    def __init__(self, num_bars: int = DEFAULT_BARS, end_time: Optional[int] = None):
+        self.num_bars = num_bars
+        self.end_time = end_time
+        self._histories: Dict[tuple, PriceHistory] = {}
+        self._lock = threading.Lock()
+
+    def history(self, ticker: str, interval: str = "day") -> PriceHistory:
+        """Return the price history for a ticker, loading it on first access."""
+        if interval not in INTERVALS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        key = (ticker.upper(), interval)
+        with self._lock:
+            history = self._histories.get(key)
+            if history is None:
+                history = self._load(key[0], interval)
+                self._histories[key] = history
+            return history
+
+    def append_bars(self, ticker: str, bars: Dict[str, Iterable[float]], interval: str = "day") -> int:
+        """Append new bars to a ticker's history and return the new length."""
+        history = self.history(ticker, interval)
+        new = {name: np.asarray(bars[name], dtype=float) for name in BAR_FIELDS}
+        count = len(new["close"])
+        if count == 0:
+            return len(history)
+
+        step = INTERVALS[interval]
+        times = history.time[-1] + step * np.arange(1, count + 1)
+        with self._lock:
+            history.time = np.concatenate([history.time, times])
+            for name in BAR_FIELDS:
+                setattr(history, name, np.concatenate([history.field(name), new[name]]))
+            history.version += 1
+        return len(history)
+
+    def panel(self, tickers: Iterable[str], field: str = "close", interval: str = "day") -> np.ndarray:
+        """Stack one field for several tickers into a 2D array aligned on the latest bars."""
+        series = [self.history(ticker, interval).field(field) for ticker in tickers]
+        length = min(len(s) for s in series)
+        return np.stack([s[-length:] for s in series])
+
+    def quotes(self, tickers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Latest quote for each ticker, keyed by upper-cased ticker."""
+        result = {}
+        for ticker in tickers:
+            history = self.history(ticker, "day")
+            if history.ticker in result:
+                continue
+            price = float(history.close[-1])
+            previous = float(history.close[-2]) if len(history) > 1 else float(history.open[-1])
+            change = price - previous
+            # Simulated share count, stable per ticker
+            shares = 50_000_000 + _seed_for(history.ticker, "shares") % 5_000_000_000
+            result[history.ticker] = {
+                "ticker": history.ticker,
+                "price": round(price, 2),
+                "change": round(change, 2),
+                "change_percent": round(change / previous * 100, 2),
+                "volume": int(history.volume[-1]),
+                "market_cap": int(price * shares),
+            }
+        return result
+
+    def _load(self, ticker: str, interval: str) -> PriceHistory:
+        bars = {name: values[0] for name, values in synthetic_bars([ticker], self.num_bars, interval).items()}
+        step = INTERVALS[interval]
+        end = self.end_time if self.end_time is not None else int(np.datetime64("today", "s").astype(np.int64))
+        time = end - step * np.arange(self.num_bars - 1, -1, -1, dtype=np.int64)
+        return PriceHistory(ticker, interval, time, bars)
+
+
+# Shared store used by the stockbroker tools
+market_data = MarketDataStore()
@@ -0,0 +1,273 @@
+"""
+Portfolio risk estimates for the Stockbroker agent.
+
+Value at Risk (VaR) and expected shortfall are estimated with a Monte Carlo
+simulation of correlated log returns, using the covariance of historical daily
+returns from the market-data store. Paths are simulated in fixed-size chunks and
+folded into streaming loss histograms, so memory use does not grow with the
+number of paths. Large simulations are split across a process pool.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import atexit
+import hashlib
+import math
+import os
+import threading
+
+import numpy as np
+
+from .market_data import MarketDataStore, market_data
+from ..telemetry import record_cache
+
+
+DEFAULT_HORIZONS = (1, 10)
+DEFAULT_LOOKBACK = 252
+DEFAULT_PATHS = 100_000
+CHUNK_SIZE = 20_000
+HISTOGRAM_BINS = 16_384
+# Histogram range, in standard deviations of the linearized loss
+HISTOGRAM_SIGMAS = 12.0
+# Positions x paths above which the simulation is split across processes
+PARALLEL_THRESHOLD = 50_000_000
+
+
+class StreamingHistogram:
+    """Fixed-bin histogram that also tracks the sum of the values in each bin.
+
+    Bin 0 and the last bin collect values below and above the range. Histograms
+    with the same range can be merged, which is how results from worker
+    processes are combined.
+    """
+
+    def __init__(self, low: float, high: float, bins: int = HISTOGRAM_BINS):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.width = (high - low) / bins
+        self.counts = np.zeros(bins + 2)
+        self.sums = np.zeros(bins + 2)
+
+    def add(self, values: np.ndarray) -> None:
+        index = np.floor((values - self.low) / self.width).astype(np.int64) + 1
+        np.clip(index, 0, self.bins + 1, out=index)
+        self.counts += np.bincount(index, minlength=self.bins + 2)
+        self.sums += np.bincount(index, weights=values, minlength=self.bins + 2)
+
+    def merge(self, counts: np.ndarray, sums: np.ndarray) -> None:
+        self.counts += counts
+        self.sums += sums
+
+    @property
+    def total(self) -> float:
+        return float(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        """Value below which a fraction ``q`` of the samples fall."""
+        target = q * self.total
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, target))
+        if i == 0 or i == self.bins + 1:
+            # Outside the histogram range: fall back to the mean of that bin
+            return float(self.sums[i] / max(self.counts[i], 1))
+        before = cumulative[i - 1]
+        fraction = (target - before) / self.counts[i] if self.counts[i] else 0.0
+        return self.low + (i - 1 + fraction) * self.width
+
+    def tail_mean(self, threshold: float) -> float:
+        """Mean of the samples at or above ``threshold``."""
+        i = int(np.clip(np.floor((threshold - self.low) / self.width) + 1, 0, self.bins + 1))
+        count = self.counts[i + 1:].sum()
+        total = self.sums[i + 1:].sum()
+        if 0 < i <= self.bins and self.counts[i]:
+            bin_high = self.low + i * self.width
+            share = (bin_high - threshold) / self.width
+            count += share * self.counts[i]
+            total += share * self.counts[i] * (threshold + bin_high) / 2
+        return float(total / count) if count else threshold
+
+
+def _simulate_chunks(
+    chol: np.ndarray,
+    mean: np.ndarray,
+    values: np.ndarray,
+    horizons: Sequence[int],
+    ranges: Sequence[Tuple[float, float]],
+    num_paths: int,
+    seed: Any,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Simulate ``num_paths`` loss paths per horizon and return histogram bins.
+
+    Runs in worker processes, so it only takes and returns plain arrays.
+    """
+    rng = np.random.default_rng(seed)
+    histograms = [StreamingHistogram(low, high) for low, high in ranges]
+    # Single precision halves the cost of sampling and of the matrix product
+    chol_t = chol.T.astype(np.float32)
+    mean = mean.astype(np.float32)
+    values = values.astype(np.float32)
+
+    remaining = num_paths
+    while remaining > 0:
+        size = min(CHUNK_SIZE, remaining)
+        # Antithetic pairs: every sampled shock is also used with its sign flipped
+        half = (size + 1) // 2
+        shocks = rng.standard_normal((half, len(values)), dtype=np.float32) @ chol_t
+        shocks = np.concatenate([shocks, -shocks])[:size]
+        for horizon, histogram in zip(horizons, histograms):
+            returns = mean * horizon + shocks * np.float32(math.sqrt(horizon))
+            histogram.add(-(np.expm1(returns) @ values).astype(np.float64))
+        remaining -= size
+    return [(h.counts, h.sums) for h in histograms]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def return_moments(
+    tickers: Sequence[str],
+    store: MarketDataStore = market_data,
+    lookback: int = DEFAULT_LOOKBACK,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean vector and covariance matrix of daily log returns."""
+    close = store.panel(tickers, "close", "day")[:, -(lookback + 1):]
+    returns = np.diff(np.log(close), axis=1)
+    mean = returns.mean(axis=1)
+    cov = np.atleast_2d(np.cov(returns))
+    return mean, cov
+
+
+def portfolio_version(positions: Dict[str, float], store: MarketDataStore = market_data) -> str:
+    """Identifier that changes whenever the positions or their price histories do."""
+    digest = hashlib.sha1()
+    for ticker in sorted(positions):
+        history = store.history(ticker, "day")
+        digest.update(f"{history.ticker}:{positions[ticker]!r}:{len(history)}:{history.version};".encode())
+    return digest.hexdigest()
+
+
+def simulate_risk(
+    positions: Dict[str, float],
+    confidence: float = 0.99,
+    num_paths: int = DEFAULT_PATHS,
+    horizons: Iterable[int] = DEFAULT_HORIZONS,
+    store: MarketDataStore = market_data,
+    lookback: int = DEFAULT_LOOKBACK,
+    seed: int = 0,
+    parallel: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Estimate VaR and expected shortfall for positions given as ticker -> value.
+
+    Losses are reported as positive amounts in the same currency as the
+    position values.
+    """
+    if not positions:
+        raise ValueError("Portfolio has no positions")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+
+    tickers = list(positions)
+    horizons = tuple(horizons)
+    values = np.array([positions[t] for t in tickers], dtype=float)
+    mean, cov = return_moments(tickers, store, lookback)
+    # Small ridge keeps the factorization stable for nearly collinear histories
+    chol = np.linalg.cholesky(cov + np.eye(len(values)) * 1e-12)
+
+    daily_sigma = math.sqrt(float(values @ cov @ values))
+    # Expected simple return includes the convexity of exp(): mean + variance / 2
+    daily_drift = float(values @ (mean + np.diag(cov) / 2))
+    ranges = []
+    for horizon in horizons:
+        center = -daily_drift * horizon
+        half_width = max(HISTOGRAM_SIGMAS * daily_sigma * math.sqrt(horizon), 1e-9)
+        ranges.append((center - half_width, center + half_width))
+
+    if parallel is None:
+        parallel = num_paths * len(values) >= PARALLEL_THRESHOLD
+    workers = (os.cpu_count() or 1) if parallel else 1
+    splits = [num_paths // workers + (1 if i < num_paths % workers else 0) for i in range(workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+
+    if workers > 1:
+        pool = _get_pool()
+        futures = [
+            pool.submit(_simulate_chunks, chol, mean, values, horizons, ranges, paths, child)
+            for paths, child in zip(splits, seeds) if paths
+        ]
+        partials = [future.result() for future in futures]
+    else:
+        partials = [_simulate_chunks(chol, mean, values, horizons, ranges, num_paths, seeds[0])]
+
+    results = {}
+    for i, (horizon, (low, high)) in enumerate(zip(horizons, ranges)):
+        histogram = StreamingHistogram(low, high)
+        for partial in partials:
+            histogram.merge(*partial[i])
+        var = histogram.quantile(confidence)
+        results[f"{horizon}d"] = {
+            "var": round(float(var), 2),
+            "expected_shortfall": round(histogram.tail_mean(var), 2),
+        }
+
+    return {
+        "confidence": confidence,
+        "num_paths": num_paths,
+        "positions": len(values),
+        "portfolio_value": round(float(values.sum()), 2),
+        "horizons": results,
+    }
+
+
+class RiskCache:
+    """Memoizes risk estimates per portfolio version and simulation settings."""
+
+    def __init__(self, store: MarketDataStore = market_data, max_entries: int = 128):
+        self.store = store
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        positions: Dict[str, float],
+        confidence: float = 0.99,
+        num_paths: int = DEFAULT_PATHS,
+        horizons: Iterable[int] = DEFAULT_HORIZONS,
+    ) -> Dict[str, Any]:
+        horizons = tuple(horizons)
+        key = (portfolio_version(positions, self.store), confidence, num_paths, horizons)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("risk", "hit")
+                return self._entries[key]
+
+        result = simulate_risk(positions, confidence, num_paths, horizons, self.store)
+        result["portfolio_version"] = key[0]
+
+        record_cache("risk", "miss")
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+
+# Shared cache used by the stockbroker tools
+risk_cache = RiskCache()
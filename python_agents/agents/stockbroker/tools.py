@@ -2,17 +2,36 @@
 Tools for the Stockbroker agent.
 """
 
-from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List, Optional
 from langchain_core.tools import tool
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from pydantic import BaseModel, Field
-import random
+import re
+import threading
 import time
 from datetime import datetime
 
 from .types import StockbrokerState, StockbrokerUpdate
+from .market_data import market_data
+from .indicators import indicator_cache, latest_values, chart_series
+from .risk import risk_cache
 from ..types import typed_ui
+from ..budget import Budget, get_budget
+from ..cancellation import run_in_thread, sleep
+from ..cascade import Cascade, invoke_cascade, tool_call_errors
+from ..providers import Capability
+from ..speculation import last_human_message, speculation_safe, take_speculative
+from ..telemetry import record_cache
+
+
+MAX_TICKERS_PER_QUERY = 50
+
+# Tools whose calls can be answered together by one bulk tool call:
+# tool name -> (bulk tool name, argument in the original call, list argument of the bulk tool)
+BULK_TOOLS = {
+    "get_stock_price": ("get_stock_prices", "ticker", "tickers"),
+    "get_stock_prices": ("get_stock_prices", "tickers", "tickers"),
+}
 
 
 class PriceQuery(BaseModel):
@@ -20,6 +39,11 @@ class PriceQuery(BaseModel):
     ticker: str = Field(description="Stock ticker symbol")
 
 
+class MultiPriceQuery(BaseModel):
+    """Query for several stock prices at once."""
+    tickers: List[str] = Field(min_length=1, max_length=MAX_TICKERS_PER_QUERY, description="Stock ticker symbols")
+
+
 class BuyOrder(BaseModel):
     """Buy order for stocks."""
     ticker: str = Field(description="Stock ticker symbol")
@@ -31,24 +55,114 @@ class PortfolioQuery(BaseModel):
     pass
 
 
+class IndicatorQuery(BaseModel):
+    """Query for technical indicators."""
+    ticker: str = Field(description="Stock ticker symbol")
+    window: int = Field(20, description="Lookback window in bars for SMA, EMA, Bollinger bands and VWAP")
+    interval: str = Field("day", description="Bar interval: 'minute', 'hour' or 'day'")
+
+
+class RiskQuery(BaseModel):
+    """Query for portfolio risk."""
+    confidence: float = Field(0.99, gt=0, lt=1, description="Confidence level for VaR and expected shortfall, e.g. 0.95 or 0.99")
+    num_paths: int = Field(100_000, ge=1_000, le=1_000_000, description="Number of Monte Carlo paths to simulate")
+
+
+# Most recent quote per ticker, served when the request budget runs low
+_recent_quotes: Dict[str, Dict[str, Any]] = {}
+_recent_quotes_lock = threading.Lock()
+
+
+def fetch_quotes(
+    tickers: List[str],
+    use_cache: bool = False,
+    prefetched: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Look up quotes for several tickers in a single request to the quote layer.
+    
+    Tickers in ``prefetched`` (quotes fetched earlier in the same request) are
+    answered from it. With ``use_cache`` set, tickers quoted before are answered
+    from their last quote. Only the rest are looked up.
+    """
+    cached = {t.upper(): prefetched[t.upper()] for t in tickers if t.upper() in (prefetched or {})}
+    if use_cache:
+        with _recent_quotes_lock:
+            cached.update({t.upper(): _recent_quotes[t.upper()] for t in tickers if t.upper() in _recent_quotes and t.upper() not in cached})
+    missing = [t for t in tickers if t.upper() not in cached]
+    if use_cache:
+        for ticker in tickers:
+            if ticker.upper() not in (prefetched or {}):
+                record_cache("quotes", "miss" if ticker in missing else "hit")
+    if not missing:
+        return cached
+    
+    # Simulate API call delay (one round trip per request, not per ticker)
+    sleep(0.5)
+    
+    quotes = market_data.quotes(missing)
+    timestamp = datetime.now().isoformat()
+    fresh = {
+        ticker: {**quote, "timestamp": timestamp}
+        for ticker, quote in quotes.items()
+    }
+    with _recent_quotes_lock:
+        _recent_quotes.update(fresh)
+    return {**cached, **fresh}
+
+
+# Upper-case words that look like tickers but are not
+NOT_TICKERS = {"I", "A", "AN", "AND", "OR", "THE", "VS", "USD", "ETF", "CEO", "IPO", "AI", "US", "OK"}
+
+
+def mentioned_tickers(text: str) -> List[str]:
+    """Ticker symbols in a user message, such as ``AAPL`` or ``$msft``."""
+    tickers = re.findall(r"\$([A-Za-z]{1,5})\b", text) + re.findall(r"\b[A-Z]{2,5}\b", text)
+    seen = []
+    for ticker in (t.upper() for t in tickers):
+        if ticker not in NOT_TICKERS and ticker not in seen:
+            seen.append(ticker)
+    return seen[:MAX_TICKERS_PER_QUERY]
+
+
+@speculation_safe
+async def prefetch_quotes(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Quotes for the tickers the user mentioned, looked up ahead of the tool calls."""
+    tickers = mentioned_tickers(last_human_message(state))
+    if not tickers:
+        return {}
+    return await run_in_thread(fetch_quotes, tickers)
+
+
 @tool
 def get_stock_price(ticker: str) -> Dict[str, Any]:
     """Get current stock price for a given ticker."""
-    # Simulate API call delay
-    time.sleep(0.5)
-    
-    # Mock price data
-    base_price = random.uniform(50, 500)
-    change = random.uniform(-0.05, 0.05)
-    current_price = base_price * (1 + change)
+    return fetch_quotes([ticker])[ticker.upper()]
+
+
+@tool(args_schema=MultiPriceQuery)
+def get_stock_prices(tickers: List[str]) -> Dict[str, Any]:
+    """Get current stock prices for several tickers at once. Use this to compare tickers."""
+    quotes = fetch_quotes(tickers)
     
     return {
-        "ticker": ticker.upper(),
-        "price": round(current_price, 2),
-        "change": round(change * 100, 2),
-        "change_percent": round(change * 100, 2),
-        "volume": random.randint(1000000, 10000000),
-        "market_cap": random.randint(1000000000, 100000000000),
+        "quotes": list(quotes.values()),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@tool(args_schema=IndicatorQuery)
+def get_indicators(ticker: str, window: int = 20, interval: str = "day") -> Dict[str, Any]:
+    """Get technical indicators for a ticker: SMA, EMA, RSI, MACD, Bollinger bands and VWAP."""
+    history, series = indicator_cache.get(ticker, interval, window)
+    latest = latest_values(history, series)
+
+    return {
+        "ticker": history.ticker,
+        "interval": interval,
+        "window": window,
+        "latest": latest,
+        "above_sma": latest["sma"] is not None and latest["close"] > latest["sma"],
+        "series": chart_series(history, series),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -57,9 +171,9 @@ def get_stock_price(ticker: str) -> Dict[str, Any]:
 def buy_stock(ticker: str, quantity: int) -> Dict[str, Any]:
     """Buy shares of a stock."""
     # Simulate API call delay
-    time.sleep(1)
+    sleep(1)
     
-    price_data = get_stock_price(ticker)
+    price_data = get_stock_price.invoke({"ticker": ticker})
     total_cost = price_data["price"] * quantity
     
     return {
@@ -72,39 +186,42 @@ def buy_stock(ticker: str, quantity: int) -> Dict[str, Any]:
     }
 
 
+# Mock portfolio data
+MOCK_HOLDINGS = [
+    {
+        "ticker": "AAPL",
+        "shares": 100,
+        "current_price": 175.50,
+        "total_value": 17550.00,
+        "day_change": 2.30,
+        "day_change_percent": 1.33
+    },
+    {
+        "ticker": "GOOGL",
+        "shares": 50,
+        "current_price": 142.80,
+        "total_value": 7140.00,
+        "day_change": -1.20,
+        "day_change_percent": -0.83
+    },
+    {
+        "ticker": "MSFT",
+        "shares": 75,
+        "current_price": 378.90,
+        "total_value": 28417.50,
+        "day_change": 5.60,
+        "day_change_percent": 1.50
+    }
+]
+
+
 @tool
 def get_portfolio() -> Dict[str, Any]:
     """Get user's portfolio information."""
     # Simulate API call delay
-    time.sleep(0.5)
-    
-    # Mock portfolio data
-    holdings = [
-        {
-            "ticker": "AAPL",
-            "shares": 100,
-            "current_price": 175.50,
-            "total_value": 17550.00,
-            "day_change": 2.30,
-            "day_change_percent": 1.33
-        },
-        {
-            "ticker": "GOOGL",
-            "shares": 50,
-            "current_price": 142.80,
-            "total_value": 7140.00,
-            "day_change": -1.20,
-            "day_change_percent": -0.83
-        },
-        {
-            "ticker": "MSFT",
-            "shares": 75,
-            "current_price": 378.90,
-            "total_value": 28417.50,
-            "day_change": 5.60,
-            "day_change_percent": 1.50
-        }
-    ]
+    sleep(0.5)
+    
+    holdings = MOCK_HOLDINGS
     
     total_value = sum(holding["total_value"] for holding in holdings)
     total_change = sum(holding["day_change"] * holding["shares"] for holding in holdings)
@@ -118,13 +235,211 @@ def get_portfolio() -> Dict[str, Any]:
     }
 
 
+@tool(args_schema=RiskQuery)
+def get_portfolio_risk(confidence: float = 0.99, num_paths: int = 100_000) -> Dict[str, Any]:
+    """Estimate the 1-day and 10-day Value at Risk and expected shortfall of the user's portfolio."""
+    positions = {holding["ticker"]: holding["total_value"] for holding in MOCK_HOLDINGS}
+    result = risk_cache.get(positions, confidence, num_paths)
+    
+    return {
+        **result,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def _invalid_arguments(error: Exception) -> str:
+    """Tool result for arguments the schema rejects, so the model can correct them."""
+    errors = error.errors() if hasattr(error, "errors") else [{"loc": (), "msg": str(error)}]
+    return "Invalid arguments: " + "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in errors
+    )
+
+
+# An out-of-range confidence from the model answers its tool call instead of failing the node
+get_portfolio_risk.handle_validation_error = _invalid_arguments
+
+
+def merge_tool_calls(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group the tool calls of one response into executions.
+    
+    Calls that map to the same bulk tool in ``BULK_TOOLS`` are merged into a
+    single execution of that tool whenever more than one call would use it; all
+    other calls are executed on their own. A merged execution asks for at most
+    ``MAX_TICKERS_PER_QUERY`` items; the calls past that start another one.
+    Each execution keeps the original calls it answers, in order, so every call
+    still gets its own tool message.
+    """
+    executions = []
+    bulk = {}
+    for tool_call in tool_calls:
+        name = tool_call["name"]
+        if name not in BULK_TOOLS:
+            executions.append({"name": name, "args": tool_call["args"], "tool_calls": [tool_call]})
+            continue
+        
+        bulk_name, item_arg, list_arg = BULK_TOOLS[name]
+        items = tool_call["args"].get(item_arg, [])
+        items = items if isinstance(items, list) else [items]
+        execution = bulk.get(bulk_name)
+        if execution is not None:
+            merged = execution["args"][list_arg]
+            added = {item for item in items if item not in merged}
+            if merged and len(merged) + len(added) > MAX_TICKERS_PER_QUERY:
+                execution = None
+        if execution is None:
+            execution = {"name": bulk_name, "args": {list_arg: []}, "tool_calls": []}
+            bulk[bulk_name] = execution
+            executions.append(execution)
+        for item in items:
+            if item not in execution["args"][list_arg]:
+                execution["args"][list_arg].append(item)
+        execution["tool_calls"].append(tool_call)
+    
+    for execution in executions:
+        calls = execution["tool_calls"]
+        if len(calls) == 1 and calls[0]["name"] != execution["name"]:
+            # A lone single-item call gains nothing from the bulk tool
+            execution.update(name=calls[0]["name"], args=calls[0]["args"])
+    return executions
+
+
+def _quotes_for_call(tool_call: Dict[str, Any], quotes: Dict[str, Dict[str, Any]]) -> Any:
+    """The part of a bulk quote result that answers one original tool call."""
+    if tool_call["name"] == "get_stock_price":
+        return quotes.get(tool_call["args"]["ticker"].upper())
+    return [quotes.get(ticker.upper()) for ticker in tool_call["args"]["tickers"]]
+
+
+def execute_tool_calls(
+    response: AIMessage,
+    ui,
+    merge: bool = True,
+    budget: Optional[Budget] = None,
+    prefetched: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Execute the tool calls in ``response``, pushing UI components to ``ui``.
+    
+    Returns one tool message per tool call. With ``merge`` set, same-tool calls
+    are first combined by ``merge_tool_calls``. Time spent in each tool is
+    recorded on ``budget``; when it runs low, quotes come from the last lookup.
+    Quotes in ``prefetched`` are used instead of looking them up again.
+    """
+    budget = budget or Budget()
+    use_cache = budget.should_use_cached_tools("stockbroker.call_tools")
+    if merge:
+        executions = merge_tool_calls(response.tool_calls)
+    else:
+        executions = [
+            {"name": tc["name"], "args": tc["args"], "tool_calls": [tc]}
+            for tc in response.tool_calls
+        ]
+    
+    tool_messages = []
+    for execution in executions:
+        component = f"stockbroker.{execution['name']}"
+        budget.check(component)
+        
+        if execution["name"] == "get_stock_prices":
+            with budget.track(component):
+                if use_cache or prefetched:
+                    result = {
+                        "quotes": list(fetch_quotes(execution["args"]["tickers"], use_cache, prefetched).values()),
+                        "timestamp": datetime.now().isoformat()
+                    }
+                else:
+                    result = get_stock_prices.invoke(execution["args"])
+            quotes = {quote["ticker"]: quote for quote in result["quotes"]}
+            ui.push(
+                {
+                    "name": "stock-comparison",
+                    "props": {
+                        "toolCallIds": [tc["id"] for tc in execution["tool_calls"]],
+                        "quotes": result["quotes"]
+                    }
+                },
+                {"message": response}
+            )
+            for tool_call in execution["tool_calls"]:
+                tool_messages.append({
+                    "type": "tool",
+                    "content": str(_quotes_for_call(tool_call, quotes)),
+                    "tool_call_id": tool_call["id"]
+                })
+            continue
+        
+        tool_call = execution["tool_calls"][0]
+        tool_name = tool_call["name"]
+        tool_args = tool_call["args"]
+        
+        with budget.track(component):
+            if tool_name == "get_stock_price" and (use_cache or prefetched):
+                result = fetch_quotes([tool_args["ticker"]], use_cache, prefetched)[tool_args["ticker"].upper()]
+            elif tool_name == "get_stock_price":
+                result = get_stock_price.invoke(tool_args)
+            elif tool_name == "buy_stock":
+                result = buy_stock.invoke(tool_args)
+            elif tool_name == "get_indicators":
+                result = get_indicators.invoke(tool_args)
+            elif tool_name == "get_portfolio":
+                result = get_portfolio.invoke({})
+            elif tool_name == "get_portfolio_risk":
+                result = get_portfolio_risk.invoke(tool_args)
+            else:
+                result = {"error": f"Unknown tool: {tool_name}"}
+        
+        if tool_name == "get_indicators":
+            # The chart series is only for the UI; the model gets the latest values
+            series = result.pop("series")
+            ui.push(
+                {
+                    "name": "indicators",
+                    "props": {
+                        "toolCallId": tool_call["id"],
+                        "ticker": result["ticker"],
+                        "interval": result["interval"],
+                        "window": result["window"],
+                        "latest": result["latest"],
+                        "series": series
+                    }
+                },
+                {"message": response}
+            )
+        else:
+            # Push UI component for each tool call
+            ui.push(
+                {
+                    "name": "stockbroker",
+                    "props": {
+                        "toolName": tool_name,
+                        "result": result,
+                        "timestamp": time.time()
+                    }
+                },
+                {"message": response}
+            )
+        
+        tool_messages.append({
+            "type": "tool",
+            "content": str(result),
+            "tool_call_id": tool_call["id"]
+        })
+    
+    return tool_messages
+
+
+CALL_TOOLS_MODELS = Cascade([Capability.TOOL_CALLING], temperature=0)
+STOCKBROKER_TOOLS = [
+    get_stock_price, get_stock_prices, get_indicators,
+    buy_stock, get_portfolio, get_portfolio_risk
+]
+
+
 async def call_tools(state: StockbrokerState, config: Dict[str, Any]) -> StockbrokerUpdate:
     """Call the appropriate tools based on the conversation."""
     ui = typed_ui(config)
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    
-    # Bind tools to the model
-    model_with_tools = model.bind_tools([get_stock_price, buy_stock, get_portfolio])
+    budget = get_budget(config)
+    # Quotes the supervisor fetched while routing to us, if it guessed the route
+    prefetched = await take_speculative(config, "stockbroker.prefetch_quotes", state)
     
     # Convert messages to proper format
     messages = []
@@ -139,46 +454,24 @@ async def call_tools(state: StockbrokerState, config: Dict[str, Any]) -> Stockbr
     
     # Add system message
     system_message = HumanMessage(
-        content="You are a helpful stockbroker assistant. Use the available tools to help users with stock prices, buying stocks, and viewing their portfolio."
+        content="You are a helpful stockbroker assistant. Use the available tools to help users with stock prices, technical indicators, buying stocks, and viewing their portfolio and its risk. When the user asks about several tickers, call get_stock_prices once with all of them."
     )
     messages.insert(0, system_message)
     
-    response = await model_with_tools.ainvoke(messages)
+    # A small model's tool calls are only used if they fit the tools' schemas
+    response = await invoke_cascade(
+        CALL_TOOLS_MODELS,
+        lambda model: model.bind_tools(STOCKBROKER_TOOLS),
+        messages,
+        config,
+        "stockbroker.call_tools",
+        lambda response: tool_call_errors(response, STOCKBROKER_TOOLS),
+    )
     
     # Execute tool calls if any
     if response.tool_calls:
-        tool_messages = []
-        for tool_call in response.tool_calls:
-            tool_name = tool_call["name"]
-            tool_args = tool_call["args"]
-            
-            if tool_name == "get_stock_price":
-                result = get_stock_price(**tool_args)
-            elif tool_name == "buy_stock":
-                result = buy_stock(**tool_args)
-            elif tool_name == "get_portfolio":
-                result = get_portfolio()
-            else:
-                result = {"error": f"Unknown tool: {tool_name}"}
-            
-            # Push UI component for each tool call
-            ui.push(
-                {
-                    "name": "stockbroker",
-                    "props": {
-                        "toolName": tool_name,
-                        "result": result,
-                        "timestamp": time.time()
-                    }
-                },
-                {"message": response}
-            )
-            
-            tool_messages.append({
-                "type": "tool",
-                "content": str(result),
-                "tool_call_id": tool_call["id"]
-            })
+        # Tools block on I/O; run them off the event loop so cancelling the run stops them
+        tool_messages = await run_in_thread(execute_tool_calls, response, ui, True, budget, prefetched)
         
         return {
             "messages": [response] + tool_messages,
@@ -6,44 +6,57 @@ from langgraph.graph import StateGraph, START, END
 from .types import SupervisorAnnotation, SupervisorState
 from .nodes.router import router
 from .nodes.general_input import general_input
-
-# Import all sub-agents
-from ..stockbroker import stockbroker_graph
-from ..trip_planner import trip_planner_graph
-from ..open_code import open_code_graph
-from ..pizza_orderer import pizza_orderer_graph
-from ..writer_agent import writer_agent_graph
+from .nodes.fan_out import make_fan_out
+from ..bulkheads import AgentPolicy, bulkheads
+from ..registry import LazyGraph
+
+# Sub-agents are imported and compiled the first time they are routed to
+stockbroker_graph = LazyGraph("agents.stockbroker:stockbroker_graph")
+trip_planner_graph = LazyGraph("agents.trip_planner:trip_planner_graph")
+open_code_graph = LazyGraph("agents.open_code:open_code_graph")
+pizza_orderer_graph = LazyGraph("agents.pizza_orderer:pizza_orderer_graph")
+writer_agent_graph = LazyGraph("agents.writer_agent:writer_agent_graph")
+
+
+# Sub-agent nodes and their bulkhead and breaker policies. A guarded agent that
+# is saturated, failing or breaching its latency SLO is answered by generalInput.
+SUB_AGENTS = [
+    ("stockbroker", stockbroker_graph, AgentPolicy(max_concurrency=64, slo_seconds=15)),
+    ("tripPlanner", trip_planner_graph, AgentPolicy(max_concurrency=64, slo_seconds=20)),
+    ("openCode", open_code_graph, AgentPolicy(max_concurrency=16, slo_seconds=60)),
+    ("orderPizza", pizza_orderer_graph, AgentPolicy(max_concurrency=16, slo_seconds=10)),
+    ("generalInput", general_input, None),
+    ("writerAgent", writer_agent_graph, AgentPolicy(max_concurrency=16, slo_seconds=60)),
+]
+
+AGENT_NODES = {
+    name: node if policy is None else bulkheads.guard(name, node, policy, fallback=general_input)
+    for name, node, policy in SUB_AGENTS
+}
 
 
 def handle_route(state: SupervisorState) -> str:
-    """Route to the appropriate agent based on the next field."""
+    """Route to the appropriate agent based on the next field, or to all of
+    them at once when the router picked several."""
+    if len(state.get("routes") or []) > 1:
+        return "fanOut"
     return state.get("next", "generalInput")
 
 
 # Create the graph
 graph = StateGraph(SupervisorAnnotation)
 graph.add_node("router", router)
-graph.add_node("stockbroker", stockbroker_graph)
-graph.add_node("tripPlanner", trip_planner_graph)
-graph.add_node("openCode", open_code_graph)
-graph.add_node("orderPizza", pizza_orderer_graph)
-graph.add_node("generalInput", general_input)
-graph.add_node("writerAgent", writer_agent_graph)
+for name, node in AGENT_NODES.items():
+    graph.add_node(name, node)
+graph.add_node("fanOut", make_fan_out(AGENT_NODES))
 
 # Add conditional edges
-graph.add_conditional_edges("router", handle_route, [
-    "stockbroker", "tripPlanner", "openCode", 
-    "orderPizza", "generalInput", "writerAgent"
-])
+graph.add_conditional_edges("router", handle_route, [*AGENT_NODES, "fanOut"])
 
 # Add regular edges
 graph.add_edge(START, "router")
-graph.add_edge("stockbroker", END)
-graph.add_edge("tripPlanner", END)
-graph.add_edge("openCode", END)
-graph.add_edge("orderPizza", END)
-graph.add_edge("generalInput", END)
-graph.add_edge("writerAgent", END)
+for name in [*AGENT_NODES, "fanOut"]:
+    graph.add_edge(name, END)
 
 # Compile the graph
 supervisor_graph = graph.compile()
@@ -0,0 +1,60 @@
+"""
+Fan-out node for supervisor agent.
+
+Runs every sub-agent the router picked for a multi-intent message concurrently
+and merges their new ``messages`` and ``ui`` items in the router's order, so the
+result does not depend on which branch finished first. Each branch runs with
+the node's config, so its UI streams to the client as it is produced.
+"""
+
+from typing import Any, Callable, Dict, List
+import asyncio
+
+from ..types import SupervisorState, SupervisorUpdate
+from ...bulkheads import call_node
+
+
+def _item_id(item: Any) -> Any:
+    return item.get("id") if isinstance(item, dict) else getattr(item, "id", None)
+
+
+def _new_items(before: List[Any], after: List[Any]) -> List[Any]:
+    """Items of ``after`` that were not already in ``before``."""
+    seen = {_item_id(item) for item in before}
+    seen.discard(None)
+    return [item for item in after if _item_id(item) is None or _item_id(item) not in seen]
+
+
+def make_fan_out(branches: Dict[str, Any]) -> Callable:
+    """Node that runs the branches named in ``state["routes"]`` concurrently."""
+
+    async def fan_out(state: SupervisorState, config: Dict[str, Any]) -> SupervisorUpdate:
+        routes = [route for route in state.get("routes") or [] if route in branches]
+        messages = list(state.get("messages", []))
+        ui = list(state.get("ui") or [])
+
+        tasks = [
+            asyncio.ensure_future(call_node(branches[route], {**state, "next": route}, config))
+            for route in routes
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            # One failed branch fails the turn; do not leave the others running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        merged_messages: List[Any] = []
+        merged_ui: List[Any] = []
+        for result in results:
+            # Branches append to the messages they were given, so what follows them is theirs
+            merged_messages.extend(list(result.get("messages") or [])[len(messages):])
+            merged_ui.extend(_new_items(ui + merged_ui, list(result.get("ui") or [])))
+
+        return {
+            "messages": merged_messages,
+            "ui": merged_ui,
+        }
+
+    return fan_out
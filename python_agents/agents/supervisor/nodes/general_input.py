@@ -3,16 +3,17 @@ General input node for supervisor agent.
 """
 
 from typing import Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 
 from ..types import SupervisorState, SupervisorUpdate
+from ...providers import ModelPool, invoke_pool
 
 
-async def general_input(state: SupervisorState) -> SupervisorUpdate:
+GENERAL_INPUT_MODELS = ModelPool([], ["gpt-4o", "claude-3-5-sonnet-latest", "gemini-1.5-pro"], temperature=0)
+
+
+async def general_input(state: SupervisorState, config: Dict[str, Any]) -> SupervisorUpdate:
     """Handle general input that doesn't require specialized agents."""
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    
     # Format messages
     messages = []
     for msg in state.get("messages", []):
@@ -29,7 +30,7 @@ async def general_input(state: SupervisorState) -> SupervisorUpdate:
     )
     messages.insert(0, system_message)
     
-    response = await model.ainvoke(messages)
+    response = await invoke_pool(GENERAL_INPUT_MODELS, lambda model: model, messages, config, "supervisor.general_input")
     
     return {
         "messages": [response]
@@ -2,24 +2,79 @@
 Router node for supervisor agent.
 """
 
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List, Optional
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage
 
-from ..types import SupervisorState, SupervisorUpdate, ALL_TOOL_DESCRIPTIONS
+from ..types import SupervisorState, SupervisorUpdate, ALL_TOOL_DESCRIPTIONS, AgentRoute, MAX_ROUTES, ROUTES
+from ...cascade import Cascade, invoke_cascade, low_confidence, tool_call_errors
+from ...providers import Capability
+from ...speculation import MIN_SPECULATION_PRIOR, get_speculations, predict_route, register_speculative_step
+
+
+# Side-effect-free first steps started while the router decides; given as
+# specs so the sub-agents are not imported before they are needed. The trip
+# planner only starts with extraction while it has no trip details.
+register_speculative_step(
+    "tripPlanner", "trip_planner.extraction", "agents.trip_planner.nodes.extraction:extraction",
+    when=lambda state: not state.get("trip_details"),
+)
+register_speculative_step("stockbroker", "stockbroker.prefetch_quotes", "agents.stockbroker.tools:prefetch_quotes")
 
 
 @tool
-def route_to_agent(agent: str) -> Dict[str, Any]:
-    """Route to a specific agent based on the conversation context."""
+def route_to_agent(agent: AgentRoute, confidence: float) -> Dict[str, Any]:
+    """Route to a specific agent based on the conversation context.
+
+    Call once per agent when the request asks for several unrelated things.
+    confidence: how sure you are of the route, from 0 to 1.
+    """
     return {"agent": agent}
 
 
-async def router(state: SupervisorState) -> SupervisorUpdate:
+ROUTER_MODELS = Cascade([Capability.TOOL_CALLING], temperature=0)
+
+
+def validate_route(response: Any) -> Optional[str]:
+    """Reason to escalate a routing decision, or None to accept it."""
+    error = tool_call_errors(response, [route_to_agent])
+    if error:
+        return error
+    if not response.tool_calls:
+        return "no route"
+    for tool_call in response.tool_calls:
+        args = tool_call["args"]
+        if args.get("agent") not in ROUTES:
+            return "unknown route"
+        if low_confidence(args):
+            return "low confidence"
+    return None
+
+
+def picked_routes(response: Any) -> List[AgentRoute]:
+    """Distinct routes of the response's ``route_to_agent`` calls, in order.
+
+    generalInput is dropped when a specialized agent was also picked.
+    """
+    routes: List[AgentRoute] = []
+    for tool_call in getattr(response, "tool_calls", None) or []:
+        if tool_call.get("name") != "route_to_agent":
+            continue
+        agent = tool_call.get("args", {}).get("agent", "generalInput")
+        if agent not in routes:
+            routes.append(agent)
+    specialized = [route for route in routes if route != "generalInput"]
+    return (specialized or ["generalInput"])[:MAX_ROUTES]
+
+
+async def router(state: SupervisorState, config: Dict[str, Any]) -> SupervisorUpdate:
     """Route the conversation to the appropriate agent."""
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    model_with_tools = model.bind_tools([route_to_agent])
+    # Start the likely sub-agent's first step while the model routes
+    speculations = get_speculations(config)
+    if speculations is not None:
+        predicted, prior = predict_route(state)
+        if predicted and prior >= MIN_SPECULATION_PRIOR:
+            speculations.start(predicted, state, config)
     
     # Format messages
     messages = []
@@ -39,21 +94,34 @@ async def router(state: SupervisorState) -> SupervisorUpdate:
         {ALL_TOOL_DESCRIPTIONS}
         
         Based on the conversation, determine which agent should handle the user's request.
+        If the latest message asks for several things that belong to different agents, route to each of them.
         If no specific agent is needed, route to 'generalInput' for general conversation."""
     )
     messages.insert(0, system_message)
     
-    response = await model_with_tools.ainvoke(messages)
+    try:
+        response = await invoke_cascade(
+            ROUTER_MODELS,
+            lambda model: model.bind_tools([route_to_agent]),
+            messages,
+            config,
+            "supervisor.router",
+            validate_route,
+            hedge=True,
+        )
+    except BaseException:
+        if speculations is not None:
+            speculations.resolve(None)
+        raise
     
     # Extract the routing decision
-    next_agent = "generalInput"  # Default
-    if response.tool_calls:
-        for tool_call in response.tool_calls:
-            if tool_call.get("name") == "route_to_agent":
-                next_agent = tool_call.get("args", {}).get("agent", "generalInput")
-                break
+    routes = picked_routes(response)
+    
+    if speculations is not None:
+        speculations.resolve(routes)
     
     return {
-        "next": next_agent,
+        "next": routes[0],
+        "routes": routes,
         "messages": [response]
     }
@@ -2,18 +2,27 @@
 Types for the Supervisor agent.
 """
 
-from typing import Dict, Any, Optional, List, Union, Literal
+from typing import Dict, Any, Optional, List, Union, Literal, get_args
 from langgraph.graph import Annotation
 from ..types import GenerativeUIAnnotation
 
 
+AgentRoute = Literal[
+    "stockbroker", "tripPlanner", "openCode", 
+    "orderPizza", "generalInput", "writerAgent"
+]
+ROUTES = get_args(AgentRoute)
+
+# Most sub-agents one message can fan out to
+MAX_ROUTES = 3
+
 # Create annotation for supervisor
 SupervisorAnnotation = GenerativeUIAnnotation.Root({
     "messages": GenerativeUIAnnotation.spec["messages"],
-    "next": Annotation[Optional[Literal[
-        "stockbroker", "tripPlanner", "openCode", 
-        "orderPizza", "generalInput", "writerAgent"
-    ]]]
+    "ui": GenerativeUIAnnotation.spec["ui"],
+    "next": Annotation[Optional[AgentRoute]],
+    # Every route picked for the last message, in the router's order; ``next`` is the first
+    "routes": Annotation[Optional[List[AgentRoute]]]
 })
 
 # Type aliases
@@ -0,0 +1,549 @@
+"""
+Spans and metrics of graph runs.
+
+``telemetry`` is a LangChain callback handler that ``AgentRegistry`` attaches
+to every graph it loads (``instrument``), so every run of every agent is
+observed without touching its nodes. From the callbacks it builds a span
+tree per run:
+
+- ``graph``: the run of an agent, ``node``: a node of it, ``subgraph``: a
+  node that ran nodes of its own (a compiled subgraph or a sub-agent);
+- ``llm``: a chat model call, with the time it queued for a
+  ``model_scheduler`` slot, its time to first token, total time and token
+  usage;
+- ``tool``: a tool call, with its duration;
+- ``speculation``: a sub-agent step the router started speculatively. It is
+  a child of the graph, not of the router, so its time and model calls are
+  not counted as the router's.
+
+Cache lookups (``record_cache``) and UI pushes (``record_ui_push``, with the
+pushed component's size in bytes) are counted against the span they happen
+in. The state a run with a ``thread_id`` returns is measured into
+``agents.memory.thread_memory``, off the event loop.
+
+Every span feeds the Prometheus metrics in ``metrics`` (``render_metrics``
+gives the text exposition format, served by the server's ``/metrics``), as
+does ``watch_loop_lag`` with the event loop's lag.
+Traces are written to an OTLP/JSON log only once ``configure`` sets one, one
+``{"resourceSpans": [...]}`` line per trace, for ``sample_rate`` of the runs,
+plus every run that failed, took at least ``slow_ms``, or was started with
+``config["configurable"]["trace"] = True``.
+"""
+
+from contextlib import suppress
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+
+from .memory import ThreadMemory, ThreadUsage, thread_memory
+from .scheduler import current_permit
+
+
+# Seconds; from a cached tool call to a long generation
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+# Bytes of a thread's state, 1 KiB to 64 MiB
+STATE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Period of the event loop lag probe (``watch_loop_lag``)
+LOOP_LAG_INTERVAL_S = 0.1
+
+SERVICE_NAME = "python_agents"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Prometheus counter with labels."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Prometheus histogram with labels."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Iterable[float] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (not cumulative), then sum and count
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    def count(self, **labels: Any) -> int:
+        values = self._values.get(tuple(str(labels.get(name, "")) for name in self.labels))
+        return int(values[-1]) if values else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, values in sorted(self._values.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, values):
+                    cumulative += count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative:g}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {values[-1]:g}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {values[-2]:g}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {values[-1]:g}")
+        return lines
+
+
+class Metrics:
+    """The metrics of this process."""
+
+    def __init__(self):
+        self.graph_seconds = Histogram(
+            "agent_graph_duration_seconds", "Duration of agent runs", ["agent", "status"])
+        self.node_seconds = Histogram(
+            "agent_node_duration_seconds", "Duration of node runs, subgraph/node inside subgraphs", ["agent", "node"])
+        self.llm_queue_seconds = Histogram(
+            "agent_llm_queue_seconds", "Time model calls waited for a scheduler slot", ["agent", "model"])
+        self.llm_first_token_seconds = Histogram(
+            "agent_llm_time_to_first_token_seconds", "Time from a model call's start to its first token", ["agent", "model"])
+        self.llm_seconds = Histogram(
+            "agent_llm_duration_seconds", "Duration of model calls", ["agent", "model", "status"])
+        self.llm_tokens = Counter(
+            "agent_llm_tokens_total", "Tokens of model calls", ["agent", "model", "type"])
+        self.tool_seconds = Histogram(
+            "agent_tool_duration_seconds", "Duration of tool calls", ["agent", "tool", "status"])
+        self.cache_lookups = Counter(
+            "agent_cache_lookups_total", "Tool cache lookups", ["cache", "result"])
+        self.ui_push_bytes = Histogram(
+            "agent_ui_push_bytes", "Size of pushed UI components", ["agent", "component"], SIZE_BUCKETS)
+        self.traces_exported = Counter(
+            "agent_traces_exported_total", "Traces written to the trace log", ["reason"])
+        self.loop_lag_seconds = Histogram(
+            "agent_event_loop_lag_seconds", "How late a timer on the event loop fired", [], LAG_BUCKETS)
+        self.thread_state_bytes = Histogram(
+            "agent_thread_state_bytes", "Estimated size of the state runs returned", ["agent"], STATE_BUCKETS)
+        self.thread_state_over_cap = Counter(
+            "agent_thread_state_over_cap_total", "Runs that returned a state over the thread size cap", ["agent"])
+
+    def all(self) -> List[Any]:
+        return list(vars(self).values())
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.all() for line in metric.render()) + "\n"
+
+
+class Span:
+    """A timed part of a run: graph, subgraph, node, speculation, llm or tool."""
+
+    __slots__ = ("trace_id", "span_id", "parent", "name", "kind", "agent", "path", "start_ns", "end_ns",
+                 "attributes", "error", "first_token_ns")
+
+    def __init__(self, trace_id: str, span_id: str, parent: Optional["Span"], name: str, kind: str, agent: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.agent = agent
+        self.path = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.first_token_ns: Optional[int] = None
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def add(self, name: str, amount: float = 1) -> None:
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def otlp(self) -> Dict[str, Any]:
+        """The span in OTLP/JSON form."""
+        attributes = {"agent.span.kind": self.kind, "agent.name": self.agent, **self.attributes}
+        if self.kind in ("node", "subgraph"):
+            attributes["agent.node.path"] = self.path
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent is not None else "",
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # 64-bit integers are strings in OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class TraceLog:
+    """Appends OTLP/JSON traces to a file, one line each, from any number of processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def write(self, spans: List[Span]) -> None:
+        document = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.otlp() for span in spans]}],
+            }]
+        }
+        # One write per line: appends from several workers do not interleave
+        os.write(self._fd, (json.dumps(document, separators=(",", ":"), default=str) + "\n").encode())
+
+    def close(self) -> None:
+        with suppress(OSError):
+            os.close(self._fd)
+
+
+def _span_id(run_id: UUID) -> str:
+    return f"{run_id.int & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+def _model_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+    params = kwargs.get("invocation_params") or {}
+    for key in ("model", "model_name", "model_id"):
+        if params.get(key):
+            return str(params[key])
+    return kwargs.get("name") or ((serialized or {}).get("id") or ["unknown"])[-1]
+
+
+class Telemetry(BaseCallbackHandler):
+    """Callback handler building the spans and metrics of the runs it sees."""
+
+    # Called in the run's own thread and context, not from an executor
+    run_inline = True
+
+    def __init__(self, metrics: Optional[Metrics] = None, thread_memory: Optional[ThreadMemory] = None):
+        self.metrics = metrics or Metrics()
+        # Measures the state every run returns, when set
+        self.thread_memory = thread_memory
+        self.sample_rate = 1.0
+        self.slow_ms: Optional[float] = None
+        self.trace_log: Optional[TraceLog] = None
+        self._rng = random.Random()
+        # run id -> the span of that run or of its closest traced ancestor
+        self._owners: Dict[UUID, Span] = {}
+        # run id -> span the run itself opened
+        self._spans: Dict[UUID, Span] = {}
+        # trace id -> finished spans, kept until the trace ends if it may be exported
+        self._traces: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    def configure(
+        self, trace_log: Optional[str] = None, sample_rate: Optional[float] = None, slow_ms: Optional[float] = None,
+    ) -> None:
+        """Write traces to ``trace_log``: ``sample_rate`` of them, and those slower than ``slow_ms``."""
+        if self.trace_log is not None:
+            self.trace_log.close()
+        self.trace_log = TraceLog(trace_log) if trace_log else None
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    # Spans
+
+    def _open(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: str, metadata: Optional[Dict[str, Any]]) -> Span:
+        with self._lock:
+            parent = self._owners.get(parent_run_id) if parent_run_id is not None else None
+            if kind == "speculation":
+                # It outlives the node that started it, which should not pay for it
+                while parent is not None and parent.kind not in ("graph", "subgraph"):
+                    parent = parent.parent
+            agent = parent.agent if parent is not None else (metadata or {}).get("agent", name)
+            trace_id = parent.trace_id if parent is not None else run_id.hex
+            span = Span(trace_id, _span_id(run_id), parent, name, kind, agent)
+            if parent is None:
+                if (metadata or {}).get("thread_id") is not None:
+                    span.attributes["agent.thread_id"] = str(metadata["thread_id"])
+                forced = bool((metadata or {}).get("trace"))
+                span.attributes["agent.trace.sampled"] = forced or self._rng.random() < self.sample_rate
+                self._traces[trace_id] = []
+            elif kind == "node":
+                node = parent
+                while node is not None and node.kind not in ("node", "subgraph"):
+                    node = node.parent
+                if node is not None:
+                    node.kind = "subgraph"
+                    span.path = f"{node.path}/{name}"
+            self._owners[run_id] = self._spans[run_id] = span
+            return span
+
+    def _follow(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        """Attribute an untraced run, and what runs inside it, to its parent's span."""
+        with self._lock:
+            owner = self._owners.get(parent_run_id) if parent_run_id is not None else None
+            if owner is not None:
+                self._owners[run_id] = owner
+
+    def _close(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Span]:
+        with self._lock:
+            self._owners.pop(run_id, None)
+            span = self._spans.pop(run_id, None)
+            if span is None:
+                return None
+            span.end_ns = time.time_ns()
+            if error is not None:
+                span.error = f"{type(error).__name__}: {error}"
+            spans = self._traces.get(span.trace_id)
+            if spans is not None and self._retains():
+                spans.append(span)
+            if span.parent is None:
+                self._traces.pop(span.trace_id, None)
+        if span.parent is None and spans is not None and self._retains():
+            self._export(span, spans)
+        return span
+
+    def _retains(self) -> bool:
+        """Whether finished spans are kept until their trace ends and goes to ``_export``."""
+        return self.trace_log is not None
+
+    def _export(self, root: Span, spans: List[Span]) -> None:
+        if root.error:
+            reason = "error"
+        elif self.slow_ms is not None and root.seconds * 1000 >= self.slow_ms:
+            reason = "slow"
+        elif root.attributes.get("agent.trace.sampled"):
+            reason = "sampled"
+        else:
+            return
+        self.trace_log.write(spans)
+        self.metrics.traces_exported.inc(reason=reason)
+
+    def current_span(self) -> Optional[Span]:
+        """Span of the run the caller executes in, e.g. the tool or node looking up a cache."""
+        config = var_child_runnable_config.get() or {}
+        parent_run_id = getattr(config.get("callbacks"), "parent_run_id", None)
+        return self._owners.get(parent_run_id) if parent_run_id is not None else None
+
+    # Graphs, subgraphs and nodes
+
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, tags: Optional[List[str]] = None,
+                       metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or ((serialized or {}).get("id") or ["chain"])[-1]
+        if parent_run_id is None or parent_run_id not in self._owners:
+            if parent_run_id is None:
+                self._open(run_id, None, (metadata or {}).get("agent", name), "graph", metadata)
+            return
+        if (metadata or {}).get("langgraph_node") == name:
+            self._open(run_id, parent_run_id, name, "node", metadata)
+        elif (metadata or {}).get("speculation") == name:
+            span = self._open(run_id, parent_run_id, name, "speculation", metadata)
+            span.attributes["agent.speculation.route"] = metadata.get("speculation_route")
+        else:
+            self._follow(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._end_chain(run_id, None)
+        if span is None or span.parent is not None or self.thread_memory is None or not isinstance(outputs, dict):
+            return
+        thread_id = span.attributes.get("agent.thread_id")
+        if thread_id is not None:
+            self.thread_memory.measure_later(str(thread_id), span.agent, outputs, self._thread_measured)
+
+    def _thread_measured(self, usage: ThreadUsage) -> None:
+        # Called from the measuring thread; the metrics are thread-safe
+        self.metrics.thread_state_bytes.observe(usage.bytes, agent=usage.agent)
+        if usage.over_cap:
+            self.metrics.thread_state_over_cap.inc(agent=usage.agent)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_chain(run_id, error)
+
+    def _end_chain(self, run_id: UUID, error: Optional[BaseException]) -> Optional[Span]:
+        span = self._close(run_id, error)
+        if span is None:
+            return None
+        if span.parent is None:
+            self.metrics.graph_seconds.observe(span.seconds, agent=span.agent, status="error" if error else "ok")
+        elif span.kind != "speculation":
+            self.metrics.node_seconds.observe(span.seconds, agent=span.agent, node=span.path)
+        return span
+
+    # Model calls
+
+    def on_chat_model_start(self, serialized: Optional[Dict[str, Any]], messages: Any, *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, tags: Optional[List[str]] = None,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        if parent_run_id not in self._owners:
+            return
+        model = _model_name(serialized, kwargs)
+        span = self._open(run_id, parent_run_id, model, "llm", metadata)
+        span.attributes["gen_ai.request.model"] = model
+        permit = current_permit.get()
+        if permit is not None:
+            # Consumed: a later call in this context without a slot must not reuse it
+            current_permit.set(None)
+            span.attributes["agent.llm.queue_ms"] = round(permit.queue_time * 1000, 3)
+            self.metrics.llm_queue_seconds.observe(permit.queue_time, agent=span.agent, model=model)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.get(run_id)
+        if span is not None and span.first_token_ns is None:
+            span.first_token_ns = time.time_ns()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._close(run_id)
+        if span is None:
+            return
+        model = span.attributes["gen_ai.request.model"]
+        if span.first_token_ns is not None:
+            first_token = (span.first_token_ns - span.start_ns) / 1e9
+            span.attributes["agent.llm.time_to_first_token_ms"] = round(first_token * 1000, 3)
+            self.metrics.llm_first_token_seconds.observe(first_token, agent=span.agent, model=model)
+        usage: Dict[str, Any] = {}
+        for generations in getattr(response, "generations", None) or []:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        for kind, key in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+            tokens = usage.get(key)
+            if tokens:
+                span.attributes[f"gen_ai.usage.{key}"] = tokens
+                self.metrics.llm_tokens.inc(tokens, agent=span.agent, model=model, type=kind)
+        self.metrics.llm_seconds.observe(span.seconds, agent=span.agent, model=model, status="ok")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._close(run_id, error)
+        if span is not None:
+            self.metrics.llm_seconds.observe(
+                span.seconds, agent=span.agent, model=span.attributes["gen_ai.request.model"], status="error")
+
+    # Tools
+
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, tags: Optional[List[str]] = None,
+                      metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        if parent_run_id not in self._owners:
+            return
+        self._open(run_id, parent_run_id, kwargs.get("name") or (serialized or {}).get("name", "tool"), "tool", metadata)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, None)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, error)
+
+    def _end_tool(self, run_id: UUID, error: Optional[BaseException]) -> None:
+        span = self._close(run_id, error)
+        if span is not None:
+            self.metrics.tool_seconds.observe(span.seconds, agent=span.agent, tool=span.name, status="error" if error else "ok")
+
+    # Events inside a span
+
+    def record_cache(self, cache: str, result: str) -> None:
+        self.metrics.cache_lookups.inc(cache=cache, result=result)
+        span = self.current_span()
+        if span is not None:
+            with self._lock:
+                span.add(f"agent.cache.{cache}.{result}")
+
+    def record_ui_push(self, component: str, message: Any) -> None:
+        span = self.current_span()
+        if span is None:
+            return
+        size = len(json.dumps(message, separators=(",", ":"), default=str).encode())
+        self.metrics.ui_push_bytes.observe(size, agent=span.agent, component=component)
+        with self._lock:
+            span.add("agent.ui.pushes")
+            span.add("agent.ui.bytes", size)
+
+
+# Handler attached to every graph of ``AgentRegistry``
+telemetry = Telemetry(thread_memory=thread_memory)
+
+
+def instrument(graph: Any, agent: str) -> Any:
+    """``graph`` reporting its runs to ``telemetry`` as runs of ``agent``."""
+    if not hasattr(graph, "with_config"):
+        return graph
+    return graph.with_config(callbacks=[telemetry], metadata={"agent": agent})
+
+
+def record_cache(cache: str, result: str) -> None:
+    """Count a lookup of a tool cache (``result``: "hit", "miss", or e.g. "extended")
+    and attribute it to the current tool or node span.
+    """
+    telemetry.record_cache(cache, result)
+
+
+def record_ui_push(component: str, message: Any) -> None:
+    """Measure a pushed UI component, attributed to the current node span; free outside a run."""
+    telemetry.record_ui_push(component, message)
+
+
+async def watch_loop_lag(interval: float = LOOP_LAG_INTERVAL_S) -> None:
+    """Observe how late the running loop wakes a timer every ``interval``, until cancelled."""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        telemetry.metrics.loop_lag_seconds.observe(max(0.0, time.monotonic() - start - interval))
+
+
+def render_metrics() -> str:
+    """Every metric, in the Prometheus text exposition format."""
+    return telemetry.metrics.render()
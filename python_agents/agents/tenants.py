@@ -0,0 +1,250 @@
+"""
+Per-tenant fair scheduling of graph runs.
+
+One process serves many tenants, and a tenant queueing hundreds of batch runs
+must not starve another tenant's interactive ones. Every run is admitted by
+``run_scheduler`` before it starts. Runs wait in per-tenant FIFO queues and
+are admitted across tenants by start-time fair queuing (see ``FairShare``),
+so backlogged tenants share the run slots in proportion to their weights.
+Each tenant may also be capped on concurrent runs and on tokens per minute;
+the tokens a run used are charged to its tenant when it finishes, and a tenant
+over its token budget waits for the bucket to refill before its next run
+starts.
+
+Admission only decides when a run starts. Its model calls carry the tenant in
+``config["configurable"]["tenant"]``, and ``model_scheduler`` applies the same
+weights when they contend for provider slots.
+"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+import asyncio
+import itertools
+import threading
+import time
+
+from .scheduler import DEFAULT_TENANT, FairShare, ModelScheduler, QueueStats, TokenBucket, model_scheduler, tenant_for
+
+
+class TenantLimits:
+    """Share and limits of one tenant. ``None`` means unlimited."""
+
+    def __init__(
+        self,
+        weight: float = 1.0,
+        max_concurrent_runs: Optional[int] = None,
+        tokens_per_min: Optional[float] = None,
+        burst_seconds: float = 60.0,
+    ):
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        self.weight = weight
+        self.max_concurrent_runs = max_concurrent_runs
+        self.tokens_per_min = tokens_per_min
+        self.burst_seconds = burst_seconds
+
+
+class Tenant:
+    """Queue, running count and token bucket of one tenant."""
+
+    def __init__(self, name: str, limits: TenantLimits, clock=time.monotonic):
+        self.name = name
+        self.limits = limits
+        # (start tag, seq, future, enqueued)
+        self.queue: Deque[Tuple[float, int, asyncio.Future, float]] = deque()
+        self.running = 0
+        self.admitted = 0
+        self.tokens_used = 0
+        self.tokens = TokenBucket(limits.tokens_per_min, limits.burst_seconds, clock) if limits.tokens_per_min else None
+        self.wait = QueueStats()
+
+    def queued(self) -> int:
+        return sum(1 for item in self.queue if not item[2].done())
+
+    def at_capacity(self) -> bool:
+        return self.limits.max_concurrent_runs is not None and self.running >= self.limits.max_concurrent_runs
+
+
+class RunTicket:
+    """An admitted run of ``tenant``."""
+
+    def __init__(self, tenant: str, wait_time: float):
+        self.tenant = tenant
+        self.wait_time = wait_time
+
+
+class RunScheduler:
+    """Admits runs fairly across tenants, within a process-wide and per-tenant limits."""
+
+    def __init__(
+        self,
+        max_concurrent_runs: Optional[int] = None,
+        default_limits: Optional[TenantLimits] = None,
+        scheduler: ModelScheduler = model_scheduler,
+        clock=time.monotonic,
+    ):
+        self.max_concurrent_runs = max_concurrent_runs
+        self.default_limits = default_limits or TenantLimits()
+        self.running = 0
+        self._scheduler = scheduler
+        self._clock = clock
+        self._limits: Dict[str, TenantLimits] = {}
+        self._tenants: Dict[str, Tenant] = {}
+        self._fair = FairShare()
+        self._seq = itertools.count()
+        self._timer: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.TimerHandle]] = None
+        self._lock = threading.Lock()
+
+    def configure(self, tenant: str, limits: TenantLimits) -> None:
+        """Set ``tenant``'s weight and limits; the weight also applies to its model calls."""
+        with self._lock:
+            self._limits[tenant] = limits
+            existing = self._tenants.get(tenant)
+            if existing is not None:
+                existing.limits = limits
+                existing.tokens = TokenBucket(limits.tokens_per_min, limits.burst_seconds, self._clock) if limits.tokens_per_min else None
+        self._scheduler.set_weight(tenant, limits.weight)
+
+    def known_tenant(self, name: str) -> str:
+        """``name`` if it is a configured tenant, else ``DEFAULT_TENANT``.
+
+        Every tenant gets a queue and stats that are kept for the life of the
+        process, so a name a client chose is only honored once ``configure``
+        has been called for it.
+        """
+        with self._lock:
+            return name if name in self._limits else DEFAULT_TENANT
+
+    def _tenant(self, name: str) -> Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            tenant = Tenant(name, self._limits.get(name, self.default_limits), self._clock)
+            self._tenants[name] = tenant
+        return tenant
+
+    async def acquire(self, tenant: str = DEFAULT_TENANT) -> RunTicket:
+        """Wait until a run of ``tenant`` may start."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        enqueued = self._clock()
+        with self._lock:
+            state = self._tenant(tenant)
+            tag = self._fair.tag(tenant, 1.0, state.limits.weight)
+            state.queue.append((tag, next(self._seq), future, enqueued))
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller was cancelled: hand the slot back
+                self.release(RunTicket(tenant, 0.0))
+            raise
+
+        wait_time = self._clock() - enqueued
+        with self._lock:
+            self._tenants[tenant].wait.add(wait_time)
+        return RunTicket(tenant, wait_time)
+
+    def release(self, ticket: RunTicket, tokens: int = 0) -> None:
+        """End an admitted run, charging the ``tokens`` it used to its tenant."""
+        with self._lock:
+            state = self._tenants[ticket.tenant]
+            state.running -= 1
+            self.running -= 1
+            state.tokens_used += tokens
+            if state.tokens is not None and tokens:
+                state.tokens.take(tokens)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tenant: str = DEFAULT_TENANT, budget: Any = None) -> AsyncIterator[RunTicket]:
+        """Hold a run slot for the block; the tokens ``budget`` recorded are charged on exit."""
+        ticket = await self.acquire(tenant)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, budget.tokens() if budget is not None else 0)
+
+    def _dispatch(self) -> None:
+        """Start queued runs while slots allow, earliest fair-share tag first."""
+        retry_in = None
+        with self._lock:
+            while self.max_concurrent_runs is None or self.running < self.max_concurrent_runs:
+                best = None
+                for state in self._tenants.values():
+                    # Drop callers that gave up while queued
+                    while state.queue and state.queue[0][2].done():
+                        state.queue.popleft()
+                    if not state.queue or state.at_capacity():
+                        continue
+                    if state.tokens is not None:
+                        wait = state.tokens.wait_time(1)
+                        if wait > 0:
+                            retry_in = wait if retry_in is None else min(retry_in, wait)
+                            continue
+                    if best is None or state.queue[0][:2] < best.queue[0][:2]:
+                        best = state
+                if best is None:
+                    break
+
+                tag, _, future, _ = best.queue.popleft()
+                self._fair.served(tag)
+                best.running += 1
+                best.admitted += 1
+                self.running += 1
+                future.set_result(None)
+
+        if retry_in is not None:
+            self._schedule(retry_in)
+
+    def _schedule(self, delay: float) -> None:
+        """Run ``_dispatch`` in ``delay`` seconds, unless a sooner run is pending."""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            timer_loop, timer = self._timer
+            # A timer from another (possibly closed) event loop never fires here
+            if timer_loop is loop and timer.when() <= when:
+                return
+            timer.cancel()
+        self._timer = (loop, loop.call_at(when, self._on_timer))
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, running runs, tokens and wait-time percentiles per tenant."""
+        model_queue_times = self._scheduler.tenant_snapshot()
+        with self._lock:
+            return {
+                "running": self.running,
+                "max_concurrent_runs": self.max_concurrent_runs,
+                "tenants": {
+                    name: {
+                        "weight": state.limits.weight,
+                        "queued": state.queued(),
+                        "running": state.running,
+                        "admitted": state.admitted,
+                        "tokens_used": state.tokens_used,
+                        "wait_time": state.wait.summary(),
+                        "model_queue_time": model_queue_times.get(name, QueueStats().summary()),
+                    }
+                    for name, state in self._tenants.items()
+                },
+            }
+
+
+# Shared run scheduler in front of every graph run
+run_scheduler = RunScheduler()
+
+
+def tenant_config(config: Optional[Dict[str, Any]] = None, tenant: Optional[str] = None) -> Dict[str, Any]:
+    """Copy of ``config`` with ``tenant`` placed in its configurable values."""
+    config = dict(config or {})
+    configurable = dict(config.get("configurable") or {})
+    configurable["tenant"] = tenant or tenant_for(config)
+    config["configurable"] = configurable
+    return config
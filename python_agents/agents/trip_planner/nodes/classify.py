@@ -2,13 +2,15 @@
 Classification node for trip planner.
 """
 
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, Optional
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel, Field
 
 from ..types import TripPlannerState, TripPlannerUpdate
+from ...budget import get_budget
+from ...cascade import Cascade, invoke_cascade, low_confidence, tool_call_errors
+from ...providers import Capability
 
 
 class ClassificationSchema(BaseModel):
@@ -17,20 +19,40 @@ class ClassificationSchema(BaseModel):
 
 
 @tool
-def classify_trip_relevance(is_relevant: bool) -> Dict[str, Any]:
-    """Classify whether trip details are still relevant."""
+def classify_trip_relevance(is_relevant: bool, confidence: float) -> Dict[str, Any]:
+    """Classify whether trip details are still relevant.
+
+    confidence: how sure you are of the classification, from 0 to 1.
+    """
     return {"is_relevant": is_relevant}
 
 
-async def classify(state: TripPlannerState) -> TripPlannerUpdate:
+CLASSIFY_MODELS = Cascade([Capability.TOOL_CALLING], temperature=0)
+
+
+def validate_classification(response: Any) -> Optional[str]:
+    """Reason to escalate a classification, or None to accept it."""
+    error = tool_call_errors(response, [classify_trip_relevance])
+    if error:
+        return error
+    if not response.tool_calls:
+        return "no classification"
+    if low_confidence(response.tool_calls[0]["args"]):
+        return "low confidence"
+    return None
+
+
+async def classify(state: TripPlannerState, config: Dict[str, Any]) -> TripPlannerUpdate:
     """Classify whether trip details are still relevant."""
     if not state.get("trip_details"):
         return {}
     
-    trip_details = state["trip_details"]
+    # Re-classification is optional: keep the existing details when short on time
+    budget = get_budget(config)
+    if budget.should_skip_optional("trip_planner.classify"):
+        return {}
     
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    model_with_tools = model.bind_tools([classify_trip_relevance])
+    trip_details = state["trip_details"]
     
     prompt = f"""You're an AI assistant for planning trips. The user has already specified the following details for their trip:
 - location - {trip_details['location']}
@@ -56,10 +78,10 @@ If they do NOT change their request details (or they never specified them), plea
     
     human_message = f"Here is the entire conversation so far:\n{_format_messages(state.get('messages', []))}"
     
-    response = await model_with_tools.ainvoke([
+    response = await invoke_cascade(CLASSIFY_MODELS, lambda model: model.bind_tools([classify_trip_relevance]), [
         HumanMessage(content=prompt),
         HumanMessage(content=human_message)
-    ])
+    ], config, "trip_planner.classify", validate_classification, hedge=True)
     
     # Extract classification result
     if response.tool_calls:
@@ -2,15 +2,17 @@
 Extraction node for trip planner.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel, Field
 import uuid
 
 from ..types import TripPlannerState, TripPlannerUpdate, TripDetails
+from ...cascade import Cascade, invoke_cascade, tool_call_errors
+from ...providers import Capability
+from ...speculation import speculation_safe, take_speculative
 
 
 class ExtractionSchema(BaseModel):
@@ -37,6 +39,9 @@ def extract_trip_details(
     }
 
 
+EXTRACTION_MODELS = Cascade([Capability.TOOL_CALLING], temperature=0)
+
+
 def calculate_dates(start_date: str = None, end_date: str = None) -> tuple[datetime, datetime]:
     """Calculate start and end dates with defaults."""
     now = datetime.now()
@@ -63,10 +68,33 @@ def calculate_dates(start_date: str = None, end_date: str = None) -> tuple[datet
     return datetime.fromisoformat(start_date), datetime.fromisoformat(end_date)
 
 
-async def extraction(state: TripPlannerState) -> TripPlannerUpdate:
+def validate_extraction(response: Any) -> Optional[str]:
+    """Reason to escalate an extraction, or None to accept it.
+
+    A reply without a tool call asks the user for the location, which is valid.
+    """
+    error = tool_call_errors(response, [extract_trip_details])
+    if error or not response.tool_calls:
+        return error
+    args = response.tool_calls[0]["args"]
+    if not str(args.get("location") or "").strip():
+        return "no location"
+    try:
+        start, end = calculate_dates(args.get("start_date"), args.get("end_date"))
+    except (TypeError, ValueError):
+        return "unparseable dates"
+    if end < start:
+        return "end before start"
+    return None
+
+
+@speculation_safe
+async def extraction(state: TripPlannerState, config: Dict[str, Any]) -> TripPlannerUpdate:
     """Extract trip details from user input."""
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    model_with_tools = model.bind_tools([extract_trip_details])
+    # The supervisor may have run this already while it was routing
+    speculative = await take_speculative(config, "trip_planner.extraction", state)
+    if speculative is not None:
+        return speculative
     
     prompt = """You're an AI assistant for planning trips. The user has requested information about a trip they want to go on.
 Before you can help them, you need to extract the following information from their request:
@@ -97,10 +125,10 @@ Extract only what is specified by the user. It is okay to leave fields blank if
     
     human_message = f"Here is the entire conversation so far:\n{_format_messages(state.get('messages', []))}"
     
-    response = await model_with_tools.ainvoke([
+    response = await invoke_cascade(EXTRACTION_MODELS, lambda model: model.bind_tools([extract_trip_details]), [
         HumanMessage(content=prompt),
         HumanMessage(content=human_message)
-    ])
+    ], config, "trip_planner.extraction", validate_extraction)
     
     # Check if we got a tool call
     if not response.tool_calls:
@@ -2,22 +2,33 @@
 Tools node for trip planner.
 """
 
+from collections import OrderedDict
 from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage
 import random
+import threading
 import time
 
 from ..types import TripPlannerState, TripPlannerUpdate
 from ...types import typed_ui
+from ...budget import get_budget
+from ...cancellation import run_in_thread, sleep
+from ...providers import Capability, ModelPool, invoke_pool
+from ...telemetry import record_cache
+
+
+# Last results per (tool, location), reused when the request budget runs low
+MAX_CACHED_RESULTS = 256
+_tool_results: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_tool_results_lock = threading.Lock()
 
 
 @tool
 def list_accommodations() -> Dict[str, Any]:
     """List accommodations for the user."""
     # Simulate API call delay
-    time.sleep(0.5)
+    sleep(0.5)
     
     # Mock accommodation data
     accommodations = []
@@ -43,7 +54,7 @@ def list_accommodations() -> Dict[str, Any]:
 def list_restaurants() -> Dict[str, Any]:
     """List restaurants for the user."""
     # Simulate API call delay
-    time.sleep(0.5)
+    sleep(0.5)
     
     # Mock restaurant data
     restaurants = []
@@ -65,6 +76,31 @@ def list_restaurants() -> Dict[str, Any]:
     }
 
 
+TRIP_TOOLS = {"list_accommodations": list_accommodations, "list_restaurants": list_restaurants}
+
+
+def run_trip_tool(tool_name: str, location: str, use_cache: bool = False) -> Dict[str, Any]:
+    """Run a trip tool, or return its cached result for the location when ``use_cache`` is set."""
+    key = (tool_name, location)
+    if use_cache:
+        with _tool_results_lock:
+            if key in _tool_results:
+                _tool_results.move_to_end(key)
+                record_cache("trip_tools", "hit")
+                return _tool_results[key]
+        record_cache("trip_tools", "miss")
+    
+    result = TRIP_TOOLS[tool_name].invoke({})
+    with _tool_results_lock:
+        _tool_results[key] = result
+        while len(_tool_results) > MAX_CACHED_RESULTS:
+            _tool_results.popitem(last=False)
+    return result
+
+
+CALL_TOOLS_MODELS = ModelPool([Capability.TOOL_CALLING], ["gpt-4o", "claude-3-5-sonnet-latest", "gemini-1.5-pro"], temperature=0)
+
+
 async def call_tools(state: TripPlannerState, config: Dict[str, Any]) -> TripPlannerUpdate:
     """Call the appropriate tools based on the conversation."""
     if not state.get("trip_details"):
@@ -72,9 +108,7 @@ async def call_tools(state: TripPlannerState, config: Dict[str, Any]) -> TripPla
     
     trip_details = state["trip_details"]
     ui = typed_ui(config)
-    
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
-    model_with_tools = model.bind_tools([list_accommodations, list_restaurants])
+    budget = get_budget(config)
     
     # Format messages for the model
     messages = []
@@ -92,7 +126,13 @@ async def call_tools(state: TripPlannerState, config: Dict[str, Any]) -> TripPla
     )
     messages.insert(0, system_message)
     
-    response = await model_with_tools.ainvoke(messages)
+    response = await invoke_pool(
+        CALL_TOOLS_MODELS,
+        lambda model: model.bind_tools([list_accommodations, list_restaurants]),
+        messages,
+        config,
+        "trip_planner.call_tools",
+    )
     
     # Check for tool calls
     if not response.tool_calls:
@@ -100,13 +140,26 @@ async def call_tools(state: TripPlannerState, config: Dict[str, Any]) -> TripPla
     
     # Execute tool calls and push UI components
     tool_messages = []
+    use_cache = budget.should_use_cached_tools("trip_planner.call_tools")
     
     for tool_call in response.tool_calls:
         tool_name = tool_call["name"]
         tool_args = tool_call["args"]
         
+        if tool_name not in TRIP_TOOLS:
+            # A tool the model made up: tell it rather than failing the node
+            tool_messages.append({
+                "type": "tool",
+                "content": str({"error": f"Unknown tool: {tool_name}"}),
+                "tool_call_id": tool_call["id"]
+            })
+            continue
+        
+        budget.check(f"trip_planner.{tool_name}")
+        with budget.track(f"trip_planner.{tool_name}"):
+            result = await run_in_thread(run_trip_tool, tool_name, trip_details.get("location", ""), use_cache)
+        
         if tool_name == "list_accommodations":
-            result = list_accommodations()
             ui.push(
                 {
                     "name": "accommodations-list",
@@ -119,7 +172,6 @@ async def call_tools(state: TripPlannerState, config: Dict[str, Any]) -> TripPla
                 {"message": response}
             )
         elif tool_name == "list_restaurants":
-            result = list_restaurants()
             ui.push(
                 {
                     "name": "restaurants-list", 
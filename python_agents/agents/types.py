@@ -9,6 +9,8 @@ from pydantic import BaseModel
 from langgraph.graph import Annotation
 import uuid
 
+from .telemetry import record_ui_push
+
 
 class UIMessage(BaseModel):
     """UI message for generative UI components."""
@@ -95,23 +97,43 @@ def find_tool_call(name: str):
 
 
 class UIMessageManager:
-    """Manager for UI messages in Python LangGraph agents."""
+    """Manager for UI messages in Python LangGraph agents.
+    
+    Series-valued props longer than ``max_points`` are downsampled before they
+    are pushed; ``max_points=None`` sends them unchanged.
+    """
     
-    def __init__(self):
+    def __init__(self, max_points: Optional[int] = None, downsample_method: str = "lttb"):
         self.items = []
+        self.max_points = max_points
+        self.downsample_method = downsample_method
     
     def push(self, ui_component: Dict[str, Any], message_metadata: Optional[Dict[str, Any]] = None):
         """Push a UI component to the UI state."""
+        props = ui_component["props"]
+        if self.max_points:
+            # Imported here so numpy loads with the first chart, not with every graph
+            from .downsample import downsample_props
+            props = downsample_props(props, self.max_points, self.downsample_method)
         ui_message = {
             "id": ui_component.get("id", str(uuid.uuid4())),
             "name": ui_component["name"],
-            "props": ui_component["props"],
+            "props": props,
             "metadata": message_metadata or {}
         }
         self.items.append(ui_message)
+        record_ui_push(ui_message["name"], ui_message)
         return ui_message
 
 
 def typed_ui(config: Dict[str, Any]) -> UIMessageManager:
-    """Create a typed UI manager for the given config."""
-    return UIMessageManager()
+    """Create a typed UI manager for the given config.
+    
+    The client can pass ``viewport_width``, ``device_pixel_ratio`` and
+    ``downsample_method`` in ``config["configurable"]`` to size chart series.
+    """
+    from .downsample import downsample_method, target_points
+    return UIMessageManager(
+        max_points=target_points(config),
+        downsample_method=downsample_method(config)
+    )
@@ -2,14 +2,16 @@
 Writer Agent - Handles text document writing with generative UI.
 """
 
+from contextlib import aclosing
 from typing import Dict, Any, List
 from langgraph.graph import StateGraph, START
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from pydantic import BaseModel, Field
 import uuid
 
 from .types import GenerativeUIAnnotation, Annotation, typed_ui
+from .budget import get_budget
+from .providers import Capability, ModelPool, astream_pool, invoke_pool
 
 
 class CreateTextDocumentTool(BaseModel):
@@ -29,12 +31,15 @@ WriterAnnotation = GenerativeUIAnnotation.Root({
 WriterState = WriterAnnotation.State
 WriterUpdate = WriterAnnotation.Update
 
+# Streaming models for the draft and document, plain ones for suggestions
+WRITER_MODELS = ModelPool([Capability.STREAMING], ["claude-3-5-sonnet-latest", "gpt-4o", "gemini-1.5-pro"])
+SUGGESTION_MODELS = ModelPool([], ["claude-3-5-sonnet-latest", "gpt-4o", "gemini-1.5-pro"])
+
 
 async def prepare(state: WriterState, config: Dict[str, Any]) -> WriterUpdate:
     """Prepare the document by creating initial draft."""
     ui = typed_ui(config)
-    model = ChatAnthropic(model="claude-3-5-sonnet-latest")
-    
+    budget = get_budget(config)
     # Create tool for document creation
     def draft_text_document(title: str, description: str) -> Dict[str, Any]:
         """Prepare a text document for the user with a short title and short description for browsing purposes."""
@@ -61,33 +66,33 @@ async def prepare(state: WriterState, config: Dict[str, Any]) -> WriterUpdate:
             messages.append(msg)
     
     # Create streaming response
-    response = await model.astream(messages)
-    
+    budget.check("writer.prepare")
     document_id = str(uuid.uuid4())
     message = None
     
-    async for chunk in response:
-        if message is None:
-            message = chunk
-        else:
-            message = message + chunk
-        
-        # Check for tool calls
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            for tool_call in message.tool_calls:
-                if tool_call.get("name") == "draft_text_document":
-                    tool_args = tool_call.get("args", {})
-                    ui.push(
-                        {
-                            "id": document_id,
-                            "name": "writer",
-                            "props": {
-                                **tool_args,
-                                "is_generating": True
-                            }
-                        },
-                        {"message": message}
-                    )
+    with budget.track("writer.prepare"):
+        async for chunk in astream_pool(WRITER_MODELS, lambda model: model, messages, config, "writer.prepare"):
+            if message is None:
+                message = chunk
+            else:
+                message = message + chunk
+            
+            # Check for tool calls
+            if hasattr(message, 'tool_calls') and message.tool_calls:
+                for tool_call in message.tool_calls:
+                    if tool_call.get("name") == "draft_text_document":
+                        tool_args = tool_call.get("args", {})
+                        ui.push(
+                            {
+                                "id": document_id,
+                                "name": "writer",
+                                "props": {
+                                    **tool_args,
+                                    "is_generating": True
+                                }
+                            },
+                            {"message": message}
+                        )
     
     return {
         "messages": [message] if message else [],
@@ -114,8 +119,7 @@ async def writer(state: WriterState, config: Dict[str, Any]) -> WriterUpdate:
     
     document_id = last_ui["id"]
     
-    # Create model for content generation
-    model = ChatAnthropic(model="claude-3-5-sonnet-latest")
+    budget = get_budget(config)
     
     # Format messages for content generation
     messages = []
@@ -141,26 +145,35 @@ async def writer(state: WriterState, config: Dict[str, Any]) -> WriterUpdate:
     
     # Generate content
     content_message = None
-    
-    async for chunk in model.astream(messages):
-        if content_message is None:
-            content_message = chunk
-        else:
-            content_message = content_message + chunk
-        
-        content = getattr(content_message, 'content', '') if content_message else ""
-        
-        ui.push(
-            {
-                "id": document_id,
-                "name": "writer",
-                "props": {
-                    "content": content,
-                    "is_generating": True
-                }
-            },
-            {"message": last_message}
-        )
+    budget.check("writer.writer")
+    
+    with budget.track("writer.writer"):
+        # Closed explicitly so a deadline break releases the stream right away
+        async with aclosing(astream_pool(WRITER_MODELS, lambda model: model, messages, config, "writer.writer")) as stream:
+            async for chunk in stream:
+                if content_message is None:
+                    content_message = chunk
+                else:
+                    content_message = content_message + chunk
+                
+                content = getattr(content_message, 'content', '') if content_message else ""
+                
+                ui.push(
+                    {
+                        "id": document_id,
+                        "name": "writer",
+                        "props": {
+                            "content": content,
+                            "is_generating": True
+                        }
+                    },
+                    {"message": last_message}
+                )
+                
+                # Keep what was written so far rather than running past the deadline
+                if budget.expired():
+                    budget.degrade("writer.writer", "truncated")
+                    break
     
     # Add final UI component
     ui.push(
@@ -180,8 +193,12 @@ async def writer(state: WriterState, config: Dict[str, Any]) -> WriterUpdate:
     }
 
 
-async def suggestions(state: WriterState) -> WriterUpdate:
+async def suggestions(state: WriterState, config: Dict[str, Any]) -> WriterUpdate:
     """Generate suggestions for the document."""
+    budget = get_budget(config)
+    if budget.should_skip_optional("writer.suggestions"):
+        return {}
+    
     messages = state.get("messages", []).copy()
     last_message = messages[-1] if messages else None
     
@@ -197,8 +214,7 @@ async def suggestions(state: WriterState) -> WriterUpdate:
                 "tool_call_id": tool_call["id"]
             })
     
-    model = ChatAnthropic(model="claude-3-5-sonnet-latest")
-    finish = await model.ainvoke(messages)
+    finish = await invoke_pool(SUGGESTION_MODELS, lambda model: model, messages, config, "writer.suggestions")
     messages.append(finish)
     
     return {
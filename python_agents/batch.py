@@ -0,0 +1,300 @@
+"""
+Offline batch runner (``run.py --batch input.jsonl``).
+
+Runs every conversation of a JSONL file through ``main.run_agent`` with a
+fixed number of runs in flight and appends one JSON line per conversation to
+the output file as soon as it may be written: in input order (default), or in
+completion order with each line keyed by the conversation's ``id``. Input
+lines look like::
+
+    {"id": "conv-1", "agent": "chat", "message": "Hello", "deadline_ms": 5000, "tenant": "evals"}
+    {"id": "conv-2", "input": {"messages": [{"role": "human", "content": "Hi"}]}}
+
+Every field is optional but a message or an input; ``id`` defaults to the
+line's index (from 0). A failed run is written as an ``error`` line and does
+not stop the batch.
+
+Inputs are read as runs free up, and at most ``window`` lines past the first
+unfinished one are ever in memory, so memory stays flat however large the
+file. A checkpoint (``<output>.checkpoint`` by default) records, after the
+output is synced to disk, how far the input is done and how long the output
+is; rerunning the same command after a crash truncates the output to that
+length and resumes from there, so no conversation is lost or written twice.
+"""
+
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+import asyncio
+import json
+import os
+import sys
+import time
+
+from agents.scheduler import DEFAULT_TENANT
+from server import dumps
+
+
+# Runs in flight at once
+DEFAULT_CONCURRENCY = 8
+# Seconds between checkpoints and between progress lines
+CHECKPOINT_INTERVAL_S = 1.0
+PROGRESS_INTERVAL_S = 5.0
+# Latencies kept for the live percentiles
+LATENCY_SAMPLES = 10000
+
+RunFn = Callable[[str, Dict[str, Any], Optional[float], str], Awaitable[Dict[str, Any]]]
+
+
+def _default_run(agent: str, input_data: Dict[str, Any], deadline_ms: Optional[float], tenant: str) -> Awaitable[Dict[str, Any]]:
+    from main import run_agent
+
+    return run_agent(agent, input_data, deadline_ms=deadline_ms, tenant=tenant)
+
+
+class Checkpoint:
+    """Progress of a batch: lines before ``line`` are done, and so are those in ``done``."""
+
+    def __init__(self, path: str, input_path: str, line: int = 0, input_offset: int = 0,
+                 output_bytes: int = 0, done: Optional[Set[int]] = None):
+        self.path = path
+        self.input_path = input_path
+        self.line = line
+        self.input_offset = input_offset
+        self.output_bytes = output_bytes
+        self.done = done or set()
+
+    @classmethod
+    def load(cls, path: str, input_path: str) -> Optional["Checkpoint"]:
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        if os.path.abspath(data["input"]) != os.path.abspath(input_path):
+            raise ValueError(f"{path} is the checkpoint of {data['input']}, not {input_path}")
+        return cls(path, input_path, data["line"], data["input_offset"], data["output_bytes"], set(data["done"]))
+
+    def save(self) -> None:
+        data = {
+            "input": self.input_path,
+            "line": self.line,
+            "input_offset": self.input_offset,
+            "output_bytes": self.output_bytes,
+            "done": sorted(self.done),
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # Atomic: a crash leaves either the old checkpoint or the new one
+        os.replace(tmp, self.path)
+
+
+class BatchStats:
+    """Counts, throughput and latency percentiles of the recent runs."""
+
+    def __init__(self, clock=time.monotonic):
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._clock = clock
+        self._start = clock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.completed += 1
+        if not ok:
+            self.failed += 1
+        self.latencies.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = self._clock() - self._start
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_s": elapsed,
+            "per_second": self.completed / elapsed if elapsed > 0 else 0.0,
+            "p50_s": percentile(0.50),
+            "p95_s": percentile(0.95),
+            "p99_s": percentile(0.99),
+        }
+
+    def line(self) -> str:
+        s = self.snapshot()
+        text = f"{s['completed']} done, {s['failed']} failed, {s['per_second']:.1f}/s"
+        if s["p50_s"] is not None:
+            text += f", latency p50 {s['p50_s'] * 1000:.0f} ms p95 {s['p95_s'] * 1000:.0f} ms p99 {s['p99_s'] * 1000:.0f} ms"
+        return text
+
+
+class BatchRunner:
+    """Runs one input file into one output file; see the module docstring."""
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        ordered: bool = True,
+        checkpoint_path: Optional[str] = None,
+        agent: str = "agent",
+        deadline_ms: Optional[float] = None,
+        tenant: str = DEFAULT_TENANT,
+        window: Optional[int] = None,
+        run: RunFn = _default_run,
+        progress: Optional[Callable[[str], None]] = None,
+        progress_interval: float = PROGRESS_INTERVAL_S,
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.agent = agent
+        self.deadline_ms = deadline_ms
+        self.tenant = tenant
+        # Lines read past the first unfinished one; bounds what an ordered run buffers
+        self.window = window or max(4 * concurrency, 64)
+        self.run = run
+        self.progress = progress or (lambda text: print(f"[batch] {text}", file=sys.stderr))
+        self.progress_interval = progress_interval
+        self.stats = BatchStats()
+
+        checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.checkpoint = Checkpoint.load(checkpoint_path, input_path) or Checkpoint(checkpoint_path, input_path)
+        self.resumed = self.checkpoint.line > 0 or bool(self.checkpoint.done)
+        # First line not yet finished, and what is known about the lines after it
+        self.next_line = self.checkpoint.line
+        self._offsets: Dict[int, int] = {}
+        self._end_offset = self.checkpoint.input_offset
+        self._buffered: Dict[int, bytes] = {}
+        self._written: Set[int] = set()
+        self._room = asyncio.Event()
+        self._out: Any = None
+
+    async def __call__(self) -> Dict[str, Any]:
+        mode = "r+b" if self.resumed and os.path.exists(self.output_path) else "wb"
+        with open(self.input_path, "rb") as source, open(self.output_path, mode) as out:
+            self._out = out
+            # Lines written after the last checkpoint are run again; drop them
+            self._out.truncate(self.checkpoint.output_bytes if mode == "r+b" else 0)
+            self._out.seek(0, os.SEEK_END)
+            source.seek(self.checkpoint.input_offset)
+            if self.resumed:
+                self.progress(f"resuming at line {self.next_line} of {self.input_path}")
+
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+            workers = [asyncio.ensure_future(self._work(queue)) for _ in range(self.concurrency)]
+            reporter = asyncio.ensure_future(self._report())
+            try:
+                await self._read(source, queue)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers + [reporter]:
+                    task.cancel()
+                await asyncio.gather(*workers, reporter, return_exceptions=True)
+                # Whatever happened, record what reached the output
+                self._save_checkpoint()
+
+        summary = self.stats.snapshot()
+        self.progress(f"finished: {self.stats.line()}")
+        # Done: a rerun starts over rather than resuming
+        os.remove(self.checkpoint.path)
+        return summary
+
+    async def _read(self, source: Any, queue: asyncio.Queue) -> None:
+        index = self.checkpoint.line
+        for raw in iter(source.readline, b""):
+            self._offsets[index] = self._end_offset
+            self._end_offset += len(raw)
+            while index - self.next_line >= self.window:
+                self._room.clear()
+                await self._room.wait()
+            if index in self.checkpoint.done or not raw.strip():
+                # Finished before the crash, or blank
+                self.stats.skipped += index in self.checkpoint.done
+                self._complete(index, b"")
+            else:
+                await queue.put((index, raw))
+            index += 1
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, raw = item
+            self._complete(index, await self._run_line(index, raw))
+
+    async def _run_line(self, index: int, raw: bytes) -> bytes:
+        start = time.monotonic()
+        record: Dict[str, Any] = {"id": index}
+        try:
+            data = json.loads(raw)
+            record["id"] = data.get("id", index)
+            agent = data.get("agent", self.agent)
+            record["agent"] = agent
+            if "input" in data:
+                input_data = data["input"]
+            elif "message" in data:
+                input_data = {"messages": [{"role": "human", "content": data["message"]}]}
+            else:
+                raise ValueError('expected a "message" or an "input"')
+            result = await self.run(agent, input_data, data.get("deadline_ms", self.deadline_ms), data.get("tenant", self.tenant))
+            record["output"] = result
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        seconds = time.monotonic() - start
+        record["latency_ms"] = round(seconds * 1000, 1)
+        self.stats.record(seconds, "error" not in record)
+        return (dumps(record) + "\n").encode()
+
+    def _complete(self, index: int, line: bytes) -> None:
+        if self.ordered:
+            self._buffered[index] = line
+            while self.next_line in self._buffered:
+                self._out.write(self._buffered.pop(self.next_line))
+                self._advance()
+        else:
+            self._out.write(line)
+            self._written.add(index)
+            while self.next_line in self._written:
+                self._written.remove(self.next_line)
+                self._advance()
+
+    def _advance(self) -> None:
+        self._offsets.pop(self.next_line, None)
+        self.checkpoint.done.discard(self.next_line)
+        self.next_line += 1
+        self._room.set()
+
+    def _save_checkpoint(self) -> None:
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self.checkpoint.line = self.next_line
+        self.checkpoint.input_offset = self._offsets.get(self.next_line, self._end_offset)
+        self.checkpoint.output_bytes = self._out.tell()
+        # Out of order lines already in the output (keyed mode), and those left from a resumed checkpoint
+        self.checkpoint.done = {i for i in self.checkpoint.done if i >= self.next_line} | self._written
+        self.checkpoint.save()
+
+    async def _report(self) -> None:
+        last_progress = time.monotonic()
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL_S)
+            self._save_checkpoint()
+            if time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                self.progress(self.stats.line())
+
+
+async def run_batch(input_path: str, output_path: str, **options: Any) -> Dict[str, Any]:
+    """Run ``input_path`` into ``output_path``, resuming from its checkpoint if there is one."""
+    return await BatchRunner(input_path, output_path, **options)()
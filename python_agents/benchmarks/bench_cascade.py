@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Offline replay of router requests through the small-model-first cascade.
+
+Replays a trace of routing requests against local fake models standing in for
+``gpt-4o-mini`` and ``gpt-4o``, once with the large model only and once through
+``invoke_cascade`` with the router's validator. Each request has a difficulty:
+the small model routes easy requests correctly and confidently, and on hard
+ones answers with an unknown route, low confidence or, for a fraction, a
+confident wrong route that validation cannot catch. Reports latency, cost
+(from ``MODEL_PRICES``), escalation rate and routing accuracy for both runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, List, Optional
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from agents.budget import Budget, budget_config
+from agents.cascade import Cascade, CascadeStats, invoke_cascade
+from agents.providers import ModelBalancer, PROVIDER_FACTORIES, invoke_pool
+from agents.supervisor.nodes.router import validate_route
+from agents.supervisor.types import ROUTES
+from benchmarks.fake_llm import FakeChatModel
+
+
+class FakeRouterModel(FakeChatModel):
+    """Answers each traced request with a ``route_to_agent`` call."""
+
+    trace: dict = {}
+    skill: float = 1.0
+    confidently_wrong: float = 0.0
+    seed: int = 0
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeRouterModel":
+        return self
+
+    def _decide(self, request: dict) -> dict:
+        rng = random.Random(f"{self.seed}:{request['id']}")
+        if request["difficulty"] < self.skill:
+            return {"agent": request["route"], "confidence": round(rng.uniform(0.8, 1.0), 2)}
+        roll = rng.random()
+        wrong = rng.choice([route for route in ROUTES if route != request["route"]])
+        if roll < self.confidently_wrong:
+            return {"agent": wrong, "confidence": 0.9}
+        if roll < (1 + self.confidently_wrong) / 2:
+            return {"agent": "weather", "confidence": 0.9}
+        return {"agent": wrong, "confidence": round(rng.uniform(0.3, 0.6), 2)}
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        request = self.trace[messages[-1].content]
+        await asyncio.sleep(self.first_token_delay)
+        message = AIMessage(
+            content="",
+            tool_calls=[{"name": "route_to_agent", "args": self._decide(request), "id": f"call-{request['id']}"}],
+            usage_metadata=self._usage(messages),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def make_trace(requests: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    return [
+        {"id": i, "text": f"request {i}: " + " ".join(["word"] * rng.randint(20, 200)),
+         "route": rng.choice(ROUTES), "difficulty": rng.random()}
+        for i in range(requests)
+    ]
+
+
+def load_trace(path: str) -> List[dict]:
+    """Trace from a JSON Lines file of {"text", "route", "difficulty"} records."""
+    with open(path) as f:
+        return [{"id": i, **json.loads(line)} for i, line in enumerate(f) if line.strip()]
+
+
+async def replay(trace: List[dict], cascade: Cascade, use_cascade: bool, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = CascadeStats()
+    balancer = ModelBalancer()
+    latencies, costs, correct = [], [], 0
+
+    async def one(request: dict) -> None:
+        nonlocal correct
+        budget = Budget()
+        config = budget_config(budget)
+        messages = [HumanMessage(content="Route this request."), HumanMessage(content=request["text"])]
+        async with semaphore:
+            start = time.monotonic()
+            if use_cascade:
+                response = await invoke_cascade(
+                    cascade, lambda model: model, messages, config, "supervisor.router", validate_route,
+                    stats=stats, balancer=balancer,
+                )
+            else:
+                response = await invoke_pool(cascade.large, lambda model: model, messages, config, "supervisor.router", balancer=balancer)
+            latencies.append(time.monotonic() - start)
+        costs.append(budget.cost())
+        correct += response.tool_calls[0]["args"]["agent"] == request["route"]
+
+    await asyncio.gather(*(one(request) for request in trace))
+    return {
+        "latencies": np.array(latencies) * 1000,
+        "cost": sum(costs),
+        "accuracy": correct / len(trace),
+        "stats": stats.snapshot().get("supervisor.router"),
+    }
+
+
+def report(label: str, result: dict, requests: int) -> None:
+    p50, p99 = np.percentile(result["latencies"], [50, 99])
+    line = (f"{label:<11} mean {result['latencies'].mean():.0f} ms, p50 {p50:.0f} ms, p99 {p99:.0f} ms, "
+            f"cost ${result['cost']:.4f} (${1000 * result['cost'] / requests:.4f}/1k), accuracy {100 * result['accuracy']:.1f}%")
+    if result["stats"]:
+        line += f", escalated {100 * result['stats']['escalation_rate']:.1f}%"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay router requests through the small-model-first cascade")
+    parser.add_argument("--trace", help="JSON Lines trace to replay instead of a generated one")
+    parser.add_argument("--requests", type=int, default=500, help="Requests in the generated trace")
+    parser.add_argument("--skill", type=float, default=0.85, help="Fraction of requests the small model routes correctly")
+    parser.add_argument("--confidently-wrong", type=float, default=0.1,
+                        help="Fraction of the small model's mistakes that pass validation")
+    parser.add_argument("--small-latency", type=float, default=0.15, help="Small model latency (s)")
+    parser.add_argument("--large-latency", type=float, default=0.6, help="Large model latency (s)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else make_trace(args.requests, args.seed)
+    by_text = {request["text"]: request for request in trace}
+    models = {
+        "gpt-4o-mini": FakeRouterModel(trace=by_text, skill=args.skill, confidently_wrong=args.confidently_wrong,
+                                       first_token_delay=args.small_latency, seed=args.seed),
+        "gpt-4o": FakeRouterModel(trace=by_text, first_token_delay=args.large_latency, seed=args.seed),
+    }
+    PROVIDER_FACTORIES["openai"] = lambda model, **options: models[model]
+    cascade = Cascade([], small=["gpt-4o-mini"], large=["gpt-4o"])
+
+    print(f"{len(trace)} requests, small model right on {100 * args.skill:.0f}% of them\n")
+    report("large only", asyncio.run(replay(trace, cascade, False, args.concurrency)), len(trace))
+    cascaded = asyncio.run(replay(trace, cascade, True, args.concurrency))
+    report("cascade", cascaded, len(trace))
+    print(f"\nescalation reasons: {cascaded['stats']['reasons']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark for downsampling series-valued UI props.
+
+Builds a 1M-point minute-bar price series, pushes it through
+``UIMessageManager`` with and without downsampling, and reports the JSON
+payload size and CPU time of each.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.downsample import downsample_indices
+from agents.stockbroker.market_data import synthetic_bars
+from agents.types import UIMessageManager
+
+
+def build_series(num_points: int):
+    close = synthetic_bars(["AAPL"], num_points, "minute")["close"][0]
+    start = np.datetime64("2015-01-02T14:30")
+    times = np.datetime_as_string(start + np.arange(num_points).astype("timedelta64[m]"))
+    return [{"time": t, "close": round(float(c), 4)} for t, c in zip(times.tolist(), close)]
+
+
+def measure(manager: UIMessageManager, series) -> tuple:
+    t0 = time.process_time()
+    item = manager.push({"name": "stock-price", "props": {"ticker": "AAPL", "series": series}})
+    payload = json.dumps(item)
+    return time.process_time() - t0, len(payload), len(item["props"]["series"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark UI series downsampling")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--target", type=int, default=768, help="Target point count (viewport pixels)")
+    args = parser.parse_args()
+
+    series = build_series(args.points)
+    print(f"Series: {args.points:,} points, target {args.target} points")
+    print(f"{'mode':<10}{'points':>10}{'bytes':>16}{'cpu (ms)':>12}")
+
+    rows = [("raw", UIMessageManager()),
+            ("lttb", UIMessageManager(args.target, "lttb")),
+            ("minmax", UIMessageManager(args.target, "minmax"))]
+    for label, manager in rows:
+        cpu, size, points = measure(manager, series)
+        print(f"{label:<10}{points:>10,}{size:>16,}{cpu * 1e3:>12.1f}")
+
+    y = np.array([row["close"] for row in series])
+    for method in ("lttb", "minmax"):
+        t0 = time.process_time()
+        downsample_indices(y, args.target, method)
+        print(f"{method} on a NumPy array alone: {(time.process_time() - t0) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
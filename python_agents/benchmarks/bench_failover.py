@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Simulation of multi-provider failover and load balancing.
+
+Three local fake providers serve the same model pool. The primary is the
+fastest but has latency spikes and a full outage in the middle of the run; the
+others are slower, and one of them has a short outage of its own. Requests
+arrive open-loop (Poisson) and go through ``invoke_pool`` either with the
+primary alone, as nodes did when each hard-coded one provider, or with the
+whole pool behind the balancer. Reports success rate and latency percentiles
+for both.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.messages import HumanMessage
+
+from agents.providers import ModelBalancer, ModelPool, NoModelAvailable, PROVIDER_FACTORIES, invoke_pool, register_model
+from benchmarks.fake_llm import FakeChatModel, FaultInjector
+
+
+def fake_providers(duration: float, seed: int) -> dict:
+    """Fresh fake chat models, one per provider, with their fault timelines starting now."""
+    return {
+        "fake-primary": FakeChatModel(reply="ok", token_delay=0.0, first_token_delay=0.08, faults=FaultInjector(
+            spike_rate=0.05, spike_seconds=1.5, outages=[(0.3 * duration, 0.6 * duration)], seed=seed,
+        )),
+        "fake-secondary": FakeChatModel(reply="ok", token_delay=0.0, first_token_delay=0.12, faults=FaultInjector(
+            spike_rate=0.01, spike_seconds=1.0, seed=seed + 1,
+        )),
+        "fake-tertiary": FakeChatModel(reply="ok", token_delay=0.0, first_token_delay=0.18, faults=FaultInjector(
+            error_rate=0.01, outages=[(0.7 * duration, 0.8 * duration)], seed=seed + 2,
+        )),
+    }
+
+
+async def simulate(models: list, rate: float, duration: float, seed: int, cooldown: float) -> dict:
+    chat_models = fake_providers(duration, seed)
+    for name, chat_model in chat_models.items():
+        register_model(name, name)
+        PROVIDER_FACTORIES[name] = lambda model, _chat_model=chat_model, **options: _chat_model
+
+    pool = ModelPool([], models)
+    balancer = ModelBalancer(cooldown=cooldown, rng=random.Random(seed))
+    prompt = [HumanMessage(content="Which agent should handle this request?")]
+    latencies = []
+    failures = 0
+
+    async def request() -> None:
+        nonlocal failures
+        start = time.monotonic()
+        try:
+            await invoke_pool(pool, lambda model: model, prompt, None, "simulation", balancer=balancer)
+        except NoModelAvailable:
+            failures += 1
+            return
+        latencies.append(time.monotonic() - start)
+
+    rng = random.Random(seed)
+    tasks = []
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        tasks.append(asyncio.ensure_future(request()))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    return {"requests": len(tasks), "failures": failures, "latencies": np.array(latencies) * 1000, "balancer": balancer}
+
+
+def report(label: str, result: dict) -> None:
+    latencies = result["latencies"]
+    ok = result["requests"] - result["failures"]
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) if len(latencies) else (0.0, 0.0, 0.0)
+    print(f"{label:<10} {ok}/{result['requests']} ok ({100 * ok / max(result['requests'], 1):.1f}%), "
+          f"p50 {p50:.0f} ms, p99 {p99:.0f} ms, p99.9 {p999:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate provider failover with fake providers")
+    parser.add_argument("--rate", type=float, default=50.0, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic per strategy")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="Circuit breaker cooldown (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.rate:.0f} req/s for {args.duration:.0f}s; primary is down from "
+          f"{0.3 * args.duration:.0f}s to {0.6 * args.duration:.0f}s\n")
+    single = asyncio.run(simulate(["fake-primary"], args.rate, args.duration, args.seed, args.cooldown))
+    report("single", single)
+    pooled = asyncio.run(simulate(
+        ["fake-primary", "fake-secondary", "fake-tertiary"], args.rate, args.duration, args.seed, args.cooldown,
+    ))
+    report("balanced", pooled)
+
+    snapshot = pooled["balancer"].snapshot()
+    print(f"\nfailovers: {snapshot['failovers']}")
+    for model, stats in snapshot["models"].items():
+        print(f"  {model:<16} {stats['calls']:>5} calls, {stats['errors']:>4} errors")
+
+
+if __name__ == "__main__":
+    main()
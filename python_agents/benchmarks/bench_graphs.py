@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Benchmark every graph in ``AGENTS`` on a scripted fake LLM.
+
+Every provider is replaced by ``ScriptedChatModel``, which answers each user
+message of ``SCRIPTS`` with the scripted reply, tool calls or structured
+output, after a fixed time to first token and per-token delay. Each agent runs
+its multi-turn conversation through ``ChatSession`` (``astream_events``, the
+same path as the interactive CLI), which yields per-node timing. Reported per
+agent:
+
+- end-to-end turn latency percentiles, one conversation at a time;
+- throughput with ``--concurrency`` conversations at once;
+- per node, its calls and its overhead: time in the node that is neither in a
+  model call nor in a nested node (tool time, e.g. the mock APIs' sleeps, is
+  included; ``--tool-delay-scale 0`` removes it);
+- memory allocated per turn (tracemalloc peak, and what the turn left behind).
+
+Model latency is fixed and no randomness is involved, so two runs differ only
+by the framework.
+
+Recorded responses can stand in for the scripted ones: ``--record PATH``
+runs each script once against the real providers into a cassette (see
+``agents/cassettes.py``), and ``--cassette PATH`` then replays it offline with
+the recorded time of every streamed chunk (scaled by ``--time-scale``), so
+streaming is measured on real response shapes. Calls the cassette does not
+hold fall back to the scripted model. ``--save`` writes the results as a JSON baseline;
+``--compare`` diffs against one and exits with status 1 when a metric got
+worse by more than ``--threshold`` (and ``--min-change``).
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.providers import PROVIDER_FACTORIES
+from benchmarks.fake_llm import ScriptedChatModel
+
+
+# agent -> conversation; each turn is a user message and what the model does while it is the latest
+SCRIPTS: Dict[str, List[Dict[str, Any]]] = {
+    "agent": [
+        {"message": "What can you do?", "tools": {"route_to_agent": {"agent": "generalInput"}}},
+        {"message": "What's the current price of AAPL?",
+         "tools": {"route_to_agent": {"agent": "stockbroker"}, "get_stock_price": {"ticker": "AAPL"}}},
+        {"message": "Show me places to stay in Paris, and how is MSFT doing?",
+         "tools": {"route_to_agent": [{"agent": "tripPlanner"}, {"agent": "stockbroker"}],
+                   "extract_trip_details": {"location": "Paris"}, "list_accommodations": {},
+                   "get_stock_price": {"ticker": "MSFT"}}},
+        {"message": "Write me a short story about a fox", "tools": {"route_to_agent": {"agent": "writerAgent"}}},
+    ],
+    "chat": [
+        {"message": "Hi there!", "reply": "Hello! How can I help you today?"},
+        {"message": "Explain what an index fund is in two sentences."},
+        {"message": "And how is that different from an ETF?"},
+    ],
+    "stockbroker": [
+        {"message": "What's the price of NVDA?", "tools": {"get_stock_price": {"ticker": "NVDA"}}},
+        {"message": "Buy 10 shares of NVDA", "tools": {"buy_stock": {"ticker": "NVDA", "quantity": 10}}},
+        {"message": "Show me my portfolio", "tools": {"get_portfolio": {}}},
+    ],
+    "trip_planner": [
+        {"message": "Find me places to stay in Lisbon for 2 guests",
+         "tools": {"extract_trip_details": {"location": "Lisbon", "number_of_guests": 2},
+                   "list_accommodations": {}}},
+        {"message": "Now recommend some restaurants nearby",
+         "tools": {"classify_trip_relevance": {"is_relevant": True}, "list_restaurants": {}}},
+    ],
+    "open_code": [
+        {"message": "Write a React TODO app for me"},
+        {"message": "Add a dark mode toggle to it"},
+    ],
+    "pizza_orderer": [
+        {"message": "Order me a large pepperoni pizza in San Francisco",
+         "tools": {"FindShopSchema": {"location": "San Francisco", "pizza_company": "Dominos"},
+                   "PlaceOrderSchema": {"address": "1 Market St", "phone_number": "555-0100",
+                                        "order": "1 large pepperoni pizza"}}},
+    ],
+    "writer_agent": [
+        {"message": "Write me a short story about a lighthouse keeper"},
+        {"message": "Make the ending happier"},
+    ],
+    "email_agent": [
+        {"message": "Write an email to sam@example.com about moving Friday's meeting",
+         "tools": {"EmailSchema": {"to": "sam@example.com", "subject": "Friday's meeting",
+                                   "body": "Hi Sam, could we move Friday's meeting to 3pm?"}}},
+        {"message": "Looks good, send it", "values": {"human_response": {"type": "accept"}},
+         "tools": {"EmailSchema": {"to": "sam@example.com", "subject": "Friday's meeting",
+                                   "body": "Hi Sam, could we move Friday's meeting to 3pm?"}}},
+    ],
+}
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED = {
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "first_token_ms.p50": False,
+    "throughput_turns_per_s": True,
+    "overhead_ms_per_turn": False,
+    "alloc_kib_per_turn.peak": False,
+    "alloc_kib_per_turn.retained": False,
+}
+
+
+def install_fake_models(first_token_s: float, token_delay: float) -> None:
+    """Route every provider to scripted models."""
+    script = {turn["message"]: turn for turns in SCRIPTS.values() for turn in turns}
+    models: Dict[str, ScriptedChatModel] = {}
+
+    def factory(model: str, **options: Any) -> ScriptedChatModel:
+        if model not in models:
+            models[model] = ScriptedChatModel(script=script, first_token_delay=first_token_s, token_delay=token_delay)
+        return models[model]
+
+    for provider in list(PROVIDER_FACTORIES):
+        PROVIDER_FACTORIES[provider] = factory
+
+
+def scale_tool_delays(scale: float) -> None:
+    """Scale the simulated API latency of the agents' tools: every ``sleep`` of an agent module."""
+
+    def scaled(sleep: Callable) -> Callable:
+        signature = inspect.signature(sleep)
+
+        def scaled_args(args: tuple, kwargs: dict) -> inspect.BoundArguments:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            first = next(iter(bound.arguments))
+            bound.arguments[first] *= scale
+            return bound
+
+        if inspect.iscoroutinefunction(sleep):
+            async def scaled_sleep(*args: Any, **kwargs: Any) -> None:
+                bound = scaled_args(args, kwargs)
+                await sleep(*bound.args, **bound.kwargs)
+        else:
+            def scaled_sleep(*args: Any, **kwargs: Any) -> None:
+                bound = scaled_args(args, kwargs)
+                sleep(*bound.args, **bound.kwargs)
+        return scaled_sleep
+
+    for name, module in list(sys.modules.items()):
+        sleep = getattr(module, "sleep", None)
+        # The tools' modules, not the cancellation helpers that define the shared sleep
+        if name.startswith("agents.") and name != "agents.cancellation" and inspect.isfunction(sleep):
+            module.sleep = scaled(sleep)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "p50": round(at(0.50), 2),
+        "p95": round(at(0.95), 2),
+        "p99": round(at(0.99), 2),
+        "mean": round(statistics.fmean(ordered), 2),
+    }
+
+
+def self_times(report: Any) -> Dict[str, float]:
+    """Seconds each node spent outside model calls and nested nodes."""
+    result = {}
+    for path, timing in report.nodes.items():
+        nested = sum(
+            other.seconds for other_path, other in report.nodes.items()
+            if other_path.startswith(path + "/") and "/" not in other_path[len(path) + 1:]
+        )
+        result[path] = max(0.0, timing.seconds - timing.model_seconds - nested)
+    return result
+
+
+async def converse(session_cls: Any, agent: str) -> List[Any]:
+    """Run ``agent``'s script once; the turn reports, or the exception of a failed turn."""
+    session = session_cls(agent, write=lambda text: None)
+    reports = []
+    for turn in SCRIPTS[agent]:
+        try:
+            reports.append(await session.send(turn["message"], turn.get("values")))
+        except Exception as e:
+            reports.append(e)
+    return reports
+
+
+async def bench_agent(agent: str, iterations: int, concurrency: int) -> Dict[str, Any]:
+    from session import ChatSession
+
+    # Import, compile and run once before measuring
+    await converse(ChatSession, agent)
+
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors: List[str] = []
+    nodes: Dict[str, Dict[str, float]] = {}
+    overhead = 0.0
+    for _ in range(iterations):
+        for report in await converse(ChatSession, agent):
+            if isinstance(report, Exception):
+                errors.append(f"{type(report).__name__}: {report}")
+                continue
+            latencies.append(report.seconds * 1000)
+            if report.first_token_s is not None:
+                first_tokens.append(report.first_token_s * 1000)
+            for path, seconds in self_times(report).items():
+                node = nodes.setdefault(path, {"calls": 0, "overhead_ms": 0.0, "model_ms": 0.0})
+                node["calls"] += report.nodes[path].calls
+                node["overhead_ms"] += seconds * 1000
+                node["model_ms"] += report.nodes[path].model_seconds * 1000
+                overhead += seconds * 1000
+
+    start = time.perf_counter()
+    concurrent = await asyncio.gather(*(converse(ChatSession, agent) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    completed = sum(1 for reports in concurrent for report in reports if not isinstance(report, Exception))
+
+    tracemalloc.start()
+    peaks, retained = [], []
+    session = ChatSession(agent, write=lambda text: None)
+    for turn in SCRIPTS[agent]:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            await session.send(turn["message"], turn.get("values"))
+        except Exception:
+            pass
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append((peak - before) / 1024)
+        retained.append((current - before) / 1024)
+    tracemalloc.stop()
+
+    turns = len(latencies)
+    return {
+        "turns": turns,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "latency_ms": percentiles(latencies) if latencies else None,
+        "first_token_ms": percentiles(first_tokens) if first_tokens else None,
+        "throughput_turns_per_s": round(completed / elapsed, 2),
+        "overhead_ms_per_turn": round(overhead / turns, 3) if turns else None,
+        "alloc_kib_per_turn": {
+            "peak": round(statistics.fmean(peaks), 1),
+            "retained": round(statistics.fmean(retained), 1),
+        },
+        "nodes": {
+            path: {
+                "calls_per_turn": round(node["calls"] / turns, 2),
+                "overhead_ms_per_call": round(node["overhead_ms"] / max(node["calls"], 1), 3),
+                "model_ms_per_call": round(node["model_ms"] / max(node["calls"], 1), 3),
+            }
+            for path, node in sorted(nodes.items())
+        },
+    }
+
+
+def metric(result: Dict[str, Any], name: str) -> Optional[float]:
+    value: Any = result
+    for key in name.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_change: float) -> bool:
+    """Print the change of every compared metric; False if any regressed past
+    ``threshold`` and by at least ``min_change`` in its own unit.
+    """
+    ok = True
+    print(f"\nagainst baseline from {baseline.get('created', 'unknown')} (threshold {threshold:.0%}):")
+    for agent, result in results["agents"].items():
+        before = baseline.get("agents", {}).get(agent)
+        if before is None:
+            print(f"  {agent}: not in baseline")
+            continue
+        for name, higher_is_better in COMPARED.items():
+            new, old = metric(result, name), metric(before, name)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > threshold and abs(new - old) >= min_change else ""
+            ok = ok and not flag
+            print(f"  {agent:<14} {name:<28} {old:>10.2f} -> {new:>10.2f}  {change:>+7.1%} {flag}")
+    return ok
+
+
+async def record_all(agents: List[str]) -> None:
+    """Run each script once on the real providers; ``cassettes.record`` is installed."""
+    from session import ChatSession
+
+    for name in agents:
+        reports = await converse(ChatSession, name)
+        failed = [report for report in reports if isinstance(report, Exception)]
+        print(f"{name}: recorded {len(reports) - len(failed)} turns" + (f", first error: {failed[0]!r}" if failed else ""))
+
+
+async def run_all(agents: List[str], args: argparse.Namespace, results: Dict[str, Any]) -> None:
+    for name in agents:
+        result = results["agents"][name] = await bench_agent(name, args.iterations, args.concurrency)
+        latency = result["latency_ms"] or {}
+        print(f"{name}: {result['turns']} turns, {result['errors']} errors, "
+              f"p50 {latency.get('p50', 0):.1f} ms p95 {latency.get('p95', 0):.1f} ms p99 {latency.get('p99', 0):.1f} ms, "
+              f"first token p50 {(result['first_token_ms'] or {}).get('p50', 0):.1f} ms, "
+              f"{result['throughput_turns_per_s']:.1f} turns/s, "
+              f"alloc {result['alloc_kib_per_turn']['peak']:.0f} KiB peak / {result['alloc_kib_per_turn']['retained']:.0f} KiB kept per turn")
+        if result["first_error"]:
+            print(f"  first error: {result['first_error']}")
+        for path, node in result["nodes"].items():
+            print(f"  {path:<32} {node['calls_per_turn']:>5.2f} calls/turn, overhead {node['overhead_ms_per_call']:>8.3f} ms/call, "
+                  f"model {node['model_ms_per_call']:>8.1f} ms/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every agent graph on a scripted fake LLM")
+    parser.add_argument("--agent", action="append", help="Agent to benchmark (default: all)")
+    parser.add_argument("--iterations", type=int, default=5, help="Conversations per agent for latency")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversations at once for throughput")
+    parser.add_argument("--first-token-ms", type=float, default=20.0, help="Fake model time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=500.0, help="Fake model output rate")
+    parser.add_argument("--record", metavar="PATH",
+                        help="Run each script once on the real providers, recording their responses into a cassette")
+    parser.add_argument("--cassette", metavar="PATH", help="Replay the responses recorded in a cassette")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Scale of the recorded response timing with --cassette (0 replays without waiting)")
+    parser.add_argument("--tool-delay-scale", type=float, default=1.0,
+                        help="Scale of the tools' simulated API latency (0 removes it)")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Diff against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    parser.add_argument("--min-change", type=float, default=1.0,
+                        help="Smaller absolute changes (ms, KiB, turns/s) are noise, not regressions")
+    args = parser.parse_args()
+
+    from agents import cassettes
+    from main import AGENTS
+
+    if args.record:
+        writer = cassettes.record(args.record)
+        try:
+            asyncio.run(record_all(args.agent or [name for name in AGENTS if name in SCRIPTS]))
+        finally:
+            writer.close()
+        print(f"{len(writer)} calls in {args.record}")
+        return
+
+    install_fake_models(args.first_token_ms / 1000, 1 / args.tokens_per_s)
+    cassette = cassettes.replay(args.cassette, args.time_scale, fallback=True) if args.cassette else None
+
+    agents = args.agent or [name for name in AGENTS if name in SCRIPTS]
+    # Importing the graphs imports their tools, including the supervisor's sub-agents'; scale their delays after that
+    for name in AGENTS:
+        AGENTS[name]
+    scale_tool_delays(args.tool_delay_scale)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "first_token_ms": args.first_token_ms,
+            "tokens_per_s": args.tokens_per_s,
+            "tool_delay_scale": args.tool_delay_scale,
+            "cassette": args.cassette,
+            "time_scale": args.time_scale if args.cassette else None,
+        },
+        "agents": {},
+    }
+    asyncio.run(run_all(agents, args, results))
+    if cassette is not None:
+        print(f"\ncassette: {cassette.hits} calls replayed, {cassette.misses} not recorded (scripted instead)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nsaved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold, args.min_change):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
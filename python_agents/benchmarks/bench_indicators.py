@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the stockbroker technical indicators.
+
+Computes every indicator for a panel of tickers (5,000 x 10 years of daily bars
+by default) and measures the per-ticker cache paths used by ``get_indicators``.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.stockbroker.indicators import IndicatorCache, compute_indicators
+from agents.stockbroker.market_data import MarketDataStore, synthetic_bars
+
+
+def bench_panel(num_tickers: int, num_bars: int, chunk: int, window: int) -> None:
+    """Compute all indicators for ``num_tickers`` in vectorized chunks."""
+    tickers = [f"T{i:05d}" for i in range(num_tickers)]
+    generate_s = 0.0
+    compute_s = 0.0
+
+    for start in range(0, num_tickers, chunk):
+        t0 = time.perf_counter()
+        bars = synthetic_bars(tickers[start:start + chunk], num_bars)
+        t1 = time.perf_counter()
+        compute_indicators(bars["high"], bars["low"], bars["close"], bars["volume"], window)
+        compute_s += time.perf_counter() - t1
+        generate_s += t1 - t0
+
+    total_bars = num_tickers * num_bars
+    print(f"Panel: {num_tickers} tickers x {num_bars} bars (chunk={chunk}, window={window})")
+    print(f"  data generation: {generate_s:8.3f} s (not included below)")
+    print(f"  indicators:      {compute_s:8.3f} s")
+    print(f"  throughput:      {num_tickers / compute_s:10.0f} tickers/s, {total_bars / compute_s / 1e6:.1f} M bars/s")
+
+
+def bench_cache(num_bars: int, window: int, repeats: int = 200) -> None:
+    """Measure cold, warm and incremental lookups through ``IndicatorCache``."""
+    store = MarketDataStore(num_bars=num_bars)
+    cache = IndicatorCache(store)
+    store.history("AAPL")
+
+    t0 = time.perf_counter()
+    cache.get("AAPL", "day", window)
+    cold = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        cache.get("AAPL", "day", window)
+    warm = (time.perf_counter() - t0) / repeats
+
+    new_bar = {name: values[0, :1] for name, values in synthetic_bars(["AAPL"], 1).items()}
+    elapsed = 0.0
+    for _ in range(repeats):
+        store.append_bars("AAPL", new_bar)
+        t0 = time.perf_counter()
+        cache.get("AAPL", "day", window)
+        elapsed += time.perf_counter() - t0
+    incremental = elapsed / repeats
+
+    print(f"Cache: 1 ticker x {num_bars} bars (window={window})")
+    print(f"  cold compute:      {cold * 1e3:8.3f} ms")
+    print(f"  warm hit:          {warm * 1e6:8.1f} us")
+    print(f"  append 1 bar:      {incremental * 1e3:8.3f} ms")
+    print(f"  hits={cache.hits} misses={cache.misses} extensions={cache.extensions}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stockbroker technical indicators")
+    parser.add_argument("--tickers", type=int, default=5000)
+    parser.add_argument("--bars", type=int, default=2520, help="Bars per ticker (2520 = 10 years of daily bars)")
+    parser.add_argument("--chunk", type=int, default=250, help="Tickers per vectorized batch")
+    parser.add_argument("--window", type=int, default=20)
+    args = parser.parse_args()
+
+    np.seterr(all="ignore")
+    bench_panel(args.tickers, args.bars, args.chunk, args.window)
+    print()
+    bench_cache(args.bars, args.window)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test of the agents with a mixed traffic profile.
+
+Simulated users arrive as a Poisson process at ``--rate`` users per second,
+however fast they are served, and each holds one conversation of
+``bench_graphs.SCRIPTS`` with an agent drawn from ``--mix`` (default: 40%
+stockbroker, 30% trip planner, 15% writer, 10% email, whose second turn
+answers the interrupt of the drafted email, and 5% pizza), thinking
+``--think-ms`` on average between turns. Every model is the scripted fake of
+``bench_graphs`` and the tools keep their simulated API latency
+(``--tool-delay-scale``). The client carries the conversation state from turn
+to turn.
+
+Targets: ``--target inproc`` calls ``main.run_agent`` in this process;
+``--target http`` posts to ``/agents/<name>/invoke`` of a server started on
+the fake providers in a child process (``--workers`` for pre-fork mode), or
+of ``--url``.
+
+Reported every ``--interval`` seconds: users started and in flight, turns/s,
+turn latency, the event loop lag (``agent_event_loop_lag_seconds`` of
+``/metrics``) and the resident memory of the serving processes. At the end of
+a rate: per agent the turn latency percentiles and histogram, and per node
+its ``agent_node_duration_seconds`` over the rate. With pre-fork workers
+``/metrics`` is the one worker that served the scrape.
+
+``--rate 10,20,40,80`` steps through the rates, ``--duration`` seconds each,
+and reports the saturation point: the highest rate at which no user was shed
+or left unfinished, under 1% of turns failed and p95 latency stayed under
+``--max-p95-ms`` (default: 3 times the p95 of the first rate), per core of the
+serving processes. ``--save`` writes everything as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+
+from agents.telemetry import DURATION_BUCKETS
+from benchmarks.bench_graphs import SCRIPTS, install_fake_models, percentiles, scale_tool_delays
+from benchmarks.bench_server import free_port, raise_fd_limit, wait_until_up
+
+
+DEFAULT_MIX = "stockbroker=40,trip_planner=30,writer_agent=15,email_agent=10,pizza_orderer=5"
+LAG_METRIC = "agent_event_loop_lag_seconds"
+NODE_METRIC = "agent_node_duration_seconds"
+# A rate is served while fewer turns than this fail
+MAX_ERROR_RATE = 0.01
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+Histograms = Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """``agent=weight,...`` as shares of the traffic."""
+    mix = {}
+    for part in text.split(","):
+        agent, _, weight = part.partition("=")
+        agent = agent.strip()
+        if agent not in SCRIPTS:
+            raise ValueError(f"no script for agent {agent!r}; one of {', '.join(SCRIPTS)}")
+        mix[agent] = float(weight or 1)
+    total = sum(mix.values())
+    return {agent: weight / total for agent, weight in mix.items()}
+
+
+def parse_histograms(text: str, name: str) -> Histograms:
+    """Histogram ``name`` of a Prometheus text exposition, by label set."""
+    histograms: Histograms = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match is None or not match.group(1).startswith(name):
+            continue
+        suffix = match.group(1)[len(name):]
+        if suffix not in ("_bucket", "_sum", "_count"):
+            continue
+        labels = dict(_LABEL.findall(match.group(2) or ""))
+        le = labels.pop("le", None)
+        entry = histograms.setdefault(tuple(sorted(labels.items())), {"buckets": {}, "sum": 0.0, "count": 0.0})
+        if suffix == "_bucket":
+            entry["buckets"][float(le)] = float(match.group(3))
+        else:
+            entry[suffix[1:]] = float(match.group(3))
+    return histograms
+
+
+def subtract(after: Histograms, before: Histograms) -> Histograms:
+    """What was observed between two scrapes."""
+    result: Histograms = {}
+    for key, entry in after.items():
+        old = before.get(key, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        count = entry["count"] - old["count"]
+        if count > 0:
+            result[key] = {
+                "buckets": {le: n - old["buckets"].get(le, 0.0) for le, n in entry["buckets"].items()},
+                "sum": entry["sum"] - old["sum"],
+                "count": count,
+            }
+    return result
+
+
+def quantile(entry: Dict[str, Any], q: float) -> float:
+    """Estimated ``q`` quantile of a histogram, interpolating within its bucket like ``histogram_quantile``."""
+    rank = q * entry["count"]
+    lower, below = 0.0, 0.0
+    for bound, cumulative in sorted(entry["buckets"].items()):
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(cumulative - below, 1e-12)
+        lower, below = bound, cumulative
+    return lower
+
+
+def process_tree(pid: int) -> List[int]:
+    """``pid`` and its descendants (pre-fork workers), from ``/proc``."""
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of ``pid`` and its descendants; None off Linux."""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total
+
+
+class InProcess:
+    """Runs turns with ``main.run_agent`` in this process."""
+
+    name = "inproc"
+    cores = 1
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._lag: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        from agents.telemetry import watch_loop_lag
+
+        self._lag = asyncio.ensure_future(watch_loop_lag())
+
+    async def turn(self, agent: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        from main import run_agent
+
+        return dict(await run_agent(agent, state))
+
+    async def metrics(self) -> str:
+        from agents.telemetry import render_metrics
+
+        return render_metrics()
+
+    async def close(self) -> None:
+        if self._lag is not None:
+            self._lag.cancel()
+
+
+_CHUNK_TYPES = {"AIMessageChunk": "ai", "HumanMessageChunk": "human", "ToolMessageChunk": "tool", "SystemMessageChunk": "system"}
+
+
+def _as_input(message: Any) -> Any:
+    if isinstance(message, dict) and message.get("type") in _CHUNK_TYPES:
+        message = {key: value for key, value in message.items() if key != "tool_call_chunks"}
+        message["type"] = _CHUNK_TYPES[message["type"]]
+    return message
+
+
+class Http:
+    """Runs turns through ``/agents/<name>/invoke`` of a server."""
+
+    name = "http"
+
+    def __init__(self, url: str, pid: Optional[int], cores: int):
+        self.url = url
+        self.pid = pid
+        self.cores = cores
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0), timeout=aiohttp.ClientTimeout(total=None))
+
+    async def turn(self, agent: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._session.post(f"{self.url}/agents/{agent}/invoke", json={"input": state}) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}: {(await resp.text())[:200]}")
+            result = await resp.json()
+        # Streamed replies come back as chunks, which are not valid input messages
+        result["messages"] = [_as_input(message) for message in result.get("messages") or []]
+        return result
+
+    async def metrics(self) -> str:
+        async with self._session.get(f"{self.url}/metrics") as resp:
+            return await resp.text()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+def serve(port: int, workers: int, first_token_s: float, token_delay: float, tool_delay_scale: float) -> None:
+    """Server process of ``--target http``: every agent on the scripted fake providers."""
+    raise_fd_limit()
+    install_fake_models(first_token_s, token_delay)
+    from main import AGENTS
+
+    # Importing the graphs imports their tools; scale their delays after that
+    for name in AGENTS:
+        AGENTS[name]
+    scale_tool_delays(tool_delay_scale)
+    if workers > 1:
+        from prefork import serve_prefork
+
+        serve_prefork("127.0.0.1", port, workers, drain_timeout=1)
+        return
+
+    from aiohttp import web
+
+    from server import create_app
+
+    web.run_app(create_app(AGENTS, prewarm_agents=False), host="127.0.0.1", port=port,
+                backlog=8192, print=None, shutdown_timeout=1)
+
+
+class StepStats:
+    """What the users of one rate did."""
+
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.shed = 0
+        self.in_flight = 0
+        self.turns: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.first_error: Optional[str] = None
+        # (monotonic time, latency ms) of every turn, for the per-interval lines
+        self.timeline: List[Tuple[float, float]] = []
+
+    def turn(self, agent: str, seconds: float) -> None:
+        self.turns.setdefault(agent, []).append(seconds * 1000)
+        self.timeline.append((time.monotonic(), seconds * 1000))
+
+    def error(self, agent: str, error: BaseException) -> None:
+        self.errors[agent] = self.errors.get(agent, 0) + 1
+        if self.first_error is None:
+            self.first_error = f"{agent}: {type(error).__name__}: {error}"
+
+
+async def user(agent: str, target: Any, stats: StepStats, think_s: float, rng: random.Random) -> None:
+    """One conversation: the agent's script, turn by turn, on the state the previous turn returned."""
+    stats.in_flight += 1
+    try:
+        state: Dict[str, Any] = {}
+        for turn in SCRIPTS[agent]:
+            if state and think_s:
+                await asyncio.sleep(rng.expovariate(1 / think_s))
+            state = {**state, **turn.get("values", {})}
+            state["messages"] = list(state.get("messages") or []) + [{"role": "human", "content": turn["message"]}]
+            start = time.monotonic()
+            try:
+                state = await target.turn(agent, state)
+            except Exception as e:
+                stats.error(agent, e)
+                return
+            stats.turn(agent, time.monotonic() - start)
+        stats.completed += 1
+    finally:
+        stats.in_flight -= 1
+
+
+async def arrivals(rate: float, duration: float, mix: Dict[str, float], target: Any, stats: StepStats,
+                   args: argparse.Namespace, rng: random.Random) -> Set[asyncio.Task]:
+    """Start users for ``duration`` seconds at Poisson arrival times; returns those still running."""
+    agents, weights = list(mix), list(mix.values())
+    users: Set[asyncio.Task] = set()
+    start = time.monotonic()
+    arrival = start
+    while True:
+        arrival += rng.expovariate(rate)
+        if arrival - start >= duration:
+            break
+        delay = arrival - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(users) >= args.max_users:
+            stats.shed += 1
+            continue
+        agent = rng.choices(agents, weights)[0]
+        task = asyncio.ensure_future(user(agent, target, stats, args.think_ms / 1000, rng))
+        users.add(task)
+        task.add_done_callback(users.discard)
+        stats.started += 1
+    return users
+
+
+async def report(target: Any, stats: StepStats, rate: float, interval: float, samples: List[Dict[str, Any]]) -> None:
+    """Print and keep a line of the current rate every ``interval`` seconds."""
+    start = last = time.monotonic()
+    seen = 0
+    lag_before = parse_histograms(await target.metrics(), LAG_METRIC)
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        window = [latency for _, latency in stats.timeline[seen:]]
+        seen += len(window)
+        lag_after = parse_histograms(await target.metrics(), LAG_METRIC)
+        lag = subtract(lag_after, lag_before).get((), None)
+        lag_before = lag_after
+        rss = rss_bytes(target.pid) if target.pid is not None else None
+        sample = {
+            "t_s": round(now - start, 1),
+            "users_started": stats.started,
+            "users_in_flight": stats.in_flight,
+            "turns_per_s": round(len(window) / (now - last), 2),
+            "latency_ms": percentiles(window) if window else None,
+            "loop_lag_ms": {"p50": round(quantile(lag, 0.5) * 1000, 2), "p99": round(quantile(lag, 0.99) * 1000, 2)} if lag else None,
+            "rss_mb": round(rss / 2**20, 1) if rss is not None else None,
+        }
+        samples.append(sample)
+        last = now
+        latency = f"p50 {sample['latency_ms']['p50']:.0f} ms p95 {sample['latency_ms']['p95']:.0f} ms" if window else "no turns"
+        line = (f"[{sample['t_s']:>6.1f}s] {rate:g} users/s: {stats.started} started, {stats.in_flight} in flight, "
+                f"{sample['turns_per_s']:.1f} turns/s, {latency}")
+        if sample["loop_lag_ms"]:
+            line += f", loop lag p99 {sample['loop_lag_ms']['p99']:.1f} ms"
+        if sample["rss_mb"] is not None:
+            line += f", rss {sample['rss_mb']:.0f} MB"
+        print(line, flush=True)
+
+
+def histogram_ms(latencies: List[float]) -> Dict[str, int]:
+    """Turn latencies counted in the ``DURATION_BUCKETS`` (upper bounds, ms)."""
+    counts = {f"{bound * 1000:g}": 0 for bound in DURATION_BUCKETS}
+    counts["+Inf"] = 0
+    for latency in latencies:
+        for bound in DURATION_BUCKETS:
+            if latency <= bound * 1000:
+                counts[f"{bound * 1000:g}"] += 1
+                break
+        else:
+            counts["+Inf"] += 1
+    return counts
+
+
+async def run_rate(rate: float, mix: Dict[str, float], target: Any, args: argparse.Namespace,
+                   rng: random.Random) -> Dict[str, Any]:
+    stats = StepStats()
+    samples: List[Dict[str, Any]] = []
+    nodes_before = parse_histograms(await target.metrics(), NODE_METRIC)
+    rss_start = rss_bytes(target.pid) if target.pid is not None else None
+    reporter = asyncio.ensure_future(report(target, stats, rate, args.interval, samples))
+    start = time.monotonic()
+    try:
+        users = await arrivals(rate, args.duration, mix, target, stats, args, rng)
+        # Turns finished while users were arriving: the throughput the rate was served at
+        steady_turns = len(stats.timeline)
+        elapsed = time.monotonic() - start
+        if users:
+            await asyncio.wait(list(users), timeout=args.drain_s)
+        unfinished = [task for task in users if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+    finally:
+        reporter.cancel()
+        await asyncio.gather(reporter, return_exceptions=True)
+    rss_end = rss_bytes(target.pid) if target.pid is not None else None
+
+    nodes = subtract(parse_histograms(await target.metrics(), NODE_METRIC), nodes_before)
+    latencies = [latency for agent_latencies in stats.turns.values() for latency in agent_latencies]
+    turns = len(latencies)
+    errors = sum(stats.errors.values())
+    return {
+        "rate_users_per_s": rate,
+        "users_started": stats.started,
+        "users_completed": stats.completed,
+        "users_unfinished": len(unfinished),
+        "users_shed": stats.shed,
+        "turns": turns,
+        "errors": errors,
+        "first_error": stats.first_error,
+        "turns_per_s": round(steady_turns / elapsed, 2),
+        "latency_ms": percentiles(latencies) if latencies else None,
+        "agents": {
+            agent: {
+                "turns": len(stats.turns.get(agent, [])),
+                "errors": stats.errors.get(agent, 0),
+                "latency_ms": percentiles(stats.turns[agent]) if stats.turns.get(agent) else None,
+                "histogram_ms": histogram_ms(stats.turns.get(agent, [])),
+            }
+            for agent in mix
+        },
+        "nodes": {
+            "/".join(dict(key).get(label, "") for label in ("agent", "node")): {
+                "calls": int(entry["count"]),
+                "mean_ms": round(entry["sum"] / entry["count"] * 1000, 2),
+                "p50_ms": round(quantile(entry, 0.5) * 1000, 2),
+                "p95_ms": round(quantile(entry, 0.95) * 1000, 2),
+            }
+            for key, entry in sorted(nodes.items(), key=lambda item: -item[1]["sum"])
+        },
+        "rss_mb": {
+            "start": round(rss_start / 2**20, 1),
+            "end": round(rss_end / 2**20, 1),
+            "growth": round((rss_end - rss_start) / 2**20, 1),
+        } if rss_start is not None and rss_end is not None else None,
+        "timeline": samples,
+    }
+
+
+def print_rate(result: Dict[str, Any]) -> None:
+    latency = result["latency_ms"] or {}
+    print(f"\n{result['rate_users_per_s']:g} users/s: {result['users_started']} users, {result['turns']} turns, "
+          f"{result['errors']} errors, {result['users_shed']} shed, {result['users_unfinished']} unfinished; "
+          f"{result['turns_per_s']:.1f} turns/s, p50 {latency.get('p50', 0):.0f} ms p95 {latency.get('p95', 0):.0f} ms "
+          f"p99 {latency.get('p99', 0):.0f} ms")
+    if result["first_error"]:
+        print(f"  first error: {result['first_error']}")
+    if result["rss_mb"]:
+        print(f"  rss {result['rss_mb']['start']:.0f} -> {result['rss_mb']['end']:.0f} MB ({result['rss_mb']['growth']:+.1f} MB)")
+    for agent, entry in result["agents"].items():
+        latency = entry["latency_ms"] or {}
+        buckets = " ".join(f"<={bound}:{count}" for bound, count in entry["histogram_ms"].items() if count)
+        print(f"  {agent:<14} {entry['turns']:>6} turns {entry['errors']:>4} errors  p50 {latency.get('p50', 0):>7.0f} ms "
+              f"p95 {latency.get('p95', 0):>7.0f} ms  [{buckets}]")
+    for path, node in list(result["nodes"].items())[:15]:
+        print(f"  {path:<40} {node['calls']:>6} calls  mean {node['mean_ms']:>8.1f} ms  p50 {node['p50_ms']:>8.1f} ms  "
+              f"p95 {node['p95_ms']:>8.1f} ms")
+
+
+def served(result: Dict[str, Any], max_p95_ms: float) -> bool:
+    """Whether a rate was served: nothing shed or left over, few errors, latency under the limit."""
+    latency = result["latency_ms"]
+    return (
+        result["users_shed"] == 0
+        and result["users_unfinished"] == 0
+        and result["errors"] <= MAX_ERROR_RATE * max(result["turns"] + result["errors"], 1)
+        and latency is not None
+        and latency["p95"] <= max_p95_ms
+    )
+
+
+async def run_all(rates: List[float], mix: Dict[str, float], target: Any, args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    await target.start()
+    results: List[Dict[str, Any]] = []
+    try:
+        for rate in rates:
+            result = await run_rate(rate, mix, target, args, rng)
+            results.append(result)
+            print_rate(result)
+    finally:
+        await target.close()
+
+    first_p95 = (results[0]["latency_ms"] or {}).get("p95") if results else None
+    max_p95_ms = args.max_p95_ms or (3 * first_p95 if first_p95 else float("inf"))
+    saturation = None
+    for result in results:
+        result["served"] = served(result, max_p95_ms)
+    for result in results:
+        if not result["served"]:
+            break
+        saturation = result
+    return {"rates": results, "max_p95_ms": max_p95_ms, "saturation": saturation}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test of the agents with a mixed traffic profile")
+    parser.add_argument("--target", choices=["inproc", "http"], default="inproc",
+                        help="Run turns in this process with run_agent, or through a server's /invoke")
+    parser.add_argument("--url", help="With --target http, the server to load instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="Pre-fork workers of the server started for --target http")
+    parser.add_argument("--rate", default="10", help="New users per second; a comma-separated list steps through rates")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds users arrive at each rate")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Traffic mix, agent=weight,... (default: {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="Mean think time between a user's turns (0: none)")
+    parser.add_argument("--max-users", type=int, default=10000, help="Users in flight at once; arrivals past it are shed")
+    parser.add_argument("--drain-s", type=float, default=30.0, help="Seconds users in flight get to finish after a rate")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--first-token-ms", type=float, default=20.0, help="Fake model time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=500.0, help="Fake model output rate")
+    parser.add_argument("--tool-delay-scale", type=float, default=1.0,
+                        help="Scale of the tools' simulated API latency (0 removes it)")
+    parser.add_argument("--max-p95-ms", type=float, help="p95 turn latency a served rate stays under (default: 3x the first rate's)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of arrivals, agents and think times")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rates = [float(rate) for rate in args.rate.split(",")]
+    raise_fd_limit()
+
+    server = None
+    if args.target == "inproc":
+        install_fake_models(args.first_token_ms / 1000, 1 / args.tokens_per_s)
+        from main import AGENTS
+
+        for name in AGENTS:
+            AGENTS[name]
+        scale_tool_delays(args.tool_delay_scale)
+        target: Any = InProcess()
+    elif args.url:
+        target = Http(args.url.rstrip("/"), None, args.workers)
+    else:
+        port = free_port()
+        server = multiprocessing.Process(
+            target=serve,
+            args=(port, args.workers, args.first_token_ms / 1000, 1 / args.tokens_per_s, args.tool_delay_scale),
+            daemon=True,
+        )
+        server.start()
+        target = Http(f"http://127.0.0.1:{port}", server.pid, args.workers)
+        asyncio.run(wait_until_up(target.url, timeout=120))
+
+    try:
+        results = asyncio.run(run_all(rates, mix, target, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    saturation = results["saturation"]
+    print(f"\np95 limit {results['max_p95_ms']:.0f} ms, {target.cores} core(s) serving ({target.name})")
+    if saturation is None:
+        print("saturated at the first rate; try a lower --rate")
+    elif saturation is results["rates"][-1]:
+        print(f"every rate was served; the saturation point is above {saturation['rate_users_per_s']:g} users/s")
+    else:
+        print(f"saturation point: {saturation['rate_users_per_s']:g} users/s, {saturation['turns_per_s']:.1f} turns/s "
+              f"({saturation['rate_users_per_s'] / target.cores:g} users/s, "
+              f"{saturation['turns_per_s'] / target.cores:.1f} turns/s per core)")
+
+    if args.save:
+        document = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": {
+                "target": target.name,
+                "workers": args.workers,
+                "mix": mix,
+                "duration_s": args.duration,
+                "think_ms": args.think_ms,
+                "first_token_ms": args.first_token_ms,
+                "tokens_per_s": args.tokens_per_s,
+                "tool_delay_scale": args.tool_delay_scale,
+                "seed": args.seed,
+            },
+            "cores": target.cores,
+            **results,
+        }
+        with open(args.save, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"saved results to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
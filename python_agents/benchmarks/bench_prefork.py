@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Pre-fork server benchmark: start-up time and memory of N workers.
+
+Starts the server in pre-fork mode with ``--workers`` workers, then the same
+number of independent server processes that each import and compile every
+graph themselves, and compares:
+
+- the time until every worker answers ``/health``;
+- the time the pre-fork master takes to replace a killed worker;
+- per-process RSS, PSS (RSS with shared pages divided among the processes
+  sharing them) and private memory, from ``/proc/<pid>/smaps_rollup``.
+
+The sum of PSS is what the processes actually cost together. ``--fake`` serves
+a ``FakeAgent`` on top of the same heavy imports instead of ``main.AGENTS``,
+for machines without the LLM provider packages. Linux only.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Add the project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import aiohttp
+
+from prefork import RESPAWN_INTERVAL_S
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_agents(fake: bool) -> Dict[str, object]:
+    """Every graph, imported and compiled, and the provider SDKs."""
+    from agents.providers import preload_providers
+
+    if fake:
+        import numpy  # noqa: F401  (the data tools' heaviest import)
+
+        from benchmarks.fake_llm import FakeAgent
+
+        agents = {"fake": FakeAgent()}
+    else:
+        from main import AGENTS
+
+        agents = {name: AGENTS[name] for name in AGENTS}
+    preload_providers()
+    return agents
+
+
+def serve(role: str, port: int, workers: int, fake: bool) -> None:
+    """Server process of the benchmark: ``prefork`` master or one ``single`` server."""
+    if role == "prefork":
+        from prefork import serve_prefork
+
+        # serve_prefork preloads in the master itself
+        serve_prefork("127.0.0.1", port, workers, agents=load_agents(fake) if fake else None, drain_timeout=1)
+        return
+
+    from aiohttp import web
+
+    from server import create_app
+
+    app = create_app(load_agents(fake), prewarm_agents=False)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, shutdown_timeout=1)
+
+
+def spawn(role: str, port: int, workers: int, fake: bool) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), "--serve", role, "--port", str(port), "--workers", str(workers)]
+    if fake:
+        command.append("--fake")
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_healthy(urls: List[str], timeout: float = 120.0) -> None:
+    """Wait until every health check URL answers 200."""
+    deadline = time.monotonic() + timeout
+    pending = set(urls)
+    async with aiohttp.ClientSession() as session:
+        while pending:
+            for url in list(pending):
+                try:
+                    async with session.get(url) as resp:
+                        if resp.status == 200:
+                            pending.discard(url)
+                except aiohttp.ClientConnectionError:
+                    pass
+            if pending:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{len(pending)} servers did not start")
+                await asyncio.sleep(0.01)
+
+
+def wait_for_workers(url: str, workers: int) -> None:
+    """Wait until /health answers from every worker of a pre-fork server."""
+    asyncio.run(wait_healthy([f"{url}/health?worker={i}" for i in range(workers)]))
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def memory(pid: int) -> Dict[str, float]:
+    """RSS, PSS and private memory of ``pid``, in MiB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "private": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def report(label: str, pids: Dict[str, int]) -> float:
+    """Print each process's memory; returns the total PSS."""
+    print(f"  {'process':<18} {'RSS':>9} {'PSS':>9} {'private':>9}")
+    total = {"rss": 0.0, "pss": 0.0, "private": 0.0}
+    for name, pid in pids.items():
+        usage = memory(pid)
+        for key in total:
+            total[key] += usage[key]
+        print(f"  {name:<18} {usage['rss']:>8.1f}M {usage['pss']:>8.1f}M {usage['private']:>8.1f}M")
+    print(f"  {label + ' total':<18} {total['rss']:>8.1f}M {total['pss']:>8.1f}M {total['private']:>8.1f}M")
+    return total["pss"]
+
+
+def stop(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def bench_prefork(workers: int, fake: bool) -> Dict[str, float]:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    master = spawn("prefork", port, workers, fake)
+    try:
+        wait_for_workers(url, workers)
+        ready = time.perf_counter() - start
+
+        # The router is forked last
+        pids = children(master.pid)
+        worker_pids, router_pid = pids[:-1], pids[-1]
+        print(f"pre-fork, {workers} workers: all ready in {ready * 1000:.0f} ms")
+        total_pss = report("pre-fork", {
+            "master": master.pid,
+            "router": router_pid,
+            **{f"worker {i}": pid for i, pid in enumerate(worker_pids)},
+        })
+
+        # A replacement worker is a fork of the already-loaded master
+        time.sleep(RESPAWN_INTERVAL_S)
+        start = time.perf_counter()
+        os.kill(worker_pids[0], signal.SIGKILL)
+        while worker_pids[0] in children(master.pid) or len(children(master.pid)) <= workers:
+            time.sleep(0.001)
+        wait_for_workers(url, workers)
+        respawn = time.perf_counter() - start
+        print(f"  worker respawn: {respawn * 1000:.0f} ms")
+    finally:
+        stop([master])
+    return {"ready": ready, "pss": total_pss, "respawn": respawn}
+
+
+def bench_independent(workers: int, fake: bool) -> Dict[str, float]:
+    ports = [free_port() for _ in range(workers)]
+    start = time.perf_counter()
+    processes = [spawn("single", port, workers, fake) for port in ports]
+    try:
+        asyncio.run(wait_healthy([f"http://127.0.0.1:{port}/health" for port in ports]))
+        ready = time.perf_counter() - start
+        print(f"independent, {workers} processes: all ready in {ready * 1000:.0f} ms")
+        total_pss = report("independent", {f"server {i}": process.pid for i, process in enumerate(processes)})
+    finally:
+        stop(processes)
+    return {"ready": ready, "pss": total_pss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pre-fork workers with independent server processes")
+    parser.add_argument("--workers", type=int, default=4, help="Workers / independent processes")
+    parser.add_argument("--fake", action="store_true", help="Serve a FakeAgent instead of main.AGENTS")
+    parser.add_argument("--serve", choices=["prefork", "single"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.workers, args.fake)
+        return
+
+    prefork = bench_prefork(args.workers, args.fake)
+    print()
+    independent = bench_independent(args.workers, args.fake)
+    print()
+    print(f"start-up: {prefork['ready'] * 1000:.0f} ms pre-fork vs {independent['ready'] * 1000:.0f} ms independent "
+          f"({independent['ready'] / prefork['ready']:.1f}x)")
+    print(f"memory:   {prefork['pss']:.1f} MiB PSS pre-fork (incl. master and router) vs "
+          f"{independent['pss']:.1f} MiB independent ({independent['pss'] / prefork['pss']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
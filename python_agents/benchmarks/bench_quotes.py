@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark for multi-ticker quote lookups in the stockbroker agent.
+
+Replays a model response that asks for N tickers through
+``execute_tool_calls``: once as N separate ``get_stock_price`` calls executed
+one by one (the behaviour before tool-call merging), and once with the calls
+merged into a single ``get_stock_prices`` execution. The model call itself is
+not included; everything after it in ``call_tools`` is.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from agents.stockbroker.tools import execute_tool_calls
+from agents.types import UIMessageManager
+
+TICKERS = [
+    "AAPL", "MSFT", "GOOGL", "AMZN", "NVDA", "META", "TSLA", "BRK.B", "JPM", "V",
+    "UNH", "XOM", "JNJ", "WMT", "MA", "PG", "HD", "CVX", "LLY", "AVGO",
+]
+
+
+def run(count: int, merge: bool) -> tuple:
+    response = AIMessage(
+        content="",
+        tool_calls=[
+            {"name": "get_stock_price", "args": {"ticker": ticker}, "id": f"call_{i}"}
+            for i, ticker in enumerate(TICKERS[:count])
+        ],
+    )
+    ui = UIMessageManager()
+    t0 = time.perf_counter()
+    tool_messages = execute_tool_calls(response, ui, merge=merge)
+    json.dumps({"messages": tool_messages, "ui": ui.items}, default=str)
+    return time.perf_counter() - t0, len(ui.items), len(tool_messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark merged multi-ticker quote lookups")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    print(f"{'tickers':>8}{'separate (s)':>15}{'merged (s)':>13}{'ui pushes':>12}{'tool msgs':>12}")
+    for count in args.counts:
+        separate, _, _ = run(count, merge=False)
+        merged, pushes, messages = run(count, merge=True)
+        print(f"{count:>8}{separate:>15.3f}{merged:>13.3f}{pushes:>12}{messages:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the stockbroker Monte Carlo portfolio risk estimate.
+
+Target: under 1 s for a 200-position portfolio at 100k paths on a
+laptop-class CPU. Also reports peak traced memory for a 1M-path run to show
+that paths are never materialized at once.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.stockbroker.market_data import MarketDataStore
+from agents.stockbroker.risk import RiskCache, return_moments, simulate_risk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Monte Carlo portfolio risk")
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--large-paths", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    store = MarketDataStore()
+    positions = {f"T{i:04d}": 10_000.0 for i in range(args.positions)}
+
+    # Load histories up front so the timings below measure the risk model only
+    t0 = time.perf_counter()
+    return_moments(list(positions), store)
+    print(f"Load {args.positions} histories: {time.perf_counter() - t0:.3f} s")
+
+    timings = []
+    for _ in range(args.repeats):
+        t0 = time.perf_counter()
+        result = simulate_risk(positions, num_paths=args.paths, store=store, parallel=False)
+        timings.append(time.perf_counter() - t0)
+    best = min(timings)
+    status = "OK" if best < 1.0 else "OVER BUDGET"
+    print(f"{args.positions} positions x {args.paths} paths: best {best:.3f} s of {args.repeats} ({status})")
+    for horizon, values in result["horizons"].items():
+        print(f"  {horizon}: VaR {values['var']:>12,.2f}  ES {values['expected_shortfall']:>12,.2f}")
+
+    cache = RiskCache(store)
+    cache.get(positions, num_paths=args.paths)
+    t0 = time.perf_counter()
+    cache.get(positions, num_paths=args.paths)
+    print(f"Memoized lookup: {(time.perf_counter() - t0) * 1e3:.3f} ms")
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    simulate_risk(positions, num_paths=args.large_paths, store=store, parallel=False)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    full = args.large_paths * args.positions * 4 / 2**20
+    print(f"{args.large_paths} paths, single process: {elapsed:.3f} s, peak {peak / 2**20:.1f} MiB "
+          f"(materialized shocks would need {full:.0f} MiB)")
+
+    t0 = time.perf_counter()
+    simulate_risk(positions, num_paths=args.large_paths, store=store, parallel=True)
+    print(f"{args.large_paths} paths, process pool ({os.cpu_count()} workers): {time.perf_counter() - t0:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
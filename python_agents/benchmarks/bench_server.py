@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP server's streaming endpoint.
+
+Starts ``server.py`` in a separate process serving a ``FakeAgent`` backed by
+the local fake LLM, then opens many concurrent ``/stream`` connections from one
+or more client processes. Every message event carries the time the fake model
+emitted it, so the clients can measure end-to-end event latency. Reports
+connections held, events/sec and latency percentiles.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+import numpy as np
+
+
+def raise_fd_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port: int, token_delay: float, words: int, gzip: bool, queue_size: int) -> None:
+    from aiohttp import web
+
+    from benchmarks.fake_llm import FakeAgent, FakeChatModel
+    from server import create_app
+
+    raise_fd_limit()
+    reply = " ".join(f"word{i}" for i in range(words))
+    agent = FakeAgent(FakeChatModel(reply=reply, token_delay=token_delay))
+    app = create_app({"fake": agent}, gzip=gzip, queue_size=queue_size)
+    web.run_app(app, host="127.0.0.1", port=port, backlog=8192, print=None, shutdown_timeout=5)
+
+
+async def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/health") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("server did not start")
+            await asyncio.sleep(0.1)
+
+
+async def one_stream(session: aiohttp.ClientSession, url: str, gzip: bool, latencies: list) -> tuple:
+    """Consume one stream; returns (events, completed)."""
+    body = {"input": {"messages": [{"role": "human", "content": "How is my portfolio doing?"}]}}
+    headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+    events = 0
+    event = None
+    async with session.post(f"{url}/agents/fake/stream", json=body, headers=headers) as resp:
+        if resp.status != 200:
+            return 0, False
+        async for line in resp.content:
+            if line.startswith(b"event: "):
+                event = line[7:].strip().decode()
+            elif line.startswith(b"data: "):
+                events += 1
+                if event == "messages":
+                    emitted_at = json.loads(line[6:])["metadata"]["emitted_at"]
+                    latencies.append(time.time() - emitted_at)
+                elif event == "end":
+                    return events, True
+    return events, False
+
+
+async def client(url: str, connections: int, gzip: bool, ramp: float) -> dict:
+    latencies: list = []
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def start(i: int):
+            await asyncio.sleep(ramp * i / max(connections, 1))
+            try:
+                return await one_stream(session, url, gzip, latencies)
+            except (aiohttp.ClientError, OSError):
+                return 0, False
+
+        results = await asyncio.gather(*(start(i) for i in range(connections)))
+    return {
+        "events": sum(r[0] for r in results),
+        "completed": sum(1 for r in results if r[1]),
+        "failed": sum(1 for r in results if not r[1]),
+        "latencies": latencies,
+    }
+
+
+def run_client(args: tuple) -> dict:
+    raise_fd_limit()
+    return asyncio.run(client(*args))
+
+
+async def fetch_stats(url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/stats") as resp:
+            return await resp.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SSE streaming endpoint with a fake LLM")
+    parser.add_argument("--connections", type=int, default=2000, help="Concurrent streaming connections")
+    parser.add_argument("--clients", type=int, default=2, help="Client processes to spread connections over")
+    parser.add_argument("--words", type=int, default=50, help="Tokens streamed per reply")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Fake LLM delay per token (s)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which connections are opened")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--gzip", action="store_true", help="Request gzip-compressed streams")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = multiprocessing.Process(
+        target=serve, args=(port, args.token_delay, args.words, args.gzip, args.queue_size), daemon=True
+    )
+    server.start()
+    try:
+        asyncio.run(wait_until_up(url))
+
+        per_client = [args.connections // args.clients + (1 if i < args.connections % args.clients else 0)
+                      for i in range(args.clients)]
+        jobs = [(url, n, args.gzip, args.ramp) for n in per_client if n]
+        t0 = time.perf_counter()
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(run_client, jobs)
+        elapsed = time.perf_counter() - t0
+        stats = asyncio.run(fetch_stats(url))
+    finally:
+        server.terminate()
+        server.join()
+
+    events = sum(r["events"] for r in results)
+    latencies = np.array([x for r in results for x in r["latencies"]]) * 1000
+    print(f"connections:      {args.connections} requested, {stats['peak_streams']} peak concurrent on server")
+    print(f"completed/failed: {sum(r['completed'] for r in results)} / {sum(r['failed'] for r in results)}")
+    print(f"events:           {events} in {elapsed:.2f}s ({events / elapsed:,.0f} events/sec)")
+    print(f"bytes sent:       {stats['bytes_sent']:,}{' (gzip)' if args.gzip else ''}")
+    if len(latencies):
+        p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])
+        print(f"event latency:    p50 {p50:.1f} ms, p99 {p99:.1f} ms, p99.9 {p999:.1f} ms, max {latencies.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
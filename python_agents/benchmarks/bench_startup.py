@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark based on ``python -X importtime``.
+
+Imports ``main`` (or ``--module``) in fresh interpreters and reports the median
+import time against a cold-start budget, with the packages that cost the most.
+With the lazy ``AGENTS`` registry, importing ``main`` loads no graph; ``--load``
+additionally times the first lookup of an agent, and ``--eager`` the loading of
+every graph, which is what start-up cost before the registry was lazy. Exits
+with status 1 when the median import exceeds ``--budget-ms``.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# Add the project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+# Median time to import main, in milliseconds, that start-up must stay under
+COLD_START_BUDGET_MS = 250.0
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_times(code: str) -> Tuple[float, Dict[str, float], List[Tuple[str, float]]]:
+    """Run ``code`` under ``-X importtime`` in a fresh interpreter.
+
+    Returns the total import time (ms), self time per top-level package (ms)
+    and the cumulative time of each module imported directly by ``code``.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    packages: Dict[str, float] = defaultdict(float)
+    top_level: List[Tuple[str, float]] = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        # Modules imported by the code itself are not indented
+        if len(indent) == 1:
+            top_level.append((name, int(cumulative_us) / 1000))
+    return sum(ms for _, ms in top_level), dict(packages), top_level
+
+
+def measure(code: str, repeat: int) -> Tuple[float, Dict[str, float]]:
+    """Median total import time and per-package self times of the median run."""
+    runs = sorted((import_times(code) for _ in range(repeat)), key=lambda run: run[0])
+    total, packages, _ = runs[len(runs) // 2]
+    return statistics.median(run[0] for run in runs), packages
+
+
+def report(label: str, total: float, packages: Dict[str, float], top: int) -> None:
+    print(f"{label}: {total:.0f} ms")
+    for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<28} {ms:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure start-up import time with -X importtime")
+    parser.add_argument("--module", default="main", help="Module whose import is the cold start (default: main)")
+    parser.add_argument("--load", action="append", default=[], metavar="AGENT",
+                        help="Also time importing the module and looking up this agent in main.AGENTS")
+    parser.add_argument("--eager", action="store_true", help="Also time loading every agent graph")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=10, help="Packages to list by self time")
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS,
+                        help=f"Cold-start budget for the median import (default: {COLD_START_BUDGET_MS:.0f})")
+    args = parser.parse_args()
+
+    total, packages = measure(f"import {args.module}", args.repeat)
+    report(f"import {args.module}", total, packages, args.top)
+
+    for agent in args.load:
+        loaded, packages = measure(f"import main; main.AGENTS[{agent!r}]", args.repeat)
+        print()
+        report(f"import main + first use of {agent!r}", loaded, packages, args.top)
+
+    if args.eager:
+        loaded, packages = measure("import main; [main.AGENTS[name] for name in main.AGENTS]", args.repeat)
+        print()
+        report("import main + every graph (eager start-up)", loaded, packages, args.top)
+
+    within = total <= args.budget_ms
+    print(f"\ncold start {total:.0f} ms, budget {args.budget_ms:.0f} ms: {'ok' if within else 'OVER BUDGET'}")
+    sys.exit(0 if within else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Local fake LLM for benchmarks and load tests.
+
+``FakeChatModel`` is a LangChain chat model that streams a canned reply token
+by token with a fixed delay, so server and graph overhead can be measured
+without network calls or API keys. ``FakeAgent`` stands in for a compiled graph
+with a single node that calls the model, and yields the same ``ainvoke`` /
+``astream`` output shapes LangGraph does. ``FakeProvider`` enforces request,
+token and concurrency limits the way a hosted provider does and rejects calls
+over them with a 429 ``RateLimitError``. ``FaultInjector`` adds latency spikes,
+random errors and outages that fail calls with a 503 ``ProviderError``.
+``ScriptedChatModel`` follows a per-message script and supports ``bind_tools``
+and ``with_structured_output``, so whole agent graphs can run on it.
+"""
+
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+DEFAULT_REPLY = (
+    "Here is a summary of your portfolio. Your largest holding is AAPL, followed "
+    "by GOOGL and MSFT. Over the last month the portfolio gained 2.4 percent, "
+    "ahead of the index, with most of the gain coming from technology names."
+)
+
+
+class RateLimitError(Exception):
+    """429 from ``FakeProvider``."""
+
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderError(Exception):
+    """503 from a ``FaultInjector``."""
+
+    status_code = 503
+
+
+class FaultInjector:
+    """Faults of an unreliable provider, on a timeline starting at construction.
+
+    ``outages`` are ``(start, end)`` seconds during which every call fails;
+    ``spike_rate`` of the other calls take ``spike_seconds`` longer and
+    ``error_rate`` of them fail.
+    """
+
+    def __init__(
+        self,
+        spike_rate: float = 0.0,
+        spike_seconds: float = 1.0,
+        error_rate: float = 0.0,
+        outages: Optional[List[tuple]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.spike_rate = spike_rate
+        self.spike_seconds = spike_seconds
+        self.error_rate = error_rate
+        self.outages = outages or []
+        self.started = time.monotonic()
+        self._rng = random.Random(seed)
+
+    def before_call(self) -> float:
+        """Extra latency for the next call; raises ``ProviderError`` if it fails."""
+        elapsed = time.monotonic() - self.started
+        if any(start <= elapsed < end for start, end in self.outages):
+            raise ProviderError("Service unavailable")
+        if self._rng.random() < self.error_rate:
+            raise ProviderError("Internal server error")
+        return self.spike_seconds if self._rng.random() < self.spike_rate else 0.0
+
+
+class FakeProvider:
+    """Rate limits of a hosted provider: token buckets on requests and tokens per
+    ``window`` seconds, plus a cap on concurrent requests.
+    """
+
+    def __init__(
+        self,
+        requests_per_window: Optional[float] = None,
+        tokens_per_window: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        window: float = 60.0,
+    ):
+        self.limits = {"requests": requests_per_window, "tokens": tokens_per_window}
+        self.levels = {name: limit for name, limit in self.limits.items() if limit}
+        self.window = window
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def admit(self, tokens: int) -> None:
+        """Start a request using ``tokens``, or raise ``RateLimitError``."""
+        with self._lock:
+            now = time.monotonic()
+            for name in self.levels:
+                limit = self.limits[name]
+                self.levels[name] = min(limit, self.levels[name] + (now - self._updated) * limit / self.window)
+            self._updated = now
+
+            needed = {"requests": 1, "tokens": tokens}
+            # Small tolerance for clock skew between caller and provider
+            short = [name for name in self.levels if self.levels[name] < min(needed[name], self.limits[name]) - 1e-6]
+            if short or (self.max_concurrency is not None and self.in_flight >= self.max_concurrency):
+                self.rejected += 1
+                raise RateLimitError(f"Rate limit exceeded: {', '.join(short) or 'concurrency'}", retry_after=self.window / 10)
+            for name in self.levels:
+                self.levels[name] -= needed[name]
+            self.in_flight += 1
+            self.accepted += 1
+
+    def done(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that replies with ``reply``, streaming one word every ``token_delay`` seconds.
+
+    With a ``provider`` set, each call is first admitted by that ``FakeProvider``;
+    with ``faults`` set, each call may be slowed or failed by that ``FaultInjector``.
+    """
+
+    reply: str = DEFAULT_REPLY
+    token_delay: float = 0.02
+    # Delay before the first token, on top of ``token_delay``
+    first_token_delay: float = 0.0
+    provider: Optional[Any] = None
+    faults: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _tokens(self) -> List[str]:
+        words = self.reply.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _usage(self, messages: List[BaseMessage]) -> Dict[str, int]:
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(self._tokens())
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        message = AIMessage(content=self.reply, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        usage = self._usage(messages)
+        extra_delay = self.faults.before_call() if self.faults is not None else 0.0
+        if self.provider is not None:
+            self.provider.admit(usage["total_tokens"])
+        try:
+            await asyncio.sleep(extra_delay + self.first_token_delay + self.token_delay * len(self._tokens()))
+        finally:
+            if self.provider is not None:
+                self.provider.done()
+        message = AIMessage(content=self.reply, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_delay)
+        tokens = self._tokens()
+        for i, token in enumerate(tokens):
+            time.sleep(self.token_delay)
+            usage = self._usage(messages) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        extra_delay = self.faults.before_call() if self.faults is not None else 0.0
+        if self.provider is not None:
+            self.provider.admit(self._usage(messages)["total_tokens"])
+        try:
+            await asyncio.sleep(extra_delay + self.first_token_delay)
+            tokens = self._tokens()
+            for i, token in enumerate(tokens):
+                await asyncio.sleep(self.token_delay)
+                usage = self._usage(messages) if i == len(tokens) - 1 else None
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+        finally:
+            if self.provider is not None:
+                self.provider.done()
+
+
+# Tool call ids, numbered in call order so a script's runs are identical
+_tool_call_ids = itertools.count()
+
+
+def _sample_value(name: str, schema: Dict[str, Any], defs: Dict[str, Any]) -> Any:
+    """Plausible value for a JSON schema property, the same on every call."""
+    if "$ref" in schema:
+        return _sample_value(name, defs.get(schema["$ref"].rsplit("/", 1)[-1], {}), defs)
+    if schema.get("default") is not None:
+        return schema["default"]
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        return _sample_value(name, options[0] if options else {}, defs)
+    kind = schema.get("type", "string")
+    if kind == "boolean":
+        return True
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        # Confidences and scores above any escalation threshold
+        return 0.9
+    if kind == "array":
+        return [_sample_value(name, schema.get("items", {}), defs)]
+    if kind == "object":
+        return {key: _sample_value(key, value, defs) for key, value in schema.get("properties", {}).items()}
+    if "email" in name or name == "to":
+        return "user@example.com"
+    if "date" in name:
+        return "2025-06-01"
+    return f"sample {name.replace('_', ' ')}"
+
+
+class ScriptedChatModel(FakeChatModel):
+    """``FakeChatModel`` that answers according to a script, with tools and structured output.
+
+    ``script`` maps the text of a user message to what the model does while
+    that message is the latest one: ``{"reply": "...", "tools": {"tool_name":
+    {...args} or [{...args}, ...]}}``. When tools are bound (``bind_tools``,
+    or ``with_structured_output``, which binds the schema as a forced tool),
+    the reply is a call of the scripted tool with the scripted arguments; tools
+    and arguments the script does not name are filled in from their schema.
+    Without tools, the reply is the scripted text or ``reply``. Latency follows
+    ``first_token_delay`` and ``token_delay`` per word, streamed or not.
+    """
+
+    script: Dict[str, Dict[str, Any]] = {}
+
+    def bind_tools(self, tools: Any, *, tool_choice: Any = None, **kwargs: Any) -> Any:
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_choice=tool_choice, **kwargs)
+
+    def _turn(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        for message in reversed(messages):
+            content = message.content if isinstance(message.content, str) else None
+            if message.type == "human" and content in self.script:
+                return self.script[content]
+        return {}
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]], tool_choice: Any) -> AIMessage:
+        turn = self._turn(messages)
+        usage = self._usage(messages)
+        if not tools:
+            return AIMessage(content=turn.get("reply", self.reply), usage_metadata=usage)
+
+        functions = {tool["function"]["name"]: tool["function"] for tool in tools}
+        scripted = {name: args for name, args in (turn.get("tools") or {}).items() if name in functions}
+        if isinstance(tool_choice, dict):
+            tool_choice = tool_choice.get("function", {}).get("name")
+        if tool_choice in functions:
+            scripted = {tool_choice: scripted.get(tool_choice, {})}
+        elif not scripted:
+            scripted = {next(iter(functions)): {}}
+
+        tool_calls = []
+        for name, calls in scripted.items():
+            parameters = functions[name].get("parameters", {})
+            for args in calls if isinstance(calls, list) else [calls]:
+                sampled = {
+                    key: _sample_value(key, schema, parameters.get("$defs", {}))
+                    for key, schema in parameters.get("properties", {}).items()
+                    if key in parameters.get("required", []) or key in args
+                }
+                tool_calls.append({"name": name, "args": {**sampled, **args}, "id": f"call_{next(_tool_call_ids)}"})
+        return AIMessage(content="", tool_calls=tool_calls, usage_metadata=usage)
+
+    def _reply_tokens(self, message: AIMessage) -> int:
+        return len(message.content.split(" ")) if message.content else 1
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice"))
+        time.sleep(self.first_token_delay + self.token_delay * self._reply_tokens(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice"))
+        await asyncio.sleep(self.first_token_delay + self.token_delay * self._reply_tokens(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice"))
+        await asyncio.sleep(self.first_token_delay)
+        if message.tool_calls:
+            await asyncio.sleep(self.token_delay)
+            chunks = [
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ]
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", tool_call_chunks=chunks, usage_metadata=message.usage_metadata,
+            ))
+            return
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.token_delay)
+            usage = message.usage_metadata if i == len(words) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word, usage_metadata=usage))
+
+
+class FakeAgent:
+    """Graph stand-in with one node that streams a ``FakeChatModel`` reply.
+
+    Message chunks carry ``emitted_at`` (``time.time()``) in their metadata so
+    clients can measure end-to-end event latency.
+    """
+
+    def __init__(self, model: Optional[FakeChatModel] = None, node: str = "agent"):
+        self.model = model or FakeChatModel()
+        self.node = node
+
+    def _ui(self, message: BaseMessage) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid4()),
+            "name": "fake",
+            "props": {"length": len(message.content)},
+            "metadata": {"message_id": message.id},
+        }
+
+    async def ainvoke(self, input: Dict[str, Any], config: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        messages = list(input.get("messages", []))
+        response = await self.model.ainvoke(messages, config)
+        return {"messages": messages + [response], "ui": [self._ui(response)]}
+
+    async def astream(
+        self,
+        input: Dict[str, Any],
+        config: Optional[Dict[str, Any]] = None,
+        stream_mode: Any = "updates",
+        subgraphs: bool = False,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def item(mode: str, chunk: Any) -> Any:
+            # Same tuple shapes as CompiledStateGraph.astream
+            if isinstance(stream_mode, str):
+                return ((), chunk) if subgraphs else chunk
+            return ((), mode, chunk) if subgraphs else (mode, chunk)
+
+        message = None
+        async for chunk in self.model.astream(list(input.get("messages", [])), config):
+            message = chunk if message is None else message + chunk
+            if "messages" in modes:
+                yield item("messages", (chunk, {"langgraph_node": self.node, "emitted_at": time.time()}))
+
+        if "updates" in modes:
+            yield item("updates", {self.node: {"messages": [message], "ui": [self._ui(message)]}})
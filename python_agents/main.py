@@ -4,42 +4,71 @@ Main entry point for the Python LangGraph agents.
 
 import os
 import asyncio
+from typing import Optional
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, START, END
 
 # Load environment variables
 load_dotenv()
 
-# Import all agents
-from agents.chat_agent import agent as chat_agent
-from agents.supervisor import supervisor_graph
-from agents.email_agent import email_agent
-from agents.stockbroker import stockbroker_graph
-from agents.trip_planner import trip_planner_graph
-from agents.open_code import open_code_graph
-from agents.pizza_orderer import pizza_orderer_graph
-from agents.writer_agent import writer_agent_graph
+from agents.budget import Budget, budget_config
+from agents.cancellation import RunHandle
+from agents.memory import thread_config
+from agents.registry import AgentRegistry
+from agents.scheduler import DEFAULT_TENANT
+from agents.speculation import Speculations, speculation_config
+from agents.tenants import run_scheduler, tenant_config
 
-# Agent registry
-AGENTS = {
-    "agent": supervisor_graph,  # Main supervisor agent
-    "chat": chat_agent,
-    "email_agent": email_agent,
-    "stockbroker": stockbroker_graph,
-    "trip_planner": trip_planner_graph,
-    "open_code": open_code_graph,
-    "pizza_orderer": pizza_orderer_graph,
-    "writer_agent": writer_agent_graph
-}
+# Agent registry; each graph is imported and compiled on first use
+AGENTS = AgentRegistry({
+    "agent": "agents.supervisor:supervisor_graph",  # Main supervisor agent
+    "chat": "agents.chat_agent:agent",
+    "email_agent": "agents.email_agent:email_agent",
+    "stockbroker": "agents.stockbroker:stockbroker_graph",
+    "trip_planner": "agents.trip_planner:trip_planner_graph",
+    "open_code": "agents.open_code:open_code_graph",
+    "pizza_orderer": "agents.pizza_orderer:pizza_orderer_graph",
+    "writer_agent": "agents.writer_agent:writer_agent_graph"
+})
 
 
-async def run_agent(agent_name: str, input_data: dict) -> dict:
-    """Run a specific agent with input data."""
+def run_config(
+    budget: Budget, speculations: Speculations, tenant: str = DEFAULT_TENANT, thread_id: Optional[str] = None,
+) -> dict:
+    """Config of one run: its budget, tenant and speculative steps, and the conversation it belongs to."""
+    return thread_config(speculation_config(tenant_config(budget_config(budget), tenant), speculations), thread_id)
+
+
+async def run_agent(
+    agent_name: str, input_data: dict, deadline_ms: Optional[float] = None, tenant: str = DEFAULT_TENANT,
+) -> dict:
+    """Run a specific agent with input data.
+    
+    With ``deadline_ms`` set, the run is bounded by a ``Budget`` that every node
+    reads from ``config["configurable"]["budget"]``, and its spend report is
+    returned under ``result["budget"]``.
+    
+    The run waits for ``run_scheduler`` to admit it for ``tenant``, and its
+    model calls are scheduled fairly against other tenants' calls.
+    """
     if agent_name not in AGENTS:
         raise ValueError(f"Unknown agent: {agent_name}")
     
-    agent = AGENTS[agent_name]
-    result = await agent.ainvoke(input_data)
+    agent = await AGENTS.aget(agent_name)
+    budget = Budget(deadline_ms)
+    speculations = Speculations()
+    config = run_config(budget, speculations, tenant)
+    
+    async def call() -> dict:
+        async with run_scheduler.admit(tenant, budget):
+            return await agent.ainvoke(input_data, config=config)
+    
+    try:
+        # Cancelling the caller tears down the whole run, including tool threads
+        result = await RunHandle().run(call())
+    finally:
+        speculations.close()
+    if deadline_ms is not None:
+        result["budget"] = budget.report()
     return result
 
 
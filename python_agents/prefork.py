@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Pre-forking multi-process mode of the HTTP server (``server.py --workers N``).
+
+The master process imports every graph in ``AGENTS``, compiles it and imports
+the provider SDKs, then freezes the garbage collector so that these objects
+are never touched by a collection again. Only then does it fork: N workers,
+each serving ``create_app`` on its own Unix socket, and one router serving the
+public port. The forked processes share the master's pages copy-on-write, so
+a worker starts in milliseconds instead of repeating the imports, and the
+shared pages stay shared because nothing writes to them.
+
+The router pins every conversation to one worker by consistent hashing on its
+``thread_id`` (``config.configurable.thread_id`` in the body, or an
+``X-Thread-Id`` header), so a conversation's in-process state (caches,
+speculation, breakers) stays on one worker. A request without a thread id
+goes to any worker; ``?worker=<i>`` targets one, e.g. for ``/stats``. When a
+worker cannot be reached, its conversations move to the next worker on the
+ring until it is back; the master forks a replacement for any worker that
+exits. ``GET /workers`` on the router reports each worker's health.
+
+Every worker has its own scheduler, breakers and caches: ``--max-runs`` and
+the tenant limits apply per worker.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import bisect
+import gc
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+
+logger = logging.getLogger("python_agents.prefork")
+
+# Points per worker on the hash ring; more spread conversations more evenly
+RING_REPLICAS = 64
+# Seconds a worker that refused a connection is skipped
+WORKER_RETRY_S = 1.0
+# Minimum seconds between forks of the same worker slot
+RESPAWN_INTERVAL_S = 1.0
+
+# Headers that apply to one connection and are not forwarded
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring: a key maps to the first node clockwise from its hash.
+
+    Removing a node only moves the keys that were on it, to the nodes that
+    follow it on the ring.
+    """
+
+    def __init__(self, nodes: Iterable[Any], replicas: int = RING_REPLICAS):
+        self._ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [point for point, _ in self._ring]
+
+    def lookup(self, key: str, exclude: Iterable[Any] = ()) -> Optional[Any]:
+        """Node for ``key``, skipping ``exclude``; None if every node is excluded."""
+        exclude = set(exclude)
+        start = bisect.bisect(self._hashes, _hash(key))
+        seen: Set[Any] = set()
+        for offset in range(len(self._ring)):
+            node = self._ring[(start + offset) % len(self._ring)][1]
+            if node not in exclude:
+                return node
+            seen.add(node)
+            if len(seen) == len(exclude):
+                break
+        return None
+
+
+def thread_key(request: web.Request, body: bytes) -> Optional[str]:
+    """Conversation a request belongs to: ``X-Thread-Id`` or ``config.configurable.thread_id``."""
+    key = request.headers.get("X-Thread-Id")
+    if key:
+        return key
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    configurable = (data.get("config") or {}).get("configurable") if isinstance(data.get("config"), dict) else None
+    thread_id = (configurable or {}).get("thread_id") if isinstance(configurable, dict) else None
+    return str(thread_id) if thread_id is not None else None
+
+
+class WorkerRouter:
+    """Forwards requests to worker sockets, pinned by thread id."""
+
+    def __init__(self, paths: List[str]):
+        self.paths = paths
+        self.ring = HashRing(range(len(paths)))
+        self.requests = [0] * len(paths)
+        self.down_until = [0.0] * len(paths)
+        self.sessions: List[aiohttp.ClientSession] = []
+        self._unpinned = itertools.count()
+
+    async def start(self, app: web.Application) -> None:
+        self.sessions = [
+            aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=path, limit=0),
+                timeout=aiohttp.ClientTimeout(total=None),
+                # Pass compressed streams through untouched
+                auto_decompress=False,
+            )
+            for path in self.paths
+        ]
+
+    async def stop(self, app: web.Application) -> None:
+        for session in self.sessions:
+            await session.close()
+
+    def pick(self, key: str, tried: Set[int]) -> Optional[int]:
+        now = time.monotonic()
+        down = {i for i, until in enumerate(self.down_until) if until > now}
+        return self.ring.lookup(key, down | tried)
+
+    async def proxy(self, request: web.Request) -> web.StreamResponse:
+        body = await request.read()
+        if "worker" in request.query:
+            key, forced = None, int(request.query["worker"]) % len(self.paths)
+        else:
+            key, forced = thread_key(request, body) or f"unpinned-{next(self._unpinned)}", None
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP}
+
+        tried: Set[int] = set()
+        while True:
+            index = forced if forced is not None else self.pick(key, tried)
+            if index is None:
+                return web.json_response({"error": "No worker available"}, status=503)
+            try:
+                upstream = await self.sessions[index].request(
+                    request.method, f"http://worker{request.rel_url}", headers=headers, data=body,
+                )
+                break
+            except aiohttp.ClientConnectorError:
+                # Down or restarting: move its conversations along the ring for a moment
+                self.down_until[index] = time.monotonic() + WORKER_RETRY_S
+                if forced is not None:
+                    return web.json_response({"error": f"Worker {index} unavailable"}, status=503)
+                tried.add(index)
+
+        self.requests[index] += 1
+        async with upstream:
+            response_headers = {
+                name: value for name, value in upstream.headers.items() if name.lower() not in HOP_BY_HOP
+            }
+            if upstream.content_type != "text/event-stream":
+                return web.Response(status=upstream.status, headers=response_headers, body=await upstream.read())
+            response = web.StreamResponse(status=upstream.status, headers=response_headers)
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_any():
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+
+    async def workers(self, request: web.Request) -> web.Response:
+        """Health, request count and socket of every worker."""
+        now = time.monotonic()
+        result = []
+        for index, (path, session) in enumerate(zip(self.paths, self.sessions)):
+            try:
+                async with session.get("http://worker/health", timeout=aiohttp.ClientTimeout(total=1)) as resp:
+                    status = (await resp.json()).get("status", "unknown")
+            except (aiohttp.ClientError, OSError, ValueError, TimeoutError):
+                status = "unreachable"
+            result.append({
+                "worker": index,
+                "status": status,
+                "requests": self.requests[index],
+                "skipped": self.down_until[index] > now,
+                "socket": path,
+            })
+        return web.json_response({"workers": result})
+
+
+def create_router_app(paths: List[str]) -> web.Application:
+    router = WorkerRouter(paths)
+    app = web.Application(client_max_size=16 * 1024 ** 2)
+    app.on_startup.append(router.start)
+    app.on_cleanup.append(router.stop)
+    app.add_routes([
+        web.get("/workers", router.workers),
+        web.route("*", "/{tail:.*}", router.proxy),
+    ])
+    return app
+
+
+def preload(agents: Any) -> Dict[str, float]:
+    """Import and compile every graph of ``agents`` and the provider SDKs; seconds per graph."""
+    from agents.providers import preload_providers
+
+    times = {}
+    for name in agents:
+        start = time.perf_counter()
+        agents[name]
+        times[name] = time.perf_counter() - start
+    preload_providers()
+    return times
+
+
+def _run_child(target, *args: Any) -> None:
+    """Body of a forked child; never returns."""
+    code = 0
+    try:
+        # The master's handlers must not run here; aiohttp installs its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        target(*args)
+    except BaseException:
+        logger.exception("worker process failed")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _serve_worker(
+    path: str, app_factory: Callable[..., web.Application], agents: Any, app_options: Dict[str, Any], drain_timeout: float,
+) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+    app = app_factory(agents, prewarm_agents=False, drain_timeout=drain_timeout, **app_options)
+    web.run_app(app, path=path, print=None, shutdown_timeout=drain_timeout + 5, handler_cancellation=True)
+
+
+def _serve_router(host: str, port: int, paths: List[str], drain_timeout: float) -> None:
+    web.run_app(
+        create_router_app(paths), host=host, port=port, backlog=4096, print=None,
+        shutdown_timeout=drain_timeout + 5, handler_cancellation=True,
+    )
+
+
+def serve_prefork(
+    host: str,
+    port: int,
+    workers: int,
+    agents: Any = None,
+    app_factory: Optional[Callable[..., web.Application]] = None,
+    drain_timeout: float = 30.0,
+    **app_options: Any,
+) -> None:
+    """Preload, fork ``workers`` workers and a router, and supervise them until SIGTERM/SIGINT.
+
+    Each worker serves ``app_factory(agents, **app_options)``; the factory
+    defaults to ``server.create_app``.
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("pre-fork mode needs os.fork")
+    if app_factory is None:
+        from server import create_app as app_factory
+    if agents is None:
+        from main import AGENTS
+        agents = AGENTS
+
+    start = time.perf_counter()
+    times = preload(agents)
+    logger.info("preloaded %d graphs in %.2fs", len(times), time.perf_counter() - start)
+    # Everything alive now is shared with the workers; keep collections off those pages
+    gc.collect()
+    gc.freeze()
+
+    socket_dir = tempfile.mkdtemp(prefix="python-agents-")
+    paths = [os.path.join(socket_dir, f"worker-{i}.sock") for i in range(workers)]
+    # child pid -> (role, worker index)
+    children: Dict[int, Tuple[str, int]] = {}
+    last_fork: Dict[Tuple[str, int], float] = {}
+
+    def fork(role: str, index: int) -> None:
+        wait = last_fork.get((role, index), 0.0) + RESPAWN_INTERVAL_S - time.monotonic()
+        if wait > 0:
+            # A child that dies at start-up must not be re-forked in a tight loop
+            time.sleep(wait)
+        last_fork[(role, index)] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            if role == "router":
+                _run_child(_serve_router, host, port, paths, drain_timeout)
+            _run_child(_serve_worker, paths[index], app_factory, agents, app_options, drain_timeout)
+        children[pid] = (role, index)
+
+    stopping = False
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        fork("worker", index)
+    fork("router", 0)
+    logger.info("serving on http://%s:%d with %d workers (sockets in %s)", host, port, workers, socket_dir)
+
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            role, index = children.pop(pid, (None, None))
+            if role is None or stopping:
+                continue
+            logger.warning("%s %d (pid %d) exited with status %d; forking a new one", role, index, pid, status)
+            fork(role, index)
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
@@ -7,6 +7,8 @@ import asyncio
 import argparse
 import sys
 import os
+import threading
+from contextlib import ExitStack
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -28,7 +30,7 @@ def check_environment():
     
     return True
 
-async def run_agent(agent_name: str, message: str):
+async def run_agent(agent_name: str, message: str, deadline_ms: float = None):
     """Run a specific agent with a message."""
     try:
         from main import run_agent
@@ -42,7 +44,7 @@ async def run_agent(agent_name: str, message: str):
         print(f"Running {agent_name} agent with message: '{message}'")
         print("-" * 50)
         
-        result = await run_agent(agent_name, input_data)
+        result = await run_agent(agent_name, input_data, deadline_ms=deadline_ms)
         
         print("Response:")
         if "messages" in result and result["messages"]:
@@ -55,21 +57,82 @@ async def run_agent(agent_name: str, message: str):
         if "ui" in result and result["ui"]:
             print(f"UI Components: {len(result['ui'])} generated")
         
+        if "budget" in result:
+            budget = result["budget"]
+            print(f"Budget: {budget['elapsed_s']}s elapsed, ${budget['cost_usd']} spent")
+            for component, spent in budget["components"].items():
+                print(f"  {component}: {spent['seconds']:.3f}s, ${spent['cost_usd']:.6f}")
+            for component, action in budget["degradations"].items():
+                print(f"  degraded {component}: {action}")
+        
         return True
         
     except Exception as e:
         print(f"❌ Error running agent: {e}")
         return False
 
-async def interactive_mode():
-    """Run in interactive mode."""
+async def read_line(prompt: str) -> str:
+    """``input(prompt)`` without blocking the event loop.
+    
+    The read runs in a daemon thread rather than the default executor: the
+    executor is joined when ``asyncio.run`` returns, and a thread still blocked
+    in ``input`` after Ctrl+C would keep the process waiting for Enter.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def deliver(line, error):
+        if not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(line)
+    
+    def read():
+        try:
+            line, error = input(prompt), None
+        except BaseException as e:
+            line, error = None, e
+        try:
+            loop.call_soon_threadsafe(deliver, line, error)
+        except RuntimeError:
+            # The loop closed while the read was waiting
+            pass
+    
+    threading.Thread(target=read, name="stdin", daemon=True).start()
+    return await future
+
+async def interactive_mode(deadline_ms: float = None):
+    """Run in interactive mode.
+    
+    Each agent keeps its conversation across turns; replies stream as they
+    are generated and every turn ends with its timing by node.
+    """
+    from main import AGENTS
+    from session import ChatSession
+    
     print("Python LangGraph Agents - Interactive Mode")
     print("Type 'help' for available commands, 'quit' to exit")
     print("-" * 50)
     
+    # Load the graphs while the first message is typed
+    AGENTS.prewarm()
+    agent_map = {
+        'agent': 'agent',
+        'chat': 'chat',
+        'stock': 'stockbroker',
+        'trip': 'trip_planner',
+        'code': 'open_code',
+        'pizza': 'pizza_orderer',
+        'write': 'writer_agent',
+        'email': 'email_agent'
+    }
+    sessions = {}
+    current = 'agent'
+    
     while True:
         try:
-            user_input = input("\n> ").strip()
+            user_input = (await read_line(f"\n{current}> ")).strip()
             
             if user_input.lower() in ['quit', 'exit', 'q']:
                 print("Goodbye!")
@@ -85,6 +148,8 @@ async def interactive_mode():
                 print("  pizza <message>     - Run pizza orderer agent")
                 print("  write <message>     - Run writer agent")
                 print("  email <message>     - Run email agent")
+                print("  <message>           - Continue the conversation with the last agent")
+                print("  new                 - Start a new conversation with the last agent")
                 print("  help                - Show this help")
                 print("  quit                - Exit")
                 continue
@@ -92,33 +157,60 @@ async def interactive_mode():
             if not user_input:
                 continue
             
-            # Parse command
+            if user_input.lower() == 'new':
+                sessions.pop(current, None)
+                print(f"New conversation with {current}")
+                continue
+            
+            # Parse command; anything else continues the current conversation
             parts = user_input.split(' ', 1)
             command = parts[0].lower()
-            message = parts[1] if len(parts) > 1 else "Hello"
-            
-            agent_map = {
-                'agent': 'agent',
-                'chat': 'chat',
-                'stock': 'stockbroker',
-                'trip': 'trip_planner',
-                'code': 'open_code',
-                'pizza': 'pizza_orderer',
-                'write': 'writer_agent',
-                'email': 'email_agent'
-            }
-            
             if command in agent_map:
-                await run_agent(agent_map[command], message)
+                current = agent_map[command]
+                message = parts[1] if len(parts) > 1 else "Hello"
             else:
-                print(f"Unknown command: {command}. Type 'help' for available commands.")
-                
-        except KeyboardInterrupt:
+                message = user_input
+            
+            if current not in sessions:
+                sessions[current] = ChatSession(current, deadline_ms=deadline_ms)
+            report = await sessions[current].send(message)
+            print(report.format())
+        
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # Ctrl+C reaches the running task as a cancellation
             print("\nGoodbye!")
             break
+        except EOFError:
+            break
         except Exception as e:
             print(f"Error: {e}")
 
+def dispatch(args):
+    """Run the mode selected on the command line."""
+    if args.test:
+        # Run tests
+        from test_agents import main as test_main
+        asyncio.run(test_main())
+    elif args.batch:
+        # Batch mode
+        from batch import run_batch
+        output = args.output or os.path.splitext(args.batch)[0] + ".out.jsonl"
+        summary = asyncio.run(run_batch(
+            args.batch,
+            output,
+            concurrency=args.concurrency,
+            ordered=not args.keyed,
+            agent=args.agent,
+            deadline_ms=args.deadline_ms,
+        ))
+        print(f"Wrote {summary['completed']} results to {output} ({summary['failed']} failed)")
+    elif args.interactive:
+        # Interactive mode
+        asyncio.run(interactive_mode(args.deadline_ms))
+    else:
+        # Single run
+        asyncio.run(run_agent(args.agent, args.message, args.deadline_ms))
+
 def main():
     """Main function."""
     parser = argparse.ArgumentParser(description="Run Python LangGraph agents")
@@ -130,23 +222,75 @@ def main():
                        help="Run in interactive mode")
     parser.add_argument("--test", "-t", action="store_true",
                        help="Run tests")
+    parser.add_argument("--deadline-ms", type=float, default=None,
+                       help="Deadline for the run in milliseconds; nodes degrade as it nears")
+    parser.add_argument("--batch", metavar="INPUT",
+                       help="Run every conversation of a JSONL file (see batch.py); resumes after a crash")
+    parser.add_argument("--output", "-o",
+                       help="JSONL file for --batch results (default: INPUT with .out.jsonl)")
+    parser.add_argument("--concurrency", "-c", type=int, default=8,
+                       help="Conversations run at once with --batch (default: 8)")
+    parser.add_argument("--keyed", action="store_true",
+                       help="With --batch, write results as they finish, keyed by id, instead of in input order")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE",
+                         help="Record every model call into a cassette file (see agents/cassettes.py)")
+    cassette.add_argument("--replay", metavar="CASSETTE",
+                         help="Answer model calls from a cassette file instead of the providers; no API keys needed")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                       help="Scale of the recorded response timing with --replay (0 replays without waiting)")
+    parser.add_argument("--trace-log", metavar="PATH",
+                       help="Append traces of runs to PATH as OTLP/JSON lines, one per trace")
+    parser.add_argument("--trace-sample-rate", type=float, default=1.0,
+                       help="Fraction of runs written to --trace-log (default: 1.0)")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="PREFIX",
+                       help="Report event loop stalls and each run's critical path to PREFIX.json "
+                            "and PREFIX.folded (flamegraph stacks; default PREFIX: profile)")
+    parser.add_argument("--tracemalloc", type=int, nargs="?", const=20, metavar="N",
+                       help="Print the N source lines that allocated the most memory left over after the run (default N: 20)")
+    parser.add_argument("--stall-ms", type=float, default=50.0,
+                       help="With --profile, report the event loop blocked for this long or more (default: 50)")
     
     args = parser.parse_args()
     
-    # Check environment
-    if not check_environment():
+    # Check environment; a replay makes no provider calls
+    if not args.replay and not check_environment():
         sys.exit(1)
     
-    if args.test:
-        # Run tests
-        from test_agents import main as test_main
-        asyncio.run(test_main())
-    elif args.interactive:
-        # Interactive mode
-        asyncio.run(interactive_mode())
-    else:
-        # Single run
-        asyncio.run(run_agent(args.agent, args.message))
+    if args.trace_log:
+        from agents.telemetry import telemetry
+        telemetry.configure(args.trace_log, args.trace_sample_rate)
+    
+    recorder = None
+    if args.record or args.replay:
+        from agents import cassettes
+        if args.record:
+            recorder = cassettes.record(args.record)
+        else:
+            cassettes.replay(args.replay, args.time_scale)
+    profiler = None
+    if args.profile:
+        from agents.profiler import Profiler
+        profiler = Profiler(args.stall_ms)
+    allocations = None
+    try:
+        with ExitStack() as stack:
+            if profiler is not None:
+                stack.enter_context(profiler.attach())
+            if args.tracemalloc:
+                from agents.memory import trace_allocations
+                allocations = stack.enter_context(trace_allocations(args.tracemalloc))
+            dispatch(args)
+    finally:
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorded {len(recorder)} model calls in {args.record}")
+        if allocations is not None:
+            print(allocations.format())
+        if profiler is not None:
+            json_path, folded_path = profiler.save(args.profile)
+            print(profiler.summary())
+            print(f"Profile written to {json_path} and {folded_path}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,686 @@
+#!/usr/bin/env python3
+"""
+HTTP server for the Python LangGraph agents.
+
+Serves every graph in ``AGENTS`` over HTTP:
+
+    GET  /health                  liveness check
+    GET  /agents                  names of the served agents
+    GET  /stats                   connection and event counters
+    GET  /stats/speculation       hit rate and waste of speculative sub-agent steps
+    GET  /metrics                 node, model call, tool, cache and UI metrics (Prometheus text format)
+    GET  /memory/threads          state size of the heaviest conversation threads (``?top=N``)
+    POST /agents/{name}/invoke    run to completion and return the final state
+    POST /agents/{name}/stream    stream messages, UI events and node updates (SSE)
+
+Request bodies are JSON: ``{"input": {...}, "config": {...}, "deadline_ms": 5000}``.
+A ``"tenant"`` field, or an ``X-Tenant-Id`` header, names the tenant the run is
+scheduled and accounted for, if it is one of the ``--tenants``; any other name
+runs as the default tenant. Runs wait for ``run_scheduler`` admission before
+they start. The conversation a run belongs to is ``config.configurable.thread_id``
+or an ``X-Thread-Id`` header; the size of the state it returns is accounted to
+that thread (``agents.memory``). On a server started with ``--trace-memory``,
+``"trace_memory": true`` on ``/invoke`` adds a tracemalloc diff of the run to
+the response under ``memory``; tracemalloc slows the whole process down, so
+other servers reject it.
+
+Each stream runs the graph in its own task and hands encoded events to a
+bounded per-connection queue that a writer task flushes to the socket. A client
+that stops reading fills its queue; once it has been full for longer than the
+send timeout the run is cancelled instead of buffering without limit. On
+shutdown the server stops accepting work and lets in-flight runs finish for up
+to the drain timeout before cancelling them.
+
+Graphs are imported on first use; at start-up a background thread pre-warms
+the rest so the first request for each does not pay for it (``--no-prewarm``
+to skip). ``--workers N`` instead loads every graph up front and forks N
+worker processes that share it; see ``prefork``.
+
+Every run gets a ``RunHandle``. When a client disconnects, or the drain timeout
+passes, the handle cancels the whole run: nested subgraph nodes, model streams
+and tool threads.
+"""
+
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, Mapping, Optional, Set
+import argparse
+import asyncio
+import json
+import logging
+import time
+import zlib
+
+from aiohttp import web
+
+from agents.budget import Budget, budget_config
+from agents.bulkheads import bulkheads
+from agents.cancellation import RunHandle, cancellation_metrics
+from agents.cascade import cascade_stats
+from agents.hedging import hedge_metrics
+from agents.memory import thread_config, thread_memory, trace_allocations
+from agents.providers import model_balancer
+from agents.registry import AgentRegistry
+from agents.speculation import Speculations, speculation_config, speculation_metrics
+from agents.scheduler import DEFAULT_TENANT, model_scheduler
+from agents.tenants import TenantLimits, run_scheduler, tenant_config
+
+
+logger = logging.getLogger("python_agents.server")
+
+STREAM_MODES = ["messages", "updates", "custom"]
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_SEND_TIMEOUT = 30.0
+DEFAULT_DRAIN_TIMEOUT = 30.0
+HEARTBEAT_INTERVAL = 15.0
+
+# Cancellation reasons
+CLIENT_DISCONNECTED = "client disconnected"
+SHUTTING_DOWN = "server shutting down"
+
+AGENTS_KEY = web.AppKey("agents", Mapping)
+SETTINGS_KEY = web.AppKey("settings", dict)
+STATE_KEY = web.AppKey("state", "ServerState")
+
+
+class ServerState:
+    """Connections in flight and counters reported by ``/stats``."""
+
+    def __init__(self):
+        self.draining = False
+        self.runs: Set[RunHandle] = set()
+        self.streams: Set["EventStream"] = set()
+        self.streams_started = 0
+        self.streams_completed = 0
+        self.streams_failed = 0
+        self.slow_clients = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self.peak_streams = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_runs": len(self.runs),
+            "active_streams": len(self.streams),
+            "peak_streams": self.peak_streams,
+            "streams_started": self.streams_started,
+            "streams_completed": self.streams_completed,
+            "streams_failed": self.streams_failed,
+            "slow_clients": self.slow_clients,
+            "events_sent": self.events_sent,
+            "bytes_sent": self.bytes_sent,
+            "draining": self.draining,
+            "cancellation": cancellation_metrics.snapshot(),
+            "models": model_scheduler.snapshot(),
+            "hedging": hedge_metrics.snapshot(),
+            "providers": model_balancer.snapshot(),
+            "cascades": cascade_stats.snapshot(),
+            "speculation": speculation_metrics.snapshot(),
+            "tenants": run_scheduler.snapshot(),
+            "agents": bulkheads.snapshot(),
+        }
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "type") and hasattr(value, "content"):
+        return message_to_dict(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+def message_to_dict(message: Any) -> Any:
+    """Compact JSON form of a LangChain message; dict messages pass through."""
+    if isinstance(message, dict):
+        return message
+    data = {"type": message.type, "id": getattr(message, "id", None), "content": message.content}
+    for key in ("tool_calls", "tool_call_chunks", "tool_call_id", "usage_metadata"):
+        value = getattr(message, key, None)
+        if value:
+            data[key] = value
+    return data
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """Encode one Server-Sent Event. ``data`` is serialized as single-line JSON."""
+    head = f"event: {event}\n" if event_id is None else f"event: {event}\nid: {event_id}\n"
+    return f"{head}data: {dumps(data)}\n\n".encode()
+
+
+def stream_events(namespace: Iterable[str], mode: str, chunk: Any) -> Iterable[tuple]:
+    """Translate one LangGraph stream item into (event, data) pairs."""
+    namespace = list(namespace)
+    if mode == "messages":
+        message, metadata = chunk
+        yield "messages", {
+            "namespace": namespace,
+            "message": message_to_dict(message),
+            "metadata": {
+                key: value for key, value in (metadata or {}).items()
+                if isinstance(value, (str, int, float, bool)) or value is None
+            },
+        }
+    elif mode == "updates":
+        for node, update in (chunk or {}).items():
+            update = dict(update or {})
+            # UI items get their own events so clients need not diff node state
+            for item in update.pop("ui", None) or []:
+                yield "ui", {"namespace": namespace, "node": node, "ui": item}
+            if "messages" in update:
+                update["messages"] = [message_to_dict(m) for m in update["messages"] or []]
+            yield "updates", {"namespace": namespace, "node": node, "update": update}
+    else:
+        yield mode, {"namespace": namespace, "data": chunk}
+
+
+# Comment line that keeps idle connections open through proxies
+PING = b": ping\n\n"
+
+
+class SlowClient(Exception):
+    """The client stopped reading and its send queue stayed full."""
+
+
+class EventStream:
+    """Bounded queue of encoded events between a graph run and one connection."""
+
+    def __init__(
+        self,
+        response: web.StreamResponse,
+        state: ServerState,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        send_timeout: float = DEFAULT_SEND_TIMEOUT,
+        gzip: bool = False,
+    ):
+        self.response = response
+        self.state = state
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.send_timeout = send_timeout
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        self.next_id = 0
+        self.last_write = time.monotonic()
+
+    async def send(self, event: str, data: Any) -> None:
+        """Queue an event, waiting while the queue is full."""
+        self.next_id += 1
+        payload = format_event(event, data, self.next_id)
+        if not self.queue.full():
+            self.queue.put_nowait(payload)
+            return
+        try:
+            await asyncio.wait_for(self.queue.put(payload), self.send_timeout)
+        except asyncio.TimeoutError:
+            raise SlowClient(f"send queue full for {self.send_timeout}s") from None
+
+    def ping(self) -> None:
+        """Queue a heartbeat if nothing has been written for a while."""
+        if self.queue.empty() and time.monotonic() - self.last_write >= HEARTBEAT_INTERVAL:
+            self.queue.put_nowait(PING)
+
+    async def finish(self, payload: Optional[bytes] = None) -> None:
+        """Queue a final payload, if any, and the end-of-stream marker.
+
+        If the client is not reading, queued events are discarded to make room
+        so the connection can still be closed.
+        """
+        for item in ([payload] if payload is not None else []) + [None]:
+            try:
+                await asyncio.wait_for(self.queue.put(item), self.send_timeout)
+            except asyncio.TimeoutError:
+                while self.queue.full():
+                    self.queue.get_nowait()
+                self.queue.put_nowait(item)
+
+    async def write_loop(self) -> None:
+        """Flush queued events to the socket until the end-of-stream marker."""
+        while True:
+            item = await self.queue.get()
+
+            # Write everything already queued in one call
+            batch = []
+            done = item is None
+            if not done:
+                batch.append(item)
+            while not done and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+            if batch:
+                await self._write(b"".join(batch), events=sum(1 for b in batch if b is not PING))
+            if done:
+                if self.compressor is not None:
+                    await self.response.write(self.compressor.flush(zlib.Z_FINISH))
+                return
+
+    async def _write(self, data: bytes, events: int) -> None:
+        if self.compressor is not None:
+            # Sync flush so every batch reaches the client immediately
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        await self.response.write(data)
+        self.last_write = time.monotonic()
+        self.state.events_sent += events
+        self.state.bytes_sent += len(data)
+
+
+async def _read_request(request: web.Request) -> Dict[str, Any]:
+    agents = request.app[AGENTS_KEY]
+    name = request.match_info["name"]
+    if name not in agents:
+        raise web.HTTPNotFound(text=dumps({"error": f"Unknown agent: {name}"}), content_type="application/json")
+    if request.app[STATE_KEY].draining:
+        raise web.HTTPServiceUnavailable(text=dumps({"error": "Server is shutting down"}), content_type="application/json")
+    try:
+        body = await request.json() if request.can_read_body else {}
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text=dumps({"error": "Body must be JSON"}), content_type="application/json")
+    if not isinstance(body, dict) or not isinstance(body.get("input", {}), dict):
+        raise web.HTTPBadRequest(text=dumps({"error": "Expected {\"input\": {...}}"}), content_type="application/json")
+
+    config = body.get("config")
+    if config is not None and (not isinstance(config, dict) or not isinstance(config.get("configurable") or {}, dict)):
+        raise web.HTTPBadRequest(text=dumps({"error": "config and config.configurable must be objects"}), content_type="application/json")
+    for key in ("deadline_ms", "max_cost_usd"):
+        value = body.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= 0):
+            raise web.HTTPBadRequest(text=dumps({"error": f"{key} must be a non-negative number"}), content_type="application/json")
+    trace_memory = bool(body.get("trace_memory"))
+    if trace_memory and not request.app[SETTINGS_KEY]["trace_memory"]:
+        raise web.HTTPBadRequest(text=dumps({"error": "trace_memory needs a server started with --trace-memory"}), content_type="application/json")
+    budget = Budget(body.get("deadline_ms"), body.get("max_cost_usd"))
+    speculations = Speculations()
+    tenant = run_scheduler.known_tenant(str(body.get("tenant") or request.headers.get("X-Tenant-Id") or DEFAULT_TENANT))
+    configurable = (config or {}).get("configurable") or {}
+    # Same precedence as the pre-fork router's pinning
+    thread_id = request.headers.get("X-Thread-Id") or configurable.get("thread_id")
+    config = tenant_config(budget_config(budget, config), tenant)
+    config = thread_config(config, str(thread_id) if thread_id is not None else None)
+    return {
+        # Importing a graph blocks; a registry does it off the event loop
+        "agent": await agents.aget(name) if isinstance(agents, AgentRegistry) else agents[name],
+        "input": body.get("input", {}),
+        "config": speculation_config(config, speculations),
+        "budget": budget,
+        "tenant": tenant,
+        "speculations": speculations,
+        "report_budget": body.get("deadline_ms") is not None or body.get("max_cost_usd") is not None,
+        "trace_memory": trace_memory,
+    }
+
+
+async def health(request: web.Request) -> web.Response:
+    state = request.app[STATE_KEY]
+    return web.json_response({"status": "draining" if state.draining else "ok"}, status=503 if state.draining else 200)
+
+
+async def list_agents(request: web.Request) -> web.Response:
+    return web.json_response({"agents": list(request.app[AGENTS_KEY])})
+
+
+async def stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app[STATE_KEY].stats())
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Metrics of this process's runs; see ``agents.telemetry``."""
+    from agents.telemetry import render_metrics
+
+    return web.Response(body=render_metrics().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def memory_threads(request: web.Request) -> web.Response:
+    """Size of this process's conversation threads: totals by channel and agent, and the heaviest ones."""
+    try:
+        top = int(request.query.get("top", 10))
+    except ValueError:
+        raise web.HTTPBadRequest(text=dumps({"error": "top must be an integer"}), content_type="application/json")
+    return web.json_response(thread_memory.summary(top), dumps=dumps)
+
+
+async def speculation_dashboard(request: web.Request) -> web.Response:
+    """Plain-text table of speculative execution per route: hit rate and waste."""
+    header = f"{'route':<14}{'started':>9}{'hit rate':>10}{'used':>7}{'discarded':>11}{'saved s':>10}{'wasted s':>10}"
+    lines = [header, "-" * len(header)]
+    for route, entry in sorted(speculation_metrics.snapshot().items()):
+        lines.append(
+            f"{route:<14}{entry['started']:>9}{entry['hit_rate']:>10.1%}{entry['used']:>7}"
+            f"{entry['discarded']:>11}{entry['seconds_saved']:>10.2f}{entry['seconds_wasted']:>10.2f}"
+        )
+    return web.Response(text="\n".join(lines) + "\n")
+
+
+async def invoke(request: web.Request) -> web.Response:
+    """Run an agent to completion and return its final state."""
+    run = await _read_request(request)
+    state = request.app[STATE_KEY]
+
+    async def call() -> Any:
+        async with run_scheduler.admit(run["tenant"], run["budget"]):
+            return await run["agent"].ainvoke(run["input"], config=run["config"])
+
+    handle = RunHandle()
+    state.runs.add(handle)
+    allocations = None
+    try:
+        with trace_allocations() if run["trace_memory"] else nullcontext() as allocations:
+            result = await handle.run(call(), CLIENT_DISCONNECTED)
+    except asyncio.CancelledError:
+        if handle.cancel_reason == CLIENT_DISCONNECTED:
+            raise
+        raise web.HTTPServiceUnavailable(text=dumps({"error": "Server is shutting down"}), content_type="application/json")
+    except Exception as e:
+        logger.exception("invoke failed")
+        return web.json_response({"error": str(e)}, status=500, dumps=dumps)
+    finally:
+        state.runs.discard(handle)
+        run["speculations"].close()
+
+    result = dict(result)
+    if "messages" in result:
+        result["messages"] = [message_to_dict(m) for m in result["messages"] or []]
+    if run["report_budget"]:
+        result["budget"] = run["budget"].report()
+    if allocations is not None:
+        result["memory"] = allocations.to_dict()
+    return web.json_response(result, dumps=dumps)
+
+
+async def stream(request: web.Request) -> web.StreamResponse:
+    """Run an agent and stream its output as Server-Sent Events.
+
+    Events are ``messages`` (LLM tokens), ``ui`` (generative UI items),
+    ``updates`` (node state updates), ``custom``, ``error`` and a final ``end``.
+    """
+    run = await _read_request(request)
+    settings = request.app[SETTINGS_KEY]
+    state = request.app[STATE_KEY]
+    gzip = settings["gzip"] and "gzip" in request.headers.get("Accept-Encoding", "")
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    if gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    await response.prepare(request)
+
+    events = EventStream(response, state, settings["queue_size"], settings["send_timeout"], gzip)
+
+    async def produce() -> None:
+        async with run_scheduler.admit(run["tenant"], run["budget"]):
+            async for item in run["agent"].astream(
+                run["input"], config=run["config"], stream_mode=STREAM_MODES, subgraphs=True
+            ):
+                namespace, mode, chunk = item
+                for event, data in stream_events(namespace, mode, chunk):
+                    await events.send(event, data)
+
+    handle = RunHandle()
+    producer = handle.start(produce())
+    writer = asyncio.ensure_future(events.write_loop())
+    state.runs.add(handle)
+    state.streams.add(events)
+    state.streams_started += 1
+    state.peak_streams = max(state.peak_streams, len(state.streams))
+
+    final = None
+    try:
+        # Stop early if the writer fails, e.g. because the client disconnected
+        await asyncio.wait([producer, writer], return_when=asyncio.FIRST_COMPLETED)
+        if not producer.done():
+            await handle.cancel(CLIENT_DISCONNECTED)
+            await asyncio.gather(producer, writer, return_exceptions=True)
+            state.streams_failed += 1
+            return response
+        try:
+            producer.result()
+            end = {"budget": run["budget"].report()} if run["report_budget"] else {}
+            final = format_event("end", end)
+            state.streams_completed += 1
+        except asyncio.CancelledError:
+            final = format_event("error", {"error": f"Run cancelled: {handle.cancel_reason}"})
+            state.streams_failed += 1
+        except SlowClient as e:
+            state.slow_clients += 1
+            state.streams_failed += 1
+            logger.warning("dropping slow client: %s", e)
+            await handle.cancel(CLIENT_DISCONNECTED)
+            _abort(request, writer)
+            await asyncio.gather(writer, return_exceptions=True)
+            return response
+        except Exception as e:
+            logger.exception("stream failed")
+            final = format_event("error", {"error": str(e)})
+            state.streams_failed += 1
+
+        await events.finish(final)
+        _, pending = await asyncio.wait([writer], timeout=settings["send_timeout"])
+        if pending:
+            _abort(request, writer)
+        await asyncio.gather(writer, return_exceptions=True)
+        return response
+    finally:
+        if not producer.done():
+            # The handler itself was cancelled because the client went away
+            await handle.cancel(CLIENT_DISCONNECTED)
+            state.streams_failed += 1
+        state.runs.discard(handle)
+        state.streams.discard(events)
+        run["speculations"].close()
+        if not writer.done():
+            writer.cancel()
+
+
+def _abort(request: web.Request, writer: asyncio.Task) -> None:
+    """Drop a connection whose client is not reading."""
+    writer.cancel()
+    if request.transport is not None:
+        request.transport.abort()
+
+
+async def heartbeat(app: web.Application):
+    """Cleanup context that pings idle streams every ``HEARTBEAT_INTERVAL``.
+
+    One task for all connections, rather than a timer per stream.
+    """
+    async def loop() -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL / 2)
+            for events in list(app[STATE_KEY].streams):
+                events.ping()
+
+    task = asyncio.ensure_future(loop())
+    yield
+    task.cancel()
+
+
+async def loop_lag(app: web.Application):
+    """Cleanup context measuring the event loop's lag into ``/metrics``."""
+    from agents.telemetry import watch_loop_lag
+
+    task = asyncio.ensure_future(watch_loop_lag())
+    yield
+    task.cancel()
+
+
+async def prewarm(app: web.Application) -> None:
+    """Start importing every lazily registered graph in the background."""
+    agents = app[AGENTS_KEY]
+    if app[SETTINGS_KEY]["prewarm"] and isinstance(agents, AgentRegistry):
+        agents.prewarm()
+
+
+async def drain(app: web.Application) -> None:
+    """Stop accepting runs, wait for in-flight ones, then cancel what is left."""
+    state = app[STATE_KEY]
+    state.draining = True
+    handles = [handle for handle in state.runs if handle.task is not None]
+    if not handles:
+        return
+    timeout = app[SETTINGS_KEY]["drain_timeout"]
+    logger.info("draining %d runs (timeout %.0fs)", len(handles), timeout)
+    await asyncio.wait([handle.task for handle in handles], timeout=timeout)
+    pending = [handle for handle in handles if not handle.task.done()]
+    if pending:
+        logger.warning("cancelling %d runs still running after drain timeout", len(pending))
+        await asyncio.gather(*(handle.cancel(SHUTTING_DOWN) for handle in pending))
+
+
+def create_app(
+    agents: Optional[Dict[str, Any]] = None,
+    gzip: bool = False,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    send_timeout: float = DEFAULT_SEND_TIMEOUT,
+    drain_timeout: float = DEFAULT_DRAIN_TIMEOUT,
+    prewarm_agents: bool = True,
+    trace_memory: bool = False,
+) -> web.Application:
+    """Build the application serving ``agents`` (default: ``main.AGENTS``)."""
+    if agents is None:
+        from main import AGENTS
+        agents = AGENTS
+
+    app = web.Application()
+    # A lazy registry is kept as is; copying it would import every graph
+    app[AGENTS_KEY] = agents if isinstance(agents, AgentRegistry) else dict(agents)
+    app[SETTINGS_KEY] = {
+        "gzip": gzip,
+        "queue_size": queue_size,
+        "send_timeout": send_timeout,
+        "drain_timeout": drain_timeout,
+        "prewarm": prewarm_agents,
+        "trace_memory": trace_memory,
+    }
+    app[STATE_KEY] = ServerState()
+    app.cleanup_ctx.append(heartbeat)
+    app.cleanup_ctx.append(loop_lag)
+    app.on_startup.append(prewarm)
+    app.on_shutdown.append(drain)
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/agents", list_agents),
+        web.get("/stats", stats),
+        web.get("/stats/speculation", speculation_dashboard),
+        web.get("/metrics", metrics),
+        web.get("/memory/threads", memory_threads),
+        web.post("/agents/{name}/invoke", invoke),
+        web.post("/agents/{name}/stream", stream),
+    ])
+    return app
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Serve Python LangGraph agents over HTTP")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to bind (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--gzip", action="store_true",
+                       help="Gzip event streams for clients that accept it")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                       help="Events buffered per connection before the run waits for the client")
+    parser.add_argument("--send-timeout", type=float, default=DEFAULT_SEND_TIMEOUT,
+                       help="Seconds a connection's queue may stay full before the run is cancelled")
+    parser.add_argument("--drain-timeout", type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                       help="Seconds to let in-flight runs finish on shutdown")
+    parser.add_argument("--no-prewarm", action="store_true",
+                       help="Import each graph on its first request instead of in the background at start-up")
+    parser.add_argument("--max-runs", type=int, default=None,
+                       help="Runs executing at once across all tenants; more wait in per-tenant queues")
+    parser.add_argument("--tenants",
+                       help="JSON file of per-tenant limits: {\"tenant\": {\"weight\": 1, "
+                            "\"max_concurrent_runs\": 4, \"tokens_per_min\": 100000}}; "
+                            "requests naming any other tenant run as the default one")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Worker processes forked from a preloaded master, with conversations "
+                            "pinned to workers by thread_id (default: 1, no forking)")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE",
+                          help="Record every model call into a cassette file (see agents/cassettes.py)")
+    cassette.add_argument("--replay", metavar="CASSETTE",
+                          help="Answer model calls from a cassette file instead of the providers")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                       help="Scale of the recorded response timing with --replay (0 replays without waiting)")
+    parser.add_argument("--trace-log", metavar="PATH",
+                       help="Append traces of runs to PATH as OTLP/JSON lines, one per trace")
+    parser.add_argument("--trace-sample-rate", type=float, default=1.0,
+                       help="Fraction of runs written to --trace-log (default: 1.0)")
+    parser.add_argument("--trace-slow-ms", type=float, default=None,
+                       help="Also write every run slower than this, whatever the sample rate")
+    parser.add_argument("--thread-state-cap-mb", type=float, default=None,
+                       help="Log a warning, and count it in /metrics, when a run returns a thread state larger than this")
+    parser.add_argument("--trace-memory", action="store_true",
+                       help="Let /invoke requests ask for a tracemalloc diff of their run with \"trace_memory\": true")
+    args = parser.parse_args()
+    if args.record and args.workers > 1:
+        parser.error("--record writes one cassette from one process; use --workers 1")
+
+    logging.basicConfig(level=logging.INFO)
+    run_scheduler.max_concurrent_runs = args.max_runs
+    if args.tenants:
+        with open(args.tenants) as f:
+            for tenant, limits in json.load(f).items():
+                run_scheduler.configure(tenant, TenantLimits(**limits))
+    if args.thread_state_cap_mb is not None:
+        thread_memory.configure(cap_bytes=int(args.thread_state_cap_mb * 2**20))
+    if args.trace_log:
+        from agents.telemetry import telemetry
+        # Opened before forking; every worker appends to it
+        telemetry.configure(args.trace_log, args.trace_sample_rate, args.trace_slow_ms)
+    recorder = None
+    if args.record or args.replay:
+        from agents import cassettes
+        if args.record:
+            recorder = cassettes.record(args.record)
+        else:
+            # Mapped before forking, so workers share its pages
+            cassettes.replay(args.replay, args.time_scale)
+    if args.workers > 1:
+        from prefork import serve_prefork
+
+        serve_prefork(
+            args.host,
+            args.port,
+            args.workers,
+            app_factory=create_app,
+            drain_timeout=args.drain_timeout,
+            gzip=args.gzip,
+            queue_size=args.queue_size,
+            send_timeout=args.send_timeout,
+            trace_memory=args.trace_memory,
+        )
+        return
+    app = create_app(
+        gzip=args.gzip,
+        queue_size=args.queue_size,
+        send_timeout=args.send_timeout,
+        drain_timeout=args.drain_timeout,
+        prewarm_agents=not args.no_prewarm,
+        trace_memory=args.trace_memory,
+    )
+    try:
+        web.run_app(
+            app,
+            host=args.host,
+            port=args.port,
+            backlog=4096,
+            shutdown_timeout=args.drain_timeout + 5,
+            # Cancel handlers whose client disconnects, which cancels their run
+            handler_cancellation=True,
+        )
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Interactive conversation session for ``run.py --interactive``.
+
+A ``ChatSession`` keeps one conversation with one agent: the graph state
+returned by a turn is the input of the next, so follow-up messages see the
+whole history, and every turn of the session runs under the same
+``thread_id``. Turns run through ``astream_events``, so model tokens and UI
+items are written as they arrive rather than after the graph finishes, and
+each turn ends with its timing: wall time, time to the first token, and for
+every node (``subgraph/node`` inside subgraphs) its calls, total time and the
+part of it spent waiting on models, followed by the size of the conversation's
+state by channel.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import time
+import uuid
+
+from agents.budget import Budget
+from agents.memory import thread_memory
+from agents.scheduler import DEFAULT_TENANT
+from agents.speculation import Speculations
+from agents.tenants import run_scheduler
+
+
+# Seconds a turn's report waits for the size of its state
+STATE_MEASURE_TIMEOUT_S = 1.0
+
+
+class NodeTiming:
+    """Time one node took during a turn."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+
+
+class TurnReport:
+    """What one turn did and how long each part took."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.first_token_s: Optional[float] = None
+        self.nodes: Dict[str, NodeTiming] = {}
+        self.ui: List[Any] = []
+        self.budget: Optional[Dict[str, Any]] = None
+        # Size of the conversation's state after the turn, by channel
+        self.state_bytes: Optional[Dict[str, int]] = None
+
+    def node(self, name: str) -> NodeTiming:
+        timing = self.nodes.get(name)
+        if timing is None:
+            timing = self.nodes[name] = NodeTiming()
+        return timing
+
+    def format(self) -> str:
+        first = f"{self.first_token_s:.2f}s" if self.first_token_s is not None else "-"
+        lines = [f"turn: {self.seconds:.2f}s, first token {first}"]
+        if self.nodes:
+            width = max(len(name) for name in self.nodes)
+            lines.append(f"  {'node':<{width}}  calls     total     model")
+            for name, timing in sorted(self.nodes.items(), key=lambda item: -item[1].seconds):
+                model = f"{timing.model_seconds:.2f}s ({timing.model_calls})" if timing.model_calls else "-"
+                lines.append(f"  {name:<{width}}  {timing.calls:>5}  {timing.seconds:>7.2f}s  {model:>8}")
+        if self.budget:
+            lines.append(f"  budget: {self.budget['elapsed_s']}s elapsed, ${self.budget['cost_usd']} spent")
+        if self.state_bytes:
+            channels = ", ".join(f"{channel} {size / 1024:.1f} KiB"
+                                 for channel, size in sorted(self.state_bytes.items(), key=lambda item: -item[1])[:4])
+            lines.append(f"  state: {sum(self.state_bytes.values()) / 1024:.1f} KiB ({channels})")
+        return "\n".join(lines)
+
+
+def node_path(metadata: Dict[str, Any]) -> Optional[str]:
+    """``subgraph/node`` name of the node an event belongs to, from its checkpoint namespace."""
+    node = metadata.get("langgraph_node")
+    if node is None:
+        return None
+    namespace = metadata.get("langgraph_checkpoint_ns") or ""
+    parts = [part.split(":")[0] for part in namespace.split("|") if part]
+    return "/".join(parts) if parts and parts[-1] == node else node
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    # Content blocks, e.g. Anthropic's
+    return "".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+
+def _ui_name(item: Any) -> str:
+    return item.get("name", "ui") if isinstance(item, dict) else getattr(item, "name", "ui")
+
+
+def _ui_id(item: Any) -> Any:
+    return item.get("id") if isinstance(item, dict) else getattr(item, "id", None)
+
+
+class ChatSession:
+    """One conversation with ``agent``, kept across turns."""
+
+    def __init__(
+        self,
+        agent: str = "agent",
+        deadline_ms: Optional[float] = None,
+        tenant: str = DEFAULT_TENANT,
+        write: Optional[Callable[[str], None]] = None,
+        agents: Any = None,
+    ):
+        if agents is None:
+            from main import AGENTS
+            agents = AGENTS
+        if agent not in agents:
+            raise ValueError(f"Unknown agent: {agent}")
+        self.agent = agent
+        self.deadline_ms = deadline_ms
+        self.tenant = tenant
+        self.write = write or (lambda text: print(text, end="", flush=True))
+        self.agents = agents
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new conversation."""
+        self.thread_id = str(uuid.uuid4())
+        self.state: Dict[str, Any] = {}
+        self.turns = 0
+
+    async def send(self, message: str, values: Optional[Dict[str, Any]] = None) -> TurnReport:
+        """Run one turn, writing its output as it streams; returns its timing.
+
+        ``values`` are set in the graph state for this turn, e.g. the human
+        response an interrupted graph waits for.
+        """
+        from main import run_config
+
+        graph = await self.agents.aget(self.agent) if hasattr(self.agents, "aget") else self.agents[self.agent]
+        state = {**self.state, **(values or {})}
+        state["messages"] = list(state.get("messages") or []) + [{"role": "human", "content": message}]
+        budget = Budget(self.deadline_ms)
+        speculations = Speculations()
+        config = run_config(budget, speculations, self.tenant, thread_id=self.thread_id)
+
+        report = TurnReport()
+        started: Dict[str, float] = {}
+        seen_ui = set()
+        speaking: Optional[str] = None
+        final: Optional[Dict[str, Any]] = None
+        start = time.monotonic()
+        try:
+            async with run_scheduler.admit(self.tenant, budget):
+                async for event in graph.astream_events(state, config=config, version="v2"):
+                    kind, run_id = event["event"], event["run_id"]
+                    metadata = event.get("metadata") or {}
+                    path = node_path(metadata)
+                    # A node's own run, rather than a runnable called inside it
+                    is_node = path is not None and event.get("name") == metadata.get("langgraph_node")
+
+                    if kind in ("on_chain_start", "on_chat_model_start") and (is_node or kind == "on_chat_model_start"):
+                        started[run_id] = time.monotonic()
+                    elif kind == "on_chat_model_stream":
+                        text = _text(event["data"]["chunk"].content)
+                        if not text:
+                            continue
+                        if report.first_token_s is None:
+                            report.first_token_s = time.monotonic() - start
+                        if speaking != path:
+                            self.write(f"\n[{path or self.agent}] ")
+                            speaking = path
+                        self.write(text)
+                    elif kind == "on_chat_model_end" and run_id in started:
+                        timing = report.node(path or self.agent)
+                        timing.model_calls += 1
+                        timing.model_seconds += time.monotonic() - started.pop(run_id)
+                    elif kind == "on_chain_end":
+                        output = event["data"].get("output")
+                        if is_node and run_id in started:
+                            timing = report.node(path)
+                            timing.calls += 1
+                            timing.seconds += time.monotonic() - started.pop(run_id)
+                            for item in (output.get("ui") or []) if isinstance(output, dict) else []:
+                                # Subgraph UI also appears in the parent node's output
+                                if _ui_id(item) is None or _ui_id(item) not in seen_ui:
+                                    seen_ui.add(_ui_id(item))
+                                    report.ui.append(item)
+                                    self.write(f"\n[{path}] <ui: {_ui_name(item)}>")
+                                    speaking = None
+                        elif not event.get("parent_ids") and isinstance(output, dict):
+                            # The graph itself finished: its output is the conversation so far
+                            final = output
+        finally:
+            speculations.close()
+        report.seconds = time.monotonic() - start
+        self.write("\n")
+
+        if final is not None:
+            self.state = final
+        self.turns += 1
+        if self.deadline_ms is not None:
+            report.budget = budget.report()
+        # The state is measured off the event loop; the report waits for it briefly
+        await asyncio.to_thread(thread_memory.wait, STATE_MEASURE_TIMEOUT_S)
+        usage = thread_memory.get(self.thread_id)
+        if usage is not None:
+            report.state_bytes = dict(usage.channels)
+        return report
@@ -9,6 +9,14 @@ import os
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+try:
+    import pytest
+except ImportError:
+    # The suite also runs as a plain script
+    pytest = None
+else:
+    pytestmark = pytest.mark.asyncio
+
 async def test_imports():
     """Test that all agents can be imported without errors."""
     try:
@@ -65,6 +73,951 @@ async def test_basic_functionality():
         print(f"❌ Functionality test error: {e}")
         return False
 
+async def test_cancellation():
+    """Test that cancelling a run tears down its whole task tree."""
+    from langchain_core.messages import HumanMessage
+    from agents.cancellation import CancellationMetrics, RunHandle, astream_model, run_in_thread, sleep
+    from benchmarks.fake_llm import FakeChatModel
+    
+    metrics = CancellationMetrics()
+    prompt = [HumanMessage(content="Write a long document")]
+    model = FakeChatModel(reply=" ".join(["word"] * 40), token_delay=0.01)
+    
+    async def stream_node():
+        async for _ in astream_model(model, prompt, "test.stream"):
+            pass
+    
+    async def tool_node():
+        # Blocking tool job in the default thread pool
+        await run_in_thread(sleep, 30)
+    
+    async def subgraph():
+        await asyncio.gather(stream_node(), asyncio.sleep(30))
+    
+    async def graph():
+        await asyncio.gather(subgraph(), tool_node())
+    
+    # A completed stream gives the metrics an expected length to compare against
+    await RunHandle(metrics=metrics).run(stream_node())
+    
+    baseline = asyncio.all_tasks()
+    handle = RunHandle(metrics=metrics)
+    handle.start(graph())
+    await asyncio.sleep(0.1)
+    
+    start = asyncio.get_running_loop().time()
+    clean = await handle.cancel("test")
+    teardown = asyncio.get_running_loop().time() - start
+    await asyncio.sleep(0)
+    
+    orphans = asyncio.all_tasks() - baseline
+    assert clean, f"{handle.pending()} operations still running"
+    assert not orphans, f"orphaned tasks: {orphans}"
+    assert teardown < 1.0, f"teardown took {teardown:.2f}s"
+    print(f"✓ Cancelled run torn down in {teardown * 1000:.0f} ms with no orphaned tasks")
+    
+    snapshot = metrics.snapshot()
+    assert snapshot["tokens_saved"] > 0 and snapshot["seconds_saved"] > 0, snapshot
+    print(f"✓ Cancellation saved {snapshot['tokens_saved']} tokens and {snapshot['seconds_saved']}s")
+    
+    # Cancelling the caller of RunHandle.run cancels the run as well
+    handle = RunHandle(metrics=metrics)
+    caller = asyncio.ensure_future(handle.run(graph()))
+    await asyncio.sleep(0.1)
+    caller.cancel()
+    await asyncio.gather(caller, return_exceptions=True)
+    assert handle.cancelled and handle.pending() == 0
+    assert not asyncio.all_tasks() - baseline
+    print("✓ Cancelling the caller tears down the run")
+
+async def test_rate_limiting():
+    """Test that scheduled model calls stay within a rate-limited provider's limits."""
+    from langchain_core.messages import HumanMessage
+    from agents.budget import invoke_model
+    from agents.scheduler import ModelLimits, model_scheduler
+    from benchmarks.fake_llm import FakeChatModel, FakeProvider, RateLimitError
+    
+    prompt = [HumanMessage(content="Summarize my portfolio")]
+    reply = " ".join(["word"] * 10)
+    
+    # 20 requests per second in bursts of at most 5, no more than 4 at a time
+    provider = FakeProvider(requests_per_window=5, max_concurrency=4, window=0.25)
+    model = FakeChatModel(reply=reply, token_delay=0.01, provider=provider)
+    results = await asyncio.gather(*(model.ainvoke(prompt) for _ in range(30)), return_exceptions=True)
+    unscheduled = sum(isinstance(r, RateLimitError) for r in results)
+    assert unscheduled > 0, "the fake provider should reject an unscheduled burst"
+    print(f"✓ Unscheduled burst: {unscheduled}/30 calls rejected with 429")
+    
+    # Configured a little under the provider's limits, as in production
+    model_scheduler.configure(
+        "default:fake-model",
+        ModelLimits(requests_per_min=18 * 60, max_concurrency=4, burst_seconds=0.25),
+    )
+    provider = FakeProvider(requests_per_window=5, max_concurrency=4, window=0.25)
+    model = FakeChatModel(reply=reply, token_delay=0.01, provider=provider)
+    
+    async def call(priority, delay):
+        await asyncio.sleep(delay)
+        config = {"configurable": {"priority": priority}}
+        return await invoke_model(model, prompt, config, "test.call", "fake-model")
+    
+    # Background work queues first; interactive calls arriving later still go ahead of it
+    calls = [call("background", 0) for _ in range(15)] + [call("interactive", 0.05) for _ in range(15)]
+    await asyncio.gather(*calls)
+    assert provider.rejected == 0, f"{provider.rejected} calls rejected"
+    print("✓ Scheduled burst: 30/30 calls admitted without a 429")
+    
+    # The permit of a finished call is not left behind in the context
+    from agents.scheduler import current_permit
+    async with model_scheduler.slot("fake-model", 10) as permit:
+        assert current_permit.get() is permit
+    assert current_permit.get() is None
+
+    queue_time = model_scheduler.snapshot()["default:fake-model"]["queue_time"]
+    interactive, background = queue_time["interactive"]["mean_s"], queue_time["background"]["mean_s"]
+    assert interactive < background, queue_time
+    print(f"✓ Mean queue time: interactive {interactive * 1000:.0f} ms, background {background * 1000:.0f} ms")
+
+async def test_tenant_fairness():
+    """Simulate a batch tenant flooding the process while another tenant runs interactively."""
+    from agents.scheduler import DEFAULT_TENANT, ModelLimits, ModelScheduler
+    from agents.tenants import RunScheduler, TenantLimits
+    
+    async def simulate(fair):
+        models = ModelScheduler({"default:fake-model": ModelLimits(max_concurrency=4)})
+        runs = RunScheduler(max_concurrent_runs=8, scheduler=models)
+        runs.configure("batch", TenantLimits(weight=1.0))
+        runs.configure("interactive", TenantLimits(weight=1.0))
+        
+        async def model_call(tenant):
+            async with models.slot("fake-model", 100, tenant=tenant if fair else "default"):
+                await asyncio.sleep(0.01)
+        
+        async def batch_run():
+            # Each batch run fans out to four model calls at once, twice
+            async with runs.admit("batch" if fair else "default"):
+                for _ in range(2):
+                    await asyncio.gather(*(model_call("batch") for _ in range(4)))
+        
+        async def interactive_run(delay):
+            await asyncio.sleep(delay)
+            start = asyncio.get_running_loop().time()
+            async with runs.admit("interactive" if fair else "default"):
+                await model_call("interactive")
+                await model_call("interactive")
+            return asyncio.get_running_loop().time() - start
+        
+        # Names a client makes up do not get queues of their own
+        assert runs.known_tenant("interactive") == "interactive" and runs.known_tenant("made-up") == DEFAULT_TENANT
+        
+        batch = [asyncio.ensure_future(batch_run()) for _ in range(150)]
+        latencies = await asyncio.gather(*(interactive_run(0.02 + 0.03 * i) for i in range(20)))
+        await asyncio.gather(*batch)
+        return sorted(latencies), runs.snapshot()
+    
+    fifo, _ = await simulate(fair=False)
+    fair, snapshot = await simulate(fair=True)
+    fifo_worst, fair_worst = fifo[-1], fair[-1]
+    # Two 10 ms calls; with fair slots, waiting is bounded by a few batch runs, not the backlog
+    assert fair_worst < 0.3, f"interactive runs took up to {fair_worst * 1000:.0f} ms"
+    assert fair_worst * 5 < fifo_worst, (fair_worst, fifo_worst)
+    print(f"✓ Worst interactive run under a 150-run batch: FIFO {fifo_worst * 1000:.0f} ms, fair {fair_worst * 1000:.0f} ms")
+    
+    tenants = snapshot["tenants"]
+    assert tenants["batch"]["admitted"] == 150 and tenants["interactive"]["admitted"] == 20, tenants
+    assert tenants["interactive"]["model_queue_time"]["count"] == 40, tenants["interactive"]
+    print(f"✓ Per-tenant metrics: interactive p99 wait {tenants['interactive']['wait_time']['p99_s'] * 1000:.0f} ms, "
+          f"batch p99 wait {tenants['batch']['wait_time']['p99_s'] * 1000:.0f} ms")
+
+async def test_batch_resume():
+    """Interrupt a batch run, then resume it from its checkpoint."""
+    import json
+    import os
+    import random
+    import tempfile
+    from batch import BatchRunner
+    
+    async def fake_run(agent, input_data, deadline_ms, tenant):
+        await asyncio.sleep(random.uniform(0, 0.004))
+        content = input_data["messages"][0]["content"]
+        if content.endswith("7"):
+            raise RuntimeError("boom")
+        return {"messages": [{"role": "ai", "content": content.upper()}]}
+    
+    for ordered in (True, False):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, output = os.path.join(tmp, "in.jsonl"), os.path.join(tmp, "out.jsonl")
+            with open(source, "w") as f:
+                for i in range(400):
+                    f.write(json.dumps({"id": f"c{i}", "message": f"hello {i}"}) + "\n")
+            
+            options = dict(concurrency=16, ordered=ordered, run=fake_run, window=64, progress=lambda text: None)
+            first = BatchRunner(source, output, **options)
+            try:
+                await asyncio.wait_for(first(), 0.05)
+                raise AssertionError("the batch finished before it was interrupted")
+            except asyncio.TimeoutError:
+                pass
+            # A line written after the last checkpoint must not survive the resume
+            with open(output, "a") as f:
+                f.write('{"id": "torn"')
+            
+            second = BatchRunner(source, output, **options)
+            assert second.resumed, "no checkpoint to resume from"
+            resumed_at = second.next_line
+            summary = await second()
+            with open(output) as f:
+                ids = [json.loads(line)["id"] for line in f]
+            assert sorted(ids) == sorted(f"c{i}" for i in range(400)), "lines lost or duplicated"
+            if ordered:
+                assert ids == [f"c{i}" for i in range(400)], "results out of input order"
+            assert not os.path.exists(output + ".checkpoint")
+            print(f"✓ {'Ordered' if ordered else 'Keyed'} batch resumed at line {resumed_at}: "
+                  f"400 results, each once")
+
+async def test_cassette_replay():
+    """Record fake model calls into a cassette and replay them with their timing."""
+    import os
+    import tempfile
+    import time
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from agents.cassettes import Cassette, CassetteChatModel, CassetteMiss, CassetteWriter, request_key
+    from benchmarks.fake_llm import FakeChatModel
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calls.cassette")
+        writer = CassetteWriter(path)
+        recording = CassetteChatModel(
+            model="gpt-4o",
+            chat_model=FakeChatModel(first_token_delay=0.1, token_delay=0.005),
+            recorder=writer,
+        )
+        recorded = [chunk.content async for chunk in recording.astream([HumanMessage("Summarize my portfolio")])]
+        await recording.ainvoke([HumanMessage("Hello")])
+        writer.close()
+        
+        cassette = Cassette(path)
+        assert len(cassette) == 2, f"{len(cassette)} recordings"
+        replaying = CassetteChatModel(model="claude-3-5-haiku-latest", cassette=cassette)
+        start = time.monotonic()
+        replayed, first_token = [], None
+        async for chunk in replaying.astream([HumanMessage("Summarize my portfolio")]):
+            first_token = first_token or time.monotonic() - start
+            replayed.append(chunk.content)
+        assert replayed == recorded, "replayed chunks differ from the recorded ones"
+        assert 0.09 < first_token < 0.2, f"first token after {first_token:.3f}s, recorded after ~0.105s"
+        
+        fast = CassetteChatModel(model="gpt-4o", cassette=cassette, time_scale=0)
+        start = time.monotonic()
+        reply = await fast.ainvoke([HumanMessage("Hello")])
+        assert reply.content == FakeChatModel().reply and time.monotonic() - start < 0.05
+        try:
+            await fast.ainvoke([HumanMessage("Never recorded")])
+            raise AssertionError("an unrecorded request was answered")
+        except CassetteMiss:
+            pass
+        cassette.close()
+    
+    # Tool call ids and timestamps differ between runs of the same conversation
+    def conversation(call_id, when):
+        return [
+            HumanMessage("Order a pizza"),
+            AIMessage("", tool_calls=[{"name": "place_order", "args": {"size": "large"}, "id": call_id}]),
+            ToolMessage(f"Order placed at {when}", tool_call_id=call_id),
+        ]
+    assert request_key(conversation("call_a", "2025-06-01T12:00:00Z")) == \
+        request_key(conversation("toolu_b", "2025-06-02T08:30:15Z"))
+    
+    print("✓ Cassette replayed the recorded chunks with their timing")
+
+async def test_telemetry():
+    """Trace a small graph-shaped run: node spans, model call, tool, cache and UI metrics."""
+    import json
+    import os
+    import tempfile
+    from langchain_core.runnables import RunnableLambda
+    from langchain_core.tools import tool
+    from agents.scheduler import model_scheduler
+    from agents.telemetry import Telemetry, instrument, record_cache, record_ui_push
+    import agents.telemetry as telemetry_module
+    from benchmarks.fake_llm import FakeChatModel
+    
+    @tool
+    def lookup(ticker: str) -> str:
+        """Look up a ticker."""
+        record_cache("quotes", "miss")
+        return ticker.upper()
+    
+    model = FakeChatModel(token_delay=0.001)
+    
+    async def call_model(state):
+        async with model_scheduler.slot("gpt-4o", 10):
+            chunks = [chunk async for chunk in model.astream(state["messages"])]
+        lookup.invoke({"ticker": "aapl"})
+        record_ui_push("quote", {"name": "quote", "props": {"ticker": "AAPL"}})
+        return {"reply": "".join(chunk.content for chunk in chunks)}
+    
+    node = RunnableLambda(call_model, name="call_model").with_config(metadata={"langgraph_node": "call_model"})
+    async def run_graph(state, config):
+        return await node.ainvoke(state, config)
+    
+    graph = RunnableLambda(run_graph, name="LangGraph")
+    handler = Telemetry()
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "traces.jsonl")
+        handler.configure(log, sample_rate=0.0, slow_ms=0)
+        # instrument() attaches the shared handler; use this test's own instead
+        previous, telemetry_module.telemetry = telemetry_module.telemetry, handler
+        try:
+            await instrument(graph, "demo").ainvoke({"messages": [("human", "hi")]})
+        finally:
+            telemetry_module.telemetry = previous
+        handler.trace_log.close()
+        with open(log) as f:
+            traces = [json.loads(line) for line in f]
+    
+    metrics = handler.metrics
+    assert metrics.graph_seconds.count(agent="demo", status="ok") == 1
+    assert metrics.node_seconds.count(agent="demo", node="call_model") == 1
+    assert metrics.llm_first_token_seconds.count(agent="demo", model="FakeChatModel") == 1
+    assert metrics.llm_queue_seconds.count(agent="demo", model="FakeChatModel") == 1
+    assert metrics.llm_tokens.value(agent="demo", model="FakeChatModel", type="completion") > 0
+    assert metrics.tool_seconds.count(agent="demo", tool="lookup", status="ok") == 1
+    assert metrics.cache_lookups.value(cache="quotes", result="miss") == 1
+    assert metrics.ui_push_bytes.count(agent="demo", component="quote") == 1
+    assert 'agent_node_duration_seconds_bucket{agent="demo",node="call_model",le="+Inf"} 1' in metrics.render()
+    
+    # Not sampled, but slower than slow_ms=0
+    assert len(traces) == 1, f"{len(traces)} traces written"
+    spans = {span["name"]: span for span in traces[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert set(spans) == {"demo", "call_model", "FakeChatModel", "lookup"}, sorted(spans)
+    assert spans["call_model"]["parentSpanId"] == spans["demo"]["spanId"]
+    assert spans["lookup"]["parentSpanId"] == spans["call_model"]["spanId"]
+    tool_attributes = {a["key"]: a["value"] for a in spans["lookup"]["attributes"]}
+    assert tool_attributes["agent.cache.quotes.miss"] == {"intValue": "1"}
+    
+    print("✓ Telemetry traced graph, node, model call and tool, with cache and UI metrics")
+
+async def test_profiler():
+    """A tool blocking the event loop is reported as a stall, and serialized tool calls as avoidable."""
+    import time
+    from langchain_core.runnables import RunnableLambda
+    from langchain_core.tools import tool
+    from agents.profiler import Profiler
+    from agents.telemetry import instrument
+    
+    @tool
+    def blocking_lookup(ticker: str) -> str:
+        """Look up a ticker, blocking."""
+        time.sleep(0.1)
+        return ticker.upper()
+    
+    async def call_tools(state):
+        # Two independent calls, one after the other, on the event loop
+        blocking_lookup.invoke({"ticker": "aapl"})
+        blocking_lookup.invoke({"ticker": "msft"})
+        return state
+    
+    node = RunnableLambda(call_tools, name="call_tools").with_config(metadata={"langgraph_node": "call_tools"})
+    
+    async def run_graph(state, config):
+        return await node.ainvoke(state, config)
+    
+    profiler = Profiler(stall_ms=50)
+    with profiler.attach():
+        await instrument(RunnableLambda(run_graph, name="LangGraph"), "demo").ainvoke({"messages": []})
+    report = profiler.report()
+    
+    assert report["runs_seen"] == 1
+    stall = report["stalls_by_span"][0]
+    assert (stall["agent"], stall["span"], stall["kind"]) == ("demo", "call_tools/blocking_lookup", "tool"), stall
+    assert stall["ms"] >= 150, stall
+    run = report["runs"][0]
+    assert run["chain"] == ["call_tools"], run["chain"]
+    assert [entry["span"] for entry in run["critical_path"]] == [
+        "demo", "call_tools", "call_tools/blocking_lookup", "call_tools/blocking_lookup"]
+    serialized = run["serialized_tools"][0]
+    assert serialized["tools"] == ["blocking_lookup", "blocking_lookup"]
+    assert 90 <= serialized["avoidable_ms"] <= run["avoidable_ms"] < 150, run
+    folded = profiler.folded()
+    assert "\ncritical;demo;call_tools;blocking_lookup " in "\n" + folded
+    assert "\nstall;demo;call_tools;blocking_lookup;" in "\n" + folded
+    
+    print("✓ Profiler attributed the loop stall to the tool and found the serialized calls")
+
+async def test_thread_memory():
+    """Thread state sizes by channel, top threads, the size cap, and a tracemalloc diff around a run."""
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+    from agents.memory import ThreadMemory, retained_size, state_size, thread_config, trace_allocations
+    from agents.telemetry import Telemetry
+    
+    reply = AIMessage(content="x" * 10000)
+    state = {
+        "messages": [HumanMessage(content="hi"), reply],
+        # The same reply kept in UI metadata is not counted twice
+        "ui": [{"id": "1", "name": "quote", "props": {}, "metadata": {"message": reply}}],
+    }
+    sizes = state_size(state)
+    assert sizes["messages"] > 10000 > sizes["ui"], sizes
+    assert retained_size(reply) > 10000
+    
+    memory = ThreadMemory(max_threads=2, cap_bytes=50000)
+    handler = Telemetry(thread_memory=memory)
+    
+    async def grow(state):
+        return {"messages": state["messages"] + [AIMessage(content="y" * state["size"])]}
+    
+    graph = RunnableLambda(grow, name="LangGraph").with_config(callbacks=[handler], metadata={"agent": "demo"})
+    for thread_id, size in (("small", 100), ("large", 20000), ("huge", 60000)):
+        await graph.ainvoke({"messages": [], "size": size}, config=thread_config(None, thread_id))
+    # Runs without a thread are not measured
+    await graph.ainvoke({"messages": [], "size": 10}, config={})
+    assert memory.wait(5), "states still being measured"
+    
+    assert [usage.thread_id for usage in memory.top(5)] == ["huge", "large"], memory.top(5)
+    assert memory.get("small") is None  # evicted: two threads tracked at most
+    assert memory.get("huge").over_cap and not memory.get("large").over_cap
+    assert handler.metrics.thread_state_over_cap.value(agent="demo") == 1
+    assert handler.metrics.thread_state_bytes.count(agent="demo") == 3
+    summary = memory.summary(1)
+    assert summary["threads"] == 2 and summary["top"][0]["thread_id"] == "huge"
+    
+    kept = []
+    with trace_allocations(limit=5) as allocations:
+        kept.append(bytearray(1 << 20))
+    assert allocations.bytes >= 1 << 20, allocations.format()
+    assert allocations.to_dict()["top"][0]["bytes"] >= 1 << 20
+    
+    print("✓ Thread memory measured state by channel, kept the heaviest threads and flagged the one over the cap")
+
+async def test_tool_call_merging():
+    """Same-tool stock price calls merge into bulk calls of at most MAX_TICKERS_PER_QUERY tickers."""
+    from agents.stockbroker.tools import MAX_TICKERS_PER_QUERY, MultiPriceQuery, merge_tool_calls
+    
+    calls = [
+        {"name": "get_stock_price", "args": {"ticker": f"T{i}"}, "id": f"call_{i}"}
+        for i in range(MAX_TICKERS_PER_QUERY + 1)
+    ]
+    calls.append({"name": "get_stock_prices", "args": {"tickers": ["T0", "AAPL"]}, "id": "bulk"})
+    executions = merge_tool_calls(calls)
+    
+    answered = [tc["id"] for execution in executions for tc in execution["tool_calls"]]
+    assert sorted(answered) == sorted(tc["id"] for tc in calls), answered
+    for execution in executions:
+        if execution["name"] == "get_stock_prices":
+            # Would raise a ValidationError past the limit
+            MultiPriceQuery(**execution["args"])
+            asked = set(execution["args"]["tickers"])
+            for tool_call in execution["tool_calls"]:
+                args = tool_call["args"]
+                assert set(args.get("tickers", [args.get("ticker")])) <= asked, tool_call
+    assert len(executions) == 2, [execution["name"] for execution in executions]
+    print(f"✓ {len(calls)} price calls merged into {len(executions)} bulk calls within the ticker limit")
+
+async def test_speculation():
+    """Speculative steps are committed, taken, discarded, or skipped when they do not apply."""
+    from agents.speculation import SPECULATIVE_STEPS, SpeculationMetrics, Speculations, register_speculative_step, speculation_safe
+    
+    @speculation_safe
+    async def first_step(state, config):
+        await asyncio.sleep(0.05)
+        return {"step": state["messages"][-1]["content"]}
+    
+    @speculation_safe
+    async def slow_step(state, config):
+        await asyncio.sleep(30)
+    
+    register_speculative_step("specA", "a.first", first_step, when=lambda state: not state.get("done"))
+    register_speculative_step("specB", "b.first", slow_step)
+    try:
+        state = {"messages": [{"role": "human", "content": "plan a trip"}]}
+        metrics = SpeculationMetrics()
+        
+        # Committed for the chosen route and taken by its node; the other route is cancelled
+        speculations = Speculations(metrics)
+        assert speculations.start("specA", state, {}) and speculations.start("specB", state, {})
+        slow = speculations._pending[1].task
+        speculations.resolve(["specA"])
+        await asyncio.sleep(0)
+        assert slow.cancelled()
+        assert await speculations.take("a.first", state) == {"step": "plan a trip"}
+        assert await speculations.take("a.first", state) is None  # taken once
+        
+        # A node asking about another message than the one speculated on runs normally
+        speculations = Speculations(metrics)
+        speculations.start("specA", state, {})
+        speculations.resolve("specA")
+        other = {"messages": state["messages"] + [{"role": "human", "content": "and a hotel"}]}
+        assert await speculations.take("a.first", other) is None
+        
+        # Left uncommitted and closed with the request
+        speculations = Speculations(metrics)
+        speculations.start("specA", state, {})
+        speculations.resolve(None)
+        speculations.close()
+        
+        # Not started when the route would not run the step first
+        assert not Speculations(metrics).start("specA", {**state, "done": True}, {})
+        
+        snapshot = metrics.snapshot()
+        assert snapshot["specA"]["started"] == 3 and snapshot["specA"]["committed"] == 2, snapshot
+        assert snapshot["specA"]["used"] == 1 and snapshot["specA"]["discarded"] == 2, snapshot
+        assert snapshot["specB"]["committed"] == 0 and snapshot["specB"]["discarded"] == 1, snapshot
+    finally:
+        SPECULATIVE_STEPS.pop("specA", None)
+        SPECULATIVE_STEPS.pop("specB", None)
+    
+    print("✓ Speculations were taken, discarded on a route or message mismatch, and skipped when they did not apply")
+
+async def test_fan_out_fallback():
+    """Fan-out keeps the reply of a branch answered by its bulkhead's fallback."""
+    import logging
+    from agents.bulkheads import AgentPolicy, Bulkheads
+    from agents.supervisor.nodes.fan_out import make_fan_out
+    
+    class Branch:
+        """Sub-agent graph stand-in: returns the messages it was given plus its reply."""
+        
+        def __init__(self, reply, fail=False, delay=0.0):
+            self.reply, self.fail, self.delay = reply, fail, delay
+        
+        async def ainvoke(self, state, config=None):
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("sub-agent down")
+            return {**state, "messages": state["messages"] + [{"id": self.reply, "role": "assistant", "content": self.reply}]}
+    
+    async def fallback(state, config):
+        return {"messages": [{"id": "fallback", "role": "assistant", "content": "fallback"}]}
+    
+    guards = Bulkheads()
+    policy = AgentPolicy(max_concurrency=1, queue_timeout=0.01, failure_threshold=1, cooldown=60)
+    branches = {
+        "ok": guards.guard("ok", Branch("ok"), policy, fallback),
+        "failing": guards.guard("failing", Branch("failing", fail=True), policy, fallback),
+        "busy": guards.guard("busy", Branch("busy", delay=0.2), policy, fallback),
+    }
+    fan_out = make_fan_out(branches)
+    state = {"messages": [{"id": "q", "role": "human", "content": "two things"}], "ui": []}
+    
+    def replies(result):
+        return [message["content"] for message in result["messages"]]
+    
+    # A failed branch; the failure it logs is expected
+    logger = logging.getLogger("agents.bulkheads")
+    logger.disabled = True
+    try:
+        assert replies(await fan_out({**state, "routes": ["ok", "failing"]}, {})) == ["ok", "fallback"]
+    finally:
+        logger.disabled = False
+    # Its breaker is now open: short-circuited
+    assert replies(await fan_out({**state, "routes": ["failing", "ok"]}, {})) == ["fallback", "ok"]
+    # A branch with no free bulkhead slot: rejected
+    holder = asyncio.ensure_future(branches["busy"](state, {}))
+    await asyncio.sleep(0.01)
+    assert replies(await fan_out({**state, "routes": ["busy", "ok"]}, {})) == ["fallback", "ok"]
+    await holder
+    
+    counts = guards.snapshot()
+    assert counts["failing"]["failed"] == 1 and counts["failing"]["short_circuited"] == 1, counts
+    assert counts["busy"]["rejected"] == 1, counts
+    print("✓ Fan-out kept the fallback replies of failed, short-circuited and rejected branches")
+
+async def test_indicator_cache():
+    """Indicators extended with appended bars match a full recompute."""
+    import numpy as np
+    from agents.stockbroker.indicators import SERIES_KEYS, IndicatorCache, compute_indicators
+    from agents.stockbroker.market_data import MarketDataStore, synthetic_bars
+    
+    store = MarketDataStore(num_bars=300, end_time=1_700_000_000)
+    cache = IndicatorCache(store)
+    cache.get("AAPL", window=20)
+    new_bars = {name: values[0][:25] for name, values in synthetic_bars(["MSFT"], 25).items()}
+    for _ in range(2):
+        store.append_bars("AAPL", new_bars)
+        history, extended = cache.get("AAPL", window=20)
+        assert len(extended["sma"]) == len(history)
+    assert (cache.misses, cache.extensions) == (1, 2), (cache.misses, cache.extensions)
+    
+    full = compute_indicators(history.high, history.low, history.close, history.volume, 20)
+    for name in SERIES_KEYS:
+        assert np.allclose(extended[name], full[name], equal_nan=True, rtol=1e-9, atol=1e-9), name
+    # Unchanged history: served as is
+    assert cache.get("AAPL", window=20)[1] is extended and cache.hits == 1
+    print(f"✓ Incremental indicators over {len(history)} bars match a full recompute")
+
+async def test_portfolio_risk():
+    """Risk estimates: cache invalidation on new bars, parallel and serial runs, bounded confidence."""
+    from unittest import mock
+    from agents.stockbroker.market_data import MarketDataStore, synthetic_bars
+    from agents.stockbroker.risk import RiskCache, simulate_risk
+    from agents.stockbroker.tools import get_portfolio_risk
+    
+    store = MarketDataStore(num_bars=300, end_time=1_700_000_000)
+    positions = {"AAPL": 10_000.0, "MSFT": 20_000.0, "GOOGL": 5_000.0}
+    cache = RiskCache(store)
+    first = cache.get(positions, 0.99, 20_000)
+    assert cache.get(positions, 0.99, 20_000) is first and (cache.hits, cache.misses) == (1, 1)
+    # New bars change the portfolio version: the estimate is recomputed
+    store.append_bars("MSFT", {name: values[0][:5] for name, values in synthetic_bars(["MSFT"], 5).items()})
+    second = cache.get(positions, 0.99, 20_000)
+    assert second["portfolio_version"] != first["portfolio_version"] and cache.misses == 2
+    
+    serial = simulate_risk(positions, 0.99, 200_000, store=store, seed=7, parallel=False)
+    # Split across four worker processes even on a single core
+    with mock.patch("agents.stockbroker.risk.os.cpu_count", return_value=4):
+        parallel = simulate_risk(positions, 0.99, 200_000, store=store, seed=7, parallel=True)
+        again = simulate_risk(positions, 0.99, 200_000, store=store, seed=7, parallel=True)
+    assert parallel == again, "the parallel simulation is not reproducible for a fixed seed"
+    for horizon, estimate in serial["horizons"].items():
+        for measure, value in estimate.items():
+            assert abs(parallel["horizons"][horizon][measure] - value) <= 0.03 * value, (horizon, measure, parallel, serial)
+    
+    # Out of range from the model: an error result, not a failed node
+    assert get_portfolio_risk.invoke({"confidence": 95}).startswith("Invalid arguments: confidence")
+    print("✓ Risk cache recomputed on new bars; parallel and serial simulations agree")
+
+async def test_downsampling():
+    """LTTB and min/max keep the endpoints within the point budget; client sizing is sanitized."""
+    import numpy as np
+    from agents.downsample import DEFAULT_VIEWPORT_WIDTH, MAX_POINTS, downsample_indices, downsample_props, target_points
+    from agents.types import typed_ui
+    
+    rng = np.random.default_rng(3)
+    y = np.cumsum(rng.standard_normal(10_000))
+    y[500:520] = np.nan
+    for method in ("lttb", "minmax"):
+        for threshold in (4, 37, 768):
+            kept = downsample_indices(y, threshold, method)
+            assert kept[0] == 0 and kept[-1] == len(y) - 1, (method, threshold)
+            assert len(kept) <= threshold and np.all(np.diff(kept) > 0), (method, threshold, len(kept))
+            if method == "lttb":
+                assert len(kept) == threshold
+    # min/max keeps the extremes
+    kept = downsample_indices(y, 100, "minmax")
+    assert np.nanargmax(y) in kept and np.nanargmin(y) in kept
+    rows = [{"time": i, "close": float(v)} for i, v in enumerate(y[:2000])]
+    props = {"series": rows, "ticker": "AAPL"}
+    reduced = downsample_props(props, 100)
+    assert len(reduced["series"]) == 100 and reduced["series"][0] is rows[0] and props["series"] is rows
+    
+    def points(width, ratio):
+        return target_points({"configurable": {"viewport_width": width, "device_pixel_ratio": ratio}})
+    
+    assert points(1024, 2) == points("1024", "2") == 2048
+    for width, ratio in ((float("nan"), 1), (-5, 1), (True, 1), ([1024], None), ("wide", 1), (float("inf"), 1)):
+        assert points(width, ratio) == DEFAULT_VIEWPORT_WIDTH, (width, ratio)
+    assert points(1e308, 1e308) == MAX_POINTS
+    assert typed_ui({"configurable": {"downsample_method": "bogus"}}).downsample_method == "lttb"
+    print("✓ Downsampling kept the endpoints within the point budget and ignored malformed client sizes")
+
+async def test_model_call_config():
+    """A budgeted model call runs with the caller's config: callbacks and tags reach the model."""
+    from langchain_core.callbacks import AsyncCallbackHandler
+    from langchain_core.messages import HumanMessage
+    from agents.budget import Budget, budget_config, invoke_model
+    from benchmarks.fake_llm import FakeChatModel
+    
+    class Starts(AsyncCallbackHandler):
+        def __init__(self):
+            self.tags = []
+        
+        async def on_chat_model_start(self, serialized, messages, *, tags=None, **kwargs):
+            self.tags.append(tags)
+    
+    handler = Starts()
+    config = budget_config(Budget(deadline_ms=5000), {"callbacks": [handler], "tags": ["trip"]})
+    await invoke_model(FakeChatModel(token_delay=0), [HumanMessage("hi")], config, "test.call", "fake-model")
+    assert handler.tags == [["trip"]], handler.tags
+    print("✓ Model call saw the run's callbacks and tags")
+
+async def test_request_validation():
+    """Malformed request bodies get a JSON 400, not a 500."""
+    from aiohttp.test_utils import TestClient, TestServer
+    import server
+    
+    class Echo:
+        async def ainvoke(self, state, config=None):
+            return {"messages": [], "thread_id": config["configurable"].get("thread_id")}
+    
+    app = server.create_app({"echo": Echo()}, prewarm_agents=False)
+    async with TestClient(TestServer(app)) as client:
+        for body in (
+            {"config": "x"},
+            {"config": {"configurable": 5}},
+            {"deadline_ms": "5000"},
+            {"max_cost_usd": -1},
+        ):
+            response = await client.post("/agents/echo/invoke", json=body)
+            assert response.status == 400 and "error" in await response.json(), body
+        response = await client.post("/agents/echo/invoke", json={"config": {"configurable": {"thread_id": "t1"}}, "deadline_ms": 5000})
+        assert response.status == 200 and (await response.json())["thread_id"] == "t1"
+    print("✓ Malformed config and budget fields were rejected with 400")
+
+async def test_hedging():
+    """A hedge fires only after the p95 delay, within its budget, and the loser is cancelled."""
+    from agents.hedging import MIN_SAMPLES, HedgeMetrics, hedged
+    
+    def warmed(**kwargs):
+        metrics = HedgeMetrics(**kwargs)
+        for _ in range(MIN_SAMPLES):
+            metrics.record_latency("node", 0.1)
+        return metrics
+    
+    def racer(*plan):
+        """Attempts that take the planned (seconds, result) in turn; a result that is an exception is raised."""
+        started, cancelled = [], []
+        loop = asyncio.get_running_loop()
+        
+        async def attempt():
+            index = len(started)
+            started.append(loop.time())
+            seconds, result = plan[index]
+            try:
+                await asyncio.sleep(seconds)
+            except asyncio.CancelledError:
+                cancelled.append(index)
+                raise
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return attempt, started, cancelled
+    
+    # Not hedged before the component has enough samples, nor when it answers within the delay
+    attempt, started, _ = racer((0.2, "only"))
+    assert await hedged(attempt, "node", metrics=HedgeMetrics()) == "only" and len(started) == 1
+    metrics = warmed()
+    attempt, started, _ = racer((0.01, "fast"))
+    assert await hedged(attempt, "node", metrics=metrics) == "fast" and len(started) == 1
+    assert metrics.snapshot()["hedges"] == 0
+    
+    # A slow primary is hedged after the delay, and loses to the hedge
+    metrics = warmed()
+    attempt, started, cancelled = racer((5, "primary"), (0.01, "hedge"))
+    assert await hedged(attempt, "node", prompt_tokens=50, metrics=metrics) == "hedge"
+    assert len(started) == 2 and started[1] - started[0] >= 0.09, started
+    assert cancelled == [0]
+    stats = metrics.snapshot()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1 and stats["tokens_wasted"] == 50, stats
+    
+    # A hedge that fails does not decide the race: the primary still wins
+    metrics = warmed()
+    attempt, started, cancelled = racer((0.3, "primary"), (0.01, RuntimeError("backup down")))
+    assert await hedged(attempt, "node", metrics=metrics) == "primary"
+    assert len(started) == 2 and cancelled == [] and metrics.snapshot()["hedge_wins"] == 0
+    
+    # Once the budget is spent, slow calls are not hedged
+    metrics = warmed(budget=0.0, burst=1.0)
+    for expected in (2, 1):
+        attempt, started, _ = racer((0.15, "primary"), (5, "hedge"))
+        assert await hedged(attempt, "node", metrics=metrics) == "primary"
+        assert len(started) == expected, started
+    stats = metrics.snapshot()
+    assert stats["hedges"] == 1 and stats["denied"] == 1, stats
+    
+    # The budget earns a hedge per 1 / budget calls
+    metrics = HedgeMetrics(budget=0.25, burst=1.0)
+    metrics.credit = 0.0
+    granted = 0
+    for _ in range(20):
+        metrics.record_call()
+        granted += metrics.try_hedge()
+    assert granted == 5, granted
+    print("✓ Hedging waited for the delay, cancelled the loser and kept to its budget")
+
+async def test_model_failover():
+    """Pools use only providers with credentials, in their declared order, and fail over on unbuildable models."""
+    from unittest import mock
+    from langchain_core.messages import HumanMessage
+    from agents.providers import (
+        FACTORY_CREDENTIALS, MODELS, PROVIDER_FACTORIES, ModelBalancer, ModelPool, NoModelAvailable,
+        _candidates, invoke_pool,
+    )
+    from benchmarks.fake_llm import FakeChatModel
+    
+    pool = ModelPool([], ["claude-3-5-sonnet-latest", "gpt-4o", "gemini-1.5-pro"])
+    keys = [name for names in FACTORY_CREDENTIALS.values() for name in names]
+    with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}):
+        for name in keys:
+            if name != "OPENAI_API_KEY":
+                os.environ.pop(name, None)
+        assert _candidates(pool, ModelBalancer()) == ["gpt-4o"]
+        assert _candidates(ModelPool([], ["gpt-4o"], api_key="x"), ModelBalancer()) == ["gpt-4o"]
+        # A factory put in place of the SDK's, e.g. a cassette replay, needs no key
+        with mock.patch.dict(PROVIDER_FACTORIES, {"anthropic": lambda model, **options: FakeChatModel()}):
+            assert _candidates(pool, ModelBalancer()) == ["claude-3-5-sonnet-latest", "gpt-4o"]
+        os.environ.pop("OPENAI_API_KEY")
+        try:
+            _candidates(pool, ModelBalancer())
+            raise AssertionError("a pool without credentials returned models")
+        except NoModelAvailable:
+            pass
+    
+    # Untried models keep the declared order; a slow one drops behind
+    with mock.patch.dict(os.environ, {name: "test" for name in keys}):
+        balancer = ModelBalancer()
+        assert _candidates(pool, balancer) == pool.models
+        balancer.record("claude-3-5-sonnet-latest", 5.0, failed=False)
+        assert _candidates(pool, balancer) == ["gpt-4o", "gemini-1.5-pro", "claude-3-5-sonnet-latest"]
+    
+    # A model whose client cannot be built is skipped for the next one
+    def broken(model, **options):
+        raise TypeError("unexpected keyword argument 'api_base'")
+    
+    models = {"broken-model": {"provider": "broken", "capabilities": MODELS["gpt-4o"]["capabilities"]},
+              "fake-model": {"provider": "fake", "capabilities": MODELS["gpt-4o"]["capabilities"]}}
+    factories = {"broken": broken, "fake": lambda model, **options: FakeChatModel(reply="fallback", token_delay=0)}
+    with mock.patch.dict(MODELS, models), mock.patch.dict(PROVIDER_FACTORIES, factories):
+        balancer = ModelBalancer()
+        fallback = ModelPool([], ["broken-model", "fake-model"])
+        response = await invoke_pool(fallback, lambda model: model, [HumanMessage("hi")], None, "test.pool", balancer=balancer)
+        assert response.content == "fallback" and balancer.failovers == 1
+        assert balancer.snapshot()["models"]["broken-model"]["errors"] == 1
+    print("✓ Pools skipped providers without credentials and failed over past an unbuildable model")
+
+async def test_cascade():
+    """Rejected or low-confidence small-model answers escalate to the large tier; unconfigured tiers are skipped."""
+    from unittest import mock
+    from langchain_core.messages import HumanMessage
+    from agents.cascade import Cascade, CascadeStats, invoke_cascade
+    from agents.providers import MODELS, PROVIDER_FACTORIES, ModelBalancer
+    from agents.supervisor.nodes.router import route_to_agent, validate_route
+    from benchmarks.fake_llm import ScriptedChatModel
+    
+    small_script = {
+        "unknown": {"tools": {"route_to_agent": {"agent": "weatherBot", "confidence": 0.9}}},
+        "unsure": {"tools": {"route_to_agent": {"agent": "stockbroker", "confidence": 0.4}}},
+        "sure": {"tools": {"route_to_agent": {"agent": "stockbroker", "confidence": 0.9}}},
+    }
+    large_script = {text: {"tools": {"route_to_agent": {"agent": "tripPlanner", "confidence": 0.95}}} for text in small_script}
+    capabilities = MODELS["gpt-4o"]["capabilities"]
+    models = {"small-fake": {"provider": "fake-small", "capabilities": capabilities},
+              "large-fake": {"provider": "fake-large", "capabilities": capabilities}}
+    factories = {
+        "fake-small": lambda model, **options: ScriptedChatModel(script=small_script, token_delay=0),
+        "fake-large": lambda model, **options: ScriptedChatModel(script=large_script, token_delay=0),
+    }
+    
+    async def route(cascade, text, stats, balancer):
+        response = await invoke_cascade(
+            cascade, lambda model: model.bind_tools([route_to_agent]), [HumanMessage(text)], None,
+            "test.router", validate_route, stats=stats, balancer=balancer,
+        )
+        return response.tool_calls[0]["args"]["agent"]
+    
+    with mock.patch.dict(MODELS, models), mock.patch.dict(PROVIDER_FACTORIES, factories):
+        cascade = Cascade([], small=["small-fake"], large=["large-fake"])
+        stats, balancer = CascadeStats(), ModelBalancer()
+        assert await route(cascade, "unknown", stats, balancer) == "tripPlanner"
+        assert await route(cascade, "unsure", stats, balancer) == "tripPlanner"
+        assert await route(cascade, "sure", stats, balancer) == "stockbroker"
+        node = stats.snapshot()["test.router"]
+        assert node["calls"] == 3 and node["escalated"] == 2, node
+        assert node["reasons"] == {"invalid route_to_agent arguments": 1, "low confidence": 1}, node["reasons"]
+        assert balancer.snapshot()["models"]["large-fake"]["calls"] == 2
+        
+        # A small tier without credentials is skipped rather than counted as an escalation
+        with mock.patch.dict(os.environ, {}):
+            os.environ.pop("OPENAI_API_KEY", None)
+            stats = CascadeStats()
+            unconfigured = Cascade([], small=["gpt-4o-mini"], large=["large-fake"])
+            assert await route(unconfigured, "sure", stats, ModelBalancer()) == "tripPlanner"
+            node = stats.snapshot()["test.router"]
+            assert node["calls"] == 1 and node["escalated"] == 0, node
+    print("✓ Cascade escalated rejected and low-confidence routes and skipped an unconfigured tier")
+
+async def test_speculation_trace():
+    """A speculative step runs as its own tagged run under the graph, on the request's budget."""
+    import json
+    import tempfile
+    from langchain_core.runnables import RunnableLambda
+    from agents.budget import Budget, budget_config, get_budget
+    from agents.speculation import SPECULATIVE_STEPS, SpeculationMetrics, Speculations, register_speculative_step, speculation_safe
+    from agents.telemetry import Telemetry, instrument
+    import agents.telemetry as telemetry_module
+    from benchmarks.fake_llm import FakeChatModel
+    
+    budget, seen = Budget(), {}
+    
+    @speculation_safe
+    async def first_step(state, config):
+        seen["budget"], seen["tags"] = get_budget(config), config.get("tags")
+        return {"reply": (await FakeChatModel(token_delay=0).ainvoke(state["messages"], config)).content}
+    
+    async def route(state, config):
+        speculations = Speculations(SpeculationMetrics())
+        speculations.start("specA", state, config)
+        await asyncio.gather(*(speculation.task for speculation in speculations._pending))
+        speculations.resolve(None)
+        return state
+    
+    router = RunnableLambda(route, name="router").with_config(metadata={"langgraph_node": "router"})
+    async def run_graph(state, config):
+        return await router.ainvoke(state, config)
+    
+    register_speculative_step("specA", "a.first", first_step)
+    handler = Telemetry()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            log = os.path.join(tmp, "traces.jsonl")
+            handler.configure(log, sample_rate=1.0)
+            previous, telemetry_module.telemetry = telemetry_module.telemetry, handler
+            try:
+                graph = instrument(RunnableLambda(run_graph, name="LangGraph"), "demo")
+                await graph.ainvoke({"messages": [("human", "plan a trip")]}, budget_config(budget))
+            finally:
+                telemetry_module.telemetry = previous
+            handler.trace_log.close()
+            with open(log) as f:
+                spans = [span for line in f for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    finally:
+        SPECULATIVE_STEPS.pop("specA", None)
+    
+    assert seen["budget"] is budget and "speculation" in seen["tags"], seen
+    by_name = {span["name"]: span for span in spans}
+    kinds = {span["name"]: {a["key"]: a["value"] for a in span["attributes"]}.get("agent.span.kind") for span in spans}
+    speculation = by_name["speculation:a.first"]
+    assert kinds["speculation:a.first"] == {"stringValue": "speculation"}, kinds
+    # Under the graph, not the router, and the model call under the speculation
+    assert speculation["parentSpanId"] == by_name["demo"]["spanId"]
+    assert by_name["FakeChatModel"]["parentSpanId"] == speculation["spanId"]
+    assert handler.metrics.node_seconds.count(agent="demo", node="speculation:a.first") == 0
+    print("✓ Speculative step traced as its own span on the request's budget")
+
+async def run_test(test) -> bool:
+    """Run ``test`` for the script mode, reporting a failure instead of raising it."""
+    try:
+        await test()
+        return True
+    except Exception as e:
+        print(f"❌ {test.__name__} failed: {e!r}")
+        return False
+
+# What main() runs after the import and functionality checks
+TESTS = [
+    ("cancellation", test_cancellation),
+    ("rate limiting", test_rate_limiting),
+    ("tenant fairness", test_tenant_fairness),
+    ("batch resume", test_batch_resume),
+    ("cassette replay", test_cassette_replay),
+    ("telemetry", test_telemetry),
+    ("profiler", test_profiler),
+    ("thread memory accounting", test_thread_memory),
+    ("tool call merging", test_tool_call_merging),
+    ("speculation", test_speculation),
+    ("speculation trace", test_speculation_trace),
+    ("fan-out with fallbacks", test_fan_out_fallback),
+    ("indicator cache", test_indicator_cache),
+    ("portfolio risk", test_portfolio_risk),
+    ("downsampling", test_downsampling),
+    ("model call config", test_model_call_config),
+    ("request validation", test_request_validation),
+    ("hedging", test_hedging),
+    ("model failover", test_model_failover),
+    ("cascade", test_cascade),
+]
+
 async def main():
     """Main test function."""
     print("Python LangGraph Agents - Test Suite")
@@ -77,8 +1030,13 @@ async def main():
         # Test basic functionality
         await test_basic_functionality()
     
+    results = []
+    for name, test in TESTS:
+        print(f"\nTesting {name}...")
+        results.append(await run_test(test))
+    
     print("\n" + "=" * 50)
-    if import_success:
+    if import_success and all(results):
         print("🎉 All tests passed! The Python agents are ready to use.")
     else:
         print("❌ Some tests failed. Please check the errors above.")
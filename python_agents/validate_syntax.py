@@ -29,10 +29,28 @@ def main():
     # List of files to validate
     files_to_check = [
         "agents/types.py",
+        "agents/downsample.py",
+        "agents/budget.py",
+        "agents/cancellation.py",
+        "agents/scheduler.py",
+        "agents/hedging.py",
+        "agents/providers.py",
+        "agents/cassettes.py",
+        "agents/telemetry.py",
+        "agents/profiler.py",
+        "agents/memory.py",
+        "agents/cascade.py",
+        "agents/speculation.py",
+        "agents/tenants.py",
+        "agents/bulkheads.py",
+        "agents/registry.py",
         "agents/chat_agent.py",
         "agents/stockbroker/__init__.py",
         "agents/stockbroker/types.py", 
         "agents/stockbroker/tools.py",
+        "agents/stockbroker/market_data.py",
+        "agents/stockbroker/indicators.py",
+        "agents/stockbroker/risk.py",
         "agents/trip_planner/__init__.py",
         "agents/trip_planner/types.py",
         "agents/trip_planner/nodes/classify.py",
@@ -42,6 +60,7 @@ def main():
         "agents/supervisor/types.py",
         "agents/supervisor/nodes/router.py",
         "agents/supervisor/nodes/general_input.py",
+        "agents/supervisor/nodes/fan_out.py",
         "agents/email_agent/__init__.py",
         "agents/email_agent/types.py",
         "agents/email_agent/nodes/write_email.py",
@@ -56,7 +75,23 @@ def main():
         "agents/writer_agent.py",
         "main.py",
         "run.py",
-        "test_agents.py"
+        "server.py",
+        "prefork.py",
+        "batch.py",
+        "session.py",
+        "test_agents.py",
+        "benchmarks/bench_indicators.py",
+        "benchmarks/bench_risk.py",
+        "benchmarks/bench_downsample.py",
+        "benchmarks/bench_quotes.py",
+        "benchmarks/bench_server.py",
+        "benchmarks/bench_failover.py",
+        "benchmarks/bench_cascade.py",
+        "benchmarks/bench_startup.py",
+        "benchmarks/bench_prefork.py",
+        "benchmarks/bench_graphs.py",
+        "benchmarks/bench_load.py",
+        "benchmarks/fake_llm.py"
     ]
     
     all_valid = True
@@ -3,6 +3,8 @@ import PortfolioView from "./stockbroker/portfolio-view";
 import AccommodationsList from "./trip-planner/accommodations-list";
 import RestaurantsList from "./trip-planner/restaurants-list";
 import BuyStock from "./stockbroker/buy-stock";
+import Indicators from "./stockbroker/indicators";
+import StockComparison from "./stockbroker/stock-comparison";
 import Plan from "./open-code/plan";
 import ProposedChange from "./open-code/proposed-change";
 import { Writer } from "./writer";
@@ -13,6 +15,8 @@ const ComponentMap = {
   "accommodations-list": AccommodationsList,
   "restaurants-list": RestaurantsList,
   "buy-stock": BuyStock,
+  indicators: Indicators,
+  "stock-comparison": StockComparison,
   "code-plan": Plan,
   "proposed-change": ProposedChange,
   writer: Writer,
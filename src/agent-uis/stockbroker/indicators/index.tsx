@@ -0,0 +1,179 @@
+import "./index.css";
+import { useMemo } from "react";
+import {
+  ChartConfig,
+  ChartContainer,
+  ChartTooltip,
+  ChartTooltipContent,
+} from "@/components/ui/chart";
+import {
+  CartesianGrid,
+  Line,
+  LineChart,
+  ReferenceLine,
+  XAxis,
+  YAxis,
+} from "recharts";
+import { format } from "date-fns";
+
+export type IndicatorPoint = {
+  time: string;
+  close: number;
+  sma: number | null;
+  ema: number | null;
+  upperBand: number | null;
+  lowerBand: number | null;
+  vwap: number | null;
+  rsi: number | null;
+  macd: number | null;
+  macdSignal: number | null;
+  macdHistogram: number | null;
+};
+
+export type IndicatorValues = {
+  close: number | null;
+  sma: number | null;
+  ema: number | null;
+  rsi: number | null;
+  macd: number | null;
+  macd_signal: number | null;
+  macd_histogram: number | null;
+  bollinger_middle: number | null;
+  bollinger_upper: number | null;
+  bollinger_lower: number | null;
+  vwap: number | null;
+};
+
+const priceConfig = {
+  close: { label: "Close", color: "hsl(var(--chart-1))" },
+  sma: { label: "SMA", color: "hsl(var(--chart-2))" },
+  ema: { label: "EMA", color: "hsl(var(--chart-3))" },
+  upperBand: { label: "Upper band", color: "hsl(var(--chart-4))" },
+  lowerBand: { label: "Lower band", color: "hsl(var(--chart-4))" },
+} satisfies ChartConfig;
+
+const rsiConfig = {
+  rsi: { label: "RSI", color: "hsl(var(--chart-5))" },
+} satisfies ChartConfig;
+
+function formatValue(value: number | null | undefined) {
+  return value === null || value === undefined ? "-" : value.toFixed(2);
+}
+
+export default function Indicators(props: {
+  ticker: string;
+  interval: string;
+  window: number;
+  latest: IndicatorValues;
+  series: IndicatorPoint[];
+}) {
+  const { ticker, interval, window, latest, series } = props;
+
+  const { lowPrice, highPrice } = useMemo(() => {
+    const values = series.flatMap((p) =>
+      [p.close, p.lowerBand, p.upperBand].filter(
+        (v): v is number => v !== null,
+      ),
+    );
+    return {
+      lowPrice: Math.min(...values),
+      highPrice: Math.max(...values),
+    };
+  }, [series]);
+
+  const formatTime = (value: string) =>
+    interval === "day"
+      ? format(value, "LLL do")
+      : format(value, "LLL do h:mm a");
+
+  return (
+    <div className="w-full max-w-3xl rounded-xl shadow-md overflow-hidden border border-gray-200 flex flex-col gap-4 p-3">
+      <div className="flex items-center justify-start gap-4 mb-2 text-lg font-medium text-gray-700">
+        <p>{ticker}</p>
+        <p>${formatValue(latest.close)}</p>
+      </div>
+      <div className="grid grid-cols-4 gap-4 text-sm">
+        <p>SMA ({window})</p>
+        <p>${formatValue(latest.sma)}</p>
+        <p>EMA ({window})</p>
+        <p>${formatValue(latest.ema)}</p>
+        <p>RSI (14)</p>
+        <p>{formatValue(latest.rsi)}</p>
+        <p>VWAP ({window})</p>
+        <p>${formatValue(latest.vwap)}</p>
+        <p>MACD</p>
+        <p>{formatValue(latest.macd)}</p>
+        <p>Signal</p>
+        <p>{formatValue(latest.macd_signal)}</p>
+      </div>
+      <ChartContainer config={priceConfig}>
+        <LineChart
+          accessibilityLayer
+          data={series}
+          margin={{
+            left: 0,
+            right: 0,
+          }}
+        >
+          <CartesianGrid vertical={false} />
+          <XAxis
+            dataKey="time"
+            tickLine={false}
+            axisLine={false}
+            tickMargin={8}
+            tickFormatter={formatTime}
+          />
+          <YAxis
+            domain={[lowPrice - 2, highPrice + 2]}
+            tickLine={false}
+            axisLine={false}
+            tickMargin={8}
+            tickFormatter={(value) => `${value.toFixed(2)}`}
+          />
+          <ChartTooltip
+            cursor={false}
+            wrapperStyle={{ backgroundColor: "white" }}
+            content={
+              <ChartTooltipContent
+                hideLabel={false}
+                labelFormatter={formatTime}
+              />
+            }
+          />
+          <Line dataKey="close" type="natural" strokeWidth={2} dot={false} />
+          <Line dataKey="sma" type="natural" strokeWidth={1} dot={false} />
+          <Line dataKey="ema" type="natural" strokeWidth={1} dot={false} />
+          <Line
+            dataKey="upperBand"
+            type="natural"
+            strokeWidth={1}
+            strokeDasharray="4 4"
+            dot={false}
+          />
+          <Line
+            dataKey="lowerBand"
+            type="natural"
+            strokeWidth={1}
+            strokeDasharray="4 4"
+            dot={false}
+          />
+        </LineChart>
+      </ChartContainer>
+      <ChartContainer config={rsiConfig} className="aspect-[4/1]">
+        <LineChart accessibilityLayer data={series}>
+          <CartesianGrid vertical={false} />
+          <XAxis dataKey="time" hide />
+          <YAxis
+            domain={[0, 100]}
+            ticks={[30, 70]}
+            tickLine={false}
+            axisLine={false}
+          />
+          <ReferenceLine y={70} strokeDasharray="3 3" />
+          <ReferenceLine y={30} strokeDasharray="3 3" />
+          <Line dataKey="rsi" type="natural" strokeWidth={1} dot={false} />
+        </LineChart>
+      </ChartContainer>
+    </div>
+  );
+}
@@ -0,0 +1,60 @@
+import "./index.css";
+import { cn } from "@/lib/utils";
+
+export type Quote = {
+  ticker: string;
+  price: number;
+  change: number;
+  change_percent: number;
+  volume: number;
+  market_cap: number;
+  timestamp: string;
+};
+
+function formatMarketCap(value: number) {
+  if (value >= 1e12) return `$${(value / 1e12).toFixed(2)}T`;
+  if (value >= 1e9) return `$${(value / 1e9).toFixed(2)}B`;
+  return `$${(value / 1e6).toFixed(2)}M`;
+}
+
+export default function StockComparison(props: { quotes: Quote[] }) {
+  const { quotes } = props;
+
+  return (
+    <div className="w-full max-w-3xl rounded-xl shadow-md overflow-hidden border border-gray-200 flex flex-col gap-4 p-3">
+      <table className="w-full text-sm">
+        <thead>
+          <tr className="text-left text-gray-500">
+            <th className="p-2">Ticker</th>
+            <th className="p-2 text-right">Price</th>
+            <th className="p-2 text-right">Change</th>
+            <th className="p-2 text-right">Volume</th>
+            <th className="p-2 text-right">Market cap</th>
+          </tr>
+        </thead>
+        <tbody>
+          {quotes.map((quote) => (
+            <tr key={quote.ticker} className="border-t border-gray-100">
+              <td className="p-2 font-medium text-gray-700">{quote.ticker}</td>
+              <td className="p-2 text-right">${quote.price.toFixed(2)}</td>
+              <td
+                className={cn(
+                  "p-2 text-right",
+                  quote.change >= 0 ? "text-green-500" : "text-red-500",
+                )}
+              >
+                {quote.change.toFixed(2)} ({quote.change_percent.toFixed(2)}%)
+              </td>
+              <td className="p-2 text-right">
+                {quote.volume.toLocaleString()}
+              </td>
+              <td className="p-2 text-right">
+                {formatMarketCap(quote.market_cap)}
+              </td>
+            </tr>
+          ))}
+        </tbody>
+      </table>
+    </div>
+  );
+}